@@ -1,4 +1,8 @@
 import WikidPadStarter
 
 if __name__ == "__main__":
+    # Needed for worker processes (e.g. of wiki-wide search) if frozen
+    import multiprocessing
+    multiprocessing.freeze_support()
+
     WikidPadStarter.main()
@@ -49,6 +49,10 @@ del __builtin__
 #     count=0)
 
 
+# Measure import times of startup if WIKIDPAD_PROFILE_IMPORTS is set
+from pwiki import ImportProfiler
+ImportProfiler.startFromEnvironment()
+
 
 import ExceptionLogger
 ExceptionLogger.startLogger(VERSION_STRING)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the batched writing of the search index (see
+pwiki.wikidata.SearchIndexWriter).
+
+Builds a synthetic wiki in memory and writes all pages into a new whoosh
+index, then writes all of them again with changed text (as after a
+search and replace over the whole wiki). Compared are pages per second
+of the former WikiPage.putIntoSearchIndex() which opened and committed a
+writer for each page, of the SearchIndexWriter (one whoosh writer and
+commit per batch) and of the SearchIndexWriter in a bulk update as done
+by the rebuild (one writer for all batches, one commit). Afterwards all
+indexes must contain the same documents.
+
+Run from the WikidPad directory:
+    python benchmarkIndexWriter.py [<pages>]
+"""
+
+import sys, os, time, shutil, tempfile, threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "lib"))
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(2, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "extensions", "wikidPadParser"))
+
+# Normally installed by the i18n initialization of the application
+import __builtin__
+__builtin__.__dict__.setdefault("_", lambda s: s)
+__builtin__.__dict__.setdefault("N_", lambda s: s)
+
+import whoosh.index, whoosh.writing
+from whoosh.qparser import QueryParser
+
+import Consts
+from pwiki.wikidata.WikiDataManager import WikiDataManager
+from pwiki.wikidata.SearchIndexWriter import SearchIndexWriter
+
+from benchmarkParallelExport import buildPages
+
+
+class BenchWikiData(object):
+    def __init__(self):
+        self.indexedCount = 0
+
+    def setMetaDataState(self, word, state):
+        assert state == Consts.WIKIWORDMETADATA_STATE_INDEXED
+        self.indexedCount += 1
+
+
+class BenchPage(object):
+    """
+    Provides the functions of a wiki page used when writing the index.
+    """
+    def __init__(self, wikiData, word, text):
+        self.wikiData = wikiData
+        self.wikiPageName = word
+        self.textOperationLock = threading.RLock()
+        self.setText(text)
+
+    def setText(self, text):
+        with self.textOperationLock:
+            self.text = text
+            self.liveTextPlaceHold = object()
+
+    def getLiveText(self):
+        return self.text
+
+    def getTimestamps(self):
+        return (1234567890.0, 1234567890.0, 1234567890.0, 1234567890.0)
+
+    def getUnifiedPageName(self):
+        return u"wikipage/" + self.wikiPageName
+
+    def getWikiWord(self):
+        return self.wikiPageName
+
+    def getWikiData(self):
+        return self.wikiData
+
+    def isInvalid(self):
+        return False
+
+
+class BenchWikiDocument(object):
+    def __init__(self, indexPath):
+        whoosh.writing.DOCLENGTH_TYPE = "l"
+        whoosh.writing.DOCLENGTH_LIMIT = 2 ** 31 - 1
+
+        whoosh.index.create_in(indexPath,
+                WikiDataManager.getWhooshIndexSchema())
+        self.whooshIndex = whoosh.index.open_dir(indexPath)
+
+    def getSearchIndex(self):
+        self.whooshIndex = self.whooshIndex.refresh()
+        return self.whooshIndex
+
+
+def putIntoSearchIndexPerPage(wikiDocument, page):
+    """
+    Former WikiPage.putIntoSearchIndex(), writes and commits a single page.
+    """
+    with page.textOperationLock:
+        liveTextPlaceHold = page.liveTextPlaceHold
+        content = page.getLiveText()
+
+    writer = None
+    try:
+        searchIdx = wikiDocument.getSearchIndex()
+        writer = searchIdx.writer(timeout=Consts.DEADBLOCKTIMEOUT)
+
+        unifName = page.getUnifiedPageName()
+
+        writer.delete_by_term("unifName", unifName)
+
+        writer.add_document(unifName=unifName,
+                modTimestamp=page.getTimestamps()[0],
+                content=content)
+    except:
+        if writer is not None:
+            writer.cancel()
+        raise
+
+    # Check within lock if data is current yet
+    with page.textOperationLock:
+        if not liveTextPlaceHold is page.liveTextPlaceHold:
+            writer.cancel()
+            return False
+        else:
+            writer.commit()
+            page.getWikiData().setMetaDataState(page.getWikiWord(),
+                    Consts.WIKIWORDMETADATA_STATE_INDEXED)
+            return True
+
+
+def runPasses(pageTexts, batched, bulkUpdate):
+    """
+    Write all pages twice into a new index, the second time with changed
+    text. Returns tuple (seconds of first pass, seconds of second pass,
+    number of "indexed" states set, number of commits, sorted search
+    results).
+    """
+    indexPath = tempfile.mkdtemp(prefix="benchIndexWriter")
+    try:
+        wikiDocument = BenchWikiDocument(indexPath)
+        wikiData = BenchWikiData()
+        pages = [BenchPage(wikiData, word, text) for word, text in pageTexts]
+        times = []
+        commitCount = 0
+
+        for passNo in (0, 1):
+            if passNo == 1:
+                for page in pages:
+                    page.setText(page.getLiveText().replace(u"bold",
+                            u"strong"))
+
+            start = time.time()
+            if batched:
+                indexWriter = SearchIndexWriter(wikiDocument)
+                if bulkUpdate:
+                    indexWriter.beginBulkUpdate()
+                for page in pages:
+                    indexWriter.putPage(page)
+                if bulkUpdate:
+                    indexWriter.endBulkUpdate()
+                else:
+                    indexWriter.flush()
+                commitCount += indexWriter.getStatistics()[0]
+            else:
+                for page in pages:
+                    putIntoSearchIndexPerPage(wikiDocument, page)
+                commitCount += len(pages)
+            times.append(time.time() - start)
+
+        searcher = wikiDocument.getSearchIndex().searcher()
+        try:
+            query = QueryParser("content", None).parse(u"strong")
+            found = sorted(hit["unifName"] for hit in
+                    searcher.search(query, limit=None))
+            docCount = searcher.doc_count()
+        finally:
+            searcher.close()
+
+        assert docCount == len(pages)
+        return times[0], times[1], wikiData.indexedCount, commitCount, found
+    finally:
+        shutil.rmtree(indexPath, True)
+
+
+def main():
+    pageCount = 1000
+    if len(sys.argv) > 1:
+        pageCount = int(sys.argv[1])
+
+    pageTexts = buildPages(pageCount)
+    print "%i pages, %i characters" % (pageCount,
+            sum(len(text) for word, text in pageTexts))
+
+    results = []
+    for batched, bulkUpdate, title in ((False, False, "writer per page"),
+            (True, False, "SearchIndexWriter"),
+            (True, True, "SearchIndexWriter, bulk update")):
+        newTime, updateTime, indexedCount, commitCount, found = runPasses(
+                pageTexts, batched, bulkUpdate)
+        assert indexedCount == 2 * pageCount
+        results.append(found)
+        print "    %s: new index %.1f pages/s, update %.1f pages/s " \
+                "(%.2f s, %.2f s, %i commits)" % (title, pageCount / newTime,
+                pageCount / updateTime, newTime, updateTime, commitCount)
+
+    assert results[0] == results[1] == results[2]
+    print "    indexes are identical (%i documents found)" % len(results[0])
+
+
+if __name__ == "__main__":
+    main()
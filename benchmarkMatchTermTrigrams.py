@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the trigram index of the match terms (table
+"matchtermtrigrams", used by getWikiWordMatchTermsWith() e.g. for the
+"Open Wiki Word" dialog) with a large vocabulary.
+
+Builds a temporary "compact_sqlite" database with about 100000 match terms
+(page names, aliases and headings made of random words) and compares the
+time of getWikiWordMatchTermsWith() scanning all match terms (as before
+the trigram index and the prefix range existed) and with both indices
+for search strings of several lengths found in the match terms and for
+random strings. Both must return the same results. The consistency of the
+trigram table after changes is checked by checkMatchTermTrigrams.py.
+
+Run from the WikidPad directory:
+    python benchmarkMatchTermTrigrams.py [<match terms>]
+"""
+
+import sys, os, time, random, shutil, tempfile
+
+from checkMatchTermTrigrams import createWikiData, getMatchTermsWith, \
+        SYNC_TYPE, ALIAS_TYPE, HEADING_TYPE
+
+from pwiki.wikidata.compact_sqlite import DbStructure
+
+
+# Number of different words the match terms are made of
+VOCABULARY_SIZE = 5000
+
+# Number of search strings per length
+SEARCHES_PER_LENGTH = 20
+
+SEARCH_LENGTHS = (2, 3, 4, 6, 10)
+
+CONSONANTS = u"bcdfghjklmnprstvwz"
+VOWELS = u"aeiou"
+
+
+def buildVocabulary(rnd):
+    vocabulary = set()
+    while len(vocabulary) < VOCABULARY_SIZE:
+        vocabulary.add(u"".join(rnd.choice(CONSONANTS) + rnd.choice(VOWELS)
+                for i in xrange(rnd.randint(2, 4))))
+
+    return sorted(vocabulary)
+
+
+def buildMatchTerms(rnd, termCount):
+    """
+    Returns tuple (list of page names, list of match term tuples).
+    """
+    vocabulary = buildVocabulary(rnd)
+    words = []
+    terms = []
+
+    while len(terms) < termCount:
+        word = u"".join(w.capitalize() for w in rnd.sample(vocabulary, 2)) + \
+                unicode(len(words))
+        words.append(word)
+        terms.append((word, SYNC_TYPE, word, -1, 0))
+        terms.append((u" ".join(rnd.sample(vocabulary, 3)).capitalize(),
+                HEADING_TYPE, word, 0, 20))
+        if rnd.random() < 0.5:
+            terms.append((rnd.choice(vocabulary).capitalize() +
+                    rnd.choice(vocabulary), ALIAS_TYPE, word, -1, 0))
+
+    return words, terms
+
+
+def buildSearchStrings(rnd, terms):
+    """
+    Returns list of tuples (title, list of search strings).
+    """
+    result = []
+    for length in SEARCH_LENGTHS:
+        found = []
+        while len(found) < SEARCHES_PER_LENGTH:
+            matchterm = rnd.choice(terms)[0]
+            if len(matchterm) <= length:
+                continue
+            # Infix, not prefix
+            start = rnd.randint(1, len(matchterm) - length)
+            found.append(matchterm[start:start + length])
+
+        result.append(("%2i chars, found" % length, found))
+        result.append(("%2i chars, random" % length,
+                [u"".join(rnd.choice(CONSONANTS + VOWELS)
+                for i in xrange(length))
+                for j in xrange(SEARCHES_PER_LENGTH)]))
+
+    return result
+
+
+def timeQueries(wikiData, searchStrings, useIndices):
+    """
+    Returns tuple (seconds per query, list of sorted results).
+    """
+    start = time.time()
+    results = [getMatchTermsWith(wikiData, DbStructure, s, useIndices)
+            for s in searchStrings]
+    seconds = (time.time() - start) / len(searchStrings)
+
+    return seconds, [sorted(r) for r in results]
+
+
+def main():
+    termCount = 100000
+    if len(sys.argv) > 1:
+        termCount = int(sys.argv[1])
+
+    rnd = random.Random(4711)
+    dataDir = tempfile.mkdtemp(prefix="benchTrigrams")
+    try:
+        wikiData = createWikiData("compact_sqlite", dataDir)
+        words, terms = buildMatchTerms(rnd, termCount)
+
+        start = time.time()
+        wikiData.addPages(words)
+        wikiData.connWrap.executemany("insert into wikiwordmatchterms("
+                "matchterm, type, word, firstcharpos, charlength, "
+                "matchtermnormcase) values (?, ?, ?, ?, ?, ?)",
+                [t + (t[0].lower(),) for t in terms])
+        DbStructure.rebuildMatchTermTrigrams(wikiData.connWrap)
+        wikiData.commit()
+        wikiData.matchTermTrigramsAvailable = \
+                DbStructure.hasMatchTermTrigrams(wikiData.connWrap)
+        assert wikiData.matchTermTrigramsAvailable
+
+        print "%i pages, %i match terms, %i trigram rows (built in %.1f s)" % \
+                (len(words), len(terms),
+                wikiData.connWrap.execSqlQuerySingleItem(
+                "select count(*) from matchtermtrigrams"),
+                time.time() - start)
+
+        for title, searchStrings in buildSearchStrings(rnd, terms):
+            indexTime, indexResults = timeQueries(wikiData, searchStrings,
+                    True)
+            scanTime, scanResults = timeQueries(wikiData, searchStrings, False)
+            assert indexResults == scanResults
+
+            print "    %-18s scan %7.2f ms, indices %7.2f ms (%5.1fx), " \
+                    "%6.1f results per query" % (title, scanTime * 1000.0,
+                    indexTime * 1000.0, scanTime / indexTime,
+                    float(sum(len(r) for r in scanResults)) /
+                    len(searchStrings))
+
+        wikiData.connWrap.close()
+    finally:
+        shutil.rmtree(dataDir, True)
+
+
+if __name__ == "__main__":
+    main()
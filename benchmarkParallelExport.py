@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for parsing the pages of the "Set of HTML pages" export in
+worker processes (see pwiki.ParallelParsing).
+
+Builds a synthetic wiki in memory and compares the time the export loop
+needs to get the ASTs of all pages when it parses each page itself with
+the time when the pages are parsed by ParallelPageParser. The ASTs of
+both runs are compared, they must be identical for the export to produce
+the same output.
+
+Run from the WikidPad directory:
+    python benchmarkParallelExport.py [<pages> [<processes>]]
+"""
+
+import sys, os, time, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "lib"))
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(2, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "extensions", "wikidPadParser"))
+
+# Normally installed by the i18n initialization of the application
+import __builtin__
+__builtin__.__dict__.setdefault("_", lambda s: s)
+__builtin__.__dict__.setdefault("N_", lambda s: s)
+
+import WikidPadParser
+from pwiki.ParseUtilities import WikiPageFormatDetails
+from pwiki.WikiPyparsing import SyntaxNode
+from pwiki.wikidata.PageAstCache import PageAstCache
+from pwiki.ParallelParsing import ParallelPageParser
+from pwiki.Utilities import DUMBTHREADSTOP
+
+
+LANGUAGE_NAME = WikidPadParser.WIKI_LANGUAGE_NAME
+
+# Size of the page AST cache in the parallel run (sum of text lengths)
+SMALL_CACHE_TEXT_LENGTH = 20000
+
+
+class BenchPage(object):
+    """
+    Provides the functions of a wiki page used by the export loop and by
+    ParallelPageParser.
+    """
+    def __init__(self, wikiDocument, word, text):
+        self.wikiDocument = wikiDocument
+        self.word = word
+        self.text = text
+
+    def getNonAliasPage(self):
+        return self
+
+    def getLivePageAstIfAvailable(self):
+        return None
+
+    def getLiveText(self):
+        return self.text
+
+    def getWikiWord(self):
+        return self.word
+
+    def getWikiDocument(self):
+        return self.wikiDocument
+
+    def getUnifiedPageName(self):
+        return u"wikipage/" + self.word
+
+    def getWikiLanguageName(self):
+        return LANGUAGE_NAME
+
+    def getFormatDetails(self):
+        return WikiPageFormatDetails(wikiDocument=self.wikiDocument,
+                basePage=self, wikiLanguageDetails=
+                WikidPadParser.WikiLanguageDetails(None, None))
+
+    def getLivePageAst(self):
+        # Same as DocPages.WikiPage.getLivePageAst() without incremental
+        # parsing
+        formatDetails = self.getFormatDetails()
+        pageAstCache = self.wikiDocument.getPageAstCache()
+        pageAst = pageAstCache.get(self.getUnifiedPageName(), self.text,
+                formatDetails)
+        if pageAst is None:
+            parser = WikidPadParser.parserFactory(LANGUAGE_NAME, False)
+            pageAst = parser.parse(LANGUAGE_NAME, self.text, formatDetails,
+                    threadstop=DUMBTHREADSTOP)
+            pageAstCache.put(self.getUnifiedPageName(), self.text,
+                    formatDetails, pageAst)
+
+        return pageAst
+
+
+class BenchWikiDocument(object):
+    def __init__(self, pages, maxCachedTextLength=None):
+        self.pages = dict((word, BenchPage(self, word, text))
+                for word, text in pages)
+        self.pageAstCache = PageAstCache(maxCachedTextLength)
+
+    def getWikiPage(self, word):
+        return self.pages[word]
+
+    def getPageAstCache(self):
+        return self.pageAstCache
+
+    def getCcWordBlacklist(self):
+        return set()
+
+    def getNccWordBlacklist(self):
+        return set()
+
+
+def pageName(i):
+    return u"PageNumber%i" % i
+
+
+def buildPages(pageCount):
+    rnd = random.Random(4711)
+    pages = []
+    for i in xrange(pageCount):
+        lines = [u"+ %s" % pageName(i), u""]
+        for p in xrange(rnd.randint(5, 30)):
+            links = u" ".join(pageName(rnd.randint(0, pageCount - 1))
+                    for l in xrange(rnd.randint(1, 5)))
+            lines.append(u"Some *bold* and _italic_ text with links %s "
+                    u"and [%s|a title] and http://example.org/%i" %
+                    (links, pageName(rnd.randint(0, pageCount - 1)), p))
+            lines.append(u"    * item %i\n    * item [key: value%i]" % (p, p))
+            lines.append(u"")
+        lines.append(u"<<|\ncell | cell\ncell | cell\n>>")
+        pages.append((pageName(i), u"\n".join(lines)))
+
+    return pages
+
+
+def normalizeAst(node):
+    """
+    Returns representation of node which doesn't depend on the order of
+    the node attributes.
+    """
+    if isinstance(node, SyntaxNode):
+        return (type(node).__name__, normalizeAst(node.__getstate__()))
+    if isinstance(node, dict):
+        return sorted((k, normalizeAst(v)) for k, v in node.iteritems())
+    if isinstance(node, (list, tuple)):
+        return [normalizeAst(n) for n in node]
+    return node
+
+
+def runExportLoop(wikiDocument, words, processCount):
+    pageParser = ParallelPageParser(wikiDocument, processCount,
+            {LANGUAGE_NAME: WikidPadParser.parserFactory})
+    pageAsts = []
+    start = time.time()
+    try:
+        for word in pageParser.iterPreparsedWords(words):
+            pageAsts.append(wikiDocument.getWikiPage(word).getLivePageAst())
+    finally:
+        pageParser.close()
+
+    return (time.time() - start, pageAsts, pageParser.preparsedCount,
+            wikiDocument.getPageAstCache().hitCount)
+
+
+def main():
+    pageCount = 2000
+    processCount = -1
+    if len(sys.argv) > 1:
+        pageCount = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        processCount = int(sys.argv[2])
+
+    pages = buildPages(pageCount)
+    words = [word for word, text in pages]
+    print "%i pages, %i characters" % (pageCount,
+            sum(len(text) for word, text in pages))
+
+    serialTime, serialAsts, count, hitCount = runExportLoop(
+            BenchWikiDocument(pages), words, 0)
+    print "    parsed by export loop: %.2f s" % serialTime
+
+    # The cache only holds a few pages, as with very large pages in
+    # the application
+    parallelTime, parallelAsts, count, hitCount = runExportLoop(
+            BenchWikiDocument(pages, SMALL_CACHE_TEXT_LENGTH), words,
+            processCount)
+    print "    parsed by worker processes: %.2f s (%i pages parsed " \
+            "in advance, %i ASTs used by export loop)" % (parallelTime,
+            count, hitCount)
+    assert hitCount == count
+
+    for serialAst, parallelAst in zip(serialAsts, parallelAsts):
+        assert normalizeAst(serialAst) == normalizeAst(parallelAst)
+    print "    ASTs are identical"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for parsing the pages of a wiki rebuild in worker processes (see
+pwiki.ParallelParsing.ParallelMetaDataExtractor).
+
+Builds a synthetic wiki in memory and compares the time step two of
+the rebuild needs to get the meta data (attributes, todos, child
+relations, heading match terms) of all pages when it parses each page
+itself with the time when the pages are parsed and the meta data is
+extracted by worker processes. The meta data of both runs are compared,
+they must be identical for the rebuild to write the same database content.
+
+Besides the elapsed time the CPU time of the main process (the rebuild
+loop) and of the worker processes is shown. On a machine with a single
+CPU the workers can't make the rebuild faster, the CPU times show the
+elapsed time to expect with more CPUs: the main process only has to write
+the meta data while the parsing is spread over the workers.
+
+Run from the WikidPad directory:
+    python benchmarkParallelRebuild.py [<pages> [<processes>]]
+"""
+
+import sys, os, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "lib"))
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(2, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "extensions", "wikidPadParser"))
+
+# Normally installed by the i18n initialization of the application
+import __builtin__
+__builtin__.__dict__.setdefault("_", lambda s: s)
+__builtin__.__dict__.setdefault("N_", lambda s: s)
+
+import WikidPadParser
+from pwiki.DocPages import WikiPage
+from pwiki.ParallelParsing import ParallelMetaDataExtractor
+
+from benchmarkParallelExport import LANGUAGE_NAME, BenchWikiDocument, \
+        buildPages
+
+
+# Value of wiki configuration setting "headingsAsAliases_depth"
+HEADINGS_AS_ALIASES_DEPTH = 2
+
+
+class BenchWikiConfig(object):
+    def getint(self, section, option, default=None):
+        assert (section, option) == ("main", "headingsAsAliases_depth")
+        return HEADINGS_AS_ALIASES_DEPTH
+
+
+class BenchRebuildWikiDocument(BenchWikiDocument):
+    def getWikiConfig(self):
+        return BenchWikiConfig()
+
+
+def addMetaData(pages):
+    """
+    Add todos, attributes and headings to the pages built by
+    benchmarkParallelExport.buildPages().
+    """
+    result = []
+    for i, (word, text) in enumerate(pages):
+        text += u"\n\n++ Second heading %i\n\ntodo: check page %i\n" \
+                u"[alias: OtherName%i]\n+++ Too deep\n" % (i, i, i)
+        result.append((word, text))
+
+    return result
+
+
+def extractMetaData(pageAst, word):
+    # Same as done by _extractChunk() in the workers
+    return (WikiPage.extractAttributesFromPageAst(pageAst),) + \
+            WikiPage.extractMainDbCacheDataFromPageAst(pageAst, word,
+            HEADINGS_AS_ALIASES_DEPTH)
+
+
+def runRebuildLoop(wikiDocument, words, processCount):
+    extractor = ParallelMetaDataExtractor(wikiDocument, processCount,
+            wikiDocument.getWikiPage,
+            {LANGUAGE_NAME: WikidPadParser.parserFactory})
+    metaDatas = []
+    start = time.time()
+    startTimes = os.times()
+    try:
+        for word in extractor.iterPreparsedWords(words):
+            page = wikiDocument.getWikiPage(word)
+            extract = extractor.popMetaData(word)
+            if extract is not None and extract[0] == page.getLiveText() and \
+                    page.getFormatDetails().isEquivTo(extract[1]):
+                metaDatas.append(extract[2])
+            else:
+                metaDatas.append(extractMetaData(page.getLivePageAst(), word))
+    finally:
+        extractor.close()
+
+    # Times of terminated children are included after close()
+    endTimes = os.times()
+    mainCpuTime = (endTimes[0] - startTimes[0]) + (endTimes[1] - startTimes[1])
+    workerCpuTime = (endTimes[2] - startTimes[2]) + \
+            (endTimes[3] - startTimes[3])
+
+    return (time.time() - start, mainCpuTime, workerCpuTime, metaDatas,
+            extractor.preparsedCount)
+
+
+def main():
+    pageCount = 2000
+    processCount = -1
+    if len(sys.argv) > 1:
+        pageCount = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        processCount = int(sys.argv[2])
+
+    pages = addMetaData(buildPages(pageCount))
+    words = [word for word, text in pages]
+    print "%i pages, %i characters" % (pageCount,
+            sum(len(text) for word, text in pages))
+
+    serialTime, mainCpuTime, workerCpuTime, serialMetaDatas, count = \
+            runRebuildLoop(BenchRebuildWikiDocument(pages), words, 0)
+    print "    parsed by rebuild loop: %.2f s (CPU: main %.2f s)" % (
+            serialTime, mainCpuTime)
+
+    parallelTime, mainCpuTime, workerCpuTime, parallelMetaDatas, count = \
+            runRebuildLoop(BenchRebuildWikiDocument(pages), words,
+            processCount)
+    print "    parsed by worker processes: %.2f s (%i pages parsed " \
+            "in advance, CPU: main %.2f s, workers %.2f s)" % (parallelTime,
+            count, mainCpuTime, workerCpuTime)
+
+    assert serialMetaDatas == parallelMetaDatas
+    print "    meta data are identical"
+
+
+if __name__ == "__main__":
+    main()
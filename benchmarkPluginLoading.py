@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the startup time saved by the plugin manifest cache (see
+pwiki.PluginManager.PluginManifestCache).
+
+Each run starts a new process which imports pwiki.PersonalWikiFrame (as
+the application does before it loads the plugins) and then loads the
+plugins of the "extensions" directory with the plugin APIs of the
+application and of the main window. This is done without manifest cache
+(as before the cache existed), with an empty cache (first start, the cache
+is written) and with the written cache (later starts). Reported are the
+time spent in PluginManager.loadPlugins() and the number of plugin files
+per load state.
+
+Run from the WikidPad directory:
+    python benchmarkPluginLoading.py [<runs>]
+"""
+
+import sys, os, time, shutil, tempfile, subprocess
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def loadPlugins(cachePath):
+    """
+    Runs in the child process. Returns tuple (seconds, dictionary
+    {state: number of plugin files}).
+    """
+    sys.path.insert(0, os.path.join(APP_DIR, "lib"))
+    sys.path.insert(1, APP_DIR)
+
+    # Normally installed by the i18n initialization of the application
+    import __builtin__
+    __builtin__.__dict__.setdefault("_", lambda s: s)
+    __builtin__.__dict__.setdefault("N_", lambda s: s)
+
+    import pwiki.PersonalWikiFrame
+    from pwiki import PluginManager
+
+    if cachePath is not None:
+        PluginManager._manifestCache = PluginManager.PluginManifestCache(
+                cachePath)
+    else:
+        PluginManager.getPluginManifestCache = lambda: None
+
+    dirs = (os.path.join(APP_DIR, u"extensions"),)
+
+    start = time.time()
+
+    # Plugin APIs of MainApp.reloadPlugins()
+    appManager = PluginManager.PluginManager(dirs, systemDirIdx=0)
+    for descriptor, functions in ((("InsertionByKey", 1),
+            ("describeInsertionKeys",)),
+            (("Options", 1), ("registerOptions",)),
+            (("WikiParser", 1), ("describeWikiLanguage",)),
+            (("Exporters", 1), ("describeExportersV01",)),
+            (("Prints", 1), ("describePrintsV01",)),
+            (("MenuModifier", 1), ("modifyMenuV01",)),
+            (("MenuItemProvider", 1), ("provideMenuItemV01",))):
+        appManager.registerSimplePluginAPI(descriptor, functions)
+    appManager.loadPlugins([u"KeyBindings.py", u"EvalLibrary.py"])
+
+    # Plugin APIs of PersonalWikiFrame (without the wrapped hooks API)
+    frameManager = PluginManager.PluginManager(dirs, systemDirIdx=0)
+    for descriptor, functions in ((("hooks", 2), ("startup", "openWiki",
+            "openedWikiWord", "savingWikiWord", "exit")),
+            (("ViFunctions", 1), ("describeViFunctions",)),
+            (("MenuFunctions", 1), ("describeMenuItems",)),
+            (("ToolbarFunctions", 1), ("describeToolbarItems",))):
+        frameManager.registerSimplePluginAPI(descriptor, functions)
+    frameManager.registerWrappedPluginAPI(("ToolbarFunctions", 2),
+            describeToolbarItems="describeToolbarItemsV02")
+    frameManager.loadPlugins([u"KeyBindings.py", u"EvalLibrary.py"])
+
+    seconds = time.time() - start
+
+    states = {}
+    for manager in (appManager, frameManager):
+        for path, state, loadTime in manager.getLoadStatistics():
+            states[state] = states.get(state, 0) + 1
+
+    return seconds, states
+
+
+def runChild(cachePath):
+    """
+    Start a new process to load the plugins, returns its result.
+    """
+    args = [sys.executable, os.path.abspath(__file__), "--child"]
+    if cachePath is not None:
+        args.append(cachePath)
+
+    output = subprocess.Popen(args, stdout=subprocess.PIPE).communicate()[0]
+    return eval(output.strip().splitlines()[-1])
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        cachePath = None
+        if len(sys.argv) > 2:
+            cachePath = sys.argv[2]
+        print repr(loadPlugins(cachePath))
+        return
+
+    runs = 3
+    if len(sys.argv) > 1:
+        runs = int(sys.argv[1])
+
+    tempDir = tempfile.mkdtemp(prefix="benchPluginLoading")
+    try:
+        results = {}
+        for i in xrange(runs):
+            cachePath = os.path.join(tempDir, "PluginManifest%i.cache" % i)
+            for title, path in (("no manifest cache", None),
+                    ("empty manifest cache", cachePath),
+                    ("written manifest cache", cachePath)):
+                results.setdefault(title, []).append(runChild(path))
+
+        for title in ("no manifest cache", "empty manifest cache",
+                "written manifest cache"):
+            times = [seconds for seconds, states in results[title]]
+            states = results[title][-1][1]
+            print "%-24s %7.1f ms (best of %i)  %s" % (title,
+                    min(times) * 1000.0, runs, ", ".join("%s: %i" % item
+                    for item in sorted(states.iteritems())))
+    finally:
+        shutil.rmtree(tempDir, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Stress benchmark for the reader connection pool of the sqlite backends.
+
+Builds a temporary "compact_sqlite" database and runs several reader
+threads, once alone and once together with one writer thread, all calling
+the WikiData object through WikiDataSynchronizedProxy. The number of calls
+done in a fixed time is compared between a single connection (all calls
+serialized by the lock of the proxy) and the database in WAL mode with a
+pool of reader connections.
+
+The pool doesn't make a single read faster. Readers gain only if the
+sqlite library can run them on several CPUs at once (it releases the
+Python interpreter lock while a query runs). With one CPU the read rate
+of readers alone stays the same and with a writer the readers and the
+writer share the CPU instead of the writer waiting behind the readers:
+more writes, but fewer reads. Together with the persistent switch to WAL
+mode this is why the option "db_readerConnectionCount" is 0 by default.
+
+Run from the WikidPad directory:
+    python benchmarkReaderPool.py [<reader threads> [<seconds>]]
+"""
+
+import sys, os, time, random, shutil, tempfile, threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "lib"))
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
+
+# Normally installed by the i18n initialization of the application
+import __builtin__
+__builtin__.__dict__.setdefault("_", lambda s: s)
+__builtin__.__dict__.setdefault("N_", lambda s: s)
+
+from pwiki.wikidata.compact_sqlite import DbStructure
+from pwiki.wikidata.compact_sqlite.WikiData import WikiData
+from pwiki.wikidata.ReaderConnectionPool import ReaderConnectionPool
+from pwiki.wikidata.WikiDataManager import WikiDataSynchronizedProxy
+from pwiki.StringOps import utf8Enc, utf8Dec
+import pwiki.sqlite3api as sqlite
+
+
+PAGE_COUNT = 20000
+
+
+class BenchWikiData(WikiData):
+    """
+    WikiData working on a database file without wiki document.
+    """
+    def __init__(self, dataDir, readerConnections):
+        self.wikiDocument = None
+        self.dataDir = dataDir
+        self.cachedWikiPageLinkTermDict = None
+        self.readerPool = None
+        self.dbfile = os.path.join(dataDir, u"wiki.sli")
+        self.writeConnWrap = DbStructure.ConnectWrapSyncCommit(
+                sqlite.connect(self.dbfile))
+
+        DbStructure.registerSqliteFunctions(self.connWrap)
+        DbStructure.registerUtf8Support(self.connWrap)
+        self.contentDbToOutput = lambda c: utf8Dec(c, "replace")[0]
+        self.contentUniInputToDb = lambda u: utf8Enc(u, "replace")[0]
+
+        if DbStructure.setJournalModeWal(self.connWrap,
+                readerConnections > 0):
+            self.readerPool = ReaderConnectionPool(
+                    self._createReaderConnection,
+                    self.writeConnWrap.isInTransaction, readerConnections)
+
+
+def pageName(i):
+    return u"Page%i" % i
+
+
+def fillDatabase(dataDir):
+    wikiData = BenchWikiData(dataDir, 0)
+    rnd = random.Random(4711)
+    now = time.time()
+    text = u"Some text of the page " * 50
+
+    wikiData.connWrap.executemany("insert into wikiwordcontent(word, content, "
+            "modified, created, visited, metadataprocessed) "
+            "values (?, ?, ?, ?, 0.0, 0)", [(pageName(i),
+            sqlite.Binary(utf8Enc(text)[0]), now - rnd.random() * 1e7,
+            now - 1e7 - rnd.random() * 1e7) for i in xrange(PAGE_COUNT)])
+    wikiData.connWrap.executemany("insert into wikirelations(word, relation, "
+            "firstcharpos) values (?, ?, ?)", [(pageName(i),
+            pageName(rnd.randint(0, PAGE_COUNT - 1)), 0)
+            for i in xrange(PAGE_COUNT)])
+    wikiData.commit()
+    wikiData.close()
+
+
+def runReader(wikiData, stopTime, rnd, counter):
+    now = time.time()
+    count = 0
+    while time.time() < stopTime:
+        # Mostly queries which scan a table in the sqlite library and
+        # return few rows
+        start = now - rnd.random() * 1e7
+        wikiData.getWikiPageNamesModifiedWithin(start, start + 1000.0)
+        wikiData.getTimeMinMax(1)
+        wikiData.getChildRelationships(pageName(rnd.randint(0,
+                PAGE_COUNT - 1)))
+        count += 3
+
+    counter.append(count)
+
+
+def runWriter(wikiData, stopTime, rnd, counter):
+    count = 0
+    while time.time() < stopTime:
+        word = pageName(rnd.randint(0, PAGE_COUNT - 1))
+        wikiData.setContent(word, u"Changed text %f " % time.time() * 50)
+        wikiData.commit()
+        count += 1
+
+    counter.append(count)
+
+
+def runStress(dataDir, readerConnections, readerThreads, withWriter,
+        seconds):
+    baseWikiData = BenchWikiData(dataDir, readerConnections)
+    wikiData = WikiDataSynchronizedProxy(baseWikiData)
+
+    stopTime = time.time() + seconds
+    readCounter = []
+    writeCounter = []
+    threads = [threading.Thread(target=runReader, args=(wikiData, stopTime,
+            random.Random(i), readCounter)) for i in xrange(readerThreads)]
+    if withWriter:
+        threads.append(threading.Thread(target=runWriter, args=(wikiData,
+                stopTime, random.Random(815), writeCounter)))
+
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    baseWikiData.close()
+
+    return (sum(readCounter) / float(seconds),
+            sum(writeCounter) / float(seconds))
+
+
+def getCpuCount():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+
+def main():
+    readerThreads = 4
+    seconds = 5
+    if len(sys.argv) > 1:
+        readerThreads = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        seconds = int(sys.argv[2])
+
+    dataDir = tempfile.mkdtemp()
+    try:
+        DbStructure.createWikiDB(None, dataDir)
+        fillDatabase(dataDir)
+        print "%i pages, %i reader threads, %i CPUs" % (PAGE_COUNT,
+                readerThreads, getCpuCount())
+
+        for withWriter, title in ((False, "readers only"),
+                (True, "readers and 1 writer thread")):
+            print "  " + title
+            for readerConnections in (0, readerThreads):
+                reads, writes = runStress(dataDir, readerConnections,
+                        readerThreads, withWriter, seconds)
+                print "    %i reader connections: %.0f reads/s, " \
+                        "%.0f writes/s" % (readerConnections, reads, writes)
+    finally:
+        shutil.rmtree(dataDir, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark for building the style bytes of the editor for big pages.
+
+Compares the previous per-byte merge of syntax and spell checker styles
+with the bulk operations of StyleCollector and orStyleMask().
+
+Run from the WikidPad directory:  python benchmarkStyling.py [<size in MB>]
+"""
+
+import sys, os, time, random, itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "lib"))
+
+from pwiki.EnhancedScintillaControl import StyleCollector, orStyleMask, \
+        bytelenSct_utf8
+from pwiki import StringOps
+
+
+INDIC2_MASK = 0x80
+
+
+class OldStyleCollector(StringOps.SnippetCollector):
+    """
+    Previous implementation of StyleCollector for comparison
+    """
+    def __init__(self, defaultStyleNo, text, bytelenSct, startCharPos=0):
+        super(OldStyleCollector, self).__init__()
+        self.defaultStyleNo = defaultStyleNo
+        self.text = text
+        self.bytelenSct = bytelenSct
+        self.charPos = startCharPos
+
+    def bindStyle(self, targetCharPos, targetLength, styleNo):
+        if targetCharPos < 0:
+            return
+
+        if targetCharPos < self.charPos:
+            bytestylelen = self.bytelenSct(self.text[targetCharPos:self.charPos])
+            self.drop(bytestylelen)
+        else:
+            bytestylelen = self.bytelenSct(self.text[self.charPos:targetCharPos])
+            self.append(chr(self.defaultStyleNo) * bytestylelen)
+
+        self.charPos = targetCharPos + targetLength
+
+        bytestylelen = self.bytelenSct(self.text[targetCharPos:self.charPos])
+        self.append(chr(styleNo) * bytestylelen)
+
+    def value(self):
+        if self.charPos < len(self.text):
+            bytestylelen = self.bytelenSct(self.text[self.charPos:len(self.text)])
+            self.append(chr(self.defaultStyleNo) * bytestylelen)
+
+        return super(OldStyleCollector, self).value()
+
+
+
+def buildPage(size, nonAscii):
+    """
+    Returns tuple (text, syntaxTokens, spellTokens) with tokens as lists
+    of tuples (charPos, charLength, styleNo)
+    """
+    rnd = random.Random(4711)
+    words = [u"WikiWord", u"some", u"text", u"with", u"*bold*", u"wrods"]
+    if nonAscii:
+        words += [u"ärger", u"grüße", u"€"]
+
+    parts = []
+    syntaxTokens = []
+    spellTokens = []
+    pos = 0
+    while pos < size:
+        word = rnd.choice(words)
+        if word.startswith(u"*"):
+            syntaxTokens.append((pos, len(word), 2))
+        elif word == u"WikiWord":
+            syntaxTokens.append((pos, len(word), 5))
+        elif word == u"wrods":
+            spellTokens.append((pos, len(word), INDIC2_MASK))
+
+        parts.append(word)
+        parts.append(u" ")
+        pos += len(word) + 1
+
+    return (u"".join(parts), syntaxTokens, spellTokens)
+
+
+def collect(collectorClass, text, tokens, defaultStyleNo):
+    collector = collectorClass(defaultStyleNo, text, bytelenSct_utf8)
+    for pos, length, styleNo in tokens:
+        collector.bindStyle(pos, length, styleNo)
+
+    return collector.value()
+
+
+def oldMerge(text, stylebytes, spellTokens):
+    spellStyleBytes = collect(OldStyleCollector, text, spellTokens, 0)
+
+    return "".join([chr(ord(a) | ord(b))
+            for a, b in itertools.izip(stylebytes, spellStyleBytes)])
+
+
+def newMerge(text, stylebytes, spellTokens):
+    stylebytes = bytearray(stylebytes)
+    orStyleMask(stylebytes, text, bytelenSct_utf8,
+            ((pos, length) for pos, length, styleNo in spellTokens),
+            INDIC2_MASK)
+
+    return str(stylebytes)
+
+
+def timeIt(fct, *args):
+    start = time.time()
+    result = fct(*args)
+    return (time.time() - start, result)
+
+
+def main():
+    if len(sys.argv) > 1:
+        size = int(float(sys.argv[1]) * 1000000)
+    else:
+        size = 1000000
+
+    for nonAscii in (False, True):
+        text, syntaxTokens, spellTokens = buildPage(size, nonAscii)
+        print "%i characters, %s" % (len(text),
+                "non-ASCII" if nonAscii else "ASCII only")
+
+        oldTime, oldBytes = timeIt(collect, OldStyleCollector, text,
+                syntaxTokens, 0)
+        newTime, newBytes = timeIt(collect, StyleCollector, text,
+                syntaxTokens, 0)
+        assert oldBytes == newBytes
+        print "    syntax styles: old %.3f s, new %.3f s" % (oldTime, newTime)
+
+        oldTime, oldResult = timeIt(oldMerge, text, oldBytes, spellTokens)
+        newTime, newResult = timeIt(newMerge, text, newBytes, spellTokens)
+        assert oldResult == newResult
+        print "    spell check merge: old %.3f s, new %.3f s" % (oldTime,
+                newTime)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the subtree query of the sqlite backends.
+
+Builds a synthetic relation graph (a random tree with some additional
+cross links and aliases) in a temporary "compact_sqlite" database and
+compares the recursive query of getAllSubWords() with the previous
+stepwise implementation.
+
+findBestPathFromWordToWord() (one query per level of parents) is compared
+with a variant using one recursive query (findBestPathRecursive()), both
+must find paths of the same length.
+
+Run from the WikidPad directory:  python benchmarkTreeQueries.py [<nodes>]
+"""
+
+import sys, os, time, random, shutil, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "lib"))
+
+from pwiki.wikidata.compact_sqlite import DbStructure
+from pwiki.wikidata.compact_sqlite.WikiData import WikiData
+import pwiki.sqlite3api as sqlite
+
+
+# Probability that a page gets an additional parent
+CROSS_LINK_RATIO = 0.05
+# Probability that a page has an alias, cross links to it use the alias then
+ALIAS_RATIO = 0.3
+
+
+class BenchWikiData(WikiData):
+    """
+    WikiData working on a database file without wiki document.
+    """
+    def __init__(self, dataDir):
+        self.wikiDocument = None
+        self.dataDir = dataDir
+        self.cachedWikiPageLinkTermDict = None
+        self.readerPool = None
+        self.writeConnWrap = DbStructure.ConnectWrapSyncCommit(
+                sqlite.connect(os.path.join(dataDir, u"wiki.sli")))
+
+        DbStructure.registerSqliteFunctions(self.connWrap)
+        DbStructure.registerUtf8Support(self.connWrap)
+        self.matchTermTrigramsAvailable = \
+                DbStructure.hasMatchTermTrigrams(self.connWrap)
+        self.recursiveCteAvailable = \
+                DbStructure.getSqliteLibVersion(self.connWrap) >= (3, 8, 3)
+        self._createTempTables()
+
+
+def pageName(i):
+    return u"Page%i" % i
+
+
+def buildGraph(wikiData, nodeCount):
+    """
+    Returns list of page names, the first one is the root of the tree
+    """
+    rnd = random.Random(4711)
+    words = [pageName(i) for i in xrange(nodeCount)]
+    linkTerms = list(words)
+    aliases = []
+
+    for i in xrange(1, nodeCount):
+        if rnd.random() < ALIAS_RATIO:
+            linkTerms[i] = u"Alias%i" % i
+            aliases.append((linkTerms[i], linkTerms[i].lower(), 2, words[i],
+                    -1, -1))
+
+    relations = set()
+    for i in xrange(1, nodeCount):
+        # Parents are near in numbering so the tree gets some depth
+        parent = rnd.randint(max(0, i - 20), i - 1)
+        relations.add((words[parent], words[i], 0))
+        if rnd.random() < CROSS_LINK_RATIO:
+            # May also create cycles
+            other = rnd.randint(0, nodeCount - 1)
+            relations.add((words[other], linkTerms[i], 0))
+
+    connWrap = wikiData.connWrap
+    connWrap.executemany("insert into wikiwordcontent(word, content, "
+            "modified, created, visited, metadataprocessed) "
+            "values (?, '', 0.0, 0.0, 0.0, 0)", [(w,) for w in words])
+    connWrap.executemany("insert or ignore into wikirelations(word, relation, "
+            "firstcharpos) values (?, ?, ?)", relations)
+    connWrap.executemany("insert into wikiwordmatchterms(matchterm, "
+            "matchtermnormcase, type, word, firstcharpos, charlength) "
+            "values (?, ?, ?, ?, ?, ?)", aliases)
+    connWrap.commit()
+
+    return words
+
+
+def findBestPathRecursive(wikiData, word, toWord, maxSteps):
+    """
+    Variant of findBestPathFromWordToWord() with one recursive query.
+    The parents are produced breadth-first ("order by" steps) and the query
+    stops at the first row reaching toWord. Each row carries the path so
+    far as string of words separated by character 1. Rows aren't unique
+    (a word reached on several ways appears several times), so the
+    number of steps must be limited by maxSteps for graphs with cycles.
+    """
+    if word == toWord:
+        return [word]
+
+    path = wikiData.connWrap.execSqlQuerySingleItem("""
+            with recursive parents(word, steps, path) as (
+                select word, 1, ? || char(1) || word from wikirelations
+                    where relation = ?
+                union all
+                select wikirelations.word, parents.steps + 1,
+                        parents.path || char(1) || wikirelations.word
+                    from parents inner join wikirelations on
+                        wikirelations.relation = parents.word
+                    where parents.steps < ?
+                    order by 2
+            )
+            select path from parents where word = ? limit 1
+            """, (word, word, maxSteps, toWord))
+
+    if path is None:
+        return []
+
+    return path.split(u"\x01")
+
+
+def isPath(wikiData, path):
+    """
+    Returns True if each word of path is a parent of the previous one.
+    """
+    for child, parent in zip(path, path[1:]):
+        if wikiData.connWrap.execSqlQuerySingleItem("select 1 from "
+                "wikirelations where word = ? and relation = ?",
+                (parent, child)) is None:
+            return False
+
+    return True
+
+
+def timeIt(fct, *args):
+    start = time.time()
+    result = fct(*args)
+    return (time.time() - start, result)
+
+
+def main():
+    if len(sys.argv) > 1:
+        nodeCount = int(sys.argv[1])
+    else:
+        nodeCount = 100000
+
+    dataDir = tempfile.mkdtemp()
+    try:
+        DbStructure.createWikiDB(None, dataDir)
+        wikiData = BenchWikiData(dataDir)
+        if not wikiData.recursiveCteAvailable:
+            print "sqlite library doesn't support recursive queries"
+            return
+
+        words = buildGraph(wikiData, nodeCount)
+        print "%i pages" % nodeCount
+
+        rnd = random.Random(815)
+        for startWord in [words[0]] + rnd.sample(words, 3):
+            for level in (-1, 3):
+                oldTime, oldResult = timeIt(wikiData._getAllSubWordsStepwise,
+                        [startWord], level)
+                newTime, newResult = timeIt(wikiData.getAllSubWords,
+                        [startWord], level)
+                assert oldResult == newResult
+                print "    subtree of %s, level %i (%i pages): " \
+                        "old %.3f s, new %.3f s" % (startWord, level,
+                        len(newResult), oldTime, newTime)
+
+        for word in rnd.sample(words, 5):
+            oldTime, oldPath = timeIt(wikiData.findBestPathFromWordToWord,
+                    word, words[0])
+            newTime, newPath = timeIt(findBestPathRecursive, wikiData,
+                    word, words[0], nodeCount)
+            assert len(oldPath) == len(newPath)
+            assert isPath(wikiData, newPath)
+            print "    path from %s to root (%i steps): level-wise %.3f s, " \
+                    "recursive %.3f s" % (word, len(oldPath) - 1, oldTime,
+                    newTime)
+
+        wikiData.connWrap.close()
+    finally:
+        shutil.rmtree(dataDir, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Correctness check for incremental parsing of page ASTs (see
+pwiki.IncrementalParsing).
+
+Builds a large synthetic page (or reads a page file, e.g. one of the
+help wiki) with the usual WikidPad markup including
+multi-line blocks ("<<pre", "<<hide", "<<", tables) and applies a series
+of edits to it: random insertions, deletions and replacements (also of
+bold and italics markup) and edits which add or remove block openers and
+">>" terminator lines. After each
+edit the AST built by reparseIncrementally() is compared with the AST of
+a full parse by verifyIncrementalParse(). As in the editor the AST of
+each step (the incremental one if it was correct) is the base for the
+next one.
+
+The check fails (exit code 1) if any incremental AST differs from the
+full one.
+
+Run from the WikidPad directory:
+    python checkIncrementalParsing.py [<edits> [<page paragraphs> | <file>]]
+"""
+
+import sys, os, time, random, codecs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "lib"))
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(2, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "extensions", "wikidPadParser"))
+
+# Normally installed by the i18n initialization of the application
+import __builtin__
+__builtin__.__dict__.setdefault("_", lambda s: s)
+__builtin__.__dict__.setdefault("N_", lambda s: s)
+
+import WikidPadParser
+from pwiki.ParseUtilities import WikiPageFormatDetails
+from pwiki import IncrementalParsing
+from pwiki.Utilities import DUMBTHREADSTOP
+
+
+LANGUAGE_NAME = WikidPadParser.WIKI_LANGUAGE_NAME
+
+# Snippets inserted by random text edits
+TEXT_SNIPPETS = (u"x", u" ", u"\n", u"\n\n", u"*", u"_", u"[", u"]",
+        u"Word", u"CamelCase", u"[a link]", u"+ ", u"    * ", u"[key: value]",
+        u"http://example.org ", u"\\", u"|")
+
+# Snippets inserted by block delimiter edits
+BLOCK_SNIPPETS = (u"<<", u">>", u"\n>>\n", u">>\n", u"\n<<pre\n",
+        u"<<hide ", u"<<hide\n", u"\n<<|\n", u"\n<<\n", u"<body>", u"<%",
+        u"%>")
+
+
+class CheckPage(object):
+    def __init__(self, wikiDocument, word):
+        self.wikiDocument = wikiDocument
+        self.word = word
+
+    def getWikiWord(self):
+        return self.word
+
+    def getWikiDocument(self):
+        return self.wikiDocument
+
+
+class CheckWikiDocument(object):
+    def getCcWordBlacklist(self):
+        return set()
+
+    def getNccWordBlacklist(self):
+        return set()
+
+
+def buildPage(paragraphCount):
+    rnd = random.Random(4711)
+    lines = [u"+ A large page", u""]
+    for p in xrange(paragraphCount):
+        kind = rnd.randint(0, 11)
+        if kind == 0:
+            lines += [u"<<pre", u"preformatted %i" % p, u"  *not bold*",
+                    u">>"]
+        elif kind == 1:
+            lines += [u"<<|", u"cell %i | cell" % p, u"cell | [link%i]" % p,
+                    u">>"]
+        elif kind == 2:
+            lines += [u"<<hide", u"hidden text %i" % p, u">>"]
+        elif kind == 3:
+            lines += [u"<<", u"no highlighting %i" % p, u">>"]
+        elif kind == 4:
+            lines += [u"++ Heading %i" % p]
+        elif kind == 5:
+            lines += [u"    * item %i" % p, u"    * item [key: value%i]" % p,
+                    u"        * sub item"]
+        elif kind == 6:
+            lines.append(u"Text with <<no *highlighting*>> in line %i" % p)
+        elif kind == 7:
+            lines.append(u"Some *bold* and _italic_ text in line %i" % p)
+        else:
+            lines.append(u"Some text with WikiWord%i and [a link|with title] "
+                    u"and http://example.org/%i and more text" % (p, p))
+        lines.append(u"")
+
+    return u"\n".join(lines)
+
+
+def randomEdit(rnd, text):
+    """
+    Returns text with a random edit applied. Two thirds are text edits,
+    one third changes block delimiters.
+    """
+    pos = rnd.randint(0, len(text))
+    kind = rnd.randint(0, 8)
+
+    if kind == 0:
+        # Delete
+        return text[:pos] + text[pos + rnd.randint(1, 40):]
+    elif kind == 1:
+        # Replace
+        return text[:pos] + rnd.choice(TEXT_SNIPPETS) + \
+                text[pos + rnd.randint(1, 10):]
+    elif kind == 2:
+        # Remove a ">>" terminator line
+        lineStart = text.find(u"\n>>", pos)
+        if lineStart == -1:
+            lineStart = text.find(u"\n>>")
+        if lineStart == -1:
+            return text
+        return text[:lineStart] + text[lineStart + 3:]
+    elif kind == 3:
+        # Remove a block opener
+        opener = rnd.choice((u"<<pre\n", u"<<|\n", u"<<hide\n", u"<<\n"))
+        openerStart = text.find(u"\n" + opener, pos)
+        if openerStart == -1:
+            return text
+        return text[:openerStart + 1] + text[openerStart + 1 + len(opener):]
+    elif kind == 4:
+        # Insert block delimiter
+        return text[:pos] + rnd.choice(BLOCK_SNIPPETS) + text[pos:]
+    else:
+        # Insert
+        return text[:pos] + rnd.choice(TEXT_SNIPPETS) + text[pos:]
+
+
+def main():
+    editCount = 200
+    paragraphCount = 300
+    pageFile = None
+    if len(sys.argv) > 1:
+        editCount = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        if sys.argv[2].isdigit():
+            paragraphCount = int(sys.argv[2])
+        else:
+            pageFile = sys.argv[2]
+
+    wikiDocument = CheckWikiDocument()
+    formatDetails = WikiPageFormatDetails(wikiDocument=wikiDocument,
+            basePage=CheckPage(wikiDocument, u"LargePage"),
+            wikiLanguageDetails=WikidPadParser.WikiLanguageDetails(None, None))
+    parser = WikidPadParser.parserFactory(LANGUAGE_NAME, False)
+
+    # Time needed by the last full parse of the current text
+    fullParseTime = [0.0]
+
+    def parseFct(text, threadstop):
+        start = time.time()
+        pageAst = parser.parse(LANGUAGE_NAME, text, formatDetails,
+                threadstop=threadstop)
+        if text is newText[0]:
+            fullParseTime[0] = time.time() - start
+        return pageAst
+
+    newText = [None]
+
+    if pageFile is None:
+        text = buildPage(paragraphCount)
+    else:
+        fp = codecs.open(pageFile, "r", "utf-8-sig")
+        try:
+            text = fp.read().replace(u"\r\n", u"\n")
+        finally:
+            fp.close()
+
+    pageAst = parseFct(text, DUMBTHREADSTOP)
+    print "Page with %i characters, %i edits" % (len(text), editCount)
+
+    rnd = random.Random(815)
+    incCount = 0
+    mismatchCount = 0
+    incTime = 0.0
+    fullTime = 0.0
+
+    for i in xrange(editCount):
+        newText[0] = randomEdit(rnd, text)
+
+        start = time.time()
+        incAst, fullAst, equal = IncrementalParsing.verifyIncrementalParse(
+                text, pageAst, newText[0], parseFct)
+        verifyTime = time.time() - start
+        fullTime += fullParseTime[0]
+
+        if incAst is not None:
+            incCount += 1
+            incTime += verifyTime - fullParseTime[0]
+        else:
+            # Caller has to parse fully after the check
+            incTime += verifyTime
+
+        if not equal:
+            mismatchCount += 1
+            start, oldEnd, newEnd = IncrementalParsing.findChangedRange(
+                    text, newText[0])
+            print "    MISMATCH at edit %i: %r -> %r" % (i,
+                    text[start:oldEnd], newText[0][start:newEnd])
+
+        text = newText[0]
+        if incAst is not None and equal:
+            pageAst = incAst
+        else:
+            pageAst = fullAst
+
+    print "    %i edits parsed incrementally, %i by full parse" % (incCount,
+            editCount - incCount)
+    print "    incremental (with fallbacks) %.2f s, always full parse " \
+            "%.2f s" % (incTime, fullTime)
+
+    if mismatchCount > 0:
+        print "    FAILED: %i mismatches" % mismatchCount
+        sys.exit(1)
+
+    print "    OK"
+
+
+if __name__ == "__main__":
+    main()
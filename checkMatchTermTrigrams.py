@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Check that the trigram index of the match terms (table "matchtermtrigrams"
+of the sqlite backends) stays consistent with table "wikiwordmatchterms".
+
+For each sqlite backend a temporary database is filled with pages and
+match terms (page names, aliases and headings, some of them equal to the
+page name except for case). Then pages are renamed, deleted and get new
+match terms and finally the wiki is rebuilt. After each step the rows of
+"matchtermtrigrams" must be exactly the trigrams of the distinct match
+terms of each page (each row once) and getWikiWordMatchTermsWith() must
+return the same with and without the trigram index and the prefix range.
+
+Run from the WikidPad directory:
+    python checkMatchTermTrigrams.py [<pages>]
+"""
+
+import sys, os, random, shutil, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "lib"))
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
+
+# Normally installed by the i18n initialization of the application
+import __builtin__
+__builtin__.__dict__.setdefault("_", lambda s: s)
+__builtin__.__dict__.setdefault("N_", lambda s: s)
+
+import Consts
+import pwiki.sqlite3api as sqlite
+from pwiki.StringOps import utf8Enc, utf8Dec
+from pwiki.Localization import getCCollator
+
+
+# Tuples (backend name, table with the page names, database file name)
+BACKENDS = (("compact_sqlite", "wikiwordcontent", u"wiki.sli"),
+        ("original_sqlite", "wikiwords", u"wikiovw.sli"))
+
+ROOT_WORD = u"WikiRoot"
+
+SYNC_TYPE = Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK | \
+        Consts.WIKIWORDMATCHTERMS_TYPE_FROM_WORD | \
+        Consts.WIKIWORDMATCHTERMS_TYPE_SYNCUPDATE
+
+ALIAS_TYPE = Consts.WIKIWORDMATCHTERMS_TYPE_EXPLICIT_ALIAS | \
+        Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK | \
+        Consts.WIKIWORDMATCHTERMS_TYPE_FROM_ATTRIBUTES
+
+HEADING_TYPE = Consts.WIKIWORDMATCHTERMS_TYPE_FROM_CONTENT
+
+
+class _CheckDocument(object):
+    def getWikiName(self):
+        return ROOT_WORD
+
+    def getCollator(self):
+        return getCCollator()
+
+
+def importBackend(backend):
+    """
+    Returns tuple (DbStructure module, WikiData class) of backend.
+    """
+    DbStructure = __import__("pwiki.wikidata.%s.DbStructure" % backend,
+            fromlist=["DbStructure"])
+    WikiData = __import__("pwiki.wikidata.%s.WikiData" % backend,
+            fromlist=["WikiData"]).WikiData
+
+    return DbStructure, WikiData
+
+
+def createWikiData(backend, dataDir):
+    """
+    Create database of backend in dataDir and return a WikiData object
+    working on it without wiki document. Page content is not stored (there
+    is only an entry in the table of page names).
+    """
+    backend, pageTable, dbFileName = [b for b in BACKENDS
+            if b[0] == backend][0]
+    DbStructure, WikiData = importBackend(backend)
+
+    class CheckWikiData(WikiData):
+        def __init__(self):
+            self.wikiDocument = _CheckDocument()
+            self.dataDir = dataDir
+            self.cachedWikiPageLinkTermDict = None
+            self.readerPool = None
+            self.writeConnWrap = DbStructure.ConnectWrapSyncCommit(
+                    sqlite.connect(os.path.join(dataDir, dbFileName)))
+
+            DbStructure.registerSqliteFunctions(self.connWrap)
+            DbStructure.registerUtf8Support(self.connWrap)
+            self.contentDbToOutput = lambda c: utf8Dec(c, "replace")[0]
+            self.contentUniInputToDb = lambda u: utf8Enc(u, "replace")[0]
+            self.matchTermTrigramsAvailable = \
+                    DbStructure.hasMatchTermTrigrams(self.connWrap)
+
+        def addPages(self, words):
+            self.connWrap.executemany("insert into %s(word, created, "
+                    "modified, visited, metadataprocessed) "
+                    "values (?, 0.0, 0.0, 0.0, 0)" % pageTable,
+                    [(w,) for w in words])
+
+        def _renameContent(self, oldWord, newWord):
+            self.connWrap.execSql("update %s set word = ? where word = ?" %
+                    pageTable, (newWord, oldWord))
+            self.cachedWikiPageLinkTermDict = None
+
+        def _deleteContent(self, word):
+            self.connWrap.execSql("delete from %s where word = ?" %
+                    pageTable, (word,))
+            self.cachedWikiPageLinkTermDict = None
+
+    DbStructure.createWikiDB(None, dataDir)
+    return CheckWikiData()
+
+
+def pageName(i):
+    return u"Page%iName" % i
+
+
+def setSyncTerms(wikiData, word):
+    # As WikiPage.refreshSyncUpdateMatchTerms()
+    wikiData.updateWikiWordMatchTerms(word, [(word, SYNC_TYPE, word, -1, 0)],
+            syncUpdate=True)
+
+
+def setOtherTerms(wikiData, word, rnd, variant):
+    terms = [(u"Alias%i%s" % (rnd.randint(0, 10 ** 6), variant), ALIAS_TYPE,
+            word, -1, 0)]
+    if rnd.random() < 0.5:
+        # Heading equal to page name except for case
+        terms.append((word.upper(), HEADING_TYPE, word, 0, len(word)))
+    if rnd.random() < 0.5:
+        # Two terms with same normcase
+        terms.append((u"Heading " + variant, HEADING_TYPE, word, 10, 12))
+        terms.append((u"HEADING " + variant, HEADING_TYPE, word, 30, 12))
+
+    wikiData.updateWikiWordMatchTerms(word, terms, syncUpdate=False)
+
+
+def findTrigramMismatches(wikiData, DbStructure):
+    """
+    Returns list of descriptions of differences between the rows of
+    "matchtermtrigrams" and the trigrams of the distinct match terms of
+    each page.
+    """
+    expected = {}
+    for word, mtnc in wikiData.connWrap.execSqlQuery("select distinct word, "
+            "matchtermnormcase from wikiwordmatchterms"):
+        for tg in DbStructure.getTrigrams(mtnc):
+            expected[(tg, mtnc, word)] = 1
+
+    actual = {}
+    for row in wikiData.connWrap.execSqlQuery("select trigram, "
+            "matchtermnormcase, word from matchtermtrigrams"):
+        row = tuple(row)
+        actual[row] = actual.get(row, 0) + 1
+
+    mismatches = []
+    for row in sorted(set(expected) | set(actual)):
+        if expected.get(row, 0) != actual.get(row, 0):
+            mismatches.append("%r: expected %i, found %i" % (row,
+                    expected.get(row, 0), actual.get(row, 0)))
+
+    return mismatches
+
+
+def getMatchTermsWith(wikiData, DbStructure, searchStr, useIndices):
+    """
+    Call getWikiWordMatchTermsWith(), if useIndices is False without trigram
+    index and prefix range (scanning all match terms as before both existed).
+    """
+    trigramsAvailable = wikiData.matchTermTrigramsAvailable
+    getPrefixRangeCondition = DbStructure.getPrefixRangeCondition
+    if not useIndices:
+        wikiData.matchTermTrigramsAvailable = False
+        DbStructure.getPrefixRangeCondition = lambda prefix: None
+    try:
+        return wikiData.getWikiWordMatchTermsWith(searchStr)
+    finally:
+        wikiData.matchTermTrigramsAvailable = trigramsAvailable
+        DbStructure.getPrefixRangeCondition = getPrefixRangeCondition
+
+
+def findQueryMismatches(wikiData, DbStructure, searchStrings):
+    """
+    Returns list of search strings for which getWikiWordMatchTermsWith()
+    returns different results with and without trigram index and prefix
+    range.
+    """
+    mismatches = []
+    for searchStr in searchStrings:
+        if sorted(getMatchTermsWith(wikiData, DbStructure, searchStr,
+                True)) != sorted(getMatchTermsWith(wikiData, DbStructure,
+                searchStr, False)):
+            mismatches.append(searchStr)
+
+    return mismatches
+
+
+def checkBackend(backend, pageCount):
+    """
+    Returns True if no mismatch was found.
+    """
+    DbStructure = importBackend(backend)[0]
+    dataDir = tempfile.mkdtemp(prefix="checkTrigrams")
+    try:
+        wikiData = createWikiData(backend, dataDir)
+        rnd = random.Random(4711)
+        words = [ROOT_WORD] + [pageName(i) for i in xrange(pageCount)]
+        searchStrings = [u"", u"p", u"ame", u"page1", u"heading",
+                u"alias1", u"e1n", u"xyz", u"ge12", u"name", u"1name",
+                u"heading a", u"*", u"[a]", u"\xe4", u"page\uffff"]
+
+        def check(step):
+            wikiData.commit()
+            mismatches = findTrigramMismatches(wikiData, DbStructure)
+            queryMismatches = findQueryMismatches(wikiData, DbStructure,
+                    searchStrings)
+            print "    %-28s %i trigram rows, %i mismatches, " \
+                    "%i query mismatches" % (step,
+                    wikiData.connWrap.execSqlQuerySingleItem(
+                    "select count(*) from matchtermtrigrams"),
+                    len(mismatches), len(queryMismatches))
+            for m in mismatches[:10]:
+                print "        " + m
+            for s in queryMismatches:
+                print "        query %r" % s
+
+            return len(mismatches) == 0 and len(queryMismatches) == 0
+
+        ok = True
+
+        wikiData.addPages(words)
+        for word in words:
+            setSyncTerms(wikiData, word)
+            setOtherTerms(wikiData, word, rnd, u"a")
+        ok &= check("filled")
+
+        for word in rnd.sample(words[1:], pageCount // 10):
+            toWord = u"Renamed" + word
+            wikiData.renameWord(word, toWord)
+            setSyncTerms(wikiData, toWord)
+            words[words.index(word)] = toWord
+        ok &= check("after renaming")
+
+        for word in rnd.sample(words[1:], pageCount // 10):
+            wikiData.deleteWord(word)
+            words.remove(word)
+        ok &= check("after deleting")
+
+        for word in rnd.sample(words, pageCount // 10):
+            setOtherTerms(wikiData, word, rnd, u"b")
+        ok &= check("after updating")
+
+        wikiData.cleanupAfterRebuild(None)
+        ok &= check("after rebuild")
+
+        wikiData.connWrap.close()
+        return ok
+    finally:
+        shutil.rmtree(dataDir, True)
+
+
+def main():
+    pageCount = 2000
+    if len(sys.argv) > 1:
+        pageCount = int(sys.argv[1])
+
+    ok = True
+    for backend, pageTable, dbFileName in BACKENDS:
+        print "%s, %i pages" % (backend, pageCount)
+        ok &= checkBackend(backend, pageCount)
+
+    if not ok:
+        print "Check failed"
+        sys.exit(1)
+
+    print "Check passed"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Check that the start of the application doesn't import more than needed.
+
+Imports pwiki.PersonalWikiFrame like MainApp does before the first frame
+is shown and counts the WikidPad modules (modules loaded from the WikidPad
+directory) which were imported. The check fails if the count exceeds the
+budget or if one of the modules which should only be loaded on first use
+(see Utilities.lazyImport()) was imported.
+
+With option -v the import times are printed (see pwiki.ImportProfiler).
+
+Run from the WikidPad directory:
+    python checkStartupImports.py [-v] [<budget>]
+"""
+
+import sys, os
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(APP_DIR, "lib"))
+sys.path.insert(1, APP_DIR)
+
+# Normally installed by the i18n initialization of the application
+import __builtin__
+__builtin__.__dict__.setdefault("_", lambda s: s)
+__builtin__.__dict__.setdefault("N_", lambda s: s)
+
+from pwiki import ImportProfiler
+
+
+# Maximum number of WikidPad modules imported before the first frame
+DEFAULT_BUDGET = 70
+
+# Modules which must not be imported at startup
+DEFERRED_MODULES = (
+        "gadfly",
+        "pwiki.Exporters",
+        "pwiki.ParallelSearch",
+        "pwiki.WorkerProcesses",
+        "pwiki.AdditionalDialogs",
+        "pwiki.OptionsDialog",
+        "pwiki.Printing",
+        "pwiki.wikidata.WikiData_original_gadfly",
+        "pwiki.wikidata.WikiData_original_sqlite",
+        "pwiki.wikidata.WikiData_compact_sqlite",
+        "whoosh",
+    )
+
+
+def isAppModule(module):
+    path = getattr(module, "__file__", None)
+    if path is None:
+        return False
+
+    return os.path.abspath(path).startswith(APP_DIR + os.sep)
+
+
+def main():
+    args = sys.argv[1:]
+    verbose = "-v" in args
+    if verbose:
+        args.remove("-v")
+
+    budget = DEFAULT_BUDGET
+    if args:
+        budget = int(args[0])
+
+    before = set(sys.modules)
+    ImportProfiler.install()
+    import pwiki.PersonalWikiFrame
+    ImportProfiler.getProfiler().uninstall()
+
+    newModules = [name for name in set(sys.modules) - before
+            if sys.modules[name] is not None]
+    appModules = [name for name in newModules if isAppModule(sys.modules[name])]
+
+    if verbose:
+        print ImportProfiler.getProfiler().getReport(limit=30)
+
+    print "%i modules imported, %i WikidPad modules (budget %i)" % (
+            len(newModules), len(appModules), budget)
+
+    failed = False
+    if len(appModules) > budget:
+        print "    FAILED: budget exceeded"
+        failed = True
+
+    for name in DEFERRED_MODULES:
+        if sys.modules.get(name) is not None:
+            print "    FAILED: %s imported at startup" % name
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+    print "    OK"
+
+
+if __name__ == "__main__":
+    main()
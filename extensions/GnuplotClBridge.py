@@ -4,6 +4,7 @@ import subprocess
 import wx
 
 from pwiki.TempFileSet import createTempFile
+from pwiki.RenderCache import createRenderedContent
 from pwiki.StringOps import mbcsEnc, mbcsDec, lineendToOs
 
 WIKIDPAD_PLUGIN = (("InsertionByKey", 1), ("Options", 1))
@@ -91,19 +92,35 @@ class GptHandler:
             return u'<pre>' + _(u'[Please set path to Gnuplot executable]') +\
                     u'</pre>'
 
-        # Get exporters temporary file set (manages creation and deletion of
-        # temporary files)
-        tfs = exporter.getTempFileSet()
+        noError = u"noerror" in [a.strip() for a in insToken.appendices]
+        source = insToken.value
 
-        pythonUrl = (exportType != "html_previewWX")
-        dstFullPath = tfs.createTempFile("", ".png", relativeTo="")
-        url = tfs.getRelativeUrl(None, dstFullPath, pythonUrl=pythonUrl)
-        
-        baseDir = os.path.dirname(exporter.getMainControl().getWikiConfigPath())
+        def buildHtml(url):
+            # Return appropriate HTML code for the image
+            if exportType == "html_previewWX":
+                # Workaround for internal HTML renderer
+                return (u'<img src="%s" border="0" align="bottom" alt="gnuplot" />'
+                        u'&nbsp;') % url
+            else:
+                return u'<img src="%s" border="0" align="bottom" alt="gnuplot" />' \
+                        % url
+
+        # The image is taken from the render cache or the external application
+        # runs in a worker thread
+        return createRenderedContent(exporter, exportType, self.extAppExe,
+                ("png", noError), mbcsEnc(source, "replace")[0], ".png",
+                lambda dstFullPath: self.renderImage(source, dstFullPath,
+                noError), buildHtml)
 
+
+    def renderImage(self, source, dstFullPath, noError):
+        """
+        Run Gnuplot to create image file dstFullPath from source code.
+        Returns None on success or HTML with error message.
+        """
         # Prepend source code with appropriate settings for PNG output
         srcCode = ("set terminal png\nset output '%s'\n" % dstFullPath) + \
-                insToken.value
+                source
 
         # Retrieve quoted content of the insertion
         bstr = lineendToOs(mbcsEnc(srcCode, "replace")[0])
@@ -125,13 +142,14 @@ class GptHandler:
             popenObject.stdin.close()
             popenObject.stdout.close()
 
-            if u"noerror" in [a.strip() for a in insToken.appendices]:
+            if noError:
                 childErr.read()
                 errResponse = ""
             else:
                 errResponse = childErr.read()
             
             childErr.close()
+            popenObject.wait()
         finally:
             os.unlink(srcfilepath)
             
@@ -140,14 +158,7 @@ class GptHandler:
             return u'<pre>' + _(u'[Gnuplot error: %s]') % errResponse +\
                     u'</pre>'
 
-        # Return appropriate HTML code for the image
-        if exportType == "html_previewWX":
-            # Workaround for internal HTML renderer
-            return (u'<img src="%s" border="0" align="bottom" alt="gnuplot" />'
-                    u'&nbsp;') % url
-        else:
-            return u'<img src="%s" border="0" align="bottom" alt="gnuplot" />' \
-                    % url
+        return None
 
 
     def getExtraFeatures(self):
@@ -4,6 +4,7 @@ import subprocess
 import wx
 
 from pwiki.TempFileSet import createTempFile
+from pwiki.RenderCache import createRenderedContent
 from pwiki.StringOps import mbcsEnc, mbcsDec, utf8Enc, lineendToOs
 
 WIKIDPAD_PLUGIN = (("InsertionByKey", 1), ("Options", 1))
@@ -106,14 +107,32 @@ class GraphVizBaseHandler:
             return u'<pre>' + _(u'[Please set path to GraphViz executables]') + \
                     '</pre>'
 
-        # Get exporters temporary file set (manages creation and deletion of
-        # temporary files)
-        tfs = exporter.getTempFileSet()
+        noError = u"noerror" in [a.strip() for a in insToken.appendices]
+
+        def buildHtml(url):
+            # Return appropriate HTML code for the image
+            if exportType == "html_previewWX":
+                # Workaround for internal HTML renderer
+                return (u'<img src="%s" border="0" align="bottom" alt="formula" />'
+                        u'&nbsp;') % url
+            else:
+                return u'<img src="%s" border="0" align="bottom" alt="formula" />' \
+                        % url
+
+        # The image is taken from the render cache or the external application
+        # runs in a worker thread
+        return createRenderedContent(exporter, exportType, self.extAppExe,
+                ("-Tpng", noError), bstr, ".png",
+                lambda dstFullPath: self.renderImage(bstr, dstFullPath, noError),
+                buildHtml)
 
-        pythonUrl = (exportType != "html_previewWX")
-        dstFullPath = tfs.createTempFile("", ".png", relativeTo="")
-        url = tfs.getRelativeUrl(None, dstFullPath, pythonUrl=pythonUrl)
 
+    def renderImage(self, bstr, dstFullPath, noError):
+        """
+        Run external application to create image file dstFullPath from
+        source bytestring bstr. Returns None on success or HTML with error
+        message.
+        """
         # Store token content in a temporary file
         srcfilepath = createTempFile(bstr, ".dot")
         try:
@@ -132,13 +151,14 @@ class GraphVizBaseHandler:
             popenObject.stdin.close()
             popenObject.stdout.close()
 
-            if u"noerror" in [a.strip() for a in insToken.appendices]:
+            if noError:
                 childErr.read()
                 errResponse = ""
             else:
                 errResponse = childErr.read()
             
             childErr.close()
+            popenObject.wait()
         finally:
             os.unlink(srcfilepath)
             
@@ -148,15 +168,7 @@ class GraphVizBaseHandler:
             return u'<pre>' + _(u'[%s Error: %s]') % (appname, errResponse) +\
                      u'</pre>'
 
-
-        # Return appropriate HTML code for the image
-        if exportType == "html_previewWX":
-            # Workaround for internal HTML renderer
-            return (u'<img src="%s" border="0" align="bottom" alt="formula" />'
-                    u'&nbsp;') % url
-        else:
-            return u'<img src="%s" border="0" align="bottom" alt="formula" />' \
-                    % url
+        return None
 
 
     def getExtraFeatures(self):
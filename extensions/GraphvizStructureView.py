@@ -13,6 +13,7 @@ from pwiki.wxHelper import copyTextToClipboard, GUI_ID
 
 
 from pwiki.TempFileSet import createTempFile, TempFileSet
+from pwiki.RenderCache import createRenderedContent, renderToFile
 from pwiki.StringOps import mbcsEnc, mbcsDec, utf8Enc, lineendToOs, uniToGui, \
         joinRegexes, rgbToHtmlColor, escapeHtmlNoBreaks
 from pwiki.AdditionalDialogs import FontFaceDialog
@@ -296,26 +297,43 @@ class GraphVizBaseHandler:
             # Nothing in, nothing out
             return u""
 
-        response, url = self.createImage(exporter.getTempFileSet(), exportType,
-                source, insToken.appendices)
-
-        if response is not None:
-            return u'<pre>' + (u'[%s]' % response)+ \
+        if self.extAppExe == "":
+            # No path to executable -> show message
+            return u'<pre>' + (u'[%s]' %
+                    u"Please set path to GraphViz executables in options") + \
                     '</pre>'
 
-        # Return appropriate HTML code for the image
-        if exportType == "html_previewWX":
-            # Workaround for internal HTML renderer
-            return (u'<img src="%s" border="0" align="bottom" alt="formula" />'
-                    u'&nbsp;') % url
-        else:
-            return u'<img src="%s" border="0" align="bottom" alt="formula" />' \
-                    % url
+        source = lineendToOs(utf8Enc(source, "replace")[0])
+        noError = u"noerror" in [a.strip() for a in insToken.appendices]
+
+        def render(dstFullPath):
+            response = self.renderImage(source, dstFullPath, noError)
+            if response is not None:
+                return u'<pre>' + (u'[%s]' % response)+ \
+                        '</pre>'
+            return None
+
+        def buildHtml(url):
+            # Return appropriate HTML code for the image
+            if exportType == "html_previewWX":
+                # Workaround for internal HTML renderer
+                return (u'<img src="%s" border="0" align="bottom" alt="formula" />'
+                        u'&nbsp;') % url
+            else:
+                return u'<img src="%s" border="0" align="bottom" alt="formula" />' \
+                        % url
+
+        # The image is taken from the render cache or the external application
+        # runs in a worker thread
+        return createRenderedContent(exporter, exportType, self.extAppExe,
+                ("-Tpng", noError), source, ".png", render, buildHtml)
 
 
 
     def createImage(self, tempFileSet, exportType, source, insParams):
         """
+        Create image from graph source. Returns tuple (response, url) with
+        either an error message as response or the URL of the image.
         """
         # Retrieve quoted content of the insertion
         
@@ -332,6 +350,22 @@ class GraphVizBaseHandler:
         dstFullPath = tfs.createTempFile("", ".png", relativeTo="")
         url = tfs.getRelativeUrl(None, dstFullPath, pythonUrl=pythonUrl)
 
+        noError = u"noerror" in [a.strip() for a in insParams]
+        response = renderToFile(self.extAppExe, ("-Tpng", noError), source,
+                ".png", lambda dstFullPath: self.renderImage(source,
+                dstFullPath, noError), dstFullPath)
+
+        if response is not None:
+            return response, None
+
+        return None, url
+
+
+    def renderImage(self, source, dstFullPath, noError):
+        """
+        Run external application to create image file dstFullPath from
+        source bytestring. Returns None on success or error message.
+        """
         # Store token content in a temporary file
         srcfilepath = createTempFile(source, ".dot")
         try:
@@ -350,22 +384,23 @@ class GraphVizBaseHandler:
             popenObject.stdin.close()
             popenObject.stdout.close()
 
-            if u"noerror" in [a.strip() for a in insParams]:
+            if noError:
                 childErr.read()
                 errResponse = None
             else:
                 errResponse = childErr.read()
             
             childErr.close()
+            popenObject.wait()
         finally:
             os.unlink(srcfilepath)
 
         if errResponse is not None and errResponse != "":
             appname = mbcsDec(self.EXAPPNAME, "replace")[0]
             errResponse = mbcsDec(errResponse, "replace")[0]
-            return (_(u"%s Error: %s") % (appname, errResponse)), None
+            return _(u"%s Error: %s") % (appname, errResponse)
 
-        return None, url
+        return None
 
 
 
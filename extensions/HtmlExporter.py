@@ -24,6 +24,8 @@ from pwiki.StringOps import *
 from pwiki import StringOps, Serialization
 from pwiki.WikiPyparsing import StackedCopyDict, SyntaxNode, buildSyntaxNode
 from pwiki.TempFileSet import TempFileSet
+from pwiki.ImageDimensions import probeImageDims, getImageDimsCache
+from pwiki.ParallelParsing import ParallelPageParser
 
 from pwiki.SearchAndReplace import SearchReplaceOperation, ListWikiPagesOperation, \
         ListItemWithSubtreeWikiPagesNode
@@ -419,6 +421,10 @@ class TableCell(object):
 # TODO UTF-8 support for HTML? Other encodings?
 
 class HtmlExporter(AbstractExporter):
+    # Milliseconds to wait after a change before continuous "html_multi"
+    # export rewrites the file, further changes in between are coalesced
+    CONTINUOUS_MULTI_EXPORT_DELAY = 1000
+
     def __init__(self, mainControl):
         """
         mainControl -- PersonalWikiFrame object. Part of "Exporters" plugin API
@@ -440,6 +446,17 @@ class HtmlExporter(AbstractExporter):
         self.avoidDeadWikiLinks = True  # avoid links to not exported wikiwords
         self.listPagesOperation = None
 
+        # Only used by continuous "html_multi" export. Dictionary from wiki
+        # word to tuple (liveTextPlaceHold, formatDetails, formatted content,
+        # set of linked words) of pages which don't need to be formatted again
+        self.multiFragmentCache = None
+        # Set of words linked by the page currently formatted for the
+        # multiFragmentCache and flag if formatted content can be cached
+        self.fragmentLinkedWords = None
+        self.fragmentCacheable = True
+        # wx.CallLater object of a pending continuous "html_multi" export
+        self.continuousExportCall = None
+
         self.wordAnchor = None  # For multiple wiki pages in one HTML page, this contains the anchor
                 # of the current word.
         self.tempFileSet = None
@@ -448,6 +465,9 @@ class HtmlExporter(AbstractExporter):
 #         self.convertFilename = removeBracketsFilename   # lambda s: mbcsEnc(s, "replace")[0]
 
         self.result = None
+        # Dictionary {placeholder string in self.result: RenderJob} of
+        # deferred insertion content, see getOutput()
+        self.deferredContents = None
         
         # Flag to control how to push output into self.result
         self.outFlagEatPostBreak = False
@@ -680,6 +700,7 @@ class HtmlExporter(AbstractExporter):
         # are not handled in this function
 
         wx.GetApp().getInsertionPluginManager().taskEnd()
+        getImageDimsCache().save()
 
         if self.referencedStorageFiles is not None:
             # Some files must be available
@@ -717,6 +738,9 @@ class HtmlExporter(AbstractExporter):
         
         self.listPagesOperation.beginWikiSearch(wikiDocument)
 
+        if exportType == u"html_multi":
+            self.multiFragmentCache = {}
+
         # Initially static export
         self.export(wikiDocument, wordList, exportType, exportDest,
             compatFilenames, addOpt, progressHandler, tempFileSetReset=False)
@@ -737,6 +761,12 @@ class HtmlExporter(AbstractExporter):
         self.avoidDeadWikiLinks = True
         self.__sinkWikiDocument.disconnect()
 
+        if self.continuousExportCall is not None:
+            self.continuousExportCall.Stop()
+            self.continuousExportCall = None
+
+        self.multiFragmentCache = None
+
         self.tempFileSet.reset()
         self.tempFileSet = None
         self.copiedTempFileCache = None
@@ -751,7 +781,8 @@ class HtmlExporter(AbstractExporter):
         self.wordList.remove(wikiWord)
         
         if self.exportType == u"html_multi":
-            self.exportHtmlMultiFile()
+            self._invalidateMultiFragments((wikiWord,))
+            self._queueHtmlMultiFileExport()
 
         elif self.exportType == u"html_single":
             self._exportHtmlSingleFiles([])
@@ -776,7 +807,8 @@ class HtmlExporter(AbstractExporter):
 
 
         if self.exportType == u"html_multi":
-            self.exportHtmlMultiFile()
+            self._invalidateMultiFragments((oldWord, newWord))
+            self._queueHtmlMultiFileExport()
 
         elif self.exportType == u"html_single":
             if newInList:
@@ -813,7 +845,10 @@ class HtmlExporter(AbstractExporter):
 
         try:
             if self.exportType == u"html_multi":
-                self.exportHtmlMultiFile()
+                # Pages linking to this one may show its "short_hint"
+                self._invalidateMultiFragments([wikiWord] +
+                        wikiPage.getAttributes().get(u"alias", []))
+                self._queueHtmlMultiFileExport()
     
             elif self.exportType == u"html_single":
                 self._exportHtmlSingleFiles(updList)
@@ -821,6 +856,47 @@ class HtmlExporter(AbstractExporter):
             pass
 
 
+    def _invalidateMultiFragments(self, words):
+        """
+        Remove cached formatted content of the pages words and of all pages
+        linking to them.
+        """
+        if self.multiFragmentCache is None:
+            return
+
+        words = set(words)
+        for word, entry in self.multiFragmentCache.items():
+            if word in words or not words.isdisjoint(entry[3]):
+                del self.multiFragmentCache[word]
+
+
+    def _queueHtmlMultiFileExport(self):
+        """
+        Rewrite the "html_multi" file of a continuous export after a short
+        delay. If an export is already pending, nothing is done.
+        """
+        if self.continuousExportCall is not None and \
+                self.continuousExportCall.IsRunning():
+            return
+
+        self.continuousExportCall = wx.CallLater(
+                self.CONTINUOUS_MULTI_EXPORT_DELAY,
+                self._runQueuedHtmlMultiFileExport)
+
+
+    def _runQueuedHtmlMultiFileExport(self):
+        self.continuousExportCall = None
+
+        if self.listPagesOperation is None:
+            # Continuous export was stopped in the meantime
+            return
+
+        try:
+            self.exportHtmlMultiFile()
+        except WikiWordNotFoundException:
+            pass
+
+
 
     def getTempFileSet(self):
         return self.tempFileSet
@@ -925,7 +1001,7 @@ class HtmlExporter(AbstractExporter):
 #                 formatDetails = wikiPage.getFormatDetails()
                     
                 self.wordAnchor = _escapeAnchor(word)
-                formattedContent = self.formatContent(wikiPage)
+                formattedContent = self._formatContentMultiCached(wikiPage)
                 
                 if self.avoidDeadWikiLinks:
                     parentLinks = self.getParentLinks(wikiPage, False,
@@ -958,6 +1034,42 @@ class HtmlExporter(AbstractExporter):
         return outputFile
 
 
+    def _formatContentMultiCached(self, wikiPage):
+        """
+        Same as formatContent(wikiPage) but uses and fills the
+        multiFragmentCache if it exists.
+        """
+        if self.multiFragmentCache is None:
+            return self.formatContent(wikiPage)
+
+        word = wikiPage.getWikiWord()
+        with wikiPage.textOperationLock:
+            liveTextPlaceHold = wikiPage.liveTextPlaceHold
+        formatDetails = wikiPage.getFormatDetails()
+
+        entry = self.multiFragmentCache.get(word)
+        if entry is not None and entry[0] is liveTextPlaceHold and \
+                entry[1].isEquivTo(formatDetails):
+            return entry[2]
+
+        self.fragmentLinkedWords = set()
+        self.fragmentCacheable = True
+        try:
+            formattedContent = self.formatContent(wikiPage)
+
+            if self.fragmentCacheable and \
+                    liveTextPlaceHold is wikiPage.liveTextPlaceHold:
+                self.multiFragmentCache[word] = (liveTextPlaceHold,
+                        formatDetails, formattedContent,
+                        self.fragmentLinkedWords)
+            else:
+                self.multiFragmentCache.pop(word, None)
+        finally:
+            self.fragmentLinkedWords = None
+
+        return formattedContent
+
+
     def _exportHtmlSingleFiles(self, wordListToUpdate):
         self.setLinkConverter(LinkConverterForHtmlSingleFilesExport(
                 self.wikiDocument, self))
@@ -1008,16 +1120,23 @@ class HtmlExporter(AbstractExporter):
             self.progressHandler.open(len(self.wordList))
             step = 0
 
-        for word in wordListToUpdate:
-            if self.progressHandler is not None:
-                step += 1
-                self.progressHandler.update(step, _(u"Exporting %s") % word)
+        # Pages are parsed in worker processes ahead of the export loop
+        pageParser = ParallelPageParser(self.wikiDocument,
+                self.mainControl.getConfig().getint("main",
+                "html_export_parseProcessCount", -1))
+        try:
+            for word in pageParser.iterPreparsedWords(wordListToUpdate):
+                if self.progressHandler is not None:
+                    step += 1
+                    self.progressHandler.update(step, _(u"Exporting %s") % word)
 
-            wikiPage = self.wikiDocument.getWikiPage(word)
-            if not self.shouldExport(word, wikiPage):
-                continue
+                wikiPage = self.wikiDocument.getWikiPage(word)
+                if not self.shouldExport(word, wikiPage):
+                    continue
 
-            self.exportWordToHtmlPage(self.exportDest, word, False)
+                self.exportWordToHtmlPage(self.exportDest, word, False)
+        finally:
+            pageParser.close()
 
         self.copyCssFiles(self.exportDest)
         rootFile = join(self.exportDest,
@@ -1430,6 +1549,7 @@ class HtmlExporter(AbstractExporter):
         self.wikiWord = word
 
         self.result = []
+        self.deferredContents = {}
         self.optsStack = StackedCopyDict()
         self.insertionVisitStack = []
         self.astNodeStack = []
@@ -1471,9 +1591,29 @@ class HtmlExporter(AbstractExporter):
         if self.asHtmlPreview and facename:
             self.outAppend('</font>')
 
+        if self.asHtmlPreview:
+            # Real exports save the cache at the end of export()
+            getImageDimsCache().save()
+
         return self.getOutput()
 
 
+    @staticmethod
+    def _decodeImageDims(imgFile):
+        """
+        Fallback for image formats not supported by probeImageDims().
+        Decodes the whole image from file object imgFile.
+        """
+        img = wx.EmptyImage(0, 0)
+        img.LoadStream(imgFile)
+        imgFile.close()
+
+        if img.Ok():
+            return img.GetWidth(), img.GetHeight()
+
+        return None, None
+
+
     def _getImageDims(self, absUrl):
         """
         Return tuple (width, height) of image absUrl or (None, None) if it
@@ -1481,22 +1621,23 @@ class HtmlExporter(AbstractExporter):
         """
         try:
             if absUrl.startswith(u"file:"):
-                absLink = pathnameFromUrl(absUrl)
-                imgFile = file(absLink, "rb")
-            else:
-                imgFile = urllib.urlopen(absUrl)
-                imgData = imgFile.read()
-                imgFile.close()
-                imgFile = StringIO(imgData)
-
-            img = wx.EmptyImage(0, 0)
-            img.LoadStream(imgFile)
+                # Only the header is read and the result is cached
+                # persistently
+                return getImageDimsCache().getImageDims(
+                        pathnameFromUrl(absUrl), lambda path:
+                        self._decodeImageDims(file(path, "rb")))
+
+            imgFile = urllib.urlopen(absUrl)
+            imgData = imgFile.read()
             imgFile.close()
-            
-            if img.Ok():
-                return img.GetWidth(), img.GetHeight()
+            imgFile = StringIO(imgData)
 
-            return None, None
+            dims = probeImageDims(imgFile)
+            if dims is not None:
+                return dims
+
+            imgFile.seek(0)
+            return self._decodeImageDims(imgFile)
 
         except IOError:
             return None, None
@@ -1549,6 +1690,26 @@ class HtmlExporter(AbstractExporter):
         self.result.append(toAppend)
 
 
+    def isDeferredContentSupported(self):
+        """
+        Returns True if createContent() of an insertion handler may return
+        an object with a getContent() method (e.g. a RenderCache.RenderJob)
+        instead of the HTML. getContent() is called (and may block) when
+        the output is assembled.
+        """
+        return True
+
+
+    def outAppendDeferred(self, deferred):
+        """
+        Append placeholder for deferred content to self.result, it is
+        replaced by deferred.getContent() in getOutput().
+        """
+        placeholder = u"\x00deferred%i\x00" % len(self.deferredContents)
+        self.deferredContents[placeholder] = deferred
+        self.outAppend(placeholder)
+
+
     def outEatBreaks(self, toAppend, **kpars):
         """
         Sets flags so that a <br /> before and/or after the item toAppend
@@ -1607,6 +1768,12 @@ class HtmlExporter(AbstractExporter):
 
 
     def getOutput(self):
+        if self.deferredContents:
+            deferredContents = self.deferredContents
+            self.deferredContents = {}
+            self.result = [deferredContents[s].getContent()
+                    if s in deferredContents else s for s in self.result]
+
         return u"".join(self.result)
 
 
@@ -1836,6 +2003,9 @@ class HtmlExporter(AbstractExporter):
 
 
     def _processInsertion(self, fullContent, astNode):
+        # Result of insertions may depend on any other page
+        self.fragmentCacheable = False
+
         self.astNodeStack.append(astNode)
         astNode.astNodeStack = self.astNodeStack
 
@@ -2117,6 +2287,9 @@ class HtmlExporter(AbstractExporter):
 
                 if htmlContent is None:
                     htmlContent = u""
+                elif not isinstance(htmlContent, basestring):
+                    self.outAppendDeferred(htmlContent)
+                    htmlContent = None
             else:
                 # Try to find a generic handler for export type
                 # "wikidpad_language"
@@ -2223,6 +2396,11 @@ class HtmlExporter(AbstractExporter):
 
         selfLink = False
 
+        if self.fragmentLinkedWords is not None:
+            self.fragmentLinkedWords.add(wikiWord)
+            self.fragmentLinkedWords.add(
+                    self.wikiDocument.getWikiPageNameForLinkTerm(wikiWord))
+
         if link:
             linkTo = self.wikiDocument.getWikiPageNameForLinkTerm(wikiWord)
 
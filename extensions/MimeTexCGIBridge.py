@@ -4,6 +4,7 @@ import subprocess
 import wx
 
 from pwiki.StringOps import mbcsEnc
+from pwiki.RenderCache import createRenderedContent
 
 WIKIDPAD_PLUGIN = (("InsertionByKey", 1), ("Options", 1))
 
@@ -92,9 +93,34 @@ class EqnHandler:
             return u'<pre>' + _(u'[Please set path to MimeTeX executable]') + \
                     '</pre>'
 
+        def buildHtml(url):
+            # Return appropriate HTML code for the image
+            if exportType == "html_previewWX":
+                # Workaround for internal HTML renderer
+                return (u'<img src="%s" border="0" align="bottom" alt="formula" />'
+                        u'&nbsp;') % url
+            else:
+                return u'<img src="%s" border="0" align="bottom" alt="formula" />' \
+                        % url
+
+        # The image is taken from the render cache or MimeTeX runs in
+        # a worker thread
+        return createRenderedContent(exporter, exportType, self.extAppExe,
+                (), bstr, ".gif",
+                lambda dstFullPath: self.renderImage(bstr, dstFullPath),
+                buildHtml)
+
+
+    def renderImage(self, bstr, dstFullPath):
+        """
+        Run MimeTeX to create image file dstFullPath for quoted formula
+        bstr. Returns None on success or HTML with error message.
+        """
         # Prepare CGI environment. MimeTeX needs only "QUERY_STRING" environment
-        # variable
-        os.environ["QUERY_STRING"] = bstr
+        # variable. It is set only for the child process as several
+        # formulas may be rendered at the same time
+        env = dict(os.environ)
+        env["QUERY_STRING"] = bstr
 
         cmdline = subprocess.list2cmdline((self.extAppExe,))
 
@@ -103,7 +129,7 @@ class EqnHandler:
         # Run MimeTeX process
         popenObject = subprocess.Popen(cmdline, shell=True,
                  stdout=subprocess.PIPE, stdin=subprocess.PIPE,
-                 stderr=subprocess.PIPE)
+                 stderr=subprocess.PIPE, env=env)
 
         childOut = popenObject.stdout
         
@@ -116,6 +142,7 @@ class EqnHandler:
         response = childOut.read()
         
         childOut.close()
+        popenObject.wait()
         
         # Cut off HTTP header (may need changes for non-Windows OS)
         try:
@@ -124,22 +151,14 @@ class EqnHandler:
             return u'<pre>' + _(u'[Invalid response from MimeTeX]') + \
                     '</pre>'
 
-        # Get exporters temporary file set (manages creation and deletion of
-        # temporary files)
-        tfs = exporter.getTempFileSet()
-        
-        # Create .gif file out of returned data and retrieve URL for the file
-        pythonUrl = (exportType != "html_previewWX")
-        url = tfs.createTempUrl(response, ".gif", pythonUrl=pythonUrl)
-
-        # Return appropriate HTML code for the image
-        if exportType == "html_previewWX":
-            # Workaround for internal HTML renderer
-            return (u'<img src="%s" border="0" align="bottom" alt="formula" />'
-                    u'&nbsp;') % url
-        else:
-            return u'<img src="%s" border="0" align="bottom" alt="formula" />' \
-                    % url
+        # Write returned data into the .gif file
+        fp = open(dstFullPath, "wb")
+        try:
+            fp.write(response)
+        finally:
+            fp.close()
+
+        return None
 
 
     def getExtraFeatures(self):
@@ -4,6 +4,7 @@ import subprocess
 import wx
 
 from pwiki.TempFileSet import createTempFile
+from pwiki.RenderCache import createRenderedContent
 from pwiki.StringOps import mbcsEnc, mbcsDec, lineendToOs
 
 WIKIDPAD_PLUGIN = (("InsertionByKey", 1), ("Options", 1))
@@ -107,22 +108,40 @@ class PltHandler:
             # No path to MimeTeX executable -> show message
             return u'<pre>' + _(u'[Please set path to Ploticus executable]') +\
                     u'</pre>'
-        # Get exporters temporary file set (manages creation and deletion of
-        # temporary files)
-        tfs = exporter.getTempFileSet()
-
-        pythonUrl = (exportType != "html_previewWX")
-        
-        dstFullPath = tfs.createTempFile("", self.outputSuffix, relativeTo="")
-        url = tfs.getRelativeUrl(None, dstFullPath, pythonUrl=pythonUrl)
-        
         baseDir = os.path.dirname(exporter.getMainControl().getWikiConfigPath())
+        noError = u"noerror" in [a.strip() for a in insToken.appendices]
+        outputParameter = self.outputParameter
+
+        def buildHtml(url):
+            # Return appropriate HTML code for the image
+            if exportType == "html_previewWX":
+                # Workaround for internal HTML renderer
+                return (u'<img src="%s" border="0" align="bottom" alt="formula" />'
+                        u'&nbsp;') % url
+            else:
+                return u'<img src="%s" border="0" align="bottom" alt="formula" />' \
+                        % url
+
+        # The image is taken from the render cache or the external application
+        # runs in a worker thread. Files referenced by the source are
+        # relative to baseDir, so it is part of the cache key
+        return createRenderedContent(exporter, exportType, self.extAppExe,
+                (baseDir, outputParameter, noError), bstr, self.outputSuffix,
+                lambda dstFullPath: self.renderImage(bstr, dstFullPath,
+                baseDir, outputParameter, noError), buildHtml)
 
+
+    def renderImage(self, bstr, dstFullPath, baseDir, outputParameter,
+            noError):
+        """
+        Run Ploticus to create image file dstFullPath from source bytestring
+        bstr. Returns None on success or HTML with error message.
+        """
         # Store token content in a temporary file
         srcfilepath = createTempFile(bstr, ".plt")
         try:
             cmdline = subprocess.list2cmdline((self.extAppExe, "-dir", baseDir,
-                    srcfilepath, self.outputParameter, "-o", dstFullPath))
+                    srcfilepath, outputParameter, "-o", dstFullPath))
 
             # Run external application
 #             childIn, childOut, childErr = os.popen3(cmdline, "b")
@@ -136,13 +155,14 @@ class PltHandler:
             popenObject.stdin.close()
             popenObject.stdout.close()
 
-            if u"noerror" in [a.strip() for a in insToken.appendices]:
+            if noError:
                 childErr.read()
                 errResponse = ""
             else:
                 errResponse = childErr.read()
             
             childErr.close()
+            popenObject.wait()
         finally:
             os.unlink(srcfilepath)
             
@@ -151,14 +171,7 @@ class PltHandler:
             return u'<pre>' + _(u'[Ploticus error: %s]') % errResponse + \
                     u'</pre>'
 
-        # Return appropriate HTML code for the image
-        if exportType == "html_previewWX":
-            # Workaround for internal HTML renderer
-            return (u'<img src="%s" border="0" align="bottom" alt="formula" />'
-                    u'&nbsp;') % url
-        else:
-            return u'<img src="%s" border="0" align="bottom" alt="formula" />' \
-                    % url
+        return None
 
 
     def getExtraFeatures(self):
@@ -13,7 +13,7 @@ import wx
 
 import re    # from pwiki.rtlibRepl import re
 from pwiki.WikiExceptions import *
-from pwiki import StringOps
+from pwiki import StringOps, ParseUtilities
 from pwiki.StringOps import revStr, HtmlStartTag, HtmlEmptyTag, HtmlEndTag
 
 from pwiki.WikiDocument import WikiDocument
@@ -1320,14 +1320,6 @@ ToDoREWithCapturing = re.compile(ur"^([^:\s]+):[ \t]*(.+?)$",
 
 
 
-# For auto-link mode relax
-AutoLinkRelaxSplitRE = re.compile(r"[\W]+", re.IGNORECASE | re.UNICODE)
-
-AutoLinkRelaxJoinPAT = ur"[\W]+"
-AutoLinkRelaxJoinFlags = re.IGNORECASE | re.UNICODE
-
-
-
 # For spell checking
 TextWordRE = re.compile(ur"(?P<negative>[0-9]+|"+ UrlPAT + u")|\b[\w']+",
         re.DOTALL | re.UNICODE | re.MULTILINE)
@@ -1534,9 +1526,8 @@ class _TheParser(object):
         Do some cleanup after main parsing.
         Not part of public API.
         """
-        autoLinkRelaxRE = None
         if formatDetails.autoLinkMode == u"relax":
-            relaxList = formatDetails.wikiDocument.getAutoLinkRelaxInfo()
+            relaxMatcher = formatDetails.wikiDocument.getAutoLinkRelaxInfo()
 
             def recursAutoLink(ast):
                 newAstNodes = []
@@ -1548,54 +1539,40 @@ class _TheParser(object):
                     if node.name == "plainText":
                         text = node.text
                         start = node.pos
+                        textPos = 0
                         
                         threadstop.testValidThread()
-                        while text != u"":
-                            # The foundWordText is the text as typed in the page
-                            # foundWord is the word as entered in database
-                            # These two may differ (esp. in whitespaces)
-                            foundPos = len(text)
-                            foundWord = None
-                            foundWordText = None
-                            
-                            # Search all regexes for the earliest match
-                            for regex, word in relaxList:
-                                match = regex.search(text)
-                                if match:
-                                    pos = match.start(0)
-                                    if pos < foundPos:
-                                        # Match is earlier than previous
-                                        foundPos = pos
-                                        foundWord = word
-                                        foundWordText = match.group(0)
-                                        if pos == 0:
-                                            # Can't find a better match -> stop loop
-                                            break
-
+                        # The foundWordText is the text as typed in the page
+                        # foundWord is the word as entered in database
+                        # These two may differ (esp. in whitespaces)
+                        for foundPos, foundEnd, foundWord in \
+                                relaxMatcher.finditer(text):
                             # Add token for text before found word (if any)
-                            preText = text[:foundPos]
+                            preText = text[textPos:foundPos]
                             if preText != u"":
                                 newAstNodes.append(buildSyntaxNode(preText,
-                                        start, "plainText"))
-                
-                                start += len(preText)
-                                text = text[len(preText):]
-                            
-                            if foundWord is not None:
-                                wwNode = buildSyntaxNode(
-                                        [buildSyntaxNode(foundWordText, start, "word")],
-                                        start, "wikiWord")
-                                        
-                                wwNode.searchFragment = None
-                                wwNode.anchorLink = None
-                                wwNode.wikiWord = foundWord
-                                wwNode.titleNode = buildSyntaxNode(foundWordText, start, "plainText") # None
-
-                                newAstNodes.append(wwNode)
-
-                                inc = max(len(foundWordText), 1)
-                                start += inc
-                                text = text[inc:]
+                                        start + textPos, "plainText"))
+
+                            foundWordText = text[foundPos:foundEnd]
+                            wwNode = buildSyntaxNode(
+                                    [buildSyntaxNode(foundWordText,
+                                    start + foundPos, "word")],
+                                    start + foundPos, "wikiWord")
+                                    
+                            wwNode.searchFragment = None
+                            wwNode.anchorLink = None
+                            wwNode.wikiWord = foundWord
+                            wwNode.titleNode = buildSyntaxNode(foundWordText,
+                                    start + foundPos, "plainText") # None
+
+                            newAstNodes.append(wwNode)
+                            textPos = foundEnd
+
+                        # Add token for text after last found word (if any)
+                        postText = text[textPos:]
+                        if postText != u"":
+                            newAstNodes.append(buildSyntaxNode(postText,
+                                    start + textPos, "plainText"))
 
                         continue
 
@@ -2051,45 +2028,22 @@ class _TheHelper(object):
             return None
 
 
-    @staticmethod
-    def _createAutoLinkRelaxWordEntryRE(word):
-        """
-        Get compiled regular expression for one word in autoLink "relax"
-        mode.
-
-        Not part of public API.
-        """
-        # Split into parts of contiguous alphanumeric characters
-        parts = AutoLinkRelaxSplitRE.split(word)
-        # Filter empty parts
-        parts = [p for p in parts if p != u""]
-
-        # Instead of original non-alphanum characters allow arbitrary
-        # non-alphanum characters
-        pat = ur"\b" + (AutoLinkRelaxJoinPAT.join(parts)) + ur"\b"
-        regex = re.compile(pat, AutoLinkRelaxJoinFlags)
-
-        return regex
-
-
     @staticmethod
     def buildAutoLinkRelaxInfo(wikiDocument):
         """
         Build some cache info needed to process auto-links in "relax" mode.
         This info will be given back in the formatDetails when calling
         _TheParser.parse().
-        The implementation for this plugin creates a list of regular
-        expressions and the related wiki words, but this is not mandatory.
+        The implementation for this plugin creates a multi-pattern matcher
+        for all wiki words, but this is not mandatory.
         """
-        # Build up regular expression
         # First fetch all wiki words
         words = wikiDocument.getWikiData().getAllProducedWikiLinks()
 
-        # Sort longest words first
+        # Sort longest words first, they win if more than one word matches
         words.sort(key=lambda w: len(w), reverse=True)
         
-        return [(_TheHelper._createAutoLinkRelaxWordEntryRE(w), w)
-                for w in words if w != u""]
+        return ParseUtilities.AutoLinkRelaxMatcher(words)
 
 
     @staticmethod
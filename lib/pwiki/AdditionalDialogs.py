@@ -2131,6 +2131,7 @@ class WikiJobDialog(SimpleInfoDialog):
             if exe is not None:
                 exe.startDoneJobCount()
                 exe.resetDoneJobCount()
+                exe.resetJobStatistics()
 
         # Start timer
         self.timer = wx.Timer(self, GUI_ID.TIMER_JOBDIALOG)
@@ -2148,6 +2149,10 @@ class WikiJobDialog(SimpleInfoDialog):
     def fillInfoLines(self):
         self.jobTxtCtrl = self._addTextLine(_(u"Number of Jobs:"), u"0")
         self.jobDoneTxtCtrl = self._addTextLine(_(u"Number of Done Jobs:"), u"0")
+        self.jobCoalescedTxtCtrl = self._addTextLine(
+                _(u"Number of Merged Jobs:"), u"0")
+        self.jobLatencyTxtCtrl = self._addTextLine(
+                _(u"Waiting Time (avg/max):"), u"")
 
     def OnTimer(self, evt):
         wd = self.mainControl.getWikiDocument()
@@ -2156,6 +2161,11 @@ class WikiJobDialog(SimpleInfoDialog):
             if exe is not None:
                 self.jobTxtCtrl.SetValue(unicode(exe.getJobCount()))
                 self.jobDoneTxtCtrl.SetValue(unicode(exe.getDoneJobCount()))
+                stats = exe.getJobStatistics()
+                self.jobCoalescedTxtCtrl.SetValue(
+                        unicode(stats["coalescedJobCount"]))
+                self.jobLatencyTxtCtrl.SetValue(u"%.1f s / %.1f s" %
+                        (stats["averageLatency"], stats["maxLatency"]))
 
     def close(self):
         self.timer.Stop()
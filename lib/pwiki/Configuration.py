@@ -663,6 +663,7 @@ GLOBALDEFAULTS = {
             # 0:None, 1:formatted as tree, 2:as list
     ("main", "export_lastDialogTag"): u"",  # Tag of the last used export tag to set as default in export dialog
     ("main", "html_toc_title"): u"Table of Contents",  # title of table of contents
+    ("main", "html_export_parseProcessCount"): u"-1",  # Number of worker processes parsing pages for "Set of HTML pages" export, -1: one per CPU, 0: no workers
     ("main", "html_export_singlePage_sepLineCount"): u"10",  # How many empty lines to separate
             # two wiki pages in a single HTML page
     ("main", "html_preview_renderer"): u"0",  # 0: Internal wxWidgets; 1: IE; 2: Mozilla; 3: Webkit
@@ -683,6 +684,8 @@ GLOBALDEFAULTS = {
     # Editor options
     ("main", "sync_highlight_byte_limit"): "400",  # Size limit when to start asyn. highlighting in editor
     ("main", "async_highlight_delay"): "0.2",  # Delay after keypress before starting async. highlighting
+    ("main", "editor_incrementalParsing"): "True",  # After an edit re-parse only the changed blocks of a large page
+            # instead of the whole page
     ("main", "editor_shortHint_delay"): "500",  # Delay in milliseconds until the short hint defined for a wikiword is displayed
             # 0 deactivates short hints
     ("main", "editor_autoUnbullets"): "True",  # When pressing return on line with lonely bullet, remove bullet?
@@ -829,6 +832,10 @@ GLOBALDEFAULTS = {
             # (advanced option to cure a problem on Mac OS)
     ("main", "search_stripSpaces"): "False", # Iff True then leading and trailing spaces are
             # stripped from search text before searching
+    ("main", "search_scanProcessCount"): "-1", # Number of worker processes to scan page
+            # content in wiki-wide search without index. -1: One per CPU; 0: No worker processes
+    ("main", "rebuild_parseProcessCount"): "-1", # Number of worker processes to parse
+            # pages when rebuilding the wiki. -1: One per CPU; 0: No worker processes
 
     # Miscellaneous
     ("main", "print_margins"): "0,0,0,0", # Left, upper, right, lower page margins on printing
@@ -853,6 +860,8 @@ GLOBALDEFAULTS = {
             # this is only necessary for special layouts where ctrl-level uses fundamentally different layout
             # than base and shift level
     ("main", "zombieCheck"): "True", # Check for already running processes? Only active if "single_process" is True
+    ("main", "plugins_reportLoadTimes"): "False", # Write load time and state of each plugin
+            # to the error log at startup
 
     ("main", "tempHandling_preferMemory"): "False", # Prefer to store temporary data in memory where this is possible?
     ("main", "tempHandling_tempMode"): u"system", # Mode for storing of temporary data.
@@ -861,6 +870,12 @@ GLOBALDEFAULTS = {
             # use "system" otherwise ))
     ("main", "tempHandling_tempDir"): u"", # Path to directory for temporary files. Only valid if
             # "tempHandling_tempMode" is set to "given".
+    ("main", "insertion_renderCache_maxSize"): "50", # Maximum size in MB of the cache for images
+            # rendered by external tools (Graphviz, Gnuplot, Ploticus, MimeTeX). 0: No cache
+    ("main", "db_readerConnectionCount"): "0", # Maximum number of additional read-only connections
+            # to sqlite databases. If > 0 the database file is switched permanently to WAL journal mode
+            # (sqlite before 3.7 can't open it then) unless it is read-only or on a network drive.
+            # 0: Use only one connection, a database in WAL mode is switched back when opened
     ("main", "wikiPathes_relative"): "False", # If True, pathes to last recently used wikis
             # are stored relative to application dir.
     ("main", "openWikiWordDialog_sortOrder"): "0", # Sort order in "Open Wiki Word" dialog
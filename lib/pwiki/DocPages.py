@@ -23,6 +23,7 @@ from Utilities import DUMBTHREADSTOP, FunctionThreadStop, TimeoutRLock, \
 
 from WikiPyparsing import buildSyntaxNode
 import ParseUtilities
+import IncrementalParsing
 
 import Serialization
 
@@ -464,7 +465,38 @@ class DataCarryingPage(DocPage):
 
     def checkFileSignatureAndMarkDirty(self, fireEvent=True):
         return True
-    
+
+
+    def getLiveTextState(self):
+        """
+        Returns an object to restore the editor text and the dirty flags
+        of the page with restoreLiveTextState() if a batch of changes fails
+        (see WikiDataManager.replaceLiveTexts()). The database content must
+        be restored by rolling back the transaction.
+        """
+        with self.textOperationLock:
+            return (self.getEditorText(), self.saveDirtySince,
+                    self.updateDirtySince)
+
+
+    def restoreLiveTextState(self, state):
+        """
+        Restore state returned by getLiveTextState().
+        """
+        editorText, saveDirtySince, updateDirtySince = state
+
+        with self.textOperationLock:
+            txtEditor = self.getTxtEditor()
+            if editorText is not None and txtEditor is not None:
+                if txtEditor.GetText() != editorText:
+                    txtEditor.replaceText(editorText)
+                self.setEditorText(editorText, dirty=False)
+
+            self.livePageAst = None
+            self.liveTextPlaceHold = object()
+            self.saveDirtySince = saveDirtySince
+            self.updateDirtySince = updateDirtySince
+
     
     def markTextChanged(self):
         """
@@ -499,12 +531,27 @@ class AbstractWikiPage(DataCarryingPage):
         self.livePageBaseFormatDetails = None   # Cached format details on which the
                 # page-ast bases
 
+        # Last built page AST with the text and format details it is based on.
+        # Unlike livePageAst these are kept when text changes, they are
+        # the base for incremental parsing
+        self.lastPageAst = None
+        self.lastPageAstText = None
+        self.lastPageAstFormatDetails = None
+
         # List of words unknown to spellchecker
         self.liveSpellCheckerUnknownWords = None
 
         # liveTextPlaceHold object on which the liveSpellCheckerUnknownWords is based.
         self.liveSpellCheckerUnknownWordsBasePlaceHold = None
 
+        # Last built unknown word list with the text and dictionary language
+        # it is based on. Base for incremental rebuild
+        self.lastSpellCheckerUnknownWords = None
+        self.lastSpellCheckerText = None
+        self.lastSpellCheckerLanguage = None
+        # Replaced by a new object each time the above values are changed
+        self.lastSpellCheckerTextPlaceHold = object()
+
         self.__sinkWikiDocumentSpellSession = KeyFunctionSinkAR((
                 ("modified spell checker session", self.onModifiedSpellCheckerSession),
         ))
@@ -524,6 +571,13 @@ class AbstractWikiPage(DataCarryingPage):
     def invalidate(self):
         super(AbstractWikiPage, self).invalidate()
         self.__sinkWikiDocumentSpellSession.setEventSource(None)
+        self.lastPageAst = None
+        self.lastPageAstText = None
+        self.lastPageAstFormatDetails = None
+        self.lastSpellCheckerUnknownWords = None
+        self.lastSpellCheckerText = None
+        self.lastSpellCheckerLanguage = None
+        self.lastSpellCheckerTextPlaceHold = object()
 
     # TODO: Replace getWikiWord by getWikiPageName where appropriate
     def getWikiWord(self):
@@ -924,6 +978,10 @@ class AbstractWikiPage(DataCarryingPage):
 
                 pageAst = self.getLivePageAstIfAvailable()
 
+                lastPageAst = self.lastPageAst
+                lastPageAstText = self.lastPageAstText
+                lastPageAstFormatDetails = self.lastPageAstFormatDetails
+
             if pageAst is not None:
                 return pageAst
 
@@ -940,8 +998,28 @@ class AbstractWikiPage(DataCarryingPage):
             if len(text) == 0:
                 pageAst = buildSyntaxNode([], 0)
             else:
-                pageAst = self.parseTextInContext(text, formatDetails=formatDetails,
-                        threadstop=threadstop)
+                pageAstCache = self.wikiDocument.getPageAstCache()
+                pageAst = pageAstCache.get(self.getUnifiedPageName(), text,
+                        formatDetails)
+
+                if pageAst is None:
+                    if lastPageAst is not None and \
+                            formatDetails.isEquivTo(lastPageAstFormatDetails) and \
+                            wx.GetApp().getGlobalConfig().getboolean("main",
+                            "editor_incrementalParsing", True):
+                        pageAst = IncrementalParsing.reparseIncrementally(
+                                lastPageAstText, lastPageAst, text,
+                                lambda t, ts: self.parseTextInContext(t,
+                                formatDetails=formatDetails, threadstop=ts),
+                                threadstop=threadstop)
+
+                    if pageAst is None:
+                        pageAst = self.parseTextInContext(text,
+                                formatDetails=formatDetails,
+                                threadstop=threadstop)
+
+                    pageAstCache.put(self.getUnifiedPageName(), text,
+                            formatDetails, pageAst)
 
             with self.textOperationLock:
                 threadstop.testValidThread()
@@ -950,6 +1028,10 @@ class AbstractWikiPage(DataCarryingPage):
                 self.livePageBasePlaceHold = liveTextPlaceHold
                 self.livePageBaseFormatDetails = formatDetails
 
+                self.lastPageAst = pageAst
+                self.lastPageAstText = text
+                self.lastPageAstFormatDetails = formatDetails
+
 
         if self.isReadOnlyEffect():
             threadstop.testValidThread()
@@ -974,6 +1056,10 @@ class AbstractWikiPage(DataCarryingPage):
 
             self.liveSpellCheckerUnknownWords = None
             self.liveSpellCheckerUnknownWordsBasePlaceHold = None
+            self.lastSpellCheckerUnknownWords = None
+            self.lastSpellCheckerText = None
+            self.lastSpellCheckerLanguage = None
+            self.lastSpellCheckerTextPlaceHold = object()
 
         self.fireMiscEventKeys(("modified spell checker session",))
 
@@ -1011,6 +1097,11 @@ class AbstractWikiPage(DataCarryingPage):
 
             unknownWords = self.getSpellCheckerUnknownWordsIfAvailable()
 
+            lastUnknownWords = self.lastSpellCheckerUnknownWords
+            lastText = self.lastSpellCheckerText
+            lastLanguage = self.lastSpellCheckerLanguage
+            lastTextPlaceHold = self.lastSpellCheckerTextPlaceHold
+
         if unknownWords is not None:
             return unknownWords
 
@@ -1030,8 +1121,15 @@ class AbstractWikiPage(DataCarryingPage):
             
         spellSession.setCurrentDocPage(self)
 
+        language = spellSession.dictLanguage
+
         if len(text) == 0:
             unknownWords = []
+        elif lastUnknownWords is not None and lastLanguage == language and \
+                len(lastText) > 0:
+            # Only check lines which have changed
+            unknownWords = spellSession.buildUnknownWordListIncrementally(
+                    lastText, lastUnknownWords, text, threadstop=threadstop)
         else:
             unknownWords = spellSession.buildUnknownWordList(text,
                     threadstop=threadstop)
@@ -1043,6 +1141,12 @@ class AbstractWikiPage(DataCarryingPage):
 
             self.liveSpellCheckerUnknownWords = unknownWords
             self.liveSpellCheckerUnknownWordsBasePlaceHold = liveTextPlaceHold
+            if lastTextPlaceHold is self.lastSpellCheckerTextPlaceHold:
+                # Session wasn't modified in the meantime
+                self.lastSpellCheckerUnknownWords = unknownWords
+                self.lastSpellCheckerText = text
+                self.lastSpellCheckerLanguage = language
+                self.lastSpellCheckerTextPlaceHold = object()
             
             self.__sinkWikiDocumentSpellSession.setEventSource(
                     self.getWikiDocument().getOnlineSpellCheckerSession())
@@ -1621,17 +1725,13 @@ class WikiPage(AbstractWikiPage):
                 syncUpdate=True)
 
 
-    def refreshAttributesFromPageAst(self, pageAst, threadstop=DUMBTHREADSTOP):
+    @staticmethod
+    def extractAttributesFromPageAst(pageAst, threadstop=DUMBTHREADSTOP):
         """
-        Update properties (aka attributes) only.
-        This is step one in update/rebuild process.
+        Return dictionary {key: list of values} of the attributes in pageAst.
+        Works without wiki document, so it can run in a worker process
+        (see ParallelParsing).
         """
-        if self.wikiDocument.isReadOnlyEffect():
-            return True  # TODO Error?
-
-        langHelper = wx.GetApp().createWikiLanguageHelper(
-                self.getWikiLanguageName())
-
         attrs = {}
 
         def addAttribute(key, value):
@@ -1643,31 +1743,94 @@ class WikiPage(AbstractWikiPage):
             values.append(value)
 
 
-        attrNodes = self.extractAttributeNodesFromPageAst(pageAst)
+        attrNodes = WikiPage.extractAttributeNodesFromPageAst(pageAst)
         for node in attrNodes:
             for attrKey, attrValue in \
                     (getattr(node, "attrs", []) + getattr(node, "props", [])):  # TODO remove "property"-compatibility
                 addAttribute(attrKey, attrValue)
 
+        return attrs
+
+
+    def _applyAttributes(self, attrs, threadstop):
+        """
+        Write attributes dictionary attrs as returned by
+        extractAttributesFromPageAst() to the database.
+        Returns False if page doesn't exist (anymore).
+        """
         with self.textOperationLock:
             threadstop.testValidThread()
 
             self.attrs = None
 
         try:
-            self.getWikiData().updateAttributes(self.wikiPageName, attrs)
+            self.getWikiData().applyPageMetaData(self.wikiPageName,
+                    attrs=attrs)
         except WikiWordNotFoundException:
             return False
 
+        self.wikiDocument.invalidateChildrenTreeOrderCache()
+        return True
+
+
+    def _isPageAstValid(self, pageAst):
+        """
+        Check if pageAst is the live page AST and the live text (equal to
+        database content) and current format details were its base.
+        Call with textOperationLock held.
+        """
+        return self.saveDirtySince is None and \
+                self.livePageBasePlaceHold is self.liveTextPlaceHold and \
+                self.livePageBaseFormatDetails is not None and \
+                self.getFormatDetails().isEquivTo(self.livePageBaseFormatDetails) and \
+                pageAst is self.livePageAst
+
+
+    def _isExtractValid(self, text, formatDetails):
+        """
+        Check if meta data extracted from a parse of text with formatDetails
+        (e.g. by a worker process) is up to date.
+        Call with textOperationLock held.
+        """
+        return self.saveDirtySince is None and \
+                self.getLiveText() == text and \
+                self.getFormatDetails().isEquivTo(formatDetails)
+
+
+    def refreshAttributesFromPageAst(self, pageAst, threadstop=DUMBTHREADSTOP):
+        """
+        Update properties (aka attributes) only.
+        This is step one in update/rebuild process.
+        """
+        if self.wikiDocument.isReadOnlyEffect():
+            return True  # TODO Error?
+
+        attrs = self.extractAttributesFromPageAst(pageAst, threadstop)
+        return self._refreshAttributes(attrs,
+                lambda: self._isPageAstValid(pageAst), threadstop)
+
+
+    def refreshAttributesFromExtract(self, attrs, text, formatDetails,
+            threadstop=DUMBTHREADSTOP):
+        """
+        Like refreshAttributesFromPageAst() for attributes dictionary attrs
+        extracted from a parse of text with formatDetails.
+        """
+        if self.wikiDocument.isReadOnlyEffect():
+            return True
+
+        return self._refreshAttributes(attrs,
+                lambda: self._isExtractValid(text, formatDetails), threadstop)
+
+
+    def _refreshAttributes(self, attrs, validFct, threadstop):
+        if not self._applyAttributes(attrs, threadstop):
+            return False
+
         valid = False
 
         with self.textOperationLock:
-            if self.saveDirtySince is None and \
-                    self.livePageBasePlaceHold is self.liveTextPlaceHold and \
-                    self.livePageBaseFormatDetails is not None and \
-                    self.getFormatDetails().isEquivTo(self.livePageBaseFormatDetails) and \
-                    pageAst is self.livePageAst:
-
+            if validFct():
                 threadstop.testValidThread()
                 # clear the dirty flag
 
@@ -1679,16 +1842,16 @@ class WikiPage(AbstractWikiPage):
         return valid
 
 
-
-    def refreshMainDbCacheFromPageAst(self, pageAst, fireEvent=True,
-            threadstop=DUMBTHREADSTOP):
+    @staticmethod
+    def extractMainDbCacheDataFromPageAst(pageAst, wikiPageName,
+            headingsAsAliasesDepth, threadstop=DUMBTHREADSTOP):
         """
-        Update everything else (todos, relations).
-        This is step two in update/rebuild process.
+        Return tuple (todos, childRelations, headingMatchTerms) of lists of
+        tuples extracted from pageAst of page wikiPageName. Headings up to
+        level headingsAsAliasesDepth become match terms.
+        Works without wiki document, so it can run in a worker process
+        (see ParallelParsing).
         """
-        if self.wikiDocument.isReadOnlyEffect():
-            return True   # return True or False?
-
         todos = []
         childRelations = []
         childRelationSet = set()
@@ -1719,7 +1882,66 @@ class WikiPage(AbstractWikiPage):
             addChildRelationship(t.wikiWord, t.pos)
 
         threadstop.testValidThread()
-        
+
+        # Add headings to match terms if wanted
+        headingMatchTerms = []
+        depth = headingsAsAliasesDepth
+
+        if depth > 0:
+            HEADALIAS_TYPE = Consts.WIKIWORDMATCHTERMS_TYPE_FROM_CONTENT
+            for node in pageAst.iterFlatByName("heading"):
+                threadstop.testValidThread()
+                if node.level > depth:
+                    continue
+
+                title = node.getString()
+                if title.endswith(u"\n"):
+                    title = title[:-1]
+                
+                headingMatchTerms.append((title, HEADALIAS_TYPE, wikiPageName,
+                        node.pos + node.strLength, 0))
+
+        return todos, childRelations, headingMatchTerms
+
+
+    def refreshMainDbCacheFromPageAst(self, pageAst, fireEvent=True,
+            threadstop=DUMBTHREADSTOP):
+        """
+        Update everything else (todos, relations).
+        This is step two in update/rebuild process.
+        """
+        if self.wikiDocument.isReadOnlyEffect():
+            return True   # return True or False?
+
+        todos, childRelations, headingMatchTerms = \
+                self.extractMainDbCacheDataFromPageAst(pageAst,
+                self.wikiPageName, self.wikiDocument.getWikiConfig().getint(
+                "main", "headingsAsAliases_depth"), threadstop)
+
+        return self._refreshMainDbCache(todos, childRelations,
+                headingMatchTerms, lambda: self._isPageAstValid(pageAst),
+                fireEvent, threadstop)
+
+
+    def refreshMainDbCacheFromExtract(self, todos, childRelations,
+            headingMatchTerms, text, formatDetails, fireEvent=True,
+            threadstop=DUMBTHREADSTOP):
+        """
+        Like refreshMainDbCacheFromPageAst() for the lists returned by
+        extractMainDbCacheDataFromPageAst() for a parse of text with
+        formatDetails.
+        """
+        if self.wikiDocument.isReadOnlyEffect():
+            return True
+
+        return self._refreshMainDbCache(todos, childRelations,
+                headingMatchTerms,
+                lambda: self._isExtractValid(text, formatDetails),
+                fireEvent, threadstop)
+
+
+    def _refreshMainDbCache(self, todos, childRelations, headingMatchTerms,
+            validFct, fireEvent, threadstop):
         # Add aliases to match terms
         matchTerms = []
 
@@ -1739,23 +1961,7 @@ class WikiPage(AbstractWikiPage):
                 matchTerms.append((langHelper.resolveWikiWordLink(v, self),
                         ALIAS_TYPE, self.wikiPageName, -1, -1))
 
-        # Add headings to match terms if wanted
-        depth = self.wikiDocument.getWikiConfig().getint(
-                "main", "headingsAsAliases_depth")
-
-        if depth > 0:
-            HEADALIAS_TYPE = Consts.WIKIWORDMATCHTERMS_TYPE_FROM_CONTENT
-            for node in pageAst.iterFlatByName("heading"):
-                threadstop.testValidThread()
-                if node.level > depth:
-                    continue
-
-                title = node.getString()
-                if title.endswith(u"\n"):
-                    title = title[:-1]
-                
-                matchTerms.append((title, HEADALIAS_TYPE, self.wikiPageName,
-                        node.pos + node.strLength, 0))
+        matchTerms += headingMatchTerms
 
         with self.textOperationLock:
             threadstop.testValidThread()
@@ -1764,16 +1970,14 @@ class WikiPage(AbstractWikiPage):
             self.childRelations = None
             self.childRelationSet = set()
         try:
-            self.getWikiData().updateTodos(self.wikiPageName, todos)
-            threadstop.testValidThread()
-            self.getWikiData().updateChildRelations(self.wikiPageName,
-                    childRelations)
-            threadstop.testValidThread()
-            self.getWikiData().updateWikiWordMatchTerms(self.wikiPageName,
-                    matchTerms)
+            self.getWikiData().applyPageMetaData(self.wikiPageName,
+                    childRelations=childRelations, todos=todos,
+                    wwmTerms=matchTerms)
             threadstop.testValidThread()
         except WikiWordNotFoundException:
             return False
+
+        self.wikiDocument.invalidateChildrenTreeOrderCache()
 #             self.modified = None   # ?
 #             self.created = None
 
@@ -1791,12 +1995,7 @@ class WikiPage(AbstractWikiPage):
 #                     self.livePageBaseFormatDetails is not None,
 # #                     self.getFormatDetails().isEquivTo(self.livePageBaseFormatDetails),
 #                     pageAst is self.livePageAst))
-            if self.saveDirtySince is None and \
-                    self.livePageBasePlaceHold is self.liveTextPlaceHold and \
-                    self.livePageBaseFormatDetails is not None and \
-                    self.getFormatDetails().isEquivTo(self.livePageBaseFormatDetails) and \
-                    pageAst is self.livePageAst:
-
+            if validFct():
                 threadstop.testValidThread()
                 # clear the dirty flag
                 self.updateDirtySince = None
@@ -1814,44 +2013,18 @@ class WikiPage(AbstractWikiPage):
 
     def putIntoSearchIndex(self, threadstop=DUMBTHREADSTOP):
         """
-        Add or update the index for the given docPage
+        Add or update the index for the given docPage. The update is
+        written as part of the next batch of the wiki's search index writer.
         """
         with self.textOperationLock:
             threadstop.testValidThread()
 
             if not self.getWikiDocument().isSearchIndexEnabled():
                 return True  # Or false?
-            
-            liveTextPlaceHold = self.liveTextPlaceHold
-            content = self.getLiveText()
-
-        writer = None
-        try:
-            searchIdx = self.getWikiDocument().getSearchIndex()
-            writer = searchIdx.writer(timeout=Consts.DEADBLOCKTIMEOUT)
-
-            unifName = self.getUnifiedPageName()
 
-            writer.delete_by_term("unifName", unifName)
-            
-            writer.add_document(unifName=unifName,
-                    modTimestamp=self.getTimestamps()[0],
-                    content=content)
-        except:
-            if writer is not None:
-                writer.cancel()
-            raise
+        return self.getWikiDocument().getSearchIndexWriter().putPage(self,
+                threadstop=threadstop)
 
-        # Check within lock if data is current yet
-        with self.textOperationLock:
-            if not liveTextPlaceHold is self.liveTextPlaceHold:
-                writer.cancel()
-                return False
-            else:
-                writer.commit()
-                self.getWikiData().setMetaDataState(self.wikiPageName,
-                        Consts.WIKIWORDMETADATA_STATE_INDEXED)
-                return True
 
     def removeFromSearchIndex(self):
         """
@@ -1861,19 +2034,8 @@ class WikiPage(AbstractWikiPage):
         if not self.getWikiDocument().isSearchIndexEnabled() or self.isInvalid():
             return
 
-        unifName = self.getUnifiedPageName()
-        
-        writer = None
-        try:
-            searchIdx = self.getWikiDocument().getSearchIndex()
-            writer = searchIdx.writer(timeout=Consts.DEADBLOCKTIMEOUT)
-            writer.delete_by_term("unifName", unifName)
-        except:
-            if writer is not None:
-                writer.cancel()
-            raise
-
-        writer.commit()
+        self.getWikiDocument().getSearchIndexWriter().removePage(
+                self.getUnifiedPageName())
 
 
     def queueRemoveFromSearchIndex(self):
@@ -1899,6 +2061,14 @@ class WikiPage(AbstractWikiPage):
             liveTextPlaceHold = self.liveTextPlaceHold
             formatDetails = self.getFormatDetails()
 
+        if step != -1:
+            # Don't parse the page if the step was done already (e.g. by
+            # a full update of the page) or must be done later
+            metaState = self.getMetaDataState()
+            if metaState >= self.getWikiDocument().getFinalMetaDataState() or \
+                    metaState != step:
+                return False
+
         try:
             pageAst = self.getLivePageAst(dieOnChange=True,
                     threadstop=threadstop)
@@ -2050,8 +2220,39 @@ class WikiPage(AbstractWikiPage):
         existingonly -- true iff non-existing words should be hidden
         excludeSet -- set of words which should be excluded from the list
         includeSet -- wikiWords to include in the result
-        """
         
+        The unfiltered order is cached by the wiki document until a page
+        is updated, renamed or deleted.
+        """
+        cache = self.wikiDocument.getChildrenTreeOrderCache()
+        key = (self.wikiPageName, existingonly)
+
+        children = cache.get(key)
+        if children is None:
+            children = self._getChildRelationshipsTreeOrderNoCache(
+                    existingonly)
+            cache[key] = children
+
+        if len(excludeSet) == 0 and len(includeSet) == 0:
+            return list(children)
+
+        childrenSet = set(children)
+        if childrenSet.isdisjoint(excludeSet) and \
+                childrenSet.issuperset(includeSet):
+            # Filtering wouldn't change anything
+            return list(children)
+
+        return list(self._getChildRelationshipsTreeOrderNoCache(existingonly,
+                excludeSet, includeSet))
+
+
+    def _getChildRelationshipsTreeOrderNoCache(self, existingonly=False,
+            excludeSet=frozenset(), includeSet=frozenset()):
+        """
+        Called by getChildRelationshipsTreeOrder() to create the order.
+        The attributes "tree_position" and "priority" of all children
+        are retrieved together with the relations.
+        """
         wikiDocument = self.wikiDocument
         
         # get the sort order for the children
@@ -2061,41 +2262,43 @@ class WikiPage(AbstractWikiPage):
         # Apply sort order
         if childSortOrder == u"natural":
             # TODO: Do it right 
-            # Retrieve relations as list of tuples (child, firstcharpos)
+            # Retrieve relations as list of tuples
+            # (child, firstcharpos, tree_position, priority)
             relations = self.getChildRelationships(existingonly,
-                    selfreference=False, withFields=("firstcharpos",),
+                    selfreference=False, withFields=("firstcharpos",
+                    "tree_position", "priority"),
                     excludeSet=excludeSet, includeSet=includeSet)
 
             relations.sort(_cmpNumbersItem1)
-            # Remove firstcharpos
-            relations = [r[0] for r in relations]
         elif childSortOrder == u"mod_oldest":
-            # Retrieve relations as list of tuples (child, modifTime)
+            # Retrieve relations as list of tuples
+            # (child, modifTime, tree_position, priority)
             relations = self.getChildRelationships(existingonly,
-                    selfreference=False, withFields=("modified",),
+                    selfreference=False, withFields=("modified",
+                    "tree_position", "priority"),
                     excludeSet=excludeSet, includeSet=includeSet)
             relations.sort(_cmpNumbersItem1)
-            # Remove firstcharpos
-            relations = [r[0] for r in relations]
         elif childSortOrder == u"mod_newest":
-            # Retrieve relations as list of tuples (child, modifTime)
+            # Retrieve relations as list of tuples
+            # (child, modifTime, tree_position, priority)
             relations = self.getChildRelationships(existingonly,
-                    selfreference=False, withFields=("modified",),
+                    selfreference=False, withFields=("modified",
+                    "tree_position", "priority"),
                     excludeSet=excludeSet, includeSet=includeSet)
             relations.sort(_cmpNumbersItem1Rev)
-            # Remove firstcharpos
-            relations = [r[0] for r in relations]            
         else:
-            # Retrieve relations as list of children words
+            # Retrieve relations as list of tuples
+            # (child, tree_position, priority)
             relations = self.getChildRelationships(existingonly, 
-                    selfreference=False, withFields=(),
+                    selfreference=False, withFields=("tree_position",
+                    "priority"),
                     excludeSet=excludeSet, includeSet=includeSet)
             if childSortOrder.startswith(u"desc"):
                 coll = wikiDocument.getCollator()
 
                 def cmpLowerDesc(a, b):
                     return coll.strcoll(
-                            b.lower(), a.lower())
+                            b[0].lower(), a[0].lower())
                             
                 # TODO Python 3.0 supports only key argument, no cmp. function
                 relations.sort(cmpLowerDesc) # sort alphabetically
@@ -2104,7 +2307,7 @@ class WikiPage(AbstractWikiPage):
 
                 def cmpLowerAsc(a, b):
                     return coll.strcoll(
-                            a.lower(), b.lower())
+                            a[0].lower(), b[0].lower())
 
                 relations.sort(cmpLowerAsc)
 
@@ -2115,14 +2318,14 @@ class WikiPage(AbstractWikiPage):
         other = []
 
         # Put relations into their appropriate arrays
-        for relation in relations:
-            relationPage = wikiDocument.getWikiPageNoError(relation)
-            attrs = relationPage.getAttributes()
+        for relationTuple in relations:
+            relation = relationTuple[0]
+            treePosition, priority = relationTuple[-2:]
             try:
-                if (attrs.has_key(u'tree_position')):
-                    positioned.append((int(attrs[u'tree_position'][-1]) - 1, relation))
-                elif (attrs.has_key(u'priority')):
-                    priorized.append((int(attrs[u'priority'][-1]), relation))
+                if treePosition is not None:
+                    positioned.append((int(treePosition) - 1, relation))
+                elif priority is not None:
+                    priorized.append((int(priority), relation))
                 else:
                     other.append(relation)
             except:
@@ -2163,7 +2366,7 @@ class WikiPage(AbstractWikiPage):
             raise InternalError("Empty relation sorting arrays")
         
 
-        return result
+        return tuple(result)
 
 
 #         # TODO Remove aliases?
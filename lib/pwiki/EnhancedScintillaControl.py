@@ -31,46 +31,126 @@ def bytelenSct_mbcs(us):
 
 
 
-class StyleCollector(StringOps.SnippetCollector):
+class StyleCollector(object):
     """
     Helps to collect the style bytes needed to set the syntax coloring in
-    Scintilla editor component
+    Scintilla editor component. The bytes are collected in a bytearray
+    and ranges are filled in bulk.
     """
-    def __init__(self, defaultStyleNo, text, bytelenSct, startCharPos=0):   
-        super(StyleCollector, self).__init__()
+    def __init__(self, defaultStyleNo, text, bytelenSct, startCharPos=0):
         self.defaultStyleNo = defaultStyleNo
         self.text = text
         self.bytelenSct = bytelenSct
         self.charPos = startCharPos
+        self.buffer = bytearray()
+        # If each character needs exactly one byte, character and byte
+        # positions are the same and no encoding is necessary
+        self.oneBytePerChar = isOneBytePerChar(text, bytelenSct)
+
+
+    def _bytelen(self, start, end):
+        if self.oneBytePerChar:
+            return max(min(end, len(self.text)) - start, 0)
+
+        return self.bytelenSct(self.text[start:end])
 
 
     def bindStyle(self, targetCharPos, targetLength, styleNo):
         if targetCharPos < 0:
             return
-        
+
+        buffer = self.buffer
+
         if targetCharPos < self.charPos:
             # Due to some unknown reason we had overlapping styles and
             # must remove some bytes
-            bytestylelen = self.bytelenSct(self.text[targetCharPos:self.charPos])
-            self.drop(bytestylelen)
+            bytestylelen = self._bytelen(targetCharPos, self.charPos)
+            del buffer[max(len(buffer) - bytestylelen, 0):]
         else:
             # There is possibly a gap between end of last style and current one
             # -> fill it with default style
-            bytestylelen = self.bytelenSct(self.text[self.charPos:targetCharPos])
-            self.append(chr(self.defaultStyleNo) * bytestylelen)
+            bytestylelen = self._bytelen(self.charPos, targetCharPos)
+            if bytestylelen > 0:
+                buffer.extend(chr(self.defaultStyleNo) * bytestylelen)
 
         self.charPos = targetCharPos + targetLength
-            
-        bytestylelen = self.bytelenSct(self.text[targetCharPos:self.charPos])
-        self.append(chr(styleNo) * bytestylelen)
+
+        bytestylelen = self._bytelen(targetCharPos, self.charPos)
+        if bytestylelen > 0:
+            buffer.extend(chr(styleNo) * bytestylelen)
+
 
     def value(self):
         if self.charPos < len(self.text):
-            bytestylelen = self.bytelenSct(self.text[self.charPos:len(self.text)])
-            self.append(chr(self.defaultStyleNo) * bytestylelen)
+            bytestylelen = self._bytelen(self.charPos, len(self.text))
+            self.buffer.extend(chr(self.defaultStyleNo) * bytestylelen)
+            self.charPos = len(self.text)
+
+        return str(self.buffer)
+
 
-        return super(StyleCollector, self).value()
 
+def isOneBytePerChar(text, bytelenSct):
+    """
+    Returns True iff each character of unicode string text needs exactly
+    one byte in Scintilla.
+    """
+    return bytelenSct(text) == len(text)
+
+
+# Cache of translation tables for orStyleMask(), key is the mask
+_OR_MASK_TABLES = {}
+
+def _getOrMaskTable(mask):
+    table = _OR_MASK_TABLES.get(mask)
+    if table is None:
+        table = "".join([chr(i | mask) for i in xrange(256)])
+        _OR_MASK_TABLES[mask] = table
+
+    return table
+
+
+def orStyleMask(stylebytes, text, bytelenSct, ranges, mask):
+    """
+    Set the bits of mask in the style bytes of the given character ranges.
+
+    stylebytes -- bytearray of style bytes for text, modified in place
+    text -- unicode string the style bytes belong to
+    bytelenSct -- function to calculate the byte length of a unicode string
+    ranges -- iterable of tuples (charPos, charLength) sorted by position
+    mask -- bits to set, e.g. wx.stc.STC_INDIC2_MASK
+
+    Only the bytes inside the ranges are touched (and the work is done
+    in C by bytearray.translate()) so the time needed depends on the size
+    of the ranges, not on the size of the text.
+    """
+    table = _getOrMaskTable(mask)
+    oneBytePerChar = isOneBytePerChar(text, bytelenSct)
+
+    charPos = 0
+    bytePos = 0
+
+    for rangeCharPos, rangeCharLength in ranges:
+        if rangeCharPos < 0:
+            continue
+
+        if oneBytePerChar:
+            byteStart = rangeCharPos
+            byteEnd = rangeCharPos + rangeCharLength
+        else:
+            # Positions are calculated relative to the previous range
+            if rangeCharPos >= charPos:
+                bytePos += bytelenSct(text[charPos:rangeCharPos])
+            else:
+                bytePos -= bytelenSct(text[rangeCharPos:charPos])
+
+            charPos = rangeCharPos
+            byteStart = bytePos
+            byteEnd = byteStart + bytelenSct(
+                    text[rangeCharPos:rangeCharPos + rangeCharLength])
+
+        stylebytes[byteStart:byteEnd] = \
+                stylebytes[byteStart:byteEnd].translate(table)
 
 
 
@@ -0,0 +1,252 @@
+"""
+Determine width and height of images by reading only the file header.
+Supported formats are PNG, GIF, JPEG, BMP and WebP.
+
+The dimensions of local files are kept in a persistent cache (file
+"ImageDims.cache" in the configuration directory) keyed by path, size
+and modification time, so the HTML export doesn't need to read the
+images again. Entries of files which were deleted or moved are dropped
+when the cache is saved.
+"""
+
+from __future__ import with_statement
+
+import os, os.path, struct, threading, traceback
+
+import wx
+
+from .StringOps import pathEnc, utf8Enc, utf8Dec
+
+
+def _probeJpeg(fp):
+    fp.seek(2)
+    while True:
+        # Find next marker, skip fill bytes
+        b = fp.read(1)
+        while b and b != "\xff":
+            b = fp.read(1)
+        while b == "\xff":
+            b = fp.read(1)
+        if not b:
+            return None
+
+        marker = ord(b)
+        if marker == 0x01 or 0xd0 <= marker <= 0xd8:
+            # Markers without length
+            continue
+        if marker in (0xd9, 0xda):
+            # End of image or start of scan before frame header
+            return None
+
+        data = fp.read(2)
+        if len(data) < 2:
+            return None
+        length = struct.unpack(">H", data)[0]
+
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            # Start of frame
+            data = fp.read(5)
+            if len(data) < 5:
+                return None
+            precision, height, width = struct.unpack(">BHH", data)
+            return width, height
+
+        fp.seek(length - 2, 1)
+
+
+def probeImageDims(fp):
+    """
+    Returns tuple (width, height) of image in seekable binary file object
+    fp or None if format isn't supported or header is invalid.
+    """
+    try:
+        return _probeHeader(fp)
+    except struct.error:
+        return None
+
+
+def _probeHeader(fp):
+    head = fp.read(30)
+
+    if head.startswith("\x89PNG\r\n\x1a\n") and head[12:16] == "IHDR":
+        return struct.unpack(">II", head[16:24])
+
+    if head[:6] in ("GIF87a", "GIF89a"):
+        return struct.unpack("<HH", head[6:10])
+
+    if head.startswith("\xff\xd8"):
+        return _probeJpeg(fp)
+
+    if head.startswith("BM") and len(head) >= 26:
+        dibHeaderSize = struct.unpack("<I", head[14:18])[0]
+        if dibHeaderSize == 12:
+            # OS/2 bitmap core header
+            return struct.unpack("<HH", head[18:22])
+        width, height = struct.unpack("<ii", head[18:26])
+        # Height is negative for top-down bitmaps
+        return abs(width), abs(height)
+
+    if head.startswith("RIFF") and head[8:12] == "WEBP":
+        chunk = head[12:16]
+        if chunk == "VP8 " and head[23:26] == "\x9d\x01\x2a":
+            width, height = struct.unpack("<HH", head[26:30])
+            return width & 0x3fff, height & 0x3fff
+        if chunk == "VP8L" and head[20] == "\x2f":
+            bits = struct.unpack("<I", head[21:25])[0]
+            return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+        if chunk == "VP8X":
+            width = struct.unpack("<I", head[24:27] + "\0")[0]
+            height = struct.unpack("<I", head[27:30] + "\0")[0]
+            return width + 1, height + 1
+
+    return None
+
+
+
+class ImageDimsCache(object):
+    """
+    Persistent cache of image dimensions of local files.
+    """
+    FORMAT_HEADER = "WikidPad image dimensions 1"
+
+    def __init__(self, cachePath):
+        self.cachePath = cachePath
+        self.lock = threading.RLock()
+        # Dictionary {path: (size, mtime, width, height)}, None until loaded.
+        # width and height are -1 if dimensions couldn't be determined
+        self.entries = None
+        self.dirty = False
+
+
+    def _getEntries(self):
+        # Must be called with self.lock acquired
+        if self.entries is None:
+            self.entries = {}
+            try:
+                fp = open(pathEnc(self.cachePath), "rb")
+            except IOError:
+                return self.entries
+
+            try:
+                try:
+                    if fp.readline().rstrip("\n") != self.FORMAT_HEADER:
+                        return self.entries
+
+                    for line in fp:
+                        size, mtime, width, height, path = \
+                                line.rstrip("\n").split("\t", 4)
+                        self.entries[utf8Dec(path)[0]] = (int(size),
+                                float(mtime), int(width), int(height))
+                except (IOError, ValueError):
+                    traceback.print_exc()
+            finally:
+                fp.close()
+
+        return self.entries
+
+
+    def getImageDims(self, path, fallbackFct=None):
+        """
+        Returns tuple (width, height) of local image file path or
+        (None, None) if it couldn't be determined.
+
+        fallbackFct -- if not None, function (path) returning (width, height)
+                or (None, None). Called if the image format isn't supported
+                by probeImageDims()
+        """
+        try:
+            st = os.stat(pathEnc(path))
+        except (OSError, IOError):
+            with self.lock:
+                if self._getEntries().pop(path, None) is not None:
+                    self.dirty = True
+            return None, None
+
+        with self.lock:
+            entry = self._getEntries().get(path)
+        if entry is not None and entry[0] == st.st_size and \
+                entry[1] == st.st_mtime:
+            if entry[2] == -1:
+                return None, None
+            return entry[2], entry[3]
+
+        try:
+            fp = open(pathEnc(path), "rb")
+            try:
+                dims = probeImageDims(fp)
+            finally:
+                fp.close()
+        except IOError:
+            dims = None
+
+        if dims is None and fallbackFct is not None:
+            dims = fallbackFct(path)
+            if dims[0] is None:
+                dims = None
+
+        if dims is None:
+            dims = (-1, -1)
+
+        with self.lock:
+            self._getEntries()[path] = (st.st_size, st.st_mtime, dims[0],
+                    dims[1])
+            self.dirty = True
+
+        if dims[0] == -1:
+            return None, None
+
+        return dims
+
+
+    def save(self):
+        """
+        Drop entries of files which don't exist anymore and write cache file
+        if entries changed.
+        """
+        with self.lock:
+            if self.entries is None:
+                # Not loaded, nothing changed
+                return
+
+            for path in self.entries.keys():
+                if not os.path.isfile(pathEnc(path)):
+                    del self.entries[path]
+                    self.dirty = True
+
+            if not self.dirty:
+                return
+
+            lines = [self.FORMAT_HEADER + "\n"]
+            for path, (size, mtime, width, height) in \
+                    self.entries.iteritems():
+                lines.append("%i\t%r\t%i\t%i\t%s\n" % (size, mtime, width,
+                        height, utf8Enc(path)[0]))
+
+            try:
+                fp = open(pathEnc(self.cachePath), "wb")
+                try:
+                    fp.writelines(lines)
+                finally:
+                    fp.close()
+                self.dirty = False
+            except IOError:
+                traceback.print_exc()
+
+
+
+_imageDimsCache = None
+_imageDimsCacheLock = threading.Lock()
+
+
+def getImageDimsCache():
+    """
+    Returns the application wide image dimensions cache.
+    """
+    global _imageDimsCache
+
+    with _imageDimsCacheLock:
+        if _imageDimsCache is None:
+            _imageDimsCache = ImageDimsCache(os.path.join(
+                    wx.GetApp().getGlobalConfigSubDir(), u"ImageDims.cache"))
+
+        return _imageDimsCache
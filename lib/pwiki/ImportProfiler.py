@@ -0,0 +1,190 @@
+"""
+Measures the time the imports need during the start of the application.
+
+If environment variable WIKIDPAD_PROFILE_IMPORTS is set, WikidPadStarter
+calls startFromEnvironment() before anything else is imported. When the
+first main frame is shown, MainApp calls stopAndReport() which writes a
+breakdown of the import times, sorted by cumulative time, to the file
+named by the variable ("-" writes to the console).
+
+Only imports of the main thread are measured. The modules which appear
+in sys.modules while an import runs are attributed to it, the time
+needed by nested imports is part of the cumulative but not of the own
+time of an import.
+"""
+
+import sys, os, threading, traceback, __builtin__
+from time import time as _time
+
+
+class ImportProfiler(object):
+    def __init__(self):
+        self.origImport = None
+        self.thread = None
+        self.startTime = None
+        self.stopTime = None
+        # Stack of frames of running imports, each a list
+        # [name, importer, start time, time of nested imports, new modules]
+        self.stack = []
+        # List of tuples (cumulative time, own time, module names, importer)
+        self.records = []
+        self.knownModules = set()
+        self.knownCount = 0
+
+
+    def install(self):
+        if self.origImport is not None:
+            return
+
+        self.thread = threading.currentThread()
+        self.knownModules = set(sys.modules)
+        self.knownCount = len(sys.modules)
+        self.origImport = __builtin__.__import__
+        self.startTime = _time()
+        __builtin__.__import__ = self._import
+
+
+    def uninstall(self):
+        if self.origImport is None:
+            return
+
+        __builtin__.__import__ = self.origImport
+        self.origImport = None
+        self.stopTime = _time()
+
+
+    def isInstalled(self):
+        return self.origImport is not None
+
+
+    def _collectNewModules(self, modules):
+        """
+        Add names of modules which appeared in sys.modules since last call
+        to list modules.
+        """
+        if len(sys.modules) == self.knownCount:
+            return
+
+        for name in sys.modules.keys():
+            if name not in self.knownModules:
+                self.knownModules.add(name)
+                # Python 2 stores None for failed implicit relative imports
+                if sys.modules[name] is not None:
+                    modules.append(name)
+
+        self.knownCount = len(sys.modules)
+
+
+    def _import(self, name, globals=None, locals=None, fromlist=None,
+            level=-1):
+        if threading.currentThread() is not self.thread:
+            return self.origImport(name, globals, locals, fromlist, level)
+
+        # Modules registered before this import belong to the running import
+        # (a module is put into sys.modules before its code is executed)
+        if self.stack:
+            self._collectNewModules(self.stack[-1][4])
+
+        importer = None
+        if globals is not None:
+            importer = globals.get("__name__")
+
+        frame = [name, importer, _time(), 0.0, []]
+        self.stack.append(frame)
+        try:
+            return self.origImport(name, globals, locals, fromlist, level)
+        finally:
+            self._collectNewModules(frame[4])
+            self.stack.pop()
+            cumulative = _time() - frame[2]
+            if self.stack:
+                self.stack[-1][3] += cumulative
+
+            if frame[4]:
+                self.records.append((cumulative, cumulative - frame[3],
+                        frame[4], importer))
+
+
+    def getReport(self, limit=None):
+        """
+        Returns report as byte string.
+
+        limit -- maximum number of imports to list, None for all
+        """
+        stopTime = self.stopTime
+        if stopTime is None:
+            stopTime = _time()
+
+        records = sorted(self.records, key=lambda r: r[0], reverse=True)
+        if limit is not None:
+            records = records[:limit]
+
+        lines = ["Startup imports: %i modules, %.1f ms imports, "
+                "%.1f ms total" % (sum(len(r[2]) for r in self.records),
+                sum(r[1] for r in self.records) * 1000,
+                (stopTime - self.startTime) * 1000),
+                "%10s %10s  %-40s %s" % ("cumul. ms", "own ms", "module",
+                "imported by")]
+
+        for cumulative, own, modules, importer in records:
+            lines.append("%10.1f %10.1f  %-40s %s" % (cumulative * 1000,
+                    own * 1000, modules[0], importer))
+            for name in modules[1:]:
+                lines.append("%23s%s" % ("", name))
+
+        return "\n".join(lines) + "\n"
+
+
+
+_profiler = None
+
+
+def install():
+    """
+    Start measuring imports.
+    """
+    global _profiler
+
+    if _profiler is None:
+        _profiler = ImportProfiler()
+    _profiler.install()
+
+
+def startFromEnvironment():
+    """
+    Start measuring if environment variable WIKIDPAD_PROFILE_IMPORTS is set.
+    """
+    if os.environ.get("WIKIDPAD_PROFILE_IMPORTS"):
+        install()
+
+
+def getProfiler():
+    return _profiler
+
+
+def stopAndReport():
+    """
+    Stop measuring and write report to the destination given by
+    environment variable WIKIDPAD_PROFILE_IMPORTS. Does nothing if
+    measuring wasn't started.
+    """
+    if _profiler is None or not _profiler.isInstalled():
+        return
+
+    _profiler.uninstall()
+    report = _profiler.getReport()
+    dest = os.environ.get("WIKIDPAD_PROFILE_IMPORTS", "-")
+
+    if dest == "-":
+        # sys.stderr may be redirected to the error log
+        sys.__stderr__.write(report)
+        return
+
+    try:
+        fp = open(dest, "w")
+        try:
+            fp.write(report)
+        finally:
+            fp.close()
+    except IOError:
+        traceback.print_exc()
@@ -0,0 +1,369 @@
+"""
+Incremental re-parsing of page ASTs after edits.
+
+Instead of parsing the whole text of a page again, only the top-level
+nodes of the previous AST which are touched by an edit are parsed again
+(together with one unchanged node on each side) and spliced into the
+tree. If the re-parsed surrounding nodes don't match the previous ones,
+the edit changed block boundaries and None is returned so that the caller
+falls back to a full parse.
+
+Some markup is closed by a delimiter which may be far behind the edit:
+multi-line blocks (e.g. "<<pre", "<<hide", tables) end at a terminator
+line ">>", bold and italics at the next "*" or "_" (or a heading),
+scripts at "%>".
+If an edit adds, removes or reorders such delimiters or changes their
+role (e.g. a "*" becomes the start of bold text instead of a bullet), the
+parse of the text around the re-parsed part may change although the
+margins match (the parser looks ahead for closing delimiters), so a full
+parse is done. Edits which leave the delimiters of the re-parsed part as
+they were (e.g. typing inside a bold word or a block) are parsed
+incrementally.
+"""
+
+import re
+
+from .WikiPyparsing import SyntaxNode, NonTerminalNode, TerminalNode, \
+        buildSyntaxNode
+
+from .Utilities import DUMBTHREADSTOP
+
+
+# Texts shorter than this are always parsed fully
+MIN_TEXT_LENGTH = 4096
+
+# If the re-parsed part would be larger than this fraction of the text,
+# a full parse is done instead
+MAX_FRAGMENT_RATIO = 0.5
+
+# Start or end of markup which may span multiple lines and blocks
+_SPANNING_DELIMITER_RE = re.compile(ur"<<|>>|</?body[ >]|<%|%>|^\+|"
+        ur"(?P<bullet>^[ \t]+\*[ \t])|(?P<attribution>[_*])",
+        re.IGNORECASE | re.UNICODE | re.MULTILINE)
+
+
+
+def findChangedRange(oldText, newText):
+    """
+    Returns tuple (start, oldEnd, newEnd) so that
+    oldText[:start] == newText[:start] and
+    oldText[oldEnd:] == newText[newEnd:] with the unchanged parts
+    as long as possible.
+    """
+    maxPrefix = min(len(oldText), len(newText))
+
+    # Binary search for the common prefix, comparisons of slices are
+    # done in C and therefore much faster than a character loop
+    lo = 0
+    hi = maxPrefix
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if oldText[lo:mid] == newText[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    start = lo
+
+    # Same for the common suffix which must not overlap the prefix
+    maxSuffix = maxPrefix - start
+    oldLen = len(oldText)
+    newLen = len(newText)
+    lo = 0
+    hi = maxSuffix
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if oldText[oldLen - mid:oldLen - lo] == newText[newLen - mid:newLen - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    return (start, oldLen - lo, newLen - lo)
+
+
+
+def _isLineStart(text, pos):
+    return pos == 0 or text[pos - 1] == u"\n"
+
+
+def _charClass(text, pos):
+    if pos < 0 or pos >= len(text):
+        return u""
+
+    c = text[pos]
+    if c.isspace():
+        return u" "
+    elif c.isalnum() or c == u"_":
+        return u"w"
+    else:
+        return u"."
+
+
+def _findSpanningDelimiters(text, start, end):
+    """
+    Returns list of the delimiters of spanning markup in text[start:end]
+    in the order they appear. start must be the start of a line.
+    Whether "*" and "_" start or end bold and italics depends on the
+    characters around them, so these are part of the result.
+    """
+    result = []
+    for m in _SPANNING_DELIMITER_RE.finditer(text, start, end):
+        if m.group("bullet") is not None:
+            result.append(u"bullet")
+        elif m.group("attribution") is not None:
+            result.append(_charClass(text, m.start() - 1) + m.group(0) +
+                    _charClass(text, m.end()))
+        else:
+            result.append(m.group(0).lower())
+
+    return result
+
+
+def _findChildIndex(children, charPos):
+    """
+    Returns index of the child containing charPos or the last child
+    if charPos is behind the end.
+    """
+    lo = 0
+    hi = len(children) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if children[mid].pos <= charPos:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    return lo
+
+
+
+def copyNodeShifted(node, delta, memo=None):
+    """
+    Returns a deep copy of node (including nodes stored as attributes) with
+    all positions moved by delta. The original node is left unchanged because
+    it may be used by other threads.
+    """
+    if memo is None:
+        memo = {}
+
+    result = memo.get(id(node))
+    if result is not None:
+        return result
+
+    if isinstance(node, NonTerminalNode):
+        result = NonTerminalNode([], node.pos + delta, node.name)
+        memo[id(node)] = result
+        result.sub = [copyNodeShifted(c, delta, memo) for c in node.sub]
+    else:
+        result = TerminalNode(node.text, node.pos + delta, node.name)
+        memo[id(node)] = result
+
+    for key, value in node.__dict__.iteritems():
+        if key == "_calcedStrLength":
+            continue
+        result.__dict__[key] = _copyValueShifted(value, delta, memo)
+
+    return result
+
+
+def _copyValueShifted(value, delta, memo):
+    if isinstance(value, SyntaxNode):
+        return copyNodeShifted(value, delta, memo)
+    elif isinstance(value, list):
+        return [_copyValueShifted(v, delta, memo) for v in value]
+    elif isinstance(value, tuple):
+        return tuple(_copyValueShifted(v, delta, memo) for v in value)
+    else:
+        return value
+
+
+
+def nodesEqual(node1, node2, delta=0, memo=None):
+    """
+    Compare structure, names, text and attributes (e.g. level of a heading,
+    key and value of an attribute) of two nodes where node2 is expected
+    to be placed delta characters behind node1.
+    """
+    if memo is None:
+        memo = set()
+
+    if node1.name != node2.name or node1.pos + delta != node2.pos or \
+            node1.strLength != node2.strLength:
+        return False
+
+    # Nodes stored as attributes are often also children, compare only once
+    # (this also stops on cyclic references)
+    key = (id(node1), id(node2))
+    if key in memo:
+        return True
+    memo.add(key)
+
+    if isinstance(node1, NonTerminalNode):
+        if not isinstance(node2, NonTerminalNode):
+            return False
+        if len(node1.sub) != len(node2.sub):
+            return False
+
+        for c1, c2 in zip(node1.sub, node2.sub):
+            if not nodesEqual(c1, c2, delta, memo):
+                return False
+    else:
+        if isinstance(node2, NonTerminalNode):
+            return False
+
+        if node1.text != node2.text:
+            return False
+
+    dict1 = node1.__dict__
+    dict2 = node2.__dict__
+    keys = set(dict1.iterkeys()) | set(dict2.iterkeys())
+    keys.discard("_calcedStrLength")
+
+    for key in keys:
+        if key not in dict1 or key not in dict2:
+            return False
+        if not _valuesEqual(dict1[key], dict2[key], delta, memo):
+            return False
+
+    return True
+
+
+def _valuesEqual(value1, value2, delta, memo):
+    if isinstance(value1, SyntaxNode):
+        if not isinstance(value2, SyntaxNode):
+            return False
+        return nodesEqual(value1, value2, delta, memo)
+    elif isinstance(value1, (list, tuple)):
+        if type(value1) is not type(value2) or len(value1) != len(value2):
+            return False
+        for v1, v2 in zip(value1, value2):
+            if not _valuesEqual(v1, v2, delta, memo):
+                return False
+        return True
+    else:
+        return value1 == value2
+
+
+
+def reparseIncrementally(oldText, oldAst, newText, parseFct,
+        threadstop=DUMBTHREADSTOP):
+    """
+    Build AST for newText based on oldAst which is the AST of oldText.
+
+    parseFct -- function which takes a text and a threadstop and returns
+            the full AST of it
+
+    Returns the new AST or None if a full parse is needed.
+    """
+    if len(newText) < MIN_TEXT_LENGTH or oldAst is None:
+        return None
+
+    children = oldAst.getChildren()
+    if len(children) < 3:
+        return None
+
+    start, oldEnd, newEnd = findChangedRange(oldText, newText)
+    delta = newEnd - oldEnd
+
+    if start == oldEnd and delta == 0:
+        # Nothing changed
+        return oldAst
+
+    # First changed child and one unchanged child before as left margin.
+    # Fragment must start at the beginning of a line
+    firstIdx = _findChildIndex(children, start)
+    leftIdx = max(firstIdx - 1, 0)
+    while leftIdx > 0 and not _isLineStart(oldText, children[leftIdx].pos):
+        leftIdx -= 1
+
+    # Last changed child and one unchanged child behind as right margin.
+    # Fragment must end at the end of a line
+    lastIdx = _findChildIndex(children, max(oldEnd - 1, start))
+    rightIdx = min(lastIdx + 1, len(children) - 1)
+    while rightIdx < len(children) - 1 and not _isLineStart(oldText,
+            children[rightIdx].pos + children[rightIdx].strLength):
+        rightIdx += 1
+
+    fragStart = children[leftIdx].pos
+    oldFragEnd = children[rightIdx].pos + children[rightIdx].strLength
+    newFragEnd = oldFragEnd + delta
+
+    if oldFragEnd < oldEnd or fragStart > start:
+        # Should not happen with a consistent AST
+        return None
+
+    if (newFragEnd - fragStart) > len(newText) * MAX_FRAGMENT_RATIO:
+        return None
+
+    # The fragment consists of whole lines and contains all lines touched
+    # by the edit. The delimiters are compared in order, not only counted,
+    # e.g. swapping "<<pre" and ">>" changes the parse of the rest as well
+    if _findSpanningDelimiters(oldText, fragStart, oldFragEnd) != \
+            _findSpanningDelimiters(newText, fragStart, newFragEnd):
+        # Parse may change up to the end of the text
+        return None
+
+    threadstop.testValidThread()
+
+    fragAst = parseFct(newText[fragStart:newFragEnd], threadstop)
+    if fragAst is None:
+        return None
+
+    fragChildren = fragAst.getChildren()
+    if newFragEnd < len(newText):
+        # Drop zero-length nodes the parser creates at the end of the
+        # string (e.g. "stringEnd"), the fragment ends before the text end
+        while fragChildren and fragChildren[-1].strLength == 0:
+            fragChildren = fragChildren[:-1]
+
+    fragChildren = [copyNodeShifted(c, fragStart) for c in fragChildren]
+
+    # Check that the margins were parsed to the same nodes as before,
+    # otherwise block boundaries have changed
+    leftCount = firstIdx - leftIdx
+    rightCount = rightIdx - lastIdx
+
+    if leftCount + rightCount > len(fragChildren):
+        return None
+
+    for i in xrange(leftCount):
+        if not nodesEqual(children[leftIdx + i], fragChildren[i]):
+            return None
+
+    for i in xrange(1, rightCount + 1):
+        if not nodesEqual(children[rightIdx + 1 - i], fragChildren[-i],
+                delta):
+            return None
+
+    threadstop.testValidThread()
+
+    # Splice together
+    if delta == 0:
+        suffix = children[rightIdx + 1:]
+    else:
+        memo = {}
+        suffix = [copyNodeShifted(c, delta, memo)
+                for c in children[rightIdx + 1:]]
+
+    newSub = children[:leftIdx] + fragChildren + suffix
+
+    return buildSyntaxNode(newSub, 0, oldAst.name)
+
+
+
+def verifyIncrementalParse(oldText, oldAst, newText, parseFct,
+        threadstop=DUMBTHREADSTOP):
+    """
+    Test harness to check correctness of incremental parsing. Returns tuple
+    (<incremental AST or None>, <full AST>, <equal flag>). The equal flag is
+    True if the incremental AST is structurally identical to the full one
+    or if incremental parsing fell back to a full parse.
+    """
+    incAst = reparseIncrementally(oldText, oldAst, newText, parseFct,
+            threadstop)
+    fullAst = parseFct(newText, threadstop)
+
+    if incAst is None:
+        return (incAst, fullAst, True)
+
+    return (incAst, fullAst, nodesEqual(fullAst, incAst))
@@ -24,6 +24,7 @@ from StringOps import mbcsDec, createRandomString, pathEnc, \
         writeEntireFile, loadEntireFile
 
 import SystemInfo
+import ImportProfiler
 import WindowLayout
 from CmdLineAction import CmdLineAction
 
@@ -401,6 +402,9 @@ class App(wx.App, MiscEventSourceMixin):
 
         self.startPersonalWikiFrame(cmdLine)
 
+        # Write import times of startup if measured
+        ImportProfiler.stopAndReport()
+
         return True
 
 
@@ -448,6 +452,11 @@ class App(wx.App, MiscEventSourceMixin):
         self.pluginManager.loadPlugins([ u'KeyBindings.py',
                 u'EvalLibrary.py'] )
 
+        if self.getGlobalConfig().getboolean("main", "plugins_reportLoadTimes",
+                False):
+            sys.stderr.write("Application-wide plugins:\n" +
+                    self.pluginManager.getLoadStatisticsReport() + "\n")
+
         # Register options
         registerOptionsApi.registerOptions(1, self)
 
@@ -649,9 +658,13 @@ class App(wx.App, MiscEventSourceMixin):
 
     def OnExit(self):
         import Ipc
+        import WorkerProcesses
 
         self.getInsertionPluginManager().taskEnd()
 
+        # Worker processes would otherwise survive the application
+        WorkerProcesses.terminateAllPools()
+
         if self.removeAppLockOnExit:
             try:
                 os.remove(os.path.join(self.globalConfigSubDir, "AppLock.lock"))
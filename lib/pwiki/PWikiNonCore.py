@@ -11,7 +11,11 @@ import traceback, os.path
 
 import wx
 
-from . import wxHelper, StringOps, Exporters, DocPages
+from . import wxHelper, StringOps, DocPages
+from .Utilities import lazyImport
+
+# Only needed for exports
+Exporters = lazyImport("pwiki.Exporters")
 
 from .wikidata import WikiDataManager
 
@@ -0,0 +1,355 @@
+"""
+Parse the texts of many wiki pages in worker processes ahead of a serial
+consumer (e.g. the HTML export or the rebuild of the wiki).
+
+The main process takes a snapshot of each page (live text, wiki language,
+format details) and sends it to a pool of worker processes which run the
+wiki language parser. The resulting ASTs are kept until the consumer
+reaches the page and stored in the page AST cache of the wiki document
+right before it processes the page (one at a time, so the ASTs of large
+pages don't push each other out of the cache before they are used). The
+consumer gets exactly the AST it would have built itself.
+
+ParallelMetaDataExtractor (used by the rebuild) doesn't send back ASTs but
+extracts the meta data (attributes, todos, child relations, heading match
+terms) in the workers and returns them as plain tuples. The consumer writes
+them to the database in page order, so attributes which change how later
+pages are parsed (e.g. global attributes) are still applied before these
+pages are processed: if the format details of a page differ from the ones
+a worker used, the consumer parses the page itself.
+
+The workers are created by fork() (see WorkerProcesses, the pool is only
+kept for one run) and inherit the parser factories and a
+snapshot of the document data the parsers need (camelcase blacklists).
+The base page of the format details (needed to resolve relative links) is
+replaced by a stand-in with the page name. The workers never access the
+database.
+
+Pages with auto-linking (which needs the set of all wiki words) and pages
+a worker couldn't parse are left to the consumer. Where fork() isn't
+available everything is parsed by the consumer as before.
+"""
+
+import copy, traceback
+from collections import deque
+
+import wx
+
+from .wikidata.PageAstCache import PageAstCache
+from .Utilities import DUMBTHREADSTOP
+from . import WorkerProcesses
+
+
+# Number of pages sent to a worker at once
+CHUNK_SIZE = 20
+
+# Maximum number of chunks in work per worker process
+CHUNKS_PER_PROCESS = 3
+
+# Parallel parsing is only started for at least this number of pages
+MIN_PAGE_COUNT = 2 * CHUNK_SIZE
+
+
+class _SnapshotDocument(object):
+    """
+    Stands in for the wiki document inside the worker processes.
+    """
+    def __init__(self, wikiDocument):
+        self.ccWordBlacklist = wikiDocument.getCcWordBlacklist()
+        self.nccWordBlacklist = wikiDocument.getNccWordBlacklist()
+
+    def getCcWordBlacklist(self):
+        return self.ccWordBlacklist
+
+    def getNccWordBlacklist(self):
+        return self.nccWordBlacklist
+
+
+class _SnapshotPage(object):
+    """
+    Stands in for the base page inside the worker processes.
+    """
+    def __init__(self, wikiDocument, wikiWord):
+        self.wikiDocument = wikiDocument
+        self.wikiWord = wikiWord
+
+    def getWikiDocument(self):
+        return self.wikiDocument
+
+    def getWikiWord(self):
+        return self.wikiWord
+
+
+# Tuple (parserFactories, snapshotDocument), set in the main process before
+# the worker processes are forked
+_workerState = None
+
+
+def _setDocument(details, document):
+    """
+    Set document of format details object and of its wiki language details.
+    """
+    details.wikiDocument = document
+    if hasattr(details.wikiLanguageDetails, "wikiDocument"):
+        details.wikiLanguageDetails.wikiDocument = document
+
+
+def _parseChunk(tasks):
+    """
+    Runs in worker process. tasks is a list of tuples (intLanguageName,
+    wikiWord, text, formatDetails). Returns list of page ASTs, None for each
+    page which couldn't be parsed.
+    """
+    parserFactories, snapshotDocument = _workerState
+    result = []
+
+    for intLanguageName, wikiWord, text, formatDetails in tasks:
+        try:
+            _setDocument(formatDetails, snapshotDocument)
+            formatDetails.basePage = _SnapshotPage(snapshotDocument, wikiWord)
+            parser = parserFactories[intLanguageName](intLanguageName, False)
+            result.append(parser.parse(intLanguageName, text, formatDetails,
+                    threadstop=DUMBTHREADSTOP))
+        except Exception:
+            # E.g. parser of a wiki language needs more from the document
+            traceback.print_exc()
+            result.append(None)
+
+    return result
+
+
+def _extractChunk(tasks, headingsAsAliasesDepth):
+    """
+    Runs in worker process. tasks is a list of tuples as for _parseChunk().
+    Returns list of tuples (attrs, todos, childRelations, headingMatchTerms)
+    as returned by WikiPage.extractAttributesFromPageAst() and
+    WikiPage.extractMainDbCacheDataFromPageAst(), None for each page which
+    couldn't be parsed.
+    """
+    from .DocPages import WikiPage
+
+    result = []
+    for pageAst, task in zip(_parseChunk(tasks), tasks):
+        if pageAst is None:
+            result.append(None)
+            continue
+
+        try:
+            result.append((WikiPage.extractAttributesFromPageAst(pageAst),) +
+                    WikiPage.extractMainDbCacheDataFromPageAst(pageAst,
+                    task[1], headingsAsAliasesDepth))
+        except Exception:
+            traceback.print_exc()
+            result.append(None)
+
+    return result
+
+
+
+class ParallelPageParser(object):
+    def __init__(self, wikiDocument, processCount, parserFactories=None):
+        """
+        wikiDocument -- WikiDataManager object
+        processCount -- configured number of worker processes, -1 means
+                one per CPU, 0 parse nothing in advance
+        parserFactories -- dictionary {intLanguageName: parser factory},
+                if None it is built from the wiki languages of the application
+        """
+        self.wikiDocument = wikiDocument
+        self.processCount = processCount
+        self.parserFactories = parserFactories
+        self.pool = None
+        # Statistics
+        self.preparsedCount = 0
+
+
+    def _startPool(self):
+        global _workerState
+
+        processCount = WorkerProcesses.getProcessCount(self.processCount)
+        if processCount < 2:
+            return False
+
+        parserFactories = self.parserFactories
+        if parserFactories is None:
+            parserFactories = dict((desc[0], desc[2]) for desc in
+                    wx.GetApp().listWikiLanguageDescriptions())
+
+        _workerState = (parserFactories,
+                _SnapshotDocument(self.wikiDocument))
+        try:
+            self.pool = WorkerProcesses.createPool(processCount)
+        finally:
+            # Only needed while forking
+            _workerState = None
+
+        if self.pool is None:
+            return False
+
+        self.processCount = processCount
+        return True
+
+
+    def _getPage(self, word):
+        return self.wikiDocument.getWikiPage(word).getNonAliasPage()
+
+
+    def _createTask(self, word):
+        """
+        Returns tuple (unifName, intLanguageName, wikiWord, text,
+        formatDetails) or None if page shouldn't be parsed in advance.
+        """
+        try:
+            page = self._getPage(word)
+            if page.getLivePageAstIfAvailable() is not None:
+                return None
+
+            text = page.getLiveText()
+            formatDetails = page.getFormatDetails()
+        except Exception:
+            # Let the consumer handle the problem
+            return None
+
+        if not text or not PageAstCache.isCacheable(formatDetails):
+            return None
+
+        return (page.getUnifiedPageName(), page.getWikiLanguageName(),
+                page.getWikiWord(), text, formatDetails)
+
+
+    def _submitChunk(self, workerTasks):
+        """
+        Send list of worker tasks to the pool, returns AsyncResult.
+        """
+        return self.pool.apply_async(_parseChunk, (workerTasks,))
+
+
+    def _handleResult(self, task, pageAst):
+        """
+        Called in the main process with the result of the worker for a task
+        right before the word of the task is yielded to the consumer.
+        """
+        self.wikiDocument.getPageAstCache().put(task[0], task[3], task[4],
+                pageAst)
+
+
+    def iterPreparsedWords(self, words):
+        """
+        Generator yielding the words of sequence words in the same order.
+        When a word is yielded, the AST of its page is in the page AST cache
+        if it could be parsed in advance (for subclasses see _handleResult()).
+        """
+        if len(words) < MIN_PAGE_COUNT or not self._startPool():
+            for word in words:
+                yield word
+            return
+
+        # Deque of tuples (chunk words, chunk tasks, AsyncResult)
+        pending = deque()
+        wordIter = iter(words)
+        exhausted = False
+
+        while True:
+            while not exhausted and \
+                    len(pending) < self.processCount * CHUNKS_PER_PROCESS:
+                chunkWords = []
+                for word in wordIter:
+                    chunkWords.append(word)
+                    if len(chunkWords) == CHUNK_SIZE:
+                        break
+                else:
+                    exhausted = True
+
+                if not chunkWords:
+                    break
+
+                chunkTasks = [self._createTask(word) for word in chunkWords]
+                # Copies without document references are sent to the workers
+                workerTasks = []
+                for task in chunkTasks:
+                    if task is None:
+                        continue
+                    formatDetails = task[4].copyWithoutBasePage()
+                    formatDetails.wikiLanguageDetails = copy.copy(
+                            formatDetails.wikiLanguageDetails)
+                    _setDocument(formatDetails, None)
+                    workerTasks.append((task[1], task[2], task[3],
+                            formatDetails))
+
+                pending.append((chunkWords, chunkTasks,
+                        self._submitChunk(workerTasks)))
+
+            if not pending:
+                break
+
+            chunkWords, chunkTasks, asyncResult = pending.popleft()
+            try:
+                results = iter(asyncResult.get())
+            except Exception:
+                traceback.print_exc()
+                results = None
+
+            chunkResults = [None] * len(chunkTasks)
+            if results is not None:
+                for i, task in enumerate(chunkTasks):
+                    if task is not None:
+                        chunkResults[i] = results.next()
+
+            for word, task, result in zip(chunkWords, chunkTasks,
+                    chunkResults):
+                if result is not None:
+                    self._handleResult(task, result)
+                    self.preparsedCount += 1
+
+                yield word
+
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        if self.pool is not None:
+            WorkerProcesses.terminatePool(self.pool)
+            self.pool = None
+
+
+
+class ParallelMetaDataExtractor(ParallelPageParser):
+    def __init__(self, wikiDocument, processCount, getPageFct,
+            parserFactories=None):
+        """
+        wikiDocument, processCount, parserFactories -- see ParallelPageParser
+        getPageFct -- function taking a word and returning the (non-alias)
+                page the consumer will process
+        """
+        ParallelPageParser.__init__(self, wikiDocument, processCount,
+                parserFactories)
+        self.getPageFct = getPageFct
+        self.headingsAsAliasesDepth = wikiDocument.getWikiConfig().getint(
+                "main", "headingsAsAliases_depth")
+        # Dictionary {word: (text, formatDetails, metaData)} of the results
+        # not yet fetched by the consumer
+        self.results = {}
+
+
+    def _getPage(self, word):
+        return self.getPageFct(word)
+
+
+    def _submitChunk(self, workerTasks):
+        return self.pool.apply_async(_extractChunk, (workerTasks,
+                self.headingsAsAliasesDepth))
+
+
+    def _handleResult(self, task, metaData):
+        self.results[task[2]] = (task[3], task[4], metaData)
+
+
+    def popMetaData(self, word):
+        """
+        Call when word was yielded by iterPreparsedWords(). Returns tuple
+        (text, formatDetails, (attrs, todos, childRelations,
+        headingMatchTerms)) with the text and format details the worker
+        used, or None if the page wasn't processed in advance.
+        """
+        return self.results.pop(word, None)
@@ -0,0 +1,222 @@
+"""
+Content scan engine for wiki-wide searches without search index.
+
+The pages are delivered in chunks of (word, content) tuples (usually read
+through a separate database connection, see
+WikiDataManager._iterContentChunks()) and tested either in the calling
+thread or in a pool of worker processes (see WorkerProcesses). The pool
+is kept for later searches until the number of processes changes or the
+application exits.
+
+Worker processes can't use the search nodes directly (they hold references
+to the wiki document), so the search tree is converted to a "standalone
+test", a nested tuple which can be pickled, by the getStandaloneTest()
+methods of the search nodes. The tuple has one of the forms:
+
+    ("true",)
+    ("not", <sub test>)
+    ("and", <left test>, <right test>)
+    ("or", <left test>, <right test>)
+    ("regex", <pattern>, <flags>)  -- regex searched in content
+    ("str", <sub string>)  -- sub string searched in content
+    ("pageRegex", <pattern>, <flags>)  -- regex matched against page name
+    ("words", <frozenset of words>)  -- page name must be in set
+
+This module must not import wx (directly or indirectly) because it is
+imported by the worker processes.
+"""
+
+from __future__ import with_statement
+
+import re, threading
+
+from . import WorkerProcesses
+
+
+# Number of outstanding chunks per worker process
+_QUEUED_CHUNKS_PER_PROCESS = 2
+
+# Timeout in seconds when waiting for a worker result before the
+# threadstop is checked again
+_RESULT_POLL_TIMEOUT = 0.05
+
+
+_compiledRegexCache = {}
+
+def _getCompiledRegex(pattern, flags):
+    key = (pattern, flags)
+    compiled = _compiledRegexCache.get(key)
+    if compiled is None:
+        compiled = re.compile(pattern, flags)
+        _compiledRegexCache[key] = compiled
+
+    return compiled
+
+
+def evalStandaloneTest(test, word, text):
+    """
+    Returns True iff page word with content text passes standalone test.
+    """
+    kind = test[0]
+
+    if kind == "and":
+        return evalStandaloneTest(test[1], word, text) and \
+                evalStandaloneTest(test[2], word, text)
+    elif kind == "or":
+        return evalStandaloneTest(test[1], word, text) or \
+                evalStandaloneTest(test[2], word, text)
+    elif kind == "not":
+        return not evalStandaloneTest(test[1], word, text)
+    elif kind == "regex":
+        return _getCompiledRegex(test[1], test[2]).search(text) is not None
+    elif kind == "str":
+        return text.find(test[1]) != -1
+    elif kind == "pageRegex":
+        return _getCompiledRegex(test[1], test[2]).match(word) is not None
+    elif kind == "words":
+        return word in test[1]
+    elif kind == "true":
+        return True
+
+    raise ValueError("Unknown standalone test %r" % kind)
+
+
+def _testChunk(test, chunk):
+    """
+    Called in worker process. Returns list of words in chunk passing test.
+    """
+    return [word for word, text in chunk if evalStandaloneTest(test, word, text)]
+
+
+
+_workerPool = None
+_workerPoolProcessCount = 0
+_workerPoolLock = threading.RLock()
+
+
+def _getWorkerPool(processCount):
+    """
+    Returns the worker pool with processCount processes or None if
+    worker processes are not available.
+    """
+    global _workerPool, _workerPoolProcessCount
+
+    with _workerPoolLock:
+        if _workerPool is not None and \
+                _workerPoolProcessCount == processCount and \
+                WorkerProcesses.isPoolLive(_workerPool):
+            return _workerPool
+
+        _terminateWorkerPool()
+
+        _workerPool = WorkerProcesses.createPool(processCount)
+        if _workerPool is not None:
+            _workerPoolProcessCount = processCount
+
+        return _workerPool
+
+
+def _terminateWorkerPool():
+    global _workerPool, _workerPoolProcessCount
+
+    with _workerPoolLock:
+        if _workerPool is None:
+            return
+
+        WorkerProcesses.terminatePool(_workerPool)
+
+        _workerPool = None
+        _workerPoolProcessCount = 0
+
+
+def scanChunks(chunkIter, testFct, standaloneTest=None, processCount=1,
+        foundCallback=None, threadstop=None):
+    """
+    Test all pages delivered by chunkIter and return set of words
+    of matching pages.
+
+    chunkIter -- iterator over lists of tuples (word, content)
+    testFct -- function (word, text) returning True if page matches, used
+            if worker processes aren't used
+    standaloneTest -- standalone test equivalent to testFct or None if
+            search tree can't be converted
+    processCount -- number of worker processes as returned by
+            WorkerProcesses.getProcessCount(), if < 2 or if
+            standaloneTest is None the test is done in the calling thread
+    foundCallback -- if not None, called with a list of newly found words
+            as soon as a chunk is processed. Called in the calling thread
+    threadstop -- threadstop object, checked between chunks
+    """
+    if threadstop is None:
+        from .Utilities import DUMBTHREADSTOP
+        threadstop = DUMBTHREADSTOP
+
+    pool = None
+    if standaloneTest is not None and processCount > 1:
+        pool = _getWorkerPool(processCount)
+
+    if pool is None:
+        return _scanChunksInThread(chunkIter, testFct, foundCallback,
+                threadstop)
+    else:
+        return _scanChunksInPool(pool, chunkIter, standaloneTest,
+                processCount * _QUEUED_CHUNKS_PER_PROCESS, foundCallback,
+                threadstop)
+
+
+def _scanChunksInThread(chunkIter, testFct, foundCallback, threadstop):
+    result = set()
+
+    for chunk in chunkIter:
+        threadstop.testValidThread()
+        found = [word for word, text in chunk if testFct(word, text) == True]
+        if found:
+            result.update(found)
+            if foundCallback is not None:
+                foundCallback(found)
+
+    threadstop.testValidThread()
+    return result
+
+
+def _scanChunksInPool(pool, chunkIter, standaloneTest, maxQueued,
+        foundCallback, threadstop):
+    result = set()
+    # List of AsyncResult objects in order of submission
+    pending = []
+    chunkIter = iter(chunkIter)
+    exhausted = False
+
+    while True:
+        # Keep the workers busy but don't read the whole database ahead
+        while not exhausted and len(pending) < maxQueued:
+            threadstop.testValidThread()
+            try:
+                chunk = chunkIter.next()
+            except StopIteration:
+                exhausted = True
+                break
+
+            pending.append(pool.apply_async(_testChunk,
+                    (standaloneTest, chunk)))
+
+        if not pending:
+            break
+
+        # Wait for the oldest chunk while checking the threadstop.
+        # Outstanding chunks are small so they just run out if the
+        # search is stopped
+        asyncResult = pending[0]
+        while not asyncResult.ready():
+            threadstop.testValidThread()
+            asyncResult.wait(_RESULT_POLL_TIMEOUT)
+
+        del pending[0]
+        found = asyncResult.get()
+        if found:
+            result.update(found)
+            if foundCallback is not None:
+                foundCallback(found)
+
+    threadstop.testValidThread()
+    return result
@@ -53,6 +53,16 @@ class WikiPageFormatDetails(object):
         # TODO Allow only if currently dummy language is set?
         self.wikiLanguageDetails = wikiLanguageDetails
 
+    def copyWithoutBasePage(self):
+        """
+        Return an equivalent details object without reference to the base
+        page, e.g. to keep it longer than the page object.
+        """
+        return WikiPageFormatDetails(withCamelCase=self.withCamelCase,
+                wikiDocument=self.wikiDocument, autoLinkMode=self.autoLinkMode,
+                noFormat=self.noFormat, paragraphMode=self.paragraphMode,
+                wikiLanguageDetails=self.wikiLanguageDetails)
+
     def isEquivTo(self, details):
         """
         Compares with other details object if both are "equivalent"
@@ -92,6 +102,96 @@ def getFootnoteAnchorDict(pageAst):
 
 
 
+class AutoLinkRelaxMatcher(object):
+    """
+    Multi-pattern matcher for auto-links in "relax" mode. A word matches
+    if its alphanumeric parts appear case-insensitively as complete
+    consecutive tokens in the text, separated by arbitrary non-alphanumeric
+    characters.
+
+    All words are stored in a trie over the lowercased tokens so a text
+    is processed in one pass instead of searching one regular expression
+    per word.
+    """
+
+    # Splits a word into its alphanumeric parts
+    SPLIT_RE = re.compile(ur"[\W]+", re.IGNORECASE | re.UNICODE)
+    # Finds the alphanumeric tokens of a text
+    TOKEN_RE = re.compile(ur"\w+", re.UNICODE)
+
+    def __init__(self, words):
+        """
+        words -- Sequence of words in order of priority. If more than one
+                word matches at the same position, the first one wins.
+        """
+        # Each trie node is a dictionary from lowercased token to child node.
+        # Key None holds the tuple (priority, word) of the word which ends
+        # at this node.
+        self.trie = {}
+
+        for priority, word in enumerate(words):
+            parts = [p.lower() for p in self.SPLIT_RE.split(word) if p != u""]
+            if len(parts) == 0:
+                continue
+
+            node = self.trie
+            for part in parts:
+                node = node.setdefault(part, {})
+
+            # Keep word with highest priority
+            node.setdefault(None, (priority, word))
+
+
+    def isEmpty(self):
+        return len(self.trie) == 0
+
+
+    def finditer(self, text):
+        """
+        Yields tuples (start, end, word) for all non-overlapping matches
+        in text from left to right. At the same position the word with
+        highest priority is chosen.
+        """
+        if len(self.trie) == 0:
+            return
+
+        tokens = [(m.start(0), m.end(0), m.group(0).lower())
+                for m in self.TOKEN_RE.finditer(text)]
+        tokenCount = len(tokens)
+        root = self.trie
+
+        i = 0
+        while i < tokenCount:
+            node = root.get(tokens[i][2])
+            if node is None:
+                i += 1
+                continue
+
+            found = None
+            foundEnd = None
+            j = i
+            while True:
+                entry = node.get(None)
+                if entry is not None and (found is None or entry < found):
+                    found = entry
+                    foundEnd = j
+
+                j += 1
+                if j >= tokenCount:
+                    break
+                node = node.get(tokens[j][2])
+                if node is None:
+                    break
+
+            if found is None:
+                i += 1
+                continue
+
+            yield (tokens[i][0], tokens[foundEnd][1], found[1])
+            i = foundEnd + 1
+
+
+
 # def coalesceTokens(tokens):
 #     """
 #     Coalesce neighboured "Default" tokens.
@@ -57,7 +57,8 @@ from .Ipc import EVT_REMOTE_COMMAND
 from . import AttributeHandling, SpellChecker
 
 
-from . import AdditionalDialogs
+# Dialogs are imported when needed
+AdditionalDialogs = Utilities.lazyImport("pwiki.AdditionalDialogs")
 
 
 from . import StringOps
@@ -296,6 +297,11 @@ camelCaseWordsEnabled: false;a=[camelCaseWordsEnabled: false]\\n
         self.pluginManager.loadPlugins([ u'KeyBindings.py',
                 u'EvalLibrary.py' ] )
 
+        if self.getConfig().getboolean("main", "plugins_reportLoadTimes",
+                False):
+            sys.stderr.write("Plugins of main window:\n" +
+                    self.pluginManager.getLoadStatisticsReport() + "\n")
+
 
         self.attributeChecker = AttributeHandling.AttributeChecker(self)
 
@@ -3919,7 +3925,7 @@ camelCaseWordsEnabled: false;a=[camelCaseWordsEnabled: false]\\n
         Returns True if renaming was done successful.
         
         modifyText -- Should the text of links to the renamed page be
-                modified? (This text replacement works unreliably)
+                modified?
         processSubpages -- Should subpages be renamed as well?
         """
         if wikiWord is None or not self.requireWriteAccess():
@@ -3936,21 +3942,18 @@ camelCaseWordsEnabled: false;a=[camelCaseWordsEnabled: false]\\n
 
             self.saveAllDocPages()
 
-            # TODO Don't recycle variable names!
-            for wikiWord, toWikiWord in renameSeq:
-
-                if wikiWord == wikiDoc.getWikiName():
-                    # Renaming of root word = renaming of wiki config file
-                    wikiConfigFilename = wikiDoc.getWikiConfigPath()
-                    self.removeFromWikiHistory(wikiConfigFilename)
-    #                 self.wikiHistory.remove(wikiConfigFilename)
-                    wikiDoc.renameWikiWord(wikiWord, toWikiWord,
-                            modifyText)
-                    # Store some additional information
-                    self.lastAccessedWiki(wikiDoc.getWikiConfigPath())
-                else:
-                    wikiDoc.renameWikiWord(wikiWord, toWikiWord,
-                            modifyText)
+            renamesRoot = wikiDoc.getWikiName() in \
+                    [fromWord for fromWord, toWord in renameSeq]
+
+            if renamesRoot:
+                # Renaming of root word = renaming of wiki config file
+                self.removeFromWikiHistory(wikiDoc.getWikiConfigPath())
+
+            wikiDoc.renameWikiWords(renameSeq, modifyText)
+
+            if renamesRoot:
+                # Store some additional information
+                self.lastAccessedWiki(wikiDoc.getWikiConfigPath())
 
             return True
         except (IOError, OSError, DbAccessError), e:
@@ -1,13 +1,16 @@
 from __future__ import with_statement
 
 from zipimport import zipimporter
-import os, sys, traceback, os.path, imp, new, collections
+import os, sys, traceback, os.path, imp, new, collections, threading, time, \
+        types
+import cPickle as pickle
 
 # sys.path.append(ur"C:\Daten\Projekte\Wikidpad\Next20\extensions")
 
 import wx
 
 import Utilities
+import Consts
 
 from .StringOps import mbcsEnc, pathEnc
 
@@ -56,9 +59,287 @@ from .StringOps import mbcsEnc, pathEnc
    only one return value, you can unpack it directly to a variable with the 
    following syntax:
    a, = api.call1()
+
+   The descriptors and attribute names of each .py plugin are recorded in a
+   manifest cache. If a plugin file is unchanged since it was recorded, it is
+   not loaded at startup. A LazyPluginModule stands in for it instead and the
+   real module is loaded when one of its functions is called first. Plugins
+   which don't implement any API of a plugin manager aren't loaded by it at
+   all.
+
+   This is only done for plugins whose top level code is unconditional and
+   which assign a literal to WIKIDPAD_PLUGIN (see hasStaticManifest()).
+   Plugins which e.g. try imports or check the platform at import time are
+   always loaded.
    """
 
 
+
+def hasStaticManifest(path):
+    """
+    Returns True if the WIKIDPAD_PLUGIN descriptors and the module attributes
+    of .py plugin file path are the same each time it is loaded: the top
+    level consists only of imports, function and class definitions and
+    assignments, and WIKIDPAD_PLUGIN (if any) is assigned a literal once.
+    """
+    import ast
+
+    try:
+        with open(pathEnc(path), "rU") as f:
+            tree = ast.parse(f.read(), mbcsEnc(path, "replace")[0])
+    except Exception:
+        return False
+
+    pluginAssignCount = 0
+    for stmt in tree.body:
+        if isinstance(stmt, (ast.Import, ast.ImportFrom, ast.FunctionDef,
+                ast.ClassDef, ast.Pass)):
+            continue
+
+        if isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Str):
+            # Docstring
+            continue
+
+        if isinstance(stmt, (ast.Assign, ast.AugAssign)):
+            if isinstance(stmt, ast.Assign):
+                targets = stmt.targets
+            else:
+                targets = [stmt.target]
+
+            if not any(isinstance(t, ast.Name) and t.id == "WIKIDPAD_PLUGIN"
+                    for t in targets):
+                continue
+
+            if isinstance(stmt, ast.AugAssign):
+                return False
+            try:
+                ast.literal_eval(stmt.value)
+            except ValueError:
+                return False
+
+            pluginAssignCount += 1
+            continue
+
+        # Conditional code (if, try, loops, ...) or calls
+        return False
+
+    return pluginAssignCount <= 1
+
+
+
+# Changed if the format of the manifest cache entries changes
+_MANIFEST_FORMAT = 2
+
+
+class PluginManifestCache(object):
+    """
+    Persistent record of the WIKIDPAD_PLUGIN descriptors and attribute names
+    of plugin files, keyed by path, size and modification time.
+    """
+    def __init__(self, cachePath):
+        self.cachePath = cachePath
+        self.lock = threading.RLock()
+        # Dictionary {path: (size, mtime, manifest)}, None until loaded.
+        # manifest is tuple (descriptors, function names, other names) or
+        # None if the plugin must always be loaded (see hasStaticManifest())
+        self.entries = None
+        self.dirty = False
+
+
+    def _getEntries(self):
+        # Must be called with self.lock acquired
+        if self.entries is None:
+            self.entries = {}
+            try:
+                f = open(pathEnc(self.cachePath), "rb")
+            except IOError:
+                return self.entries
+
+            try:
+                try:
+                    data = pickle.load(f)
+                    # A new version may change the plugin API
+                    if isinstance(data, tuple) and len(data) == 3 and \
+                            data[0] == Consts.VERSION_TUPLE and \
+                            data[1] == _MANIFEST_FORMAT:
+                        self.entries = data[2]
+                except Exception:
+                    traceback.print_exc()
+            finally:
+                f.close()
+
+        return self.entries
+
+
+    def _getCurrentEntry(self, path, st):
+        with self.lock:
+            entry = self._getEntries().get(path)
+
+        if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime:
+            return None
+
+        return entry
+
+
+    def get(self, path):
+        """
+        Returns tuple (descriptors, function names, other names) for plugin
+        file path or None if not known, changed or the plugin must always be
+        loaded. descriptors is None if the module has no WIKIDPAD_PLUGIN
+        attribute.
+        """
+        try:
+            st = os.stat(pathEnc(path))
+        except (OSError, IOError):
+            return None
+
+        entry = self._getCurrentEntry(path, st)
+        if entry is None:
+            return None
+
+        return entry[2]
+
+
+    def put(self, path, module):
+        """
+        Record descriptors and attribute names of just loaded module from
+        plugin file path.
+        """
+        try:
+            st = os.stat(pathEnc(path))
+        except (OSError, IOError):
+            return
+
+        if self._getCurrentEntry(path, st) is not None:
+            # Recorded already as a plugin which must always be loaded
+            return
+
+        if hasStaticManifest(path):
+            functionNames = []
+            otherNames = []
+            for name, value in module.__dict__.iteritems():
+                if name.startswith("__"):
+                    continue
+                # Only plain functions get a stub, everything else (classes,
+                # other callables) loads the real module when accessed
+                if isinstance(value, types.FunctionType):
+                    functionNames.append(name)
+                else:
+                    otherNames.append(name)
+
+            manifest = (getattr(module, "WIKIDPAD_PLUGIN", None),
+                    frozenset(functionNames), frozenset(otherNames))
+        else:
+            manifest = None
+
+        with self.lock:
+            self._getEntries()[path] = (st.st_size, st.st_mtime, manifest)
+            self.dirty = True
+
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            try:
+                f = open(pathEnc(self.cachePath), "wb")
+                try:
+                    pickle.dump((Consts.VERSION_TUPLE, _MANIFEST_FORMAT,
+                            self.entries), f, pickle.HIGHEST_PROTOCOL)
+                finally:
+                    f.close()
+                self.dirty = False
+            except Exception:
+                # E.g. descriptors which can't be pickled
+                traceback.print_exc()
+
+
+
+_manifestCache = None
+_manifestCacheLock = threading.Lock()
+
+
+def getPluginManifestCache():
+    """
+    Returns the application wide manifest cache or None if the application
+    isn't initialized.
+    """
+    global _manifestCache
+
+    with _manifestCacheLock:
+        if _manifestCache is None:
+            app = wx.GetApp()
+            if app is None:
+                return None
+            _manifestCache = PluginManifestCache(os.path.join(
+                    app.getGlobalConfigSubDir(), u"PluginManifest.cache"))
+
+        return _manifestCache
+
+
+
+# Serializes loading of modules behind LazyPluginModule objects
+_lazyLoadLock = threading.RLock()
+
+
+class LazyPluginModule(object):
+    """
+    Stands in for a plugin module until one of its functions is called or
+    another attribute is needed.
+    """
+    def __init__(self, name, descriptors, functionNames, otherNames,
+            loadFct):
+        """
+        name -- full module name
+        descriptors -- content of WIKIDPAD_PLUGIN
+        functionNames -- set of names of module attributes which are plain
+                functions
+        otherNames -- set of names of other module attributes
+        loadFct -- function without parameters which loads and returns the
+                real module
+        """
+        self.__name__ = name
+        self.WIKIDPAD_PLUGIN = descriptors
+        self._functionNames = functionNames
+        self._otherNames = otherNames
+        self._loadFct = loadFct
+        self._module = None
+
+
+    def getRealModule(self):
+        with _lazyLoadLock:
+            if self._module is None:
+                self._module = self._loadFct()
+                self._loadFct = None
+
+            return self._module
+
+
+    def _createStub(self, name):
+        def stub(*args, **kwargs):
+            return getattr(self.getRealModule(), name)(*args, **kwargs)
+
+        stub.__name__ = name
+        return stub
+
+
+    def __getattr__(self, attr):
+        # Only called if attr wasn't found in the instance
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+
+        if attr in self._functionNames:
+            # Loading is deferred until the function is called
+            stub = self._createStub(attr)
+            self.__dict__[attr] = stub
+            return stub
+
+        if attr in self._otherNames:
+            return getattr(self.getRealModule(), attr)
+
+        raise AttributeError(attr)
+
+
 class SimplePluginAPI(object):
     """encapsulates a single plugin api and stores the functions of various
        plugins implementing that api. It takes a unique descriptor and a list
@@ -222,6 +503,10 @@ class PluginManager(object):
         self.plugins = {}  
         self.directories = directories
         self.systemDirIdx = systemDirIdx
+        # List of lists [path, state, load time in seconds] for each plugin
+        # file in the order they were processed. State is one of "loaded",
+        # "deferred", "loaded on demand", "not needed" or "failed"
+        self.loadStatistics = []
         
     def registerSimplePluginAPI(self, descriptor, functions):
         api = SimplePluginAPI(descriptor, functions)
@@ -310,6 +595,7 @@ class PluginManager(object):
            appearing in earlier directories are not loaded from later ones."""
         import imp
         exclusions = excludeFiles[:]
+        manifestCache = getPluginManifestCache()
         
         for dirNum, directory in enumerate(self.directories):
             sys.path.append(os.path.dirname(directory))
@@ -336,9 +622,8 @@ class PluginManager(object):
                         continue
                     if os.path.isfile(fullname):
                         if ext == '.py':
-                            with open(fullname) as f:
-                                module = imp.load_module(packageName + "." + moduleName, f,
-                                        mbcsEnc(fullname)[0], (".py", "r", imp.PY_SOURCE))
+                            module = self._loadPyPlugin(package, moduleName,
+                                    fullname, manifestCache)
                         elif ext == '.zip':
                             module = imp.new_module(
                                     packageName + "." + moduleName)
@@ -356,6 +641,93 @@ class PluginManager(object):
                 except:
                     traceback.print_exc()
             del sys.path[-1]
+
+        if manifestCache is not None:
+            manifestCache.save()
+
+
+    def _loadPyPlugin(self, package, moduleName, fullname, manifestCache):
+        """
+        Returns the module of .py plugin file fullname, a LazyPluginModule
+        standing in for it or None if it isn't needed.
+        """
+        manifest = None
+        if manifestCache is not None:
+            manifest = manifestCache.get(fullname)
+
+        statEntry = [fullname, "failed", 0.0]
+        self.loadStatistics.append(statEntry)
+
+        if manifest is None:
+            module = self._importPyPlugin(package, moduleName, fullname,
+                    statEntry, "loaded")
+            if manifestCache is not None:
+                manifestCache.put(fullname, module)
+            return module
+
+        descriptors, functionNames, otherNames = manifest
+        if descriptors is None or not self._processDescriptors(descriptors):
+            statEntry[1] = "not needed"
+            return None
+
+        statEntry[1] = "deferred"
+        return LazyPluginModule(package.__name__ + "." + moduleName,
+                descriptors, functionNames, otherNames,
+                lambda: self._importPyPlugin(package, moduleName, fullname,
+                statEntry, "loaded on demand"))
+
+
+    def _importPyPlugin(self, package, moduleName, fullname, statEntry,
+            state):
+        """
+        Load module from .py plugin file fullname and update statistics
+        entry statEntry with the load time and state.
+        """
+        statEntry[1] = "failed"
+        directory = package.__path__[0]
+        startTime = time.time()
+        # Needed e.g. for absolute imports of a plugin subpackage if called
+        # later for a LazyPluginModule
+        sys.path.append(os.path.dirname(directory))
+        try:
+            with open(fullname) as f:
+                module = imp.load_module(package.__name__ + "." + moduleName,
+                        f, mbcsEnc(fullname)[0], (".py", "r", imp.PY_SOURCE))
+        finally:
+            del sys.path[-1]
+            statEntry[2] = time.time() - startTime
+
+        statEntry[1] = state
+        # Replace a LazyPluginModule
+        setattr(package, moduleName, module)
+        if module.__name__ in self.plugins:
+            self.plugins[module.__name__] = module
+
+        return module
+
+
+    def getLoadStatistics(self):
+        """
+        Returns list of tuples (path, state, load time in seconds) for each
+        plugin file, see self.loadStatistics
+        """
+        return [tuple(entry) for entry in self.loadStatistics]
+
+
+    def getLoadStatisticsReport(self):
+        """
+        Returns byte string describing the load statistics.
+        """
+        lines = []
+        totalTime = 0.0
+        for path, state, loadTime in self.loadStatistics:
+            lines.append("%8.1f ms  %-16s %s" % (loadTime * 1000.0, state,
+                    mbcsEnc(path, "replace")[0]))
+            totalTime += loadTime
+
+        lines.append("%8.1f ms  total" % (totalTime * 1000.0))
+        return "\n".join(lines)
+
           
     def importDirectory(self, name, add_to_sys_modules = False): 
         name = mbcsEnc(name, "replace")[0]
@@ -0,0 +1,328 @@
+"""
+Shared cache and worker threads for images rendered by external tools
+(Graphviz, Gnuplot, Ploticus, MimeTeX insertions).
+
+Rendered images are stored in a cache directory under a name built from
+a hash of the tool executable, the arguments and the source text. Size
+and modification date of the executable stand in for the tool version.
+The total size of the directory is bounded, least recently used files
+are deleted first.
+
+Insertion handlers call createRenderedContent(). On a cache hit the image
+is copied to the temporary file set of the exporter and the HTML is
+returned at once. On a miss, if the exporter supports deferred content
+(see HtmlExporter.isDeferredContentSupported()), a RenderJob is queued to
+the worker threads and returned instead. The exporter calls its
+getContent() when it assembles the output so the external tools of all
+insertions on a page run in parallel.
+"""
+
+from __future__ import with_statement
+
+import os, os.path, threading, traceback, Queue, hashlib, shutil, time
+
+import wx
+
+from .StringOps import pathEnc
+
+
+class RenderCache(object):
+    def __init__(self, cacheDir, maxSize):
+        """
+        cacheDir -- directory of the cache files, created when needed
+        maxSize -- maximum total size of cache files in bytes
+        """
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+        self.lock = threading.RLock()
+        # Dictionary {file name: [size, time of last use]}, None until
+        # the directory was scanned
+        self.entries = None
+        self.totalSize = 0
+
+
+    @staticmethod
+    def getKey(toolPath, args, source):
+        """
+        Returns cache key (hex string) for the output of tool toolPath
+        called with sequence of arguments args on source (byte string).
+        Arguments which don't change the output (e.g. temporary file names)
+        must not be part of args.
+        """
+        try:
+            st = os.stat(pathEnc(toolPath))
+            toolId = "%s\0%i\0%i" % (repr(toolPath), st.st_size,
+                    int(st.st_mtime))
+        except (OSError, IOError):
+            toolId = repr(toolPath)
+
+        h = hashlib.sha1(toolId)
+        for arg in args:
+            h.update("\0")
+            h.update(repr(arg))
+        h.update("\1")
+        h.update(source)
+
+        return h.hexdigest()
+
+
+    def _getEntries(self):
+        # Must be called with self.lock acquired
+        if self.entries is None:
+            self.entries = {}
+            self.totalSize = 0
+            try:
+                names = os.listdir(pathEnc(self.cacheDir))
+            except (OSError, IOError):
+                names = []
+
+            for name in names:
+                try:
+                    st = os.stat(os.path.join(pathEnc(self.cacheDir), name))
+                except (OSError, IOError):
+                    continue
+
+                self.entries[name] = [st.st_size, st.st_mtime]
+                self.totalSize += st.st_size
+
+        return self.entries
+
+
+    def fetch(self, key, suffix, dstPath):
+        """
+        Copy cached image for key to dstPath. Returns False if not in cache.
+        """
+        if self.maxSize <= 0:
+            return False
+
+        name = key + suffix
+        with self.lock:
+            entry = self._getEntries().get(name)
+            if entry is None:
+                return False
+            entry[1] = time.time()
+
+        path = os.path.join(pathEnc(self.cacheDir), name)
+        try:
+            shutil.copyfile(path, pathEnc(dstPath))
+            # Modification time is used as time of last use by _getEntries()
+            os.utime(path, None)
+        except (OSError, IOError):
+            traceback.print_exc()
+            with self.lock:
+                self._removeEntry(name)
+            return False
+
+        return True
+
+
+    def store(self, key, suffix, srcPath):
+        """
+        Put a copy of image file srcPath into the cache.
+        """
+        if self.maxSize <= 0:
+            return
+
+        name = key + suffix
+        cacheDir = pathEnc(self.cacheDir)
+        try:
+            if not os.path.exists(cacheDir):
+                os.makedirs(cacheDir)
+
+            # Copy to temporary name first so that no other thread sees an
+            # incomplete file
+            tmpPath = os.path.join(cacheDir, "%s.%i.tmp" % (name,
+                    threading.currentThread().ident))
+            shutil.copyfile(pathEnc(srcPath), tmpPath)
+            size = os.path.getsize(tmpPath)
+            path = os.path.join(cacheDir, name)
+            if os.path.exists(path):
+                os.unlink(path)
+            os.rename(tmpPath, path)
+        except (OSError, IOError):
+            traceback.print_exc()
+            return
+
+        with self.lock:
+            entries = self._getEntries()
+            oldEntry = entries.get(name)
+            if oldEntry is not None:
+                self.totalSize -= oldEntry[0]
+            entries[name] = [size, time.time()]
+            self.totalSize += size
+
+            if self.totalSize > self.maxSize:
+                self._evict()
+
+
+    def _evict(self):
+        """
+        Delete least recently used files until total size is below the
+        maximum. Must be called with self.lock acquired.
+        """
+        byUse = sorted(self.entries.iteritems(), key=lambda item: item[1][1])
+        for name, entry in byUse:
+            if self.totalSize <= self.maxSize:
+                break
+            self._removeEntry(name)
+
+
+    def _removeEntry(self, name):
+        # Must be called with self.lock acquired
+        entry = self._getEntries().pop(name, None)
+        if entry is None:
+            return
+
+        self.totalSize -= entry[0]
+        try:
+            os.unlink(os.path.join(pathEnc(self.cacheDir), name))
+        except (OSError, IOError):
+            traceback.print_exc()
+
+
+
+class RenderJob(object):
+    """
+    Deferred content of an insertion which is created by a worker thread.
+    """
+    def __init__(self, fct):
+        """
+        fct -- function without parameters returning the content
+        """
+        self.fct = fct
+        self.event = threading.Event()
+        self.content = None
+
+    def run(self):
+        try:
+            self.content = self.fct()
+        except Exception, e:
+            traceback.print_exc()
+            self.content = u'<pre>' + (u'[%s]' % e) + u'</pre>'
+        finally:
+            self.event.set()
+
+    def getContent(self):
+        """
+        Wait until job is done and return content.
+        """
+        self.event.wait()
+        return self.content
+
+
+
+_renderCache = None
+_jobQueue = None
+_cacheLock = threading.Lock()
+
+
+def getRenderCache():
+    """
+    Returns the application wide render cache.
+    """
+    global _renderCache
+
+    with _cacheLock:
+        if _renderCache is None:
+            app = wx.GetApp()
+            maxSize = app.getGlobalConfig().getint("main",
+                    "insertion_renderCache_maxSize", 50) * 1024 * 1024
+            _renderCache = RenderCache(os.path.join(
+                    app.getGlobalConfigSubDir(), u"RenderCache"), maxSize)
+
+        return _renderCache
+
+
+def _getWorkerCount():
+    try:
+        import multiprocessing
+        return max(2, multiprocessing.cpu_count())
+    except (ImportError, NotImplementedError):
+        return 2
+
+
+def _runWorker(jobQueue):
+    while True:
+        jobQueue.get().run()
+
+
+def _queueJob(job):
+    global _jobQueue
+
+    with _cacheLock:
+        if _jobQueue is None:
+            _jobQueue = Queue.Queue()
+            # The work is done by external processes so threads are enough
+            for i in xrange(_getWorkerCount()):
+                t = threading.Thread(target=_runWorker, args=(_jobQueue,))
+                t.setDaemon(True)
+                t.start()
+
+    _jobQueue.put(job)
+
+
+def renderToFile(toolPath, args, source, suffix, renderFct, dstPath):
+    """
+    Create image at dstPath, either as copy from the render cache or by
+    calling renderFct(dstPath). See createRenderedContent() for parameters.
+    Returns None on success or the value returned by renderFct.
+    """
+    cache = getRenderCache()
+    key = cache.getKey(toolPath, args, source)
+    if cache.fetch(key, suffix, dstPath):
+        return None
+
+    result = renderFct(dstPath)
+    if result is None:
+        cache.store(key, suffix, dstPath)
+
+    return result
+
+
+def createRenderedContent(exporter, exportType, toolPath, args, source,
+        suffix, renderFct, htmlFct):
+    """
+    Returns the HTML content for an insertion rendered by an external tool
+    or a RenderJob which delivers it later.
+
+    exporter -- Exporter object calling the insertion handler
+    exportType -- string describing the export type
+    toolPath -- path of tool executable
+    args -- sequence of further values which influence the output
+            (options, output format, ...)
+    source -- byte string of source of insertion
+    suffix -- suffix of image file
+    renderFct -- function (outPath) creating the image file at outPath.
+            Returns None on success or unicode HTML to show instead of the
+            image (error message). Called in a worker thread, it must
+            not access wiki document or GUI
+    htmlFct -- function (url) returning HTML to show the image
+    """
+    tfs = exporter.getTempFileSet()
+
+    pythonUrl = (exportType != "html_previewWX")
+    dstFullPath = tfs.createTempFile("", suffix, relativeTo="")
+    url = tfs.getRelativeUrl(None, dstFullPath, pythonUrl=pythonUrl)
+
+    cache = getRenderCache()
+    key = cache.getKey(toolPath, args, source)
+    if cache.fetch(key, suffix, dstFullPath):
+        return htmlFct(url)
+
+    def render():
+        errorHtml = renderFct(dstFullPath)
+        if errorHtml is not None:
+            return errorHtml
+
+        cache.store(key, suffix, dstFullPath)
+        return htmlFct(url)
+
+    isDeferredContentSupported = getattr(exporter,
+            "isDeferredContentSupported", None)
+    if isDeferredContentSupported is None or \
+            not isDeferredContentSupported():
+        return render()
+
+    job = RenderJob(render)
+    _queueJob(job)
+    return job
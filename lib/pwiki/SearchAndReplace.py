@@ -10,6 +10,8 @@ from Serialization import SerializeStream, findXmlElementFlat, \
 
 import SearchAndReplaceBoolLang
 
+from Utilities import DUMBTHREADSTOP
+
 
 
 Unknown = object()  # Abstract third truth value constant
@@ -60,7 +62,56 @@ class AbstractSearchNode:
         Should return True in case of doubt.
         """
         return True
-        
+
+
+    def getCandidateWords(self):
+        """
+        Returns a set of words which contains at least all words for which
+        testWikiPage() can return True or None if the node can't restrict
+        the set of pages cheaply (then all pages must be tested).
+        The set may contain words of not existing pages.
+        It is only called after a call to beginWikiSearch() and before
+        matching call to endWikiSearch(). The returned set must not be
+        modified.
+        """
+        return None
+
+
+    def getStandaloneTest(self):
+        """
+        Returns a picklable nested tuple equivalent to testWikiPage() which
+        can be evaluated by ParallelSearch.evalStandaloneTest() without access
+        to the wiki (e.g. in another process) or None if the node can't be
+        converted.
+        It is only called after a call to beginWikiSearch() and before
+        matching call to endWikiSearch().
+        """
+        return None
+
+
+    def explainPlan(self, totalCount, indent=u""):
+        """
+        Returns list of unicode lines describing how the node is evaluated
+        for a wiki-wide search and how many pages are estimated to pass it.
+        It is only called after a call to beginWikiSearch() and before
+        matching call to endWikiSearch().
+
+        totalCount -- number of pages in the wiki
+        """
+        candidates = self.getCandidateWords()
+        if candidates is not None:
+            method = u"index lookup"
+            estimate = min(len(candidates), totalCount)
+        elif self.isTextNeededForTest():
+            method = u"content scan"
+            estimate = totalCount
+        else:
+            method = u"page test"
+            estimate = totalCount
+
+        return [u"%s%s: %s, est. rows %i" % (indent, self.__class__.__name__,
+                method, estimate)]
+
 
 #     def testText(self, text):
 #         """
@@ -166,6 +217,20 @@ class NotSearchNode(AbstractSearchNode):
     def isTextNeededForTest(self):
         return self.sub.isTextNeededForTest()
 
+    # getCandidateWords() can't be delegated, the complement of the
+    # candidates of the subnode is unknown
+
+    def getStandaloneTest(self):
+        subTest = self.sub.getStandaloneTest()
+        if subTest is None:
+            return None
+
+        return ("not", subTest)
+
+    def explainPlan(self, totalCount, indent=u""):
+        return AbstractSearchNode.explainPlan(self, totalCount, indent) + \
+                self.sub.explainPlan(totalCount, indent + u"    ")
+
     # orderNatural() from the subnode is not delegated
 
     def serializeBin(self, stream):  # TODO !!!
@@ -235,6 +300,9 @@ class AllWikiPagesNode(AbstractSearchNode):
     def isTextNeededForTest(self):
         return False
 
+    def getStandaloneTest(self):
+        return ("true",)
+
     def searchText(self, text, searchCharStartPos=0, cycleToStart=False):
         return (0, 0)
 
@@ -283,13 +351,36 @@ class RegexWikiPageNode(AbstractSearchNode):
         AbstractSearchNode.__init__(self, sarOp)
         self.compPat = re.compile(pattern,
                 re.DOTALL | re.UNICODE | re.MULTILINE)  # TODO MULTILINE?
-    
+        self.wordSet = None    # used for getCandidateWords()
+
+    def beginWikiSearch(self, wikiDocument, commonCache):
+        """
+        Always called before a new wiki-wide search operation begins.
+        Fills wordSet with the matching names of all existing pages.
+        """
+        self.wordSet = set(word for word in
+                _getAllDefinedWikiPageNames(wikiDocument, commonCache)
+                if self.compPat.match(word))
+
+    def endWikiSearch(self):
+        """
+        Called after a wiki-wide search operation ended.
+        Clears wordSet
+        """
+        self.wordSet = None
+
     def testWikiPage(self, word, text):
         return bool(self.compPat.match(word))
 
     def isTextNeededForTest(self):
         return False
 
+    def getCandidateWords(self):
+        return self.wordSet
+
+    def getStandaloneTest(self):
+        return ("pageRegex", self.compPat.pattern, self.compPat.flags)
+
     def serializeBin(self, stream):
         """
         Read or write content of this object to or from a serialize stream
@@ -393,6 +484,12 @@ class ListItemWithSubtreeWikiPagesNode(AbstractSearchNode):
     def isTextNeededForTest(self):
         return False
 
+    def getCandidateWords(self):
+        return set(self.wordSet)
+
+    def getStandaloneTest(self):
+        return ("words", frozenset(self.wordSet))
+
 
     def orderNatural(self, wordSet, coll):
         result = []
@@ -467,6 +564,17 @@ class ListItemWithSubtreeWikiPagesNode(AbstractSearchNode):
 
 
 
+def _getAllDefinedWikiPageNames(wikiDocument, commonCache):
+    allNames = commonCache.get("allDefinedWikiPageNames")
+
+    if allNames is None:
+        allNames = wikiDocument.getAllDefinedWikiPageNames()
+        commonCache["allDefinedWikiPageNames"] = allNames
+
+    return allNames
+
+
+
 _CLASSES_WITH_PERSID = (NotSearchNode, AllWikiPagesNode,
         ListItemWithSubtreeWikiPagesNode, RegexWikiPageNode)
 
@@ -619,6 +727,22 @@ class AbstractAndOrSearchNode(AbstractContentSearchNode):
     def isTextNeededForTest(self):
         return self.left.isTextNeededForTest() or self.right.isTextNeededForTest()
 
+    def explainPlan(self, totalCount, indent=u""):
+        return AbstractSearchNode.explainPlan(self, totalCount, indent) + \
+                self.left.explainPlan(totalCount, indent + u"    ") + \
+                self.right.explainPlan(totalCount, indent + u"    ")
+
+    def getStandaloneTest(self):
+        leftTest = self.left.getStandaloneTest()
+        if leftTest is None:
+            return None
+
+        rightTest = self.right.getStandaloneTest()
+        if rightTest is None:
+            return None
+
+        return (self.STANDALONE_TEST_KIND, leftTest, rightTest)
+
     def searchDocPageAndText(self, docPage, text, searchCharStartPos=0,
             cycleToStart=False):
         """
@@ -750,6 +874,7 @@ class AndSearchNode(AbstractAndOrSearchNode):
     Connects two nodes by logical "and"
     """
     CLASS_PERSID = "And"  # Class id for persistence storage
+    STANDALONE_TEST_KIND = "and"
 
     def testWikiPage(self, word, text):
         leftret = self.left.testWikiPage(word, text)
@@ -767,12 +892,27 @@ class AndSearchNode(AbstractAndOrSearchNode):
             
         return Unknown
 
+    def getCandidateWords(self):
+        """
+        A page can only match if it is a candidate of both operands
+        """
+        leftCands = self.left.getCandidateWords()
+        rightCands = self.right.getCandidateWords()
+
+        if leftCands is None:
+            return rightCands
+        if rightCands is None:
+            return leftCands
+
+        return leftCands & rightCands
+
 
 class OrSearchNode(AbstractAndOrSearchNode):
     """
     Connects two nodes by logical "or"
     """
     CLASS_PERSID = "Or"  # Class id for persistence storage
+    STANDALONE_TEST_KIND = "or"
 
     def testWikiPage(self, word, text):
         leftret = self.left.testWikiPage(word, text)
@@ -790,6 +930,17 @@ class OrSearchNode(AbstractAndOrSearchNode):
 
         return Unknown
 
+    def getCandidateWords(self):
+        leftCands = self.left.getCandidateWords()
+        if leftCands is None:
+            return None
+
+        rightCands = self.right.getCandidateWords()
+        if rightCands is None:
+            return None
+
+        return leftCands | rightCands
+
 
 
 class RegexTextNode(AbstractContentSearchNode):
@@ -825,6 +976,9 @@ class RegexTextNode(AbstractContentSearchNode):
     def testWikiPage(self, word, text):
         return bool(self.rePattern.search(text))
 
+    def getStandaloneTest(self):
+        return ("regex", self.rePattern.pattern, self.rePattern.flags)
+
 #     def testText(self, text):
 #         return bool(self.rePattern.search(text))
 
@@ -878,6 +1032,9 @@ class SimpleStrNode(AbstractContentSearchNode):
     def testWikiPage(self, word, text):
         return text.find(self.subStr) != -1
 
+    def getStandaloneTest(self):
+        return ("str", self.subStr)
+
 
 #     def testText(self, text):
 #         return text.find(self.subStr) != -1
@@ -981,6 +1138,12 @@ class AttributeNode(AbstractContentSearchNode):
     def isTextNeededForTest(self):
         return False
 
+    def getCandidateWords(self):
+        return self.wordSet
+
+    def getStandaloneTest(self):
+        return ("words", frozenset(self.wordSet))
+
     def serializeBin(self, stream):
         """
         Read or write content of this object to or from a serialize stream
@@ -1111,6 +1274,12 @@ class TodoNode(AbstractContentSearchNode):
     def isTextNeededForTest(self):
         return False
 
+    def getCandidateWords(self):
+        return self.wordSet
+
+    def getStandaloneTest(self):
+        return ("words", frozenset(self.wordSet))
+
     def serializeBin(self, stream):
         """
         Read or write content of this object to or from a serialize stream
@@ -1339,6 +1508,43 @@ class ListWikiPagesOperation:
         return self.searchOpTree.isTextNeededForTest()
 
 
+    def getCandidateWords(self):
+        """
+        Returns set of words which contains at least all words for which
+        testWikiPage() can return True or None if all pages must be tested.
+        It must be called after beginWikiSearch() and before corresponding
+        endWikiSearch() call.
+        """
+        if self.searchOpTree is None:
+            return None
+
+        return self.searchOpTree.getCandidateWords()
+
+
+    def getStandaloneTest(self):
+        """
+        Returns standalone test for search tree or None if not possible.
+        It must be called after beginWikiSearch() and before corresponding
+        endWikiSearch() call.
+        """
+        if self.searchOpTree is None:
+            return ("true",)
+
+        return self.searchOpTree.getStandaloneTest()
+
+
+    def explainPlan(self, totalCount, indent=u""):
+        """
+        Returns list of lines describing the evaluation of the search tree.
+        It must be called after beginWikiSearch() and before corresponding
+        endWikiSearch() call.
+        """
+        if self.searchOpTree is None:
+            return []
+
+        return self.searchOpTree.explainPlan(totalCount, indent)
+
+
     def testWikiPageByDocPage(self, docPage):
         return self.testWikiPage(docPage.getWikiWord(), docPage.getLiveText())
 
@@ -1872,6 +2078,80 @@ class SearchReplaceOperation:
         return self.searchOpTree.replace(text, foundData, self.replaceStr)
 
 
+    def replaceAllInDocPageAndText(self, docPage, text):
+        """
+        Replace all occurrences in text of docPage in one pass. The
+        positions are searched in the original text and the result is
+        joined at the end.
+        Returns tuple (<new text>, <number of replacements>).
+        """
+        result = []
+        searchCharStartPos = 0
+        copiedPos = 0  # Text before this position is already in result
+        count = 0
+
+        while True:
+            found = self.searchDocPageAndText(docPage, text,
+                    searchCharStartPos)
+            start, end = found[:2]
+            if start is None or start < searchCharStartPos:
+                # Not found (anymore) or cycled to start
+                break
+
+            result.append(text[copiedPos:start])
+            result.append(self.replace(text, found))
+            copiedPos = end
+            count += 1
+
+            if start == end:
+                # Otherwise replacing would go infinitely
+                break
+
+            searchCharStartPos = end
+
+        if count == 0:
+            return (text, 0)
+
+        result.append(text[copiedPos:])
+        return (u"".join(result), count)
+
+
+    def replaceAllInWiki(self, wikiDocument, wikiWords,
+            threadstop=DUMBTHREADSTOP):
+        """
+        Replace all occurrences on the pages listed in wikiWords.
+        The changed pages are written as one batch by
+        wikiDocument.replaceLiveTexts().
+        Returns list of tuples (<wiki word>, <number of replacements>) for
+        all changed pages.
+        """
+        pageTextSeq = []
+        counts = []
+
+        self.beginWikiSearch(wikiDocument)
+        try:
+            for wikiWord in wikiWords:
+                threadstop.testValidThread()
+                docPage = wikiDocument.getWikiPageNoError(wikiWord)
+                text = docPage.getLiveTextNoTemplate()
+                if text is None:
+                    continue
+
+                text, count = self.replaceAllInDocPageAndText(docPage, text)
+                if count == 0:
+                    continue
+
+                pageTextSeq.append((docPage, text))
+                counts.append((wikiWord, count))
+        finally:
+            self.endWikiSearch()
+
+        threadstop.testValidThread()
+        wikiDocument.replaceLiveTexts(pageTextSeq)
+
+        return counts
+
+
     def beginWikiSearch(self, wikiDocument, commonCache=None):
         """
         Called by WikiDocument(=WikiDataManager) to begin a wiki-wide search
@@ -1935,6 +2215,64 @@ class SearchReplaceOperation:
                 self.searchOpTree.isTextNeededForTest()
 
 
+    def getCandidateWords(self):
+        """
+        Returns set of words which contains at least all words for which
+        testWikiPage() can return True or None if all pages must be tested.
+        The candidates of the page list and the search tree are intersected.
+        It must be called after beginWikiSearch() and before corresponding
+        endWikiSearch() call.
+        """
+        if self.searchOpTree is None:
+            self.rebuildSearchOpTree()
+
+        listCands = self.listWikiPagesOp.getCandidateWords()
+        searchCands = self.searchOpTree.getCandidateWords()
+
+        if listCands is None:
+            return searchCands
+        if searchCands is None:
+            return listCands
+
+        return listCands & searchCands
+
+
+    def getStandaloneTest(self):
+        """
+        Returns a picklable test equivalent to testWikiPage() (see module
+        ParallelSearch) or None if the search can't be converted.
+        It must be called after beginWikiSearch() and before corresponding
+        endWikiSearch() call.
+        """
+        if self.searchOpTree is None:
+            self.rebuildSearchOpTree()
+
+        listTest = self.listWikiPagesOp.getStandaloneTest()
+        if listTest is None:
+            return None
+
+        searchTest = self.searchOpTree.getStandaloneTest()
+        if searchTest is None:
+            return None
+
+        return ("and", listTest, searchTest)
+
+
+    def explainPlan(self, totalCount, indent=u""):
+        """
+        Returns list of lines describing the evaluation of the page list
+        and the search tree. It must be called after beginWikiSearch() and
+        before corresponding endWikiSearch() call.
+        """
+        if self.searchOpTree is None:
+            self.rebuildSearchOpTree()
+
+        return [indent + u"Page list:"] + \
+                self.listWikiPagesOp.explainPlan(totalCount, indent + u"    ") + \
+                [indent + u"Search:"] + \
+                self.searchOpTree.explainPlan(totalCount, indent + u"    ")
+
+
     def testWikiPageByDocPage(self, docPage):
         return self.testWikiPage(docPage.getWikiWord(), docPage.getLiveText())
 
@@ -3,6 +3,8 @@
 
 import sys, traceback, re, time
 
+from collections import deque
+
 import wx, wx.html, wx.xrc
 
 from rtlibRepl import minidom
@@ -11,7 +13,7 @@ import Consts
 from .MiscEvent import MiscEventSourceMixin, KeyFunctionSink
 from WikiExceptions import *
 from .Utilities import DUMBTHREADSTOP, callInMainThread, callInMainThreadAsync, \
-        ThreadHolder, FunctionThreadStop
+        ThreadHolder, FunctionThreadStop, SingleThreadExecutor
 
 from .SystemInfo import isLinux
 
@@ -35,10 +37,10 @@ from .SearchAndReplace import SearchReplaceOperation, ListWikiPagesOperation, \
 
 class _SearchResultItemInfo(object):
     __slots__ = ("__weakref__", "wikiWord", "occCount", "occNumber", "occHtml",
-            "occPos", "html", "maxCountOccurrences")
+            "occPos", "html", "maxCountOccurrences", "contextBuilt")
 
     def __init__(self, wikiWord, occPos = (-1, -1), occCount = -1,
-            maxOccCount=100):
+            maxOccCount=100, contextBuilt=True):
         self.wikiWord = wikiWord
         if occPos[0] != -1:
             self.occNumber = 1
@@ -50,6 +52,8 @@ class _SearchResultItemInfo(object):
         self.occCount = occCount # -1: Undefined; -2: More than maxCountOccurrences
         self.maxCountOccurrences = maxOccCount
         self.html = None
+        # False if context and occurrence count still must be built
+        self.contextBuilt = contextBuilt
 
 
     def buildOccurrence(self, text, before, after, pos, occNumber, maxOccCount):
@@ -128,7 +132,80 @@ class _SearchResultItemInfo(object):
 
 
 
+def _buildSearchResultItemInfo(sarOp, wikiDocument, wikiWord, before, after,
+        countOccurrences, maxCountOccurrences):
+    """
+    Build and return _SearchResultItemInfo with context and occurrence count
+    for found page wikiWord. sarOp.beginWikiSearch() must have been called.
+    """
+    context = before + after
+    docPage = wikiDocument.getWikiPageNoError(wikiWord)
+    text = docPage.getLiveTextNoTemplate()
+    if text is None:
+        return _SearchResultItemInfo(wikiWord)
+
+    if sarOp.hasParticularTextPosition():
+        # "As is" or regex search
+#         pos = sarOp.searchText(text)
+        pos = sarOp.searchDocPageAndText(docPage, text)
+        if pos[0] is None:
+            # This can happen e.g. for boolean searches like
+            # 'foo or not bar' on a page which has neither 'foo'
+            # nor 'bar'.
+
+            # Similar as if no particular text position available
+            if context == 0:
+                return _SearchResultItemInfo(wikiWord)
+            else:
+                return _SearchResultItemInfo(wikiWord).buildOccurrence(
+                        text, before, after, (-1, -1), -1, 100)
+
+        firstpos = pos
+
+        info = _SearchResultItemInfo(wikiWord, occPos=pos,
+                maxOccCount=maxCountOccurrences)
+
+        if countOccurrences:
+            occ = 1
+            while True:
+                pos = sarOp.searchDocPageAndText(docPage, text, pos[1])
+                if pos[0] is None or pos[0] == pos[1]:
+                    break
+                occ += 1
+                if occ > maxCountOccurrences:
+                    occ = -2
+                    break
+
+            info.occCount = occ
+
+        return info.buildOccurrence(text, before, after, firstpos, 1,
+                maxCountOccurrences)
+
+    elif sarOp.hasWhooshHighlighting():
+        # Index search
+        html, firstPos = sarOp.highlightWhooshIndexFound(text, docPage,
+                context * 2 + 30, context // 2)
+
+        info = _SearchResultItemInfo(wikiWord, occPos=(firstPos, firstPos))
+        info.setHtmlDirectly(html)
+
+        return info
+
+    else:  # not sarOp.hasParticularTextPosition():
+        # No specific position to show as context, so show beginning of page
+        return _SearchResultItemInfo(wikiWord).buildOccurrence(text, before,
+                after, (-1, -1), -1, 100)
+
+
+
 class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
+    # Number of rows before and after a shown row for which the snippets
+    # are built in one background job
+    SNIPPET_PREFETCH = 20
+    # Maximum number of rows with built snippets, snippets of the rows built
+    # first are dropped again
+    SNIPPET_CACHE_SIZE = 500
+
     def __init__(self, parent, pWiki, ID):
         wx.HtmlListBox.__init__(self, parent, ID, style = wx.SUNKEN_BORDER)
 
@@ -139,14 +216,28 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
         self.searchOp = None # last search operation set by showFound
         self.SetItemCount(0)
         self.isShowingSearching = False  # Show a visual feedback only while searching
+        # True while intermediate results of a running search are shown
+        self.isShowingIntermediate = False
         self.contextMenuSelection = -2
 
+        # Builds context snippets of the found pages in the background
+        self.snippetExecutor = SingleThreadExecutor(1, daemon=True)
+        self.snippetExecutor.start()
+        self.snippetGeneration = 0
+        # Index of the row which requested snippets last
+        self.snippetRequestPos = 0
+        # Search operation whose wiki-wide search was begun in the thread of
+        # the snippetExecutor (see _beginSnippetSearch())
+        self.snippetSearchOp = None
+        self._resetSnippets()
+
         wx.EVT_LEFT_DOWN(self, self.OnLeftDown)
         wx.EVT_LEFT_DCLICK(self, self.OnLeftDown)
         wx.EVT_MIDDLE_DOWN(self, self.OnMiddleButtonDown)
         wx.EVT_KEY_DOWN(self, self.OnKeyDown)
         wx.EVT_LISTBOX_DCLICK(self, ID, self.OnDClick)
         wx.EVT_CONTEXT_MENU(self, self.OnContextMenu)
+        wx.EVT_WINDOW_DESTROY(self, self.OnDestroy)
 
 
         wx.EVT_MENU(self, GUI_ID.CMD_ACTIVATE_THIS, self.OnActivateThis)
@@ -163,10 +254,23 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
             return u"<b>" + _(u"Not found") + u"</b>"
 
         try:
-            return self.foundinfo[i].getHtml()
+            info = self.foundinfo[i]
         except IndexError:
             return u""
 
+        if not info.contextBuilt:
+            self._requestSnippets(i)
+
+        return info.getHtml()
+
+
+    def OnDestroy(self, evt):
+        self._resetSnippets()
+        self.snippetExecutor.end(hardEnd=True)
+        self._endSnippetSearch()
+        evt.Skip()
+
+
     def showSearching(self):
         """
         Shows a "Searching..." as visual feedback while search runs
@@ -182,11 +286,33 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
         showFound may have happened. If it did not happen,
         the list is cleared.
         """
-        if self.isShowingSearching:
+        if self.isShowingSearching or self.isShowingIntermediate:
             # This can only happen if showFound wasn't called
             self.showFound(None, None, None)
 
 
+    def showIntermediateFound(self, words):
+        """
+        Called during a running search (in main thread) to add the
+        just found words to the list without context. The final result
+        is set later by showFound().
+        """
+        if len(words) == 0:
+            return
+
+        if not self.isShowingIntermediate:
+            self.found = []
+            self.foundinfo = []
+            self._resetSnippets()
+            self.isShowingIntermediate = True
+
+        self.isShowingSearching = False
+        self.found.extend(words)
+        self.foundinfo.extend(_SearchResultItemInfo(w) for w in words)
+        self.SetItemCount(len(self.foundinfo))
+        self.Refresh()
+
+
     def _displayFound(self, itemCount, threadstop):
         """
         Called by showFound(), must be called in main thread.
@@ -202,7 +328,14 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
         Shows the results of search operation sarOp
         found -- list of matching wiki words
         wikiDocument -- WikiDocument(=WikiDataManager) object
+
+        The list is shown at once, context and occurrence count of the
+        found pages are built later in the background for the rows
+        which are shown (see _requestSnippets()).
         """
+        self.isShowingIntermediate = False
+        self._resetSnippets()
+
         if found is None or len(found) == 0:
             self.found = []
             self.foundinfo = []
@@ -217,7 +350,6 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
                 self.searchOp.cycleToStart = True
     
                 self.found = found
-                self.foundinfo = []
                 # Load context settings
                 before = self.pWiki.configuration.getint("main",
                         "search_wiki_context_before")
@@ -232,104 +364,27 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
                 context = before + after
 
                 if sarOp.hasParticularTextPosition():
-                    if context == 0 and not countOccurrences:
-                        # No context, no occurrence counting
-                        # -> just a list of found pages
-                        self.foundinfo = [_SearchResultItemInfo(w) for w in found]
-                    else:
-                        # "As is" or regex search
-                        sarOp.beginWikiSearch(self.pWiki.getWikiDocument())
-                        try:
-                            for w in found:
-                                threadstop.testValidThread()
-                                docPage = wikiDocument.getWikiPageNoError(w)
-                                text = docPage.getLiveTextNoTemplate()
-                                if text is None:
-                                    continue
-    
-    #                             pos = sarOp.searchText(text)
-                                pos = sarOp.searchDocPageAndText(docPage, text)
-                                if pos[0] is None:
-                                    # This can happen e.g. for boolean searches like
-                                    # 'foo or not bar' on a page which has neither 'foo'
-                                    # nor 'bar'.
-                                    
-                                    # Similar as if no particular text position available
-                                    if context == 0:
-                                        self.foundinfo.append(
-                                                _SearchResultItemInfo(w))
-                                    else:
-                                        self.foundinfo.append(
-                                                _SearchResultItemInfo(w).buildOccurrence(
-                                                text, before, after, (-1, -1), -1,
-                                                100))
-                                    continue
-                                firstpos = pos
-                                
-                                info = _SearchResultItemInfo(w, occPos=pos,
-                                        maxOccCount=maxCountOccurrences)
-    
-                                if countOccurrences:
-                                    occ = 1
-                                    while True:
-                                        pos = sarOp.searchDocPageAndText(
-                                                docPage, text, pos[1])
-                                        if pos[0] is None or pos[0] == pos[1]:
-                                            break
-                                        occ += 1
-                                        if occ > maxCountOccurrences:
-                                            occ = -2
-                                            break
-    
-                                    info.occCount = occ
-    
-                                self.foundinfo.append(info.buildOccurrence(
-                                        text, before, after, firstpos, 1,
-                                        maxCountOccurrences))
-                        finally:
-                            sarOp.endWikiSearch()
-                elif sarOp.hasWhooshHighlighting():
-                    # Index search
-                    if context == 0:
-                        # No context, occurrence counting doesn't matter
-                        # -> just a list of found pages
-                        self.foundinfo = [_SearchResultItemInfo(w) for w in found]
-                    else:
-                        sarOp.beginWikiSearch(self.pWiki.getWikiDocument())
-                        try:
-                            for w in found:
-                                threadstop.testValidThread()
-                                docPage = wikiDocument.getWikiPageNoError(w)
-                                text = docPage.getLiveTextNoTemplate()
-                                if text is None:
-                                    continue
-    
-                                html, firstPos = sarOp.highlightWhooshIndexFound(
-                                        text, docPage, context * 2 + 30,
-                                        context // 2)
-                                
-                                info = _SearchResultItemInfo(w, occPos=(firstPos, firstPos))
-                                info.setHtmlDirectly(html)
-    
-                                self.foundinfo.append(info)
-                        finally:
-                            sarOp.endWikiSearch()
-                else:  # not sarOp.hasParticularTextPosition():
-                    # No specific position to show as context, so show beginning of page
-                    # Also, no occurrence counting possible
-                    if context == 0:
-                        self.foundinfo = [_SearchResultItemInfo(w) for w in found]
-                    else:
-                        for w in found:
-                            text = wikiDocument.getWikiPageNoError(w).\
-                                    getLiveTextNoTemplate()
-                            if text is None:
-                                continue
-                            self.foundinfo.append(
-                                    _SearchResultItemInfo(w).buildOccurrence(
-                                    text, before, after, (-1, -1), -1, 100))
-                    threadstop.testValidThread()
-                
+                    # "As is" or regex search
+                    needsSnippets = context != 0 or countOccurrences
+                else:
+                    # Index search (occurrence counting doesn't matter) or
+                    # no specific position so beginning of page is shown
+                    # as context (no occurrence counting possible)
+                    needsSnippets = context != 0
+
+                if needsSnippets:
+                    # Separate clone because snippets are built in
+                    # another thread
+                    snippetOp = self.searchOp.clone()
+                    self.snippetParams = (snippetOp, wikiDocument, before,
+                            after, countOccurrences, maxCountOccurrences)
+                    self.foundinfo = [_SearchResultItemInfo(w,
+                            contextBuilt=False) for w in found]
+                else:
+                    # No context, no occurrence counting
+                    # -> just a list of found pages
+                    self.foundinfo = [_SearchResultItemInfo(w) for w in found]
+
                 threadstop.testValidThread()
                 self.isShowingSearching = False
 #                 callInMainThreadAsync(self.SetItemCount, len(self.foundinfo))
@@ -339,12 +394,206 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
             except NotCurrentThreadException:
                 self.found = []
                 self.foundinfo = []
+                self._resetSnippets()
                 self.isShowingSearching = False
                 # For the "Not found" entry
                 callInMainThreadAsync(self._displayFound, 1, threadstop)
                 raise
 
 
+    def _resetSnippets(self):
+        """
+        Drop pending and cached context snippets. Must be called in
+        main thread.
+        """
+        # Background jobs of an older generation are stopped and their
+        # results are ignored
+        self.snippetGeneration += 1
+        if self.snippetSearchOp is not None:
+            self.snippetExecutor.executeAsync(0, self._endSnippetSearch)
+        # Tuple (search operation, wikiDocument, before, after,
+        #     countOccurrences, maxCountOccurrences) or None if no snippets
+        #     must be built
+        self.snippetParams = None
+        # Indices of rows queued for the background job
+        self.snippetsPending = set()
+        # Indices of rows with built snippets, oldest first
+        self.snippetsBuilt = deque()
+
+
+    def _requestSnippets(self, idx):
+        """
+        Called by OnGetItem() for row idx without context. Queues the
+        building of the snippets for the rows around idx.
+        """
+        if self.snippetParams is None:
+            return
+
+        self.snippetRequestPos = idx
+        if idx in self.snippetsPending:
+            return
+
+        indices = [i for i in xrange(max(0, idx - self.SNIPPET_PREFETCH),
+                min(len(self.foundinfo), idx + self.SNIPPET_PREFETCH + 1))
+                if not self.foundinfo[i].contextBuilt and
+                i not in self.snippetsPending]
+
+        self.snippetsPending.update(indices)
+
+        generation = self.snippetGeneration
+        threadstop = FunctionThreadStop(
+                lambda: generation == self.snippetGeneration)
+
+        self.snippetExecutor.executeAsync(0, self._buildSnippets,
+                self.snippetParams, self.found, indices, threadstop)
+
+
+    def _beginSnippetSearch(self, sarOp, wikiDocument):
+        """
+        Called in the thread of the snippetExecutor. Begins the wiki-wide
+        search of sarOp once for all jobs of a generation (they share the
+        same sarOp) and ends the one of the previous generation.
+        """
+        if self.snippetSearchOp is sarOp:
+            return
+
+        self._endSnippetSearch()
+        sarOp.beginWikiSearch(wikiDocument)
+        self.snippetSearchOp = sarOp
+
+
+    def _endSnippetSearch(self):
+        """
+        Called in the thread of the snippetExecutor (or after it ended).
+        """
+        sarOp = self.snippetSearchOp
+        if sarOp is None:
+            return
+
+        self.snippetSearchOp = None
+        try:
+            sarOp.endWikiSearch()
+        except Exception:
+            traceback.print_exc()
+
+
+    def _buildSnippets(self, snippetParams, found, indices, threadstop):
+        """
+        Called in the thread of the snippetExecutor to build the item infos
+        for the rows listed in indices. Rows which can't be built are shown
+        without context.
+        """
+        sarOp, wikiDocument, before, after, countOccurrences, \
+                maxCountOccurrences = snippetParams
+
+        results = []
+        skipped = []
+        try:
+            threadstop.testValidThread()
+            try:
+                self._beginSnippetSearch(sarOp, wikiDocument)
+            except Exception:
+                traceback.print_exc()
+                sarOp = None
+
+            for idx in indices:
+                threadstop.testValidThread()
+                if abs(idx - self.snippetRequestPos) > \
+                        self.SNIPPET_CACHE_SIZE // 2:
+                    # Row was scrolled out of view meanwhile
+                    skipped.append(idx)
+                    continue
+
+                info = None
+                if sarOp is not None:
+                    try:
+                        info = _buildSearchResultItemInfo(sarOp,
+                                wikiDocument, found[idx], before, after,
+                                countOccurrences, maxCountOccurrences)
+                    except Exception:
+                        traceback.print_exc()
+
+                if info is None:
+                    info = _SearchResultItemInfo(found[idx])
+
+                results.append((idx, info))
+        except NotCurrentThreadException:
+            return
+
+        callInMainThreadAsync(self._storeSnippets, results, skipped,
+                threadstop)
+
+
+    def _storeSnippets(self, results, skipped, threadstop):
+        """
+        Called in main thread by _buildSnippets() with list of tuples
+        (index, item info) of the built rows and list of skipped indices.
+        """
+        if not threadstop.isValidThread():
+            return
+
+        self.snippetsPending.difference_update(skipped)
+
+        for idx, info in results:
+            self.snippetsPending.discard(idx)
+            if self.foundinfo[idx].contextBuilt:
+                # Built meanwhile by _getBuiltItemInfo()
+                continue
+            self.foundinfo[idx] = info
+            self.snippetsBuilt.append(idx)
+
+        # Drop oldest snippets if cache is full (but not the one of the
+        # selected row as its occurrence may have been moved by
+        # _pageListFindNext())
+        sel = self.GetSelection()
+        while len(self.snippetsBuilt) > self.SNIPPET_CACHE_SIZE:
+            idx = self.snippetsBuilt.popleft()
+            if idx == sel:
+                self.snippetsBuilt.append(idx)
+                continue
+
+            self.foundinfo[idx] = _SearchResultItemInfo(self.found[idx],
+                    contextBuilt=False)
+
+        if len(results) > 0:
+            # Clears also the HTML cache of the list box
+            self.RefreshAll()
+
+
+    def _getBuiltItemInfo(self, idx):
+        """
+        Returns the item info of row idx. If its context wasn't built yet
+        (by the background job), it is built now, so the position of the
+        first occurrence is known when the page is opened.
+        """
+        info = self.foundinfo[idx]
+        if info.contextBuilt or self.snippetParams is None:
+            return info
+
+        sarOp, wikiDocument, before, after, countOccurrences, \
+                maxCountOccurrences = self.snippetParams
+
+        # self.searchOp is only used in main thread
+        try:
+            self.searchOp.beginWikiSearch(wikiDocument)
+            try:
+                info = _buildSearchResultItemInfo(self.searchOp, wikiDocument,
+                        self.found[idx], before, after, countOccurrences,
+                        maxCountOccurrences)
+            finally:
+                self.searchOp.endWikiSearch()
+        except Exception:
+            traceback.print_exc()
+            info = _SearchResultItemInfo(self.found[idx])
+
+        self.snippetsPending.discard(idx)
+        self.foundinfo[idx] = info
+        self.snippetsBuilt.append(idx)
+        self.RefreshAll()
+
+        return info
+
+
     def GetSelectedWord(self):
         sel = self.GetSelection()
         if sel == -1 or self.GetCount() == 0:
@@ -368,7 +617,7 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
         if sel == -1:
             return
         
-        info = self.foundinfo[sel]
+        info = self._getBuiltItemInfo(sel)
         if info.occPos[0] == -1 or info.occPos[1] is None:
             return
         if info.occNumber == -1:
@@ -425,7 +674,7 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
         if sel == -1 or self.GetCount() == 0:
             return
 
-        info = self.foundinfo[sel]
+        info = self._getBuiltItemInfo(sel)
 
         self.pWiki.openWikiPage(info.wikiWord)
 
@@ -446,6 +695,10 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
     def OnLeftDown(self, evt):
         if self.isShowingSearching:
             self.searchWikiDialog.stopSearching()
+        elif self.isShowingIntermediate:
+            # Search still running
+            self.searchWikiDialog.stopSearching()
+            return
 
         if self.GetCount() == 0:
             return  # no evt.Skip()?
@@ -486,7 +739,7 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
             self._pageListFindNext()
             return
         
-        info = self.foundinfo[hitsel]
+        info = self._getBuiltItemInfo(hitsel)
 
         if evt.ControlDown():
             configCode = self.pWiki.getConfig().getint("main",
@@ -561,7 +814,7 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
 
     def OnActivateThis(self, evt):
         if self.contextMenuSelection > -1:
-            info = self.foundinfo[self.contextMenuSelection]
+            info = self._getBuiltItemInfo(self.contextMenuSelection)
 
 #             presenter = self.pWiki.activateWikiWord(info.wikiWord, 0)
             presenter = self.pWiki.activatePageByUnifiedName(
@@ -584,7 +837,7 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
 
     def OnActivateNewTabThis(self, evt):
         if self.contextMenuSelection > -1:
-            info = self.foundinfo[self.contextMenuSelection]
+            info = self._getBuiltItemInfo(self.contextMenuSelection)
 
 #             presenter = self.pWiki.activateWikiWord(info.wikiWord, 2)
             presenter = self.pWiki.activatePageByUnifiedName(
@@ -607,7 +860,7 @@ class SearchResultListBox(wx.HtmlListBox, MiscEventSourceMixin):
 
     def OnActivateNewTabBackgroundThis(self, evt):
         if self.contextMenuSelection > -1:
-            info = self.foundinfo[self.contextMenuSelection]
+            info = self._getBuiltItemInfo(self.contextMenuSelection)
 
 #             presenter = self.pWiki.activateWikiWord(info.wikiWord, 3)
             presenter = self.pWiki.activatePageByUnifiedName(
@@ -1400,7 +1653,8 @@ class SearchWikiDialog(wx.Dialog, MiscEventSourceMixin):
             win.Disable()
         try:
             self.foundPages = self.mainControl.getWikiDocument().searchWiki(
-                    sarOp, self.allowOrdering, threadstop=threadstop)
+                    sarOp, self.allowOrdering, threadstop=threadstop,
+                    foundCallback=self.ctrls.htmllbPages.showIntermediateFound)
             if not self.allowOrdering:
                 # Use default alphabetical ordering
                 self.mainControl.getCollator().sort(self.foundPages)
@@ -1614,48 +1868,16 @@ class SearchWikiDialog(wx.Dialog, MiscEventSourceMixin):
             # wikiData = self.pWiki.getWikiData()
             wikiDocument = self.mainControl.getWikiDocument()
             self.addCurrentToHistory()
-            
-            replaceCount = 0
-    
-            for i in xrange(self.ctrls.htmllbPages.GetCount()):
-                self.ctrls.htmllbPages.SetSelection(i)
-                wikiWord = guiToUni(self.ctrls.htmllbPages.GetSelectedWord())
-                wikiPage = wikiDocument.getWikiPageNoError(wikiWord)
-                text = wikiPage.getLiveTextNoTemplate()
-                if text is None:
-                    continue
-    
-                charStartPos = 0
-    
-                sarOp.beginWikiSearch(self.mainControl.getWikiDocument())
-                try:
-                    while True:
-                        try:
-                            found = sarOp.searchDocPageAndText(wikiPage, text,
-                                    charStartPos)
-                            start, end = found[:2]
-                        except:
-                            # Regex error -> Stop searching
-                            return
-                            
-                        if start is None: break
-                        
-                        repl = sarOp.replace(text, found)
-                        text = text[:start] + repl + text[end:]  # TODO Faster?
-                        charStartPos = start + len(repl)
-                        replaceCount += 1
-                        if start == end:
-                            # Otherwise replacing would go infinitely
-                            break
-                finally:
-                    sarOp.endWikiSearch()
-
-                wikiPage.replaceLiveText(text)
-                    
+
+            # All changed pages are written as one batch
+            pageCounts = sarOp.replaceAllInWiki(wikiDocument,
+                    self.foundPages)
+            replaceCount = sum(count for wikiWord, count in pageCounts)
+
             self._refreshPageList()
             
-            wx.MessageBox(_(u"%i replacements done") % replaceCount,
-                    _(u"Replace All"),
+            wx.MessageBox(_(u"%i replacements done on %i pages") %
+                    (replaceCount, len(pageCounts)), _(u"Replace All"),
                 wx.OK, self)        
         except UserAbortException:
             return
@@ -2594,7 +2816,8 @@ class FastSearchPopup(wx.Frame):
             win.Disable()
         try:
             self.foundPages = self.mainControl.getWikiDocument().searchWiki(
-                    self.sarOp, threadstop=threadstop)
+                    self.sarOp, threadstop=threadstop,
+                    foundCallback=self.resultBox.showIntermediateFound)
             self.mainControl.getCollator().sort(self.foundPages)
             self.resultBox.showFound(self.sarOp, self.foundPages,
                     self.mainControl.getWikiDocument(),
@@ -14,6 +14,8 @@ from .wxHelper import GUI_ID, XrcControls, autosizeColumn, wxKeyFunctionSink
 
 from .WikiPyparsing import buildSyntaxNode
 
+from .IncrementalParsing import findChangedRange
+
 
 try:
     from EnchantDriver import Dict
@@ -335,6 +337,9 @@ class SpellCheckerDialog(wx.Dialog):
 
 
 class SpellCheckerSession(MiscEvent.MiscEventSourceMixin):
+    # Maximum number of entries in the verdict cache before it is cleared
+    VERDICT_CACHE_MAX_SIZE = 50000
+
     def __init__(self, wikiDocument):
         MiscEvent.MiscEventSourceMixin.__init__(self)
 
@@ -348,6 +353,11 @@ class SpellCheckerSession(MiscEvent.MiscEventSourceMixin):
         self.autoReplaceWords = {}
         self.spellChkIgnore = set()  # set of words to ignore during spell checking
 
+        # Dictionary {(dictLanguage, spWord): checkWord() result}, shared
+        # with clones. Must be cleared in place whenever the dictionary or
+        # an ignore list changes
+        self.verdictCache = {}
+
         # For currently open dict file (if any)
         self.spellChkAddedGlobal = None
         self.globalPwlPage = None
@@ -398,6 +408,7 @@ class SpellCheckerSession(MiscEvent.MiscEventSourceMixin):
         # For current session
         result.autoReplaceWords = self.autoReplaceWords
         result.spellChkIgnore = self.spellChkIgnore
+        result.verdictCache = self.verdictCache
 
         result.dictLanguage = self.dictLanguage
         result.enchantDict = self.enchantDict  # Thread safety???  Dict(self.dictLanguage)
@@ -462,6 +473,8 @@ class SpellCheckerSession(MiscEvent.MiscEventSourceMixin):
         self.spellChkAddedLocal = \
                 set(self.localPwlPage.getLiveText().split("\n"))
 
+        self.verdictCache.clear()
+
 
     def findAndLoadNextWikiPage(self, firstCheckedWikiWord, checkedWikiWord):
         while True:
@@ -492,12 +505,24 @@ class SpellCheckerSession(MiscEvent.MiscEventSourceMixin):
 
 
     def checkWord(self, spWord):
-        return spWord in self.spellChkIgnore or \
+        key = (self.dictLanguage, spWord)
+        verdict = self.verdictCache.get(key)
+        if verdict is not None:
+            return verdict
+
+        verdict = spWord in self.spellChkIgnore or \
                 spWord in self.spellChkAddedGlobal or \
                 spWord in self.spellChkAddedLocal or \
                 (self.enchantDict is not None and \
                 self.enchantDict.check(spWord))
 
+        if len(self.verdictCache) >= self.VERDICT_CACHE_MAX_SIZE:
+            self.verdictCache.clear()
+
+        self.verdictCache[key] = verdict
+
+        return verdict
+
     def suggest(self, spWord):
         if self.enchantDict is None:
             return []
@@ -516,11 +541,13 @@ class SpellCheckerSession(MiscEvent.MiscEventSourceMixin):
         Clear the list of words to ignore for this session.
         """
         self.spellChkIgnore.clear()
+        self.verdictCache.clear()
         self.fireMiscEventKeys(("modified spell checker session",))
 
 
     def addIgnoreWordSession(self, spWord):
         self.spellChkIgnore.add(spWord)
+        self.verdictCache.clear()
         # For global and local ignores the changed FuncPage automatically
         # issues an event which triggers a reread of the word lists
         # and sends another event that session was modified.
@@ -536,6 +563,7 @@ class SpellCheckerSession(MiscEvent.MiscEventSourceMixin):
         if self.spellChkAddedGlobal is None:
             return  # TODO When does this happen?
         self.spellChkAddedGlobal.add(spWord)
+        self.verdictCache.clear()
         words = list(self.spellChkAddedGlobal)
         self.wikiDocument.getCollator().sort(words)
         self.globalPwlPage.replaceLiveText(u"\n".join(words))
@@ -548,6 +576,7 @@ class SpellCheckerSession(MiscEvent.MiscEventSourceMixin):
         if self.spellChkAddedLocal is None:
             return  # TODO When does this happen?
         self.spellChkAddedLocal.add(spWord)
+        self.verdictCache.clear()
         words = list(self.spellChkAddedLocal)
         self.wikiDocument.getCollator().sort(words)
         self.localPwlPage.replaceLiveText(u"\n".join(words))
@@ -591,7 +620,66 @@ class SpellCheckerSession(MiscEvent.MiscEventSourceMixin):
             # It is added as a WikiPyparsing.TerminalNode
             
             result.append(buildSyntaxNode(spWord, start, "unknownSpelling"))
-            
+
+
+    def buildUnknownWordListIncrementally(self, oldText, oldUnknownWords,
+            text, threadstop=DUMBTHREADSTOP):
+        """
+        Same as buildUnknownWordList(text) but only the lines which differ
+        from oldText are checked again.
+        oldUnknownWords -- result of buildUnknownWordList() (or this method)
+                for oldText with the same dictionary and ignore lists
+        """
+        if not self.hasEnchantDict():
+            return buildSyntaxNode([], -1, "unknownSpellList")
+        
+        docPage = self.getCurrentDocPage()
+        
+        if docPage is None:
+            return buildSyntaxNode([], -1, "unknownSpellList")
+
+        start, oldEnd, newEnd = findChangedRange(oldText, text)
+        delta = newEnd - oldEnd
+
+        # Words don't span multiple lines so whole lines are checked again
+        lineStart = text.rfind(u"\n", 0, start) + 1
+        oldLineEnd = oldText.find(u"\n", oldEnd)
+        if oldLineEnd == -1:
+            oldLineEnd = len(oldText)
+        lineEnd = oldLineEnd + delta
+
+        oldNodes = oldUnknownWords.getChildren()
+
+        result = [node for node in oldNodes if node.pos < lineStart]
+
+        langHelper = wx.GetApp().createWikiLanguageHelper(
+                docPage.getWikiLanguageName())
+
+        startPos = lineStart
+
+        while True:
+            threadstop.testValidThread()
+
+            start, end, spWord = langHelper.findNextWordForSpellcheck(text,
+                    startPos, docPage)
+
+            if start is None or start >= lineEnd:
+                break
+
+            startPos = end
+
+            if self.checkWord(spWord):
+                continue
+
+            result.append(buildSyntaxNode(spWord, start, "unknownSpelling"))
+
+        for node in oldNodes:
+            if node.pos >= oldLineEnd:
+                result.append(buildSyntaxNode(node.getString(),
+                        node.pos + delta, "unknownSpelling"))
+
+        return buildSyntaxNode(result, -1, "unknownSpellList")
+
 
 
 def isSpellCheckSupported():
@@ -451,6 +451,13 @@ class _SqliteStatement3:
             self.bind_auto(i, datas[i-1], fctfinder)
 
 
+    def bind_parameter_count(self):
+        """
+        Return number of parameters of this statement
+        """
+        return _dll.sqlite3_bind_parameter_count(self._stmtpointer)
+
+
 #     def bind_hint(self, datas, hint):
 #         first=1  # TODO: as dict parameter
 #         
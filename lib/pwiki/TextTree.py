@@ -13,8 +13,10 @@ from wxHelper import XrcControls, GUI_ID
 
 from StringOps import splitIndentDeepness, unescapeWithRe, uniWithNone, \
         re_sub_escape, splitFill
+from Utilities import lazyImport
 
-from AdditionalDialogs import SelectIconDialog
+# Dialogs are imported when needed
+AdditionalDialogs = lazyImport("pwiki.AdditionalDialogs")
 
 
 # class MenuBuilder:
@@ -371,7 +373,7 @@ class AddWikiToFavoriteWikisDialog(wx.Dialog):
         """
         The "..." button after the icon field was pressed
         """
-        iconDesc = SelectIconDialog.runModal(self, -1,
+        iconDesc = AdditionalDialogs.SelectIconDialog.runModal(self, -1,
                 wx.GetApp().getIconCache())
         
         if iconDesc is not None:
@@ -13,7 +13,11 @@ import Consts
 
 from .MiscEvent import MiscEventSourceMixin, KeyFunctionSink
 
-from . import Exporters, Serialization
+from . import Serialization
+from .Utilities import lazyImport
+
+# Only needed when a page is deleted
+Exporters = lazyImport("pwiki.Exporters")
 
 from . import StringOps
 
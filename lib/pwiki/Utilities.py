@@ -1,6 +1,6 @@
 from __future__ import with_statement
 
-import threading, traceback, collections, heapq
+import os, sys, threading, traceback, collections, heapq
 from thread import allocate_lock as _allocate_lock
 from time import time as _time, sleep as _sleep
 
@@ -138,12 +138,15 @@ class SingleThreadExecutor(BasicThreadStop, MiscEvent.MiscEventSourceMixin):
         self.dequeCount = dequeCount
 
         self.deques = None
+        # Dictionary from key to pending job queued with this key
+        self.keyedJobs = {}
         self.thread = None
         self.paused = False
         self.currentThreadStop = None
         
         self.doneJobCount = 0
         self.incDoneJobCount = self._inactiveIncDoneJobCount
+        self.resetJobStatistics()
 
     def isValidThread(self):
         return self.deques is not None
@@ -157,6 +160,7 @@ class SingleThreadExecutor(BasicThreadStop, MiscEvent.MiscEventSourceMixin):
             if self.deques is None:
                 self.deques = tuple(collections.deque()
                         for i in range(self.dequeCount))
+                self.keyedJobs = {}
 
     def start(self):
         with self.dequeCondition:
@@ -188,6 +192,10 @@ class SingleThreadExecutor(BasicThreadStop, MiscEvent.MiscEventSourceMixin):
             return  # Error?
 
         with self.dequeCondition:
+            for job in self.deques[idx]:
+                if job[6] is not None:
+                    del self.keyedJobs[job[6]]
+
             self.deques[idx].clear()
 
 
@@ -202,11 +210,53 @@ class SingleThreadExecutor(BasicThreadStop, MiscEvent.MiscEventSourceMixin):
         # No lock as it is called always inside a lock
         for deque in self.deques:
             if len(deque) != 0:
-                return deque.pop()
+                job = deque.pop()
+                if job[6] is not None:
+                    del self.keyedJobs[job[6]]
+                return job
         
         return None
 
 
+    def _queueJob(self, idx, key, fct, args, kwargs, event, retObj, tstop):
+        """
+        Put job into deque idx. Must be called with dequeCondition acquired.
+
+        If key is not None and a job with the same key is pending already,
+        this job is replaced by the new one. The replaced job keeps its
+        place in the queue unless deque idx has a higher priority (lower
+        index), then it is moved there. Both callers get the same
+        ExecutionResult object.
+
+        A job is a list [fct, args, kwargs, event, retObj, tstop, key,
+        deque index, time of queueing].
+        Returns the ExecutionResult object of the job.
+        """
+        if key is not None:
+            job = self.keyedJobs.get(key)
+            if job is not None:
+                job[0] = fct
+                job[1] = args
+                job[2] = kwargs
+                job[5] = tstop
+                self.coalescedJobCount += 1
+
+                if idx < job[7]:
+                    self.deques[job[7]].remove(job)
+                    self.deques[idx].appendleft(job)
+                    job[7] = idx
+
+                return job[4]
+
+        job = [fct, args, kwargs, event, retObj, tstop, key, idx, _time()]
+        self.deques[idx].appendleft(job)
+        if key is not None:
+            self.keyedJobs[key] = job
+        self.dequeCondition.notify()
+
+        return retObj
+
+
     def getJobCount(self, start=None, end=None):
         if start is not None and end is None:
             end = start
@@ -239,7 +289,64 @@ class SingleThreadExecutor(BasicThreadStop, MiscEvent.MiscEventSourceMixin):
 
     def stopDoneJobCount(self):
         self.incDoneJobCount = self._inactiveIncDoneJobCount
-        
+
+
+    def resetJobStatistics(self):
+        self.coalescedJobCount = 0
+        self.startedJobCount = 0
+        self.totalJobLatency = 0.0
+        self.maxJobLatency = 0.0
+
+    def getJobStatistics(self):
+        """
+        Returns dictionary with statistics since creation or last call
+        to resetJobStatistics():
+            "jobCounts": List of number of pending jobs in each deque
+            "coalescedJobCount": Number of jobs which replaced a pending job
+                with the same key
+            "startedJobCount": Number of jobs taken from the deques
+            "averageLatency", "maxLatency": Average and maximum time in
+                seconds between queueing and start of a job
+        """
+        with self.dequeCondition:
+            if self.deques is None:
+                jobCounts = [0] * self.dequeCount
+            else:
+                jobCounts = [len(deque) for deque in self.deques]
+
+            if self.startedJobCount > 0:
+                averageLatency = self.totalJobLatency / self.startedJobCount
+            else:
+                averageLatency = 0.0
+
+            return {"jobCounts": jobCounts,
+                    "coalescedJobCount": self.coalescedJobCount,
+                    "startedJobCount": self.startedJobCount,
+                    "averageLatency": averageLatency,
+                    "maxLatency": self.maxJobLatency}
+
+
+    def isKeyedJobPending(self, key):
+        """
+        Returns True if a job queued with key is waiting in a deque.
+        """
+        with self.dequeCondition:
+            return key in self.keyedJobs
+
+
+    def removeKeyedJob(self, key):
+        """
+        Remove pending job queued with key (if any) from its deque.
+        Returns True if a job was removed.
+        """
+        with self.dequeCondition:
+            job = self.keyedJobs.pop(key, None)
+            if job is None:
+                return False
+
+            self.deques[job[7]].remove(job)
+            return True
+
 
     def _fireStateChange(self, running=None):
         if running is None:
@@ -266,7 +373,7 @@ class SingleThreadExecutor(BasicThreadStop, MiscEvent.MiscEventSourceMixin):
                     self._fireStateChange(False)
                     return
 
-                fct, args, kwargs, event, retObj, tstop = job
+                fct, args, kwargs, event, retObj, tstop = job[:6]
 
                 try:
                     if fct is SingleThreadExecutor.ENDOBJECT:
@@ -277,9 +384,9 @@ class SingleThreadExecutor(BasicThreadStop, MiscEvent.MiscEventSourceMixin):
                             self._fireStateChange(False)
                             return
 
-                        self.deques[-1].appendleft(
-                                (SingleThreadExecutor.ENDOBJECT, None, None,
-                                None, None))
+                        self._queueJob(len(self.deques) - 1, None,
+                                SingleThreadExecutor.ENDOBJECT, None, None,
+                                None, None, False)
                         continue
                     elif fct is SingleThreadExecutor.PAUSEOBJECT:
                         # Operation should pause, this means to kill the thread, but
@@ -292,6 +399,12 @@ class SingleThreadExecutor(BasicThreadStop, MiscEvent.MiscEventSourceMixin):
                     traceback.print_exc() # ?
                     retObj.setException(e)
 
+                latency = _time() - job[8]
+                self.startedJobCount += 1
+                self.totalJobLatency += latency
+                if latency > self.maxJobLatency:
+                    self.maxJobLatency = latency
+
 #                 tracer.runctx('retObj.result = fct(*args, **kwargs)', globals(), locals())
                 if tstop:
                     kwargs["threadstop"] = self
@@ -327,8 +440,7 @@ class SingleThreadExecutor(BasicThreadStop, MiscEvent.MiscEventSourceMixin):
         retObj = ExecutionResult()
 
         with self.dequeCondition:
-            self.deques[idx].appendleft((fct, args, kwargs, event, retObj, None))
-            self.dequeCondition.notify()
+            self._queueJob(idx, None, fct, args, kwargs, event, retObj, None)
 
         event.wait(240)  # TODO: Replace by constant
 
@@ -348,29 +460,43 @@ class SingleThreadExecutor(BasicThreadStop, MiscEvent.MiscEventSourceMixin):
         fct was executed already and which result it returned or exception
         it threw.
         """
+        return self.executeAsyncKeyed(idx, None, fct, *args, **kwargs)
+
+
+    def executeAsyncKeyed(self, idx, key, fct, *args, **kwargs):
+        """
+        Like executeAsync() but if a job with the same hashable key (if not
+        None) is still pending it is replaced by this one instead of queueing
+        a new job. See _queueJob().
+        """
         retObj = ExecutionResult()
 
         if self.deques is None:
             return retObj  # Error?
 
         with self.dequeCondition:
-            self.deques[idx].appendleft((fct, args, kwargs, None, retObj, False))
-            self.dequeCondition.notify()
-
-        return retObj
+            return self._queueJob(idx, key, fct, args, kwargs, None, retObj,
+                    False)
 
 
     def executeAsyncWithThreadStop(self, idx, fct, *args, **kwargs):
+        return self.executeAsyncWithThreadStopKeyed(idx, None, fct, *args,
+                **kwargs)
+
+
+    def executeAsyncWithThreadStopKeyed(self, idx, key, fct, *args, **kwargs):
+        """
+        Like executeAsyncKeyed() but fct gets the executor as additional
+        "threadstop" keyword argument.
+        """
         retObj = ExecutionResult()
 
         if self.deques is None:
             return retObj  # Error?
 
         with self.dequeCondition:
-            self.deques[idx].appendleft((fct, args, kwargs, None, retObj, True))
-            self.dequeCondition.notify()
-
-        return retObj
+            return self._queueJob(idx, key, fct, args, kwargs, None, retObj,
+                    True)
 
 
     __call__ = execute
@@ -394,10 +520,11 @@ class SingleThreadExecutor(BasicThreadStop, MiscEvent.MiscEventSourceMixin):
         with self.dequeCondition:
             if hardEnd:
                 self.deques = None
+                self.keyedJobs = {}
             else:
-                self.deques[-1].appendleft(
-                        (SingleThreadExecutor.ENDOBJECT, None, None, None, None,
-                        False))
+                self._queueJob(len(self.deques) - 1, None,
+                        SingleThreadExecutor.ENDOBJECT, None, None, None, None,
+                        False)
             self.dequeCondition.notify()
 
         self.thread.join(120)  # TODO: Replace by constant
@@ -830,6 +957,55 @@ class IdentityList(list):
 # ---------- Misc ----------
 
 
+class LazyModule(object):
+    """
+    Stands in for a module which is imported on first attribute access.
+    Used for subsystems which are rarely needed so that they don't slow
+    down the start of the application.
+    """
+    def __init__(self, name):
+        """
+        name -- full name of the module, e.g. "pwiki.Exporters"
+        """
+        self.__dict__["_LazyModule__name"] = name
+        self.__dict__["_LazyModule__module"] = None
+
+    def _getModule(self):
+        module = self.__module
+        if module is None:
+            __import__(self.__name)
+            module = sys.modules[self.__name]
+            self.__dict__["_LazyModule__module"] = module
+
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._getModule(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._getModule(), attr, value)
+
+    def __repr__(self):
+        return "<LazyModule %r>" % self.__name
+
+
+def lazyImport(name):
+    """
+    Returns module name if it is already imported, otherwise a LazyModule
+    for it. If environment variable WIKIDPAD_EAGER_IMPORTS is set, the
+    module is always imported at once (helps to find import errors).
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    if os.environ.get("WIKIDPAD_EAGER_IMPORTS"):
+        __import__(name)
+        return sys.modules[name]
+
+    return LazyModule(name)
+
+
 
 def sgn(value):
     """
@@ -363,6 +363,20 @@ class SyntaxNode(object):
 #         raise NotImplementedError  # abstract
 
 
+    # Pickling support (e.g. to transfer ASTs between processes). The
+    # default doesn't work because NonTerminalNode overrides the slot
+    # strLength with a read-only property.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["pos"] = self.pos
+        state["name"] = self.name
+        return state
+
+    def __setstate__(self, state):
+        for key, value in state.iteritems():
+            setattr(self, key, value)
+
+
     @staticmethod
     def pprintList(lst):
         result = []
@@ -396,6 +410,11 @@ class NonTerminalNode(SyntaxNode):
         self.sub = sub
         self._calcedStrLength = -1 # sum(t.strLength for t in sub)
 
+    def __getstate__(self):
+        state = super(NonTerminalNode, self).__getstate__()
+        state["sub"] = self.sub
+        return state
+
 
     def __repr__(self):
         if self.__dict__:
@@ -721,6 +740,12 @@ class TerminalNode(SyntaxNode):
         self.text = text
         self.strLength = len(text)
 
+    def __getstate__(self):
+        state = super(TerminalNode, self).__getstate__()
+        state["text"] = self.text
+        state["strLength"] = self.strLength
+        return state
+
 
     def __repr__(self):
         if self.__dict__:
@@ -800,9 +825,19 @@ class ParsingState(object):
         else:
             self.threadstop = threadstop
         self.fullText = fullText
-        self.revText = u"".join(reversed(fullText))
+        self._revText = None
         self.debugIndent = 0
 
+    @property
+    def revText(self):
+        """
+        Reversed full text, only built if a parse action needs it
+        """
+        if self._revText is None:
+            self._revText = self.fullText[::-1]
+
+        return self._revText
+
 
 
 
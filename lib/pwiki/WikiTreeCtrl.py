@@ -17,7 +17,7 @@ from WikiExceptions import WikiWordNotFoundException, InternalError, \
         NoPageAstException
 
 import Utilities
-from Utilities import StringPathSet
+from Utilities import StringPathSet, lazyImport
 
 
 from Configuration import MIDDLE_MOUSE_CONFIG_TO_TABMODE
@@ -31,7 +31,8 @@ from StringOps import mbcsEnc, guiToUni, uniToGui, strToBool, \
 
 from DocPagePresenter import BasicDocPagePresenter
 
-from AdditionalDialogs import SelectWikiWordDialog
+# Dialogs are imported when needed
+AdditionalDialogs = lazyImport("pwiki.AdditionalDialogs")
 
 
 class NodeStyle(object):
@@ -1998,8 +1999,8 @@ class WikiTreeCtrl(customtreectrl.CustomTreeCtrl):          # wxTreeCtrl):
 #         self.activeEditor.AppendText(u"\n\n[%s=%s]" % (name, value))
 
     def OnAppendWikiWord(self, evt):
-        toWikiWord = SelectWikiWordDialog.runModal(self.pWiki, self.pWiki, -1,
-                title=_(u"Append Wiki Word"))
+        toWikiWord = AdditionalDialogs.SelectWikiWordDialog.runModal(
+                self.pWiki, self.pWiki, -1, title=_(u"Append Wiki Word"))
 
         if toWikiWord is not None:
             parentWord = self.GetPyData(self.contextMenuNode).getWikiWord()
@@ -2013,8 +2014,8 @@ class WikiTreeCtrl(customtreectrl.CustomTreeCtrl):          # wxTreeCtrl):
 
 
     def OnPrependWikiWord(self, evt):
-        toWikiWord = SelectWikiWordDialog.runModal(self.pWiki, self.pWiki, -1,
-                title=_(u"Prepend Wiki Word"))
+        toWikiWord = AdditionalDialogs.SelectWikiWordDialog.runModal(
+                self.pWiki, self.pWiki, -1, title=_(u"Prepend Wiki Word"))
 
         if toWikiWord is not None:
             parentWord = self.GetPyData(self.contextMenuNode).getWikiWord()
@@ -21,7 +21,8 @@ import wx, wx.stc
 from Consts import FormatTypes
 
 from .Utilities import DUMBTHREADSTOP, callInMainThread, ThreadHolder, \
-        calcResizeArIntoBoundingBox, DictFromFields, seqEnforceContained
+        calcResizeArIntoBoundingBox, DictFromFields, seqEnforceContained, \
+        lazyImport
 
 from .wxHelper import GUI_ID, getTextFromClipboard, copyTextToClipboard, \
         wxKeyFunctionSink, getAccelPairFromKeyDown, appendToMenuByMenuDesc
@@ -35,16 +36,18 @@ from .SystemInfo import isUnicode, isOSX, isLinux, isWindows
 
 from .ParseUtilities import getFootnoteAnchorDict
 
-from .EnhancedScintillaControl import StyleCollector
+from .EnhancedScintillaControl import StyleCollector, orStyleMask
 
 from .SearchableScintillaControl import SearchableScintillaControl
 
 
 
 from . import Configuration
-from . import AdditionalDialogs
 from . import WikiTxtDialogs
 
+# Dialogs are imported when needed
+AdditionalDialogs = lazyImport("pwiki.AdditionalDialogs")
+
 # image stuff
 import imghdr
 
@@ -1847,15 +1850,11 @@ class WikiTxtCtrl(SearchableScintillaControl):
                 threadstop.testValidThread()
 
                 if scTokens.getChildrenCount() > 0:
-                    spellStyleBytes = self.processSpellCheckTokens(text, scTokens,
-                            threadstop)
+                    stylebytes = self.processSpellCheckTokens(text, scTokens,
+                            stylebytes, threadstop)
 
                     threadstop.testValidThread()
 
-                    # TODO: Faster? How?
-                    stylebytes = "".join([chr(ord(a) | ord(b))
-                            for a, b in itertools.izip(stylebytes, spellStyleBytes)])
-
                     self.storeStylingAndAst(stylebytes, None, styleMask=0xff)
                 else:
                     self.storeStylingAndAst(stylebytes, None, styleMask=0xff)
@@ -1999,14 +1998,21 @@ class WikiTxtCtrl(SearchableScintillaControl):
         return stylebytes.value()
 
 
-    def processSpellCheckTokens(self, text, scTokens, threadstop):
-        stylebytes = StyleCollector(0, text, self.bytelenSct)
-        for node in scTokens:
-            threadstop.testValidThread()
-            stylebytes.bindStyle(node.pos, node.strLength,
-                    wx.stc.STC_INDIC2_MASK)
+    def processSpellCheckTokens(self, text, scTokens, stylebytes, threadstop):
+        """
+        Returns the syntax stylebytes with the spell checker indicator
+        set for the unknown words in scTokens.
+        """
+        def iterRanges():
+            for node in scTokens:
+                threadstop.testValidThread()
+                yield (node.pos, node.strLength)
 
-        return stylebytes.value()
+        stylebytes = bytearray(stylebytes)
+        orStyleMask(stylebytes, text, self.bytelenSct, iterRanges(),
+                wx.stc.STC_INDIC2_MASK)
+
+        return str(stylebytes)
 
 
     def getFoldingNodeDict(self):
@@ -0,0 +1,119 @@
+"""
+Pools of worker processes for CPU bound work on many pages (wiki-wide
+search without index, see ParallelSearch, parsing of pages for export and
+rebuild, see ParallelParsing).
+
+All options which set a number of worker processes use the same
+convention: -1 means one process per CPU, 0 means no worker processes
+(the work is done in the calling thread as before). Fewer than two
+processes are never started because one worker doesn't gain anything.
+
+Worker processes are only used where they are created by fork(), so they
+inherit the loaded modules (and, for ParallelParsing, the data prepared
+in the main process) and never run the startup code of the application.
+The workers only do computations on the data sent to them, they don't
+use wx, the database or other threads of the application.
+
+All pools are terminated when the application exits (MainApp.OnExit()
+calls terminateAllPools()).
+
+This module must not import wx (directly or indirectly).
+"""
+
+from __future__ import with_statement
+
+import os, threading, traceback
+
+
+_livePools = set()
+_livePoolsLock = threading.RLock()
+
+
+def isAvailable():
+    """
+    Returns True if worker processes can be used on this platform.
+    """
+    if not hasattr(os, "fork"):
+        return False
+    try:
+        import multiprocessing
+        return True
+    except ImportError:
+        return False
+
+
+def getProcessCount(configuredCount):
+    """
+    Returns the number of worker processes to start for a configured count
+    (-1: one per CPU, 0: none) or 0 if no workers should be used.
+    """
+    if configuredCount == 0 or not isAvailable():
+        return 0
+
+    if configuredCount < 0:
+        import multiprocessing
+        try:
+            configuredCount = multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 0
+
+    if configuredCount < 2:
+        return 0
+
+    return configuredCount
+
+
+def createPool(processCount):
+    """
+    Returns a new multiprocessing.Pool with processCount processes (as
+    returned by getProcessCount()) or None if it can't be created.
+    Terminate it with terminatePool() when it isn't needed anymore.
+    """
+    if processCount < 2:
+        return None
+
+    import multiprocessing
+
+    try:
+        pool = multiprocessing.Pool(processCount)
+    except (OSError, IOError):
+        traceback.print_exc()
+        return None
+
+    with _livePoolsLock:
+        _livePools.add(pool)
+
+    return pool
+
+
+def terminatePool(pool):
+    """
+    Stop the worker processes of a pool created by createPool().
+    """
+    with _livePoolsLock:
+        _livePools.discard(pool)
+
+    try:
+        pool.terminate()
+        pool.join()
+    except Exception:
+        traceback.print_exc()
+
+
+def isPoolLive(pool):
+    """
+    Returns True if pool was created by createPool() and not terminated yet.
+    """
+    with _livePoolsLock:
+        return pool in _livePools
+
+
+def terminateAllPools():
+    """
+    Stop all pools which weren't terminated yet.
+    """
+    with _livePoolsLock:
+        pools = list(_livePools)
+
+    for pool in pools:
+        terminatePool(pool)
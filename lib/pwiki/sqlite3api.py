@@ -3,7 +3,7 @@
 # This module does currently not support date and time handling
 
 
-import exceptions, re
+import exceptions, re, time
 
 import SqliteThin3
 
@@ -66,6 +66,9 @@ class NotSupportedError(DatabaseError):
 TYPEDET_NONE = 0    # No automatic detection
 TYPEDET_FIRST = 1   # Use types of first retrieved row
 
+# Maximum number of prepared statements cached per connection
+STATEMENT_CACHE_SIZE = 200
+
 # TODO UTF-8 ???
 
 
@@ -77,6 +80,14 @@ class Connection:
         self.thinConn = None
         self.thinConn = SqliteThin3.SqliteDb3(dsn, self._errHandler)
         self.statementCache = {} # Cache for prepared statements
+        self.statementCacheSize = keywords.get("statementcachesize",
+                STATEMENT_CACHE_SIZE)
+        # Dictionary sql -> counter value of last use, for LRU eviction
+        self.statementUseTicks = {}
+        self.statementUseCounter = 0
+        # Dictionary sql -> [prepare count, execute count, total time]
+        # or None if statistics are switched off
+        self.statementStatistics = None
         self._autoCommit = False
         self.bindfct = None
         self.colfct = None
@@ -94,7 +105,12 @@ class Connection:
         sql -- SQL-string to prepare
         """
         try:
+            self.statementUseCounter += 1
+            self.statementUseTicks[sql] = self.statementUseCounter
+
             if self.statementCache.get(sql, None) is None:
+                if self.statementStatistics is not None:
+                    self._getStatementStatEntry(sql)[0] += 1
                 return [self.thinConn.prepare(sql), None]
             else:
                 st = self.statementCache[sql]
@@ -116,6 +132,8 @@ class Connection:
             if (self.statementCache.get(sql, None) is None):
                 stmt[0].reset()
                 self.statementCache[sql] = stmt
+                if len(self.statementCache) > self.statementCacheSize:
+                    self._pruneStmtCache()
             else:
                 # There is already a statement for this sql
                 stmt[0].close()
@@ -123,8 +141,26 @@ class Connection:
         except AttributeError:
             stmt[0].close()
             pass   # raise Error, "Trying to access a closed connection"
-            
-            
+
+
+    def _pruneStmtCache(self):
+        """
+        Remove the least recently used quarter of the cached statements
+        (at least one) and finalize them. Entries of statements currently
+        in use by a cursor are removed as well, the cursor puts the statement
+        back later.
+        """
+        useTicks = self.statementUseTicks
+        sqls = self.statementCache.keys()
+        sqls.sort(key=lambda s: useTicks.get(s, 0))
+
+        for sql in sqls[:max(1, len(sqls) // 4)]:
+            st = self.statementCache.pop(sql)
+            useTicks.pop(sql, None)
+            if st is not None:
+                st[0].close()
+
+
     def clearStmtCache(self):
         try:
             stmts = filter(lambda s: s is not None, self.statementCache.values())
@@ -132,15 +168,53 @@ class Connection:
                 s[0].close()
                 
             self.statementCache = {}
+            self.statementUseTicks = {}
         except AttributeError:
             raise Error, "Trying to access a closed connection"
 
 
+    def setStatementStatistics(self, enabled):
+        """
+        Switch collection of per-statement statistics on or off. Switching
+        it on resets the statistics.
+        """
+        if enabled:
+            self.statementStatistics = {}
+        else:
+            self.statementStatistics = None
+
+
+    def getStatementStatistics(self):
+        """
+        Returns list of tuples (sql, prepareCount, executeCount, totalTime)
+        sorted by descending total time. totalTime is the time in seconds
+        for preparing, binding and retrieving the first row.
+        Returns empty list if statistics are switched off.
+        """
+        if self.statementStatistics is None:
+            return []
+
+        result = [(sql, st[0], st[1], st[2])
+                for sql, st in self.statementStatistics.iteritems()]
+        result.sort(key=lambda t: t[3], reverse=True)
+        return result
+
+
+    def _getStatementStatEntry(self, sql):
+        entry = self.statementStatistics.get(sql)
+        if entry is None:
+            entry = [0, 0, 0.0]
+            self.statementStatistics[sql] = entry
+
+        return entry
+
+
     def close(self):
         error = None
         try:
             self.clearStmtCache()
             self.statementCache = None
+            self.statementUseTicks = None
         except Exception, e:
             error = e        
         
@@ -323,11 +397,16 @@ class Cursor:
                             "create", "drop"):
                         self.conn.begin()
                 else:
-                    if cmd not in ("select", "begin", "commit", "rollback",
-                            "insert", "update", "delete", "replace", "create",
+                    if cmd not in ("select", "with", "begin", "commit",
+                            "rollback", "insert", "update", "delete", "replace", "create",
                             "drop"):
                         self.conn.commit()
-            
+
+            if self.conn.statementStatistics is not None:
+                startTime = time.time()
+            else:
+                startTime = None
+
             self.stmt = self.conn.prepare(sql)
             self.stmtsql = sql
 
@@ -368,6 +447,11 @@ class Cursor:
                 self.colFct = None
                 
                 raise
+
+            if startTime is not None:
+                entry = self.conn._getStatementStatEntry(sql)
+                entry[1] += 1
+                entry[2] += time.time() - startTime
                 
             # After schema change clear stmt cache            
             if cmd in ("create", "drop", "vacuum", "pragma"):
@@ -385,12 +469,74 @@ class Cursor:
             raise Error, "Trying to access a closed cursor"
 
 
-    def executemany(self, sql, seq_of_parameters, *params, **keywords):
+    def executemany(self, sql, seq_of_parameters, bindfct=None, colfct=None,
+            **keywords):
         """
-        Simple implementation
+        Execute sql once for each parameter sequence. The statement is
+        prepared only once and just rebound for each parameter sequence,
+        result rows are ignored. Each parameter sequence must provide all
+        parameters of the statement (otherwise values of the previous one
+        would be used), ProgrammingError is raised if not.
+        Schema changing commands fall back to a loop over execute().
         """
-        for pars in seq_of_parameters:
-            self.execute(sql, pars, *params, **keywords)
+        cmd = sql.lstrip().split(" ",1)[0].lower()
+        if cmd in ("create", "drop", "vacuum", "pragma"):
+            for pars in seq_of_parameters:
+                self.execute(sql, pars, bindfct, colfct, **keywords)
+            return
+
+        self._reset()
+
+        try:
+            if bindfct is None:
+                bindfct = self.conn.bindfct
+
+            if not self.conn._autoCommit:
+                if self.conn.thinConn.get_autocommit():
+                    if cmd in ("insert", "update", "delete", "replace"):
+                        self.conn.begin()
+                else:
+                    if cmd not in ("select", "with", "insert", "update",
+                            "delete", "replace"):
+                        self.conn.commit()
+
+            if self.conn.statementStatistics is not None:
+                startTime = time.time()
+            else:
+                startTime = None
+
+            stmt = self.conn.prepare(sql)
+            rowcount = 0
+            count = 0
+            try:
+                parCount = stmt[0].bind_parameter_count()
+                for pars in seq_of_parameters:
+                    if len(pars or ()) != parCount:
+                        raise ProgrammingError, "Statement needs %i " \
+                                "parameters, %i supplied in parameter " \
+                                "sequence %i" % (parCount, len(pars or ()),
+                                count)
+                    if count > 0:
+                        stmt[0].reset()
+                    if pars:
+                        stmt[0].bind_auto_multi(pars, fctfinder=bindfct)
+                    stmt[0].step()
+                    count += 1
+                    if cmd in ("insert", "update", "delete", "replace"):
+                        rowcount += self.conn.thinConn.changes()
+            finally:
+                self.conn.putStmtBack(sql, stmt)
+
+            if startTime is not None:
+                entry = self.conn._getStatementStatEntry(sql)
+                entry[1] += count
+                entry[2] += time.time() - startTime
+
+            if cmd in ("insert", "update", "delete", "replace"):
+                self.rowcount = rowcount
+
+        except AttributeError:
+            raise Error, "Trying to access a closed cursor"
             
     def fetchone(self):
         """
@@ -1,28 +1,29 @@
-import WikiData_compact_sqlite
-import WikiData_original_gadfly
-import WikiData_original_sqlite
+# The backend modules are imported when needed, they (especially Gadfly)
+# pull in a lot of modules which aren't needed for the start of the
+# application.
+# Tuple of tuples (handler name, module name)
+_HANDLER_MODULES = (
+        ("original_sqlite", "WikiData_original_sqlite"),
+        ("compact_sqlite", "WikiData_compact_sqlite"),
+        ("original_gadfly", "WikiData_original_gadfly"),
+    )
 
 _handlers = None
 
 
+def _importHandlerModule(modName):
+    return __import__(modName, globals(), locals(), [], -1)
+
+
 def _collectHandlers():
     global _handlers
     _handlers = []
 
-    hdls = WikiData_original_sqlite.listAvailableWikiDataHandlers()
-    for h in hdls:
-        _handlers.append((h[0], h[1],
-                WikiData_original_sqlite.getWikiDataHandler))
-
-    hdls = WikiData_compact_sqlite.listAvailableWikiDataHandlers()
-    for h in hdls:
-        _handlers.append((h[0], h[1],
-                WikiData_compact_sqlite.getWikiDataHandler))
-
-    hdls = WikiData_original_gadfly.listAvailableWikiDataHandlers()
-    for h in hdls:
-        _handlers.append((h[0], h[1],
-                WikiData_original_gadfly.getWikiDataHandler))
+    for hdlName, modName in _HANDLER_MODULES:
+        module = _importHandlerModule(modName)
+        hdls = module.listAvailableWikiDataHandlers()
+        for h in hdls:
+            _handlers.append((h[0], h[1], module.getWikiDataHandler))
 
 def listHandlers():
     global _handlers
@@ -35,6 +36,15 @@ def listHandlers():
 def getHandler(name):
     global _handlers
     if _handlers is None:
+        # Import only the module needed for name
+        for hdlName, modName in _HANDLER_MODULES:
+            if hdlName == name:
+                module = _importHandlerModule(modName)
+                if name in [h[0] for h in
+                        module.listAvailableWikiDataHandlers()]:
+                    return module.getWikiDataHandler(name)
+                break
+
         _collectHandlers()
 
     for h in _handlers:
@@ -0,0 +1,154 @@
+"""
+Document-wide cache of page ASTs.
+
+Page objects are often created only temporarily (e.g. during rebuild or
+by background updates) so the AST cached in the page object itself is lost
+and the same unchanged text is parsed again and again. This cache keeps
+recently built ASTs keyed by page name and a hash of the text. The entry is
+only used if the format details are equivalent to the ones the AST was
+built with.
+"""
+
+from __future__ import with_statement
+
+import threading, hashlib
+
+from collections import deque
+
+
+
+class PageAstCache(object):
+    """
+    Owned by WikiDataManager. The size of the cache is limited by the total
+    length of the texts the cached ASTs were built from, the least recently
+    used entries are removed first.
+    """
+
+    # Maximum sum of text lengths of cached ASTs
+    MAX_TOTAL_TEXT_LENGTH = 4000000
+
+    def __init__(self, maxTotalTextLength=None):
+        if maxTotalTextLength is None:
+            maxTotalTextLength = self.MAX_TOTAL_TEXT_LENGTH
+
+        self.maxTotalTextLength = maxTotalTextLength
+        self.lock = threading.RLock()
+
+        # Dictionary from tuple (unifName, text digest) to tuple
+        # (use count, formatDetails, pageAst, text length)
+        self.entries = {}
+        # Deque of tuples (key, use count) in order of use. An item is
+        # outdated if the use count of the entry doesn't match anymore
+        self.useOrder = deque()
+        self.useCount = 0
+        self.totalTextLength = 0
+
+        # Statistics
+        self.hitCount = 0
+        self.missCount = 0
+
+
+    @staticmethod
+    def isCacheable(formatDetails):
+        """
+        ASTs built with auto-linking depend on the set of existing wiki words
+        and are therefore not cached.
+        """
+        return formatDetails.noFormat or formatDetails.autoLinkMode == u"off"
+
+
+    @staticmethod
+    def _getKey(unifName, text):
+        return (unifName, hashlib.sha1(text.encode("utf-8")).digest())
+
+
+    def get(self, unifName, text, formatDetails):
+        """
+        Return cached AST for text of page unifName built with format details
+        equivalent to formatDetails or None.
+        """
+        if not self.isCacheable(formatDetails):
+            return None
+
+        key = self._getKey(unifName, text)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or not entry[1].isEquivTo(formatDetails):
+                self.missCount += 1
+                return None
+
+            # Mark as most recently used
+            self.entries[key] = self._markUsed(key) + entry[1:]
+            self.hitCount += 1
+
+            return entry[2]
+
+
+    def _markUsed(self, key):
+        """
+        Returns the first item of the entry tuple for key.
+        """
+        if len(self.useOrder) > 4 * len(self.entries) + 100:
+            # Too many outdated items, rebuild
+            self.useOrder = deque(sorted(((k, e[0])
+                    for k, e in self.entries.iteritems()),
+                    key=lambda item: item[1]))
+
+        self.useCount += 1
+        self.useOrder.append((key, self.useCount))
+
+        return (self.useCount,)
+
+
+    def put(self, unifName, text, formatDetails, pageAst):
+        """
+        Store pageAst as AST for text of page unifName built with
+        formatDetails.
+        """
+        if not self.isCacheable(formatDetails):
+            return
+
+        textLength = len(text)
+        if textLength > self.maxTotalTextLength:
+            return
+
+        key = self._getKey(unifName, text)
+
+        with self.lock:
+            oldEntry = self.entries.pop(key, None)
+            if oldEntry is not None:
+                self.totalTextLength -= oldEntry[3]
+
+            self.entries[key] = self._markUsed(key) + \
+                    (formatDetails.copyWithoutBasePage(), pageAst, textLength)
+            self.totalTextLength += textLength
+
+            # Remove least recently used entries
+            while self.totalTextLength > self.maxTotalTextLength:
+                oldKey, oldUseCount = self.useOrder.popleft()
+                oldEntry = self.entries.get(oldKey)
+                if oldEntry is None or oldEntry[0] != oldUseCount:
+                    # Outdated item
+                    continue
+
+                del self.entries[oldKey]
+                self.totalTextLength -= oldEntry[3]
+
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.useOrder.clear()
+            self.totalTextLength = 0
+
+
+    def getStatistics(self):
+        """
+        Returns tuple (<number of hits>, <number of misses>,
+        <number of entries>, <total text length>)
+        """
+        with self.lock:
+            return (self.hitCount, self.missCount, len(self.entries),
+                    self.totalTextLength)
+
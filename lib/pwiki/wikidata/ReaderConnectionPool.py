@@ -0,0 +1,198 @@
+"""
+Pool of additional read-only database connections for the sqlite backends.
+
+WikiDataSynchronizedProxy serializes all calls to a WikiData object by one
+lock. The methods listed by WikiData.getReaderMethodNames() only read from
+the database, so they can instead run on a separate connection from this
+pool and threads reading the database don't have to wait for each other.
+With the database in WAL journal mode the readers also don't block the
+writing connection (and aren't blocked by it).
+
+While a pooled call runs, the connection is stored in a thread-local and
+the "connWrap" property of the WikiData object returns it instead of the
+writing connection.
+
+Readers only see committed data. As long as a transaction is open on the
+writing connection the pool isn't used, so a thread which wrote something
+always reads its own changes.
+
+WAL mode is stored in the database file, sqlite versions before 3.7 can't
+open the database anymore until it is switched back. It needs write access
+to the directory of the database (for the "-wal" and "-shm" files) and
+doesn't work on network file systems, see isWalUsable().
+"""
+
+from __future__ import with_statement
+
+import sys, os, os.path, threading, traceback
+
+
+# File system types (as listed in /proc/mounts) of network file systems
+_NETWORK_FS_TYPES = frozenset(("nfs", "nfs4", "cifs", "smbfs", "smb3",
+        "ncpfs", "afs", "9p", "fuse.sshfs", "davfs", "fuse.davfs2"))
+
+
+def _isNetworkPath(path):
+    """
+    Returns True if path is on a network drive or file system. Returns False
+    if unknown.
+    """
+    path = os.path.abspath(path)
+
+    if sys.platform == "win32":
+        if path.startswith(u"\\\\?\\UNC\\"):
+            return True
+        if path.startswith(u"\\\\?\\"):
+            path = path[4:]
+        if path.startswith(u"\\\\"):
+            return True
+
+        import ctypes
+        DRIVE_REMOTE = 4
+        return ctypes.windll.kernel32.GetDriveTypeW(
+                os.path.splitdrive(path)[0] + u"\\") == DRIVE_REMOTE
+
+    if isinstance(path, unicode):
+        path = path.encode(sys.getfilesystemencoding() or "utf-8")
+    path = os.path.realpath(path)
+
+    try:
+        mountsFile = open("/proc/mounts")
+    except IOError:
+        return False
+
+    # Find file system type of the longest mount point containing path
+    bestMountPoint = ""
+    fsType = None
+    try:
+        for line in mountsFile:
+            fields = line.split()
+            if len(fields) < 3:
+                continue
+            # Blanks etc. are escaped as octal numbers
+            mountPoint = fields[1].decode("string_escape")
+            if path != mountPoint and \
+                    not path.startswith(mountPoint.rstrip("/") + "/"):
+                continue
+            if len(mountPoint) >= len(bestMountPoint):
+                bestMountPoint = mountPoint
+                fsType = fields[2]
+    finally:
+        mountsFile.close()
+
+    return fsType in _NETWORK_FS_TYPES
+
+
+def isWalUsable(dbPath):
+    """
+    Returns True if the database file dbPath may be switched to WAL journal
+    mode: the file and its directory are writable and it isn't on a network
+    file system.
+    """
+    if not os.access(dbPath, os.W_OK) or \
+            not os.access(os.path.dirname(os.path.abspath(dbPath)), os.W_OK):
+        return False
+
+    try:
+        return not _isNetworkPath(dbPath)
+    except Exception:
+        traceback.print_exc()
+        return False
+
+
+
+class ReaderConnectionPool(object):
+    def __init__(self, connFactory, writerBusyFct, maxConnections):
+        """
+        connFactory -- function without parameters returning a new
+                connection wrapper
+        writerBusyFct -- function without parameters returning True iff
+                a transaction is open on the writing connection
+        maxConnections -- maximum number of reader connections
+        """
+        self.connFactory = connFactory
+        self.writerBusyFct = writerBusyFct
+        self.maxConnections = maxConnections
+
+        self.lock = threading.Lock()
+        self.idleConnections = []
+        self.connectionCount = 0
+        self.closed = False
+        self.threadLocal = threading.local()
+
+
+    def getThreadConnection(self):
+        """
+        Returns the reader connection used by the current thread or None.
+        """
+        return getattr(self.threadLocal, "connWrap", None)
+
+
+    def acquire(self):
+        """
+        Assign a reader connection to the current thread and return it.
+        Returns None if the caller should use the writing connection instead
+        (pool exhausted or closed, a transaction is open on the writing
+        connection or the current thread uses a reader connection already).
+        """
+        if self.getThreadConnection() is not None or self.writerBusyFct():
+            return None
+
+        with self.lock:
+            if self.closed:
+                return None
+
+            if len(self.idleConnections) > 0:
+                connWrap = self.idleConnections.pop()
+            elif self.connectionCount < self.maxConnections:
+                self.connectionCount += 1
+                connWrap = None
+            else:
+                return None
+
+        if connWrap is None:
+            try:
+                connWrap = self.connFactory()
+            except Exception:
+                traceback.print_exc()
+                with self.lock:
+                    self.connectionCount -= 1
+                return None
+
+        self.threadLocal.connWrap = connWrap
+        return connWrap
+
+
+    def release(self, connWrap):
+        """
+        Return connection acquired by the current thread to the pool.
+        """
+        self.threadLocal.connWrap = None
+
+        with self.lock:
+            if not self.closed:
+                self.idleConnections.append(connWrap)
+                return
+
+            self.connectionCount -= 1
+
+        connWrap.close()
+
+
+    def close(self):
+        """
+        Close all idle connections. Connections currently in use are closed
+        when they are released.
+        """
+        with self.lock:
+            self.closed = True
+            idleConnections = self.idleConnections
+            self.idleConnections = []
+            self.connectionCount -= len(idleConnections)
+
+        for connWrap in idleConnections:
+            try:
+                connWrap.close()
+            except Exception:
+                traceback.print_exc()
+
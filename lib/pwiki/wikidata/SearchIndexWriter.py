@@ -0,0 +1,256 @@
+"""
+Batched, single-writer access to the whoosh search index of a wiki.
+
+Instead of opening, filling and committing a whoosh writer for each
+single page, updates are collected and written in batches. A batch
+is committed when it reaches a maximum size, when its oldest entry gets
+too old or when the update executor has nothing else to do.
+
+During a bulk update (e.g. rebuilding the wiki) full batches are written
+into one whoosh writer which is kept open and only committed by flush()
+(or when the update executor is idle), so the index isn't merged and
+committed again after each batch.
+"""
+
+from __future__ import with_statement
+
+import time, threading
+
+import Consts
+
+from ..Utilities import DUMBTHREADSTOP
+
+
+
+class SearchIndexWriter(object):
+    """
+    Owned by WikiDataManager. All writing access to the search index should
+    go through this object so that only one whoosh writer exists at a time.
+    """
+
+    # Maximum number of pending page updates before a batch is committed
+    BATCH_SIZE = 200
+    # Maximum number of seconds a pending update waits before committing
+    BATCH_MAX_DELAY = 10.0
+
+    def __init__(self, wikiDocument, flushQueue=None):
+        """
+        wikiDocument -- WikiDataManager instance
+        flushQueue -- index of the update executor queue where a job is
+                queued to commit a batch once the executor is idle.
+                If None, no such job is queued.
+        """
+        self.wikiDocument = wikiDocument
+        self.flushQueue = flushQueue
+        self.lock = threading.RLock()
+
+        # Dictionary from unified page name to tuple
+        # (page, liveTextPlaceHold, modTimestamp, content) or to None
+        # if page should be removed from index
+        self.pending = {}
+        self.pendingSince = None
+
+        # Whoosh writer kept open during a bulk update and list of tuples
+        # (page, liveTextPlaceHold) of the pages written to it but not
+        # committed yet
+        self.bulkUpdate = False
+        self.writer = None
+        self.uncommitted = []
+
+        # Statistics
+        self.commitCount = 0
+        self.writtenCount = 0
+
+
+    def getPendingCount(self):
+        with self.lock:
+            return len(self.pending)
+
+
+    def getStatistics(self):
+        """
+        Returns tuple (<number of commits>, <number of documents written>)
+        """
+        return (self.commitCount, self.writtenCount)
+
+
+    def putPage(self, docPage, threadstop=DUMBTHREADSTOP):
+        """
+        Add or update the index entry for docPage in the next batch.
+        Returns True if the page was queued, False if it wasn't.
+        The metadata state of the page is set to "indexed" after the batch
+        was committed if the text didn't change in the meantime.
+        """
+        with docPage.textOperationLock:
+            threadstop.testValidThread()
+
+            liveTextPlaceHold = docPage.liveTextPlaceHold
+            content = docPage.getLiveText()
+
+        entry = (docPage, liveTextPlaceHold, docPage.getTimestamps()[0],
+                content)
+
+        self._addPending(docPage.getUnifiedPageName(), entry)
+        return True
+
+
+    def removePage(self, unifName):
+        """
+        Remove the index entry with unified name unifName in the next batch.
+        """
+        self._addPending(unifName, None)
+
+
+    def beginBulkUpdate(self):
+        """
+        Start writing full batches into one writer which is only committed
+        by flush() (or when the update executor is idle). Call
+        endBulkUpdate() when done.
+        """
+        with self.lock:
+            self.bulkUpdate = True
+
+
+    def endBulkUpdate(self):
+        """
+        Commit all updates and return to committing each batch.
+        """
+        with self.lock:
+            self.bulkUpdate = False
+            self.flush()
+
+
+    def _addPending(self, unifName, entry):
+        with self.lock:
+            self.pending[unifName] = entry
+            if self.pendingSince is None:
+                self.pendingSince = time.time()
+
+            if self.bulkUpdate:
+                if len(self.pending) >= self.BATCH_SIZE:
+                    self._writePending()
+                self._queueFlushJob()
+            elif len(self.pending) >= self.BATCH_SIZE or \
+                    time.time() - self.pendingSince >= self.BATCH_MAX_DELAY:
+                self.flush()
+            else:
+                self._queueFlushJob()
+
+
+    def _queueFlushJob(self):
+        if self.flushQueue is None:
+            return
+
+        executor = self.wikiDocument.getUpdateExecutor()
+        with executor.getDequeCondition():
+            deque = executor.getDeque(self.flushQueue)
+            if deque is None or len(deque) > 0:
+                # Executor not running or flush job already queued
+                return
+
+            executor.executeAsync(self.flushQueue, self.flush)
+
+
+    def discard(self):
+        """
+        Throw away all pending updates (e.g. when index is removed).
+        """
+        with self.lock:
+            self.pending = {}
+            self.pendingSince = None
+            self._cancelWriter()
+
+
+    def _cancelWriter(self):
+        """
+        Throw away the updates written to the open writer, the pages stay
+        in a metadata state which lets the normal update process index them
+        again.
+        """
+        if self.writer is None:
+            return
+
+        writer = self.writer
+        self.writer = None
+        self.uncommitted = []
+        writer.cancel()
+
+
+    def _writePending(self):
+        """
+        Write all pending updates into the open writer (opened if
+        necessary) without committing them.
+        Updates of pages whose text changed after they were queued are
+        cancelled, the page will be queued again by the normal update
+        process.
+        """
+        if len(self.pending) == 0:
+            return
+
+        pending = self.pending
+        self.pending = {}
+        self.pendingSince = None
+
+        if self.writer is None:
+            searchIdx = self.wikiDocument.getSearchIndex()
+            if searchIdx is None:
+                # Index was disabled in the meantime
+                return
+
+            self.writer = searchIdx.writer(timeout=Consts.DEADBLOCKTIMEOUT)
+
+        try:
+            for unifName, entry in pending.iteritems():
+                if entry is None:
+                    self.writer.delete_by_term("unifName", unifName)
+                    continue
+
+                docPage, liveTextPlaceHold, modTimestamp, content = entry
+
+                # Check within lock if data is current yet
+                with docPage.textOperationLock:
+                    if not liveTextPlaceHold is docPage.liveTextPlaceHold:
+                        continue
+
+                self.writer.delete_by_term("unifName", unifName)
+                self.writer.add_document(unifName=unifName,
+                        modTimestamp=modTimestamp, content=content)
+                self.uncommitted.append((docPage, liveTextPlaceHold))
+        except:
+            self._cancelWriter()
+            raise
+
+
+    def flush(self):
+        """
+        Write all pending updates and commit them together with the ones
+        already written to the open writer.
+        """
+        with self.lock:
+            self._writePending()
+
+            if self.writer is None:
+                return
+
+            writer = self.writer
+            written = self.uncommitted
+            self.writer = None
+            self.uncommitted = []
+
+            writer.commit()
+
+            self.commitCount += 1
+            self.writtenCount += len(written)
+
+            for docPage, liveTextPlaceHold in written:
+                with docPage.textOperationLock:
+                    if docPage.isInvalid() or \
+                            not liveTextPlaceHold is docPage.liveTextPlaceHold:
+                        continue
+
+                    docPage.getWikiData().setMetaDataState(
+                            docPage.getWikiWord(),
+                            Consts.WIKIWORDMETADATA_STATE_INDEXED)
+
+
+    close = flush
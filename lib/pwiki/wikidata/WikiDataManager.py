@@ -15,7 +15,8 @@ from wx import GetApp
 import Consts
 from pwiki.WikiExceptions import *
 
-from ..Utilities import TimeoutRLock, SingleThreadExecutor, DUMBTHREADSTOP
+from ..Utilities import TimeoutRLock, SingleThreadExecutor, DUMBTHREADSTOP, \
+        lazyImport
 
 from ..MiscEvent import MiscEventSourceMixin
 
@@ -32,11 +33,16 @@ from ..timeView.WikiWideHistory import WikiWideHistory
 from .. import AttributeHandling
 
 from ..SearchAndReplace import SearchReplaceOperation
+# Only needed when searching
+ParallelSearch = lazyImport("pwiki.ParallelSearch")
+WorkerProcesses = lazyImport("pwiki.WorkerProcesses")
 
 from .. import SpellChecker
 from .. import Trashcan
 
 import DbBackendUtils, FileStorage
+from .SearchIndexWriter import SearchIndexWriter
+from .PageAstCache import PageAstCache
 
 # Some functions import parts of the whoosh library
 
@@ -257,6 +263,25 @@ class WikiDataSynchronizedFunction:
             return self.callFunction(*args, **kwargs)
 
 
+class WikiDataReaderFunction(WikiDataSynchronizedFunction):
+    """
+    Wraps a read-only function of WikiData. It runs on a connection of the
+    reader connection pool of the WikiData without acquiring the lock of
+    the proxy if possible.
+    """
+    def __call__(self, *args, **kwargs):
+        readerPool = self.proxy.wikiData.getReaderConnectionPool()
+        if readerPool is not None:
+            connWrap = readerPool.acquire()
+            if connWrap is not None:
+                try:
+                    return self.callFunction(*args, **kwargs)
+                finally:
+                    readerPool.release(connWrap)
+
+        return WikiDataSynchronizedFunction.__call__(self, *args, **kwargs)
+
+
 class WikiDataSynchronizedProxy:
     """
     Proxy class for synchronized access to a WikiData instance
@@ -266,9 +291,19 @@ class WikiDataSynchronizedProxy:
         self.proxyAccessLock = TimeoutRLock(Consts.DEADBLOCKTIMEOUT)
 #         self.accessLockStackTrace = None
 
+        if wikiData.checkCapability("reader connections") is not None:
+            self.readerMethodNames = wikiData.getReaderMethodNames()
+        else:
+            self.readerMethodNames = frozenset()
+
 
     def __getattr__(self, attr):
-        result = WikiDataSynchronizedFunction(self, self.proxyAccessLock,
+        if attr in self.readerMethodNames:
+            functionClass = WikiDataReaderFunction
+        else:
+            functionClass = WikiDataSynchronizedFunction
+
+        result = functionClass(self, self.proxyAccessLock,
                 getattr(self.wikiData, attr))
                 
         self.__dict__[attr] = result
@@ -295,6 +330,8 @@ class WikiDataManager(MiscEventSourceMixin):
     
     # Update executor queue for index search update
     UEQUEUE_INDEX = 2
+    # Update executor queue to commit pending search index updates when idle
+    UEQUEUE_INDEXFLUSH = 3
 
     def __init__(self, wikiConfigFilename, dbtype, wikiLangName, ignoreLock=False,
             createLock=True, recoveryMode=False):
@@ -403,6 +440,9 @@ class WikiDataManager(MiscEventSourceMixin):
 
         self.baseWikiData = wikiData
         self.autoLinkRelaxInfo = None
+        # Dictionary from tuple (wikiWord, existingonly) to tuple of children
+        # in tree order, see DocPages.WikiPage.getChildRelationshipsTreeOrder()
+        self.childrenTreeOrderCache = {}
 
         # Set of camelcase words not to see as wiki words
         self.ccWordBlacklist = None
@@ -427,6 +467,12 @@ class WikiDataManager(MiscEventSourceMixin):
         self.dbtype = wikidhName
 
         self.whooshIndex = None
+        self.searchIndexWriter = SearchIndexWriter(self,
+                flushQueue=self.UEQUEUE_INDEXFLUSH)
+
+        # ASTs of pages which are no longer (or not yet) cached in a
+        # page object
+        self.pageAstCache = PageAstCache()
 
         self.refCount = 1
 
@@ -549,9 +595,7 @@ class WikiDataManager(MiscEventSourceMixin):
             if step == Consts.WIKIWORDMETADATA_STATE_ATTRSPROCESSED:
                 if page.runDatabaseUpdate(step=step, threadstop=threadstop):
                     if self.isSearchIndexEnabled():
-                        self.updateExecutor.executeAsyncWithThreadStop(
-                                self.UEQUEUE_INDEX,
-                                self._runDatabaseUpdate, word,
+                        self._pushDatabaseUpdate(self.UEQUEUE_INDEX, word,
                                 Consts.WIKIWORDMETADATA_STATE_SYNTAXPROCESSED)
 
             elif step == Consts.WIKIWORDMETADATA_STATE_SYNTAXPROCESSED:
@@ -559,9 +603,8 @@ class WikiDataManager(MiscEventSourceMixin):
                     page.runDatabaseUpdate(step=step, threadstop=threadstop)
             else:   # should be: step == Consts.WIKIWORDMETADATA_STATE_DIRTY:
                 if page.runDatabaseUpdate(step=step, threadstop=threadstop):
-                    self.updateExecutor.executeAsyncWithThreadStop(1,
-                            self._runDatabaseUpdate, word,
-                            Consts.WIKIWORDMETADATA_STATE_ATTRSPROCESSED)
+                    self._pushDatabaseUpdate(self._getUpdateQueueForWord(word),
+                            word, Consts.WIKIWORDMETADATA_STATE_ATTRSPROCESSED)
 
 
 
@@ -569,6 +612,27 @@ class WikiDataManager(MiscEventSourceMixin):
             return
 
 
+    def _pushDatabaseUpdate(self, queue, word, step):
+        """
+        Queue _runDatabaseUpdate() for word and step. A job for the same
+        word and step which is still waiting in the queue is replaced.
+        """
+        self.updateExecutor.executeAsyncWithThreadStopKeyed(queue,
+                (word, step), self._runDatabaseUpdate, word, step)
+
+
+    def _getUpdateQueueForWord(self, word):
+        """
+        Returns index of update executor queue for meta data updates of
+        word. Pages with a live page object (especially those open in an
+        editor) are updated before all others.
+        """
+        if word in self.wikiPageDict:
+            return 0
+        else:
+            return 1
+
+
     def incRefCount(self):
         self.refCount += 1
         return self.refCount
@@ -601,6 +665,12 @@ class WikiDataManager(MiscEventSourceMixin):
             self.refCount = 0
             self.updateExecutor.end(hardEnd=True)  # TODO Inform user as this may take some time
 
+            # Commit pending search index updates
+            try:
+                self.searchIndexWriter.close()
+            except:
+                traceback.print_exc()
+
             if self.trashcan is not None:
                 self.trashcan.writeOverview()
                 self.trashcan.close()
@@ -901,11 +971,28 @@ class WikiDataManager(MiscEventSourceMixin):
 
 
     def pushUpdatePage(self, page):
-        self.updateExecutor.executeAsyncWithThreadStop(0, page.runDatabaseUpdate)
+        self.updateExecutor.executeAsyncWithThreadStopKeyed(0,
+                self._getUpdatePageKey(page), page.runDatabaseUpdate)
+
+
+    @staticmethod
+    def _getUpdatePageKey(page):
+        """
+        Key of the update job queued by pushUpdatePage().
+        """
+        return (page.getUnifiedPageName(), -1)
 
 
     def getUpdateExecutor(self):
         return self.updateExecutor
+
+
+    def getSearchIndexWriter(self):
+        return self.searchIndexWriter
+
+
+    def getPageAstCache(self):
+        return self.pageAstCache
         
         
     def pushDirtyMetaDataUpdate(self):
@@ -944,11 +1031,11 @@ class WikiDataManager(MiscEventSourceMixin):
 
             with self.updateExecutor.getDequeCondition():
                 for word in words0:
-                    self.updateExecutor.executeAsyncWithThreadStop(1, self._runDatabaseUpdate,
+                    self._pushDatabaseUpdate(self._getUpdateQueueForWord(word),
                             word, Consts.WIKIWORDMETADATA_STATE_DIRTY)
     
                 for word in words1:
-                    self.updateExecutor.executeAsyncWithThreadStop(1, self._runDatabaseUpdate,
+                    self._pushDatabaseUpdate(self._getUpdateQueueForWord(word),
                             word, Consts.WIKIWORDMETADATA_STATE_ATTRSPROCESSED)
             
             if self.isSearchIndexEnabled():
@@ -957,9 +1044,8 @@ class WikiDataManager(MiscEventSourceMixin):
 
                 with self.updateExecutor.getDequeCondition():
                     for word in words2:
-                        self.updateExecutor.executeAsyncWithThreadStop(
-                                self.UEQUEUE_INDEX, self._runDatabaseUpdate,
-                                word, Consts.WIKIWORDMETADATA_STATE_SYNTAXPROCESSED)
+                        self._pushDatabaseUpdate(self.UEQUEUE_INDEX, word,
+                                Consts.WIKIWORDMETADATA_STATE_SYNTAXPROCESSED)
 
 
     def isReadOnlyEffect(self):
@@ -1394,6 +1480,21 @@ class WikiDataManager(MiscEventSourceMixin):
             self.updateExecutor.start()
 
 
+    def _getRebuildPage(self, wikiWord):
+        """
+        Return the page of wikiWord as processed by rebuildWiki().
+        """
+        wikiPage = self._getWikiPageNoErrorNoCache(wikiWord)
+        if isinstance(wikiPage, AliasWikiPage):
+            # This should never be an alias page, so fetch the
+            # real underlying page
+            # This can only happen if there is a real page with
+            # the same name as an alias
+            wikiPage = WikiPage(self, wikiWord)
+
+        return wikiPage
+
+
     def rebuildWiki(self, progresshandler, onlyDirty):
         """
         Rebuild  the wiki
@@ -1454,34 +1555,113 @@ class WikiDataManager(MiscEventSourceMixin):
             self.getWikiData().setDbSettingsValue(
                     "syncWikiWordMatchtermsUpToDate", "1")
 
-            # Step two: update attributes. There may be attributes which
-            #   define how the rest has to be interpreted, therefore they
-            #   must be processed first.
-            for wikiWord in wikiWords:
-                progresshandler.update(step, _(u"Update attributes of %s") %
-                        wikiWord)
+            # Step two: update attributes and, if possible, the rest of the
+            #   syntax (todos, relations) from the same page AST so that
+            #   each page is parsed only once.
+            #   There may be (global) attributes which define how the rest has
+            #   to be interpreted, therefore the syntax of pages processed
+            #   before a page with global attributes is checked again in
+            #   step three.
+            #   The pages are parsed and their meta data extracted in worker
+            #   processes ahead of this loop (see ParallelParsing). The
+            #   results are only used if the page text and format details
+            #   are still the ones the worker used, otherwise (e.g. after
+            #   global attributes changed the format details) the page is
+            #   parsed here as before.
+
+            # List of tuples (wikiWord, globalAttrsVersion, formatDetails)
+            # of pages whose syntax was processed in step two
+            syntaxProcessed = []
+            # Words of pages which must be parsed again in step three
+            syntaxNeeded = []
+            # Incremented each time a page with global attributes is processed
+            globalAttrsVersion = 0
+
+            from ..ParallelParsing import ParallelMetaDataExtractor
+
+            extractor = ParallelMetaDataExtractor(self,
+                    GetApp().getGlobalConfig().getint("main",
+                    "rebuild_parseProcessCount", -1), self._getRebuildPage)
+            try:
+                for wikiWord in extractor.iterPreparsedWords(wikiWords):
+                    progresshandler.update(step,
+                            _(u"Update attributes of %s") % wikiWord)
+                    try:
+                        wikiPage = self._getRebuildPage(wikiWord)
+
+                        wikiPage.refreshSyncUpdateMatchTerms()
+                        formatDetails = wikiPage.getFormatDetails()
+
+                        extract = extractor.popMetaData(wikiWord)
+                        if extract is not None and \
+                                (extract[0] != wikiPage.getLiveText() or
+                                not formatDetails.isEquivTo(extract[1])):
+                            # Outdated
+                            extract = None
+
+                        if extract is None:
+                            pageAst = wikiPage.getLivePageAst()
+                        else:
+                            text, extractFormatDetails, (attrs, todos,
+                                    childRelations, headingMatchTerms) = extract
+
+                        self.getWikiData().refreshFileSignatureForWikiPageName(
+                                wikiWord)
+
+                        if extract is None:
+                            wikiPage.refreshAttributesFromPageAst(pageAst)
+                        else:
+                            wikiPage.refreshAttributesFromExtract(attrs, text,
+                                    extractFormatDetails)
+
+                        for key in wikiPage.getAttributes().iterkeys():
+                            if key.startswith(u"global."):
+                                globalAttrsVersion += 1
+                                break
+
+                        formatDetails2 = wikiPage.getFormatDetails()
+                        if formatDetails.isEquivTo(formatDetails2):
+                            if extract is None:
+                                wikiPage.refreshMainDbCacheFromPageAst(pageAst)
+                            else:
+                                wikiPage.refreshMainDbCacheFromExtract(todos,
+                                        childRelations, headingMatchTerms,
+                                        text, extractFormatDetails)
+
+                            syntaxProcessed.append((wikiWord,
+                                    globalAttrsVersion,
+                                    formatDetails2.copyWithoutBasePage()))
+                        else:
+                            # Own attributes changed formatting, parse again
+                            syntaxNeeded.append(wikiWord)
+                    except:
+                        traceback.print_exc()
+
+                    step += 1
+            finally:
+                extractor.close()
+
+            # Step three: update the rest of the syntax (todos, relations)
+            #   for pages which need it. These are pages whose format details
+            #   were changed by the attributes processed in step two.
+            for wikiWord, version, formatDetails in syntaxProcessed:
+                if version == globalAttrsVersion:
+                    # No global attributes were processed later
+                    break
+                
                 try:
                     wikiPage = self._getWikiPageNoErrorNoCache(wikiWord)
                     if isinstance(wikiPage, AliasWikiPage):
-                        # This should never be an alias page, so fetch the
-                        # real underlying page
-                        # This can only happen if there is a real page with
-                        # the same name as an alias
                         wikiPage = WikiPage(self, wikiWord)
 
-                    wikiPage.refreshSyncUpdateMatchTerms()
-                    pageAst = wikiPage.getLivePageAst()
-
-                    self.getWikiData().refreshFileSignatureForWikiPageName(
-                            wikiWord)
-                    wikiPage.refreshAttributesFromPageAst(pageAst)
+                    if not wikiPage.getFormatDetails().isEquivTo(formatDetails):
+                        syntaxNeeded.append(wikiWord)
                 except:
                     traceback.print_exc()
 
-                step += 1
+            step += len(wikiWords) - len(syntaxNeeded)
 
-            # Step three: update the rest of the syntax (todos, relations)
-            for wikiWord in wikiWords:
+            for wikiWord in syntaxNeeded:
                 progresshandler.update(step, _(u"Update syntax of %s") % wikiWord)
                 try:
                     wikiPage = self._getWikiPageNoErrorNoCache(wikiWord)
@@ -1501,27 +1681,32 @@ class WikiDataManager(MiscEventSourceMixin):
                 step += 1
             
             if self.isSearchIndexEnabled():
-                # Step four: update index
-                for wikiWord in wikiWords:
-                    progresshandler.update(step, _(u"Update index of %s") % wikiWord)
-                    try:
-                        wikiPage = self._getWikiPageNoErrorNoCache(wikiWord)
-                        if isinstance(wikiPage, AliasWikiPage):
-                            # This should never be an alias page, so fetch the
-                            # real underlying page
-                            # This can only happen if there is a real page with
-                            # the same name as an alias
-                            wikiPage = WikiPage(self, wikiWord)
-
-                        wikiPage.putIntoSearchIndex()
-
-#                         writer.add_document(unifName="wikipage/"+wikiWord,
-#                                 modTimestamp=wikiPage.getTimestamps()[0],
-#                                 content=content)
-                    except:
-                        traceback.print_exc()
- 
-                    step += 1
+                # Step four: update index, all batches go into one writer
+                self.searchIndexWriter.beginBulkUpdate()
+                try:
+                    for wikiWord in wikiWords:
+                        progresshandler.update(step, _(u"Update index of %s") % wikiWord)
+                        try:
+                            wikiPage = self._getWikiPageNoErrorNoCache(wikiWord)
+                            if isinstance(wikiPage, AliasWikiPage):
+                                # This should never be an alias page, so fetch the
+                                # real underlying page
+                                # This can only happen if there is a real page with
+                                # the same name as an alias
+                                wikiPage = WikiPage(self, wikiWord)
+
+                            wikiPage.putIntoSearchIndex()
+
+#                             writer.add_document(unifName="wikipage/"+wikiWord,
+#                                     modTimestamp=wikiPage.getTimestamps()[0],
+#                                     content=content)
+                        except:
+                            traceback.print_exc()
+
+                        step += 1
+                finally:
+                    # Commit all batches
+                    self.searchIndexWriter.endBulkUpdate()
 
             progresshandler.update(step - 1, _(u"Final cleanup"))
             # Give possibility to do further reorganisation
@@ -1600,10 +1785,126 @@ class WikiDataManager(MiscEventSourceMixin):
         return renameDict.items()
 
 
+    def replaceLiveTexts(self, pageTextSeq):
+        """
+        Replace the live texts of several pages as one batch.
+        pageTextSeq -- sequence of tuples (docPage, text)
+
+        The texts of pages not loaded in an editor are written to the
+        database in one transaction. The update executor is paused meanwhile,
+        so the meta-data and index updates of all pages are queued first
+        and processed afterwards.
+
+        If an error occurs, nothing is changed: the transaction is rolled
+        back, the editor texts and dirty flags of the pages already changed
+        are restored and the update jobs queued for them are removed.
+        """
+        if len(pageTextSeq) == 0:
+            return
+
+        wikiData = self.getWikiData()
+        resume = self.updateExecutor.pause(wait=True)
+        try:
+            wikiData.commit()
+            # List of tuples (docPage, live text state, update job pending)
+            # of the pages changed so far
+            changed = []
+            try:
+                for docPage, text in pageTextSeq:
+                    changed.append((docPage, docPage.getLiveTextState(),
+                            self.updateExecutor.isKeyedJobPending(
+                            self._getUpdatePageKey(docPage))))
+                    docPage.replaceLiveText(text)
+
+                wikiData.commit()
+            except:
+                try:
+                    wikiData.rollback()
+                finally:
+                    for docPage, state, jobPending in reversed(changed):
+                        try:
+                            docPage.restoreLiveTextState(state)
+                            if not jobPending:
+                                self.updateExecutor.removeKeyedJob(
+                                        self._getUpdatePageKey(docPage))
+                        except Exception:
+                            traceback.print_exc()
+                raise
+        finally:
+            if resume:
+                self.updateExecutor.start()
+
+
     def renameWikiWord(self, wikiWord, toWikiWord, modifyText):
         """
         modifyText -- Should the text of links to the renamed page be
-                modified? This text replacement works unreliably
+                modified?
+        """
+        self.renameWikiWords([(wikiWord, toWikiWord)], modifyText)
+
+
+    def renameWikiWords(self, renameSeq, modifyText):
+        """
+        Rename all pages in renameSeq as one batch. renameSeq is a sequence
+        of tuples (fromWikiWord, toWikiWord) as returned by
+        buildRenameSeqWithSubpages().
+
+        modifyText -- Should the text of links to the renamed pages be
+                modified?
+        """
+        renameDict = dict(renameSeq)
+
+        if modifyText:
+            # Collect pages linking to the renamed ones before renaming.
+            # Pages with outdated relations are checked as well
+            wikiData = self.getWikiData()
+            backlinkWords = set()
+            for wikiWord, toWikiWord in renameSeq:
+                backlinkWords.update(wikiData.getParentRelationships(wikiWord))
+
+            backlinkWords.update(wikiData.getWikiPageNamesForMetaDataState(
+                    Consts.WIKIWORDMETADATA_STATE_SYNTAXPROCESSED, "<"))
+
+        prevTitles = []
+        for wikiWord, toWikiWord in renameSeq:
+            prevTitles.append(self._renameWikiWordNoTextModification(wikiWord,
+                    toWikiWord))
+
+        if modifyText:
+            # Rewrite links on the (possibly renamed) backlinking pages
+            pageTextSeq = []
+            for word in backlinkWords:
+                pageText = self._renameLinksOnPage(renameDict.get(word, word),
+                        renameDict)
+                if pageText is not None:
+                    pageTextSeq.append(pageText)
+
+            self.replaceLiveTexts(pageTextSeq)
+
+        for (wikiWord, toWikiWord), prevTitle in zip(renameSeq, prevTitles):
+            # Now we modify the page heading if not yet done by text replacing
+            page = self.getWikiPage(toWikiWord)
+            # But first update the match terms which need synchronous updating
+            page.refreshSyncUpdateMatchTerms()
+    
+            self.getWikiData().setMetaDataState(toWikiWord,
+                    Consts.WIKIWORDMETADATA_STATE_DIRTY)
+    
+            content = page.getLiveText()
+            if prevTitle is not None and content.startswith(prevTitle):
+                # Replace previous title with new one
+                content = self.formatPageTitle(self.getWikiPageTitle(
+                        toWikiWord)) + u"\n" + content[len(prevTitle):]
+                page.replaceLiveText(content)
+    
+            page.initiateUpdate()
+
+
+    def _renameWikiWordNoTextModification(self, wikiWord, toWikiWord):
+        """
+        Rename a single page in database and configuration without
+        modifying any page text.
+        Returns the formatted previous title of the page or None.
         """
         global _openDocuments
         
@@ -1670,60 +1971,82 @@ class WikiDataManager(MiscEventSourceMixin):
         oldWikiPage.queueRemoveFromSearchIndex()
         oldWikiPage.informRenamedWikiPage(toWikiWord)
         del self.wikiPageDict[wikiWord]
+        self.invalidateChildrenTreeOrderCache()
 
-        if modifyText:
-            # now we have to search the wiki files and replace the old word with the new
-            sarOp = SearchReplaceOperation()
-            sarOp.wikiWide = True
-            sarOp.wildCard = 'regex'
-            sarOp.caseSensitive = True
-            sarOp.searchStr = ur"\b" + re.escape(wikiWord) + ur"\b"
-            
-            for resultWord in self.searchWiki(sarOp):
-                wikiPage = self.getWikiPage(resultWord)
-                text = wikiPage.getLiveTextNoTemplate()
-                if text is None:
-                    continue
+        return prevTitle
 
-                sarOp.replaceStr = re_sub_escape(toWikiWord)
-                sarOp.replaceOp = True
-                sarOp.cycleToStart = False
 
-                charStartPos = 0
-    
-                while True:
-                    found = sarOp.searchText(text, charStartPos)
-                    start, end = found[:2]
-                    
-                    if start is None: break
-                    
-                    repl = sarOp.replace(text, found)
-                    text = text[:start] + repl + text[end:]  # TODO Faster?
-                    charStartPos = start + len(repl)
+    def _renameLinksOnPage(self, wikiWord, renameDict):
+        """
+        Rewrite all links on page wikiWord which point to a key of renameDict
+        so that they point to the related value. Only the link nodes of the
+        page AST are changed, the new text is built in one pass.
+        Returns tuple (wikiPage, new text) or None if nothing must be changed.
+        """
+        try:
+            wikiPage = self.getWikiPage(wikiWord)
+        except WikiWordNotFoundException:
+            return None
 
-                wikiPage.replaceLiveText(text)
-#                 wikiPage.update(text)
+        text = wikiPage.getLiveTextNoTemplate()
+        if text is None:
+            return None
+
+        langHelper = GetApp().createWikiLanguageHelper(
+                wikiPage.getWikiLanguageName())
 
+        pageAst = wikiPage.getLivePageAst()
 
-        # Now we modify the page heading if not yet done by text replacing
-        page = self.getWikiPage(toWikiWord)
-        # But first update the match terms which need synchronous updating
-        page.refreshSyncUpdateMatchTerms()
+        replacements = []
+        for node in pageAst.iterDeepByName("wikiWord"):
+            newTarget = renameDict.get(node.wikiWord)
+            if newTarget is None:
+                continue
 
-        self.getWikiData().setMetaDataState(toWikiWord,
-                Consts.WIKIWORDMETADATA_STATE_DIRTY)
+            coreNode = node.findFlatByName("word")
+            if coreNode is None:
+                continue
 
-        content = page.getLiveText()
-        if prevTitle is not None and content.startswith(prevTitle):
-            # Replace previous title with new one
-            content = self.formatPageTitle(self.getWikiPageTitle(toWikiWord)) + \
-                    u"\n" + content[len(prevTitle):]
-            page.replaceLiveText(content)
+            linkCore = coreNode.getString()
 
-        page.initiateUpdate()
+            if langHelper.isAbsoluteLinkCore(linkCore):
+                newCore = None
+            else:
+                newCore = langHelper.createRelativeLinkFromWikiWord(newTarget,
+                        wikiWord, downwardOnly=False)
+
+            if newCore is None:
+                newCore = langHelper.createWikiLinkPathObject(
+                        pageName=newTarget).getLinkCore()
+
+            if coreNode.pos == node.pos and \
+                    coreNode.strLength == node.strLength and \
+                    not langHelper.isCcWikiWord(newCore):
+                # Bare link which wouldn't be recognized anymore
+                replacements.append((node.pos, node.pos + node.strLength,
+                        langHelper.createLinkFromWikiWord(newTarget, wikiPage)))
+            else:
+                replacements.append((coreNode.pos,
+                        coreNode.pos + coreNode.strLength, newCore))
 
+        if len(replacements) == 0:
+            return None
+
+        replacements.sort()
+        result = []
+        pos = 0
+        for start, end, repl in replacements:
+            if start < pos:
+                # Overlapping (nested) link, already replaced
+                continue
+            result.append(text[pos:start])
+            result.append(repl)
+            pos = end
+
+        result.append(text[pos:])
+
+        return (wikiPage, u"".join(result))
 
-#             page.update(content)
 
 
     # TODO threadstop?
@@ -1741,6 +2064,20 @@ class WikiDataManager(MiscEventSourceMixin):
         return self.autoLinkRelaxInfo
 
 
+    def getChildrenTreeOrderCache(self):
+        """
+        Return dictionary used by WikiPage.getChildRelationshipsTreeOrder()
+        to cache the order of children. The dictionary is replaced by
+        a new one when it becomes invalid so a caller holding a reference
+        to the old one can't fill in outdated data.
+        """
+        return self.childrenTreeOrderCache
+
+
+    def invalidateChildrenTreeOrderCache(self):
+        self.childrenTreeOrderCache = {}
+
+
     _TITLE_SPLIT_RE1 = re.compile(ur"([" + StringOps.UPPERCASE + ur"]+)" + 
             ur"([" + StringOps.UPPERCASE + ur"][" + StringOps.LOWERCASE + ur"])")
     _TITLE_SPLIT_RE2 = re.compile(ur"([" + StringOps.LOWERCASE + ur"])" +
@@ -1773,12 +2110,17 @@ class WikiDataManager(MiscEventSourceMixin):
             return None
 
 
-    def searchWiki(self, sarOp, applyOrdering=True, threadstop=DUMBTHREADSTOP):
+    def searchWiki(self, sarOp, applyOrdering=True, threadstop=DUMBTHREADSTOP,
+            foundCallback=None):
         """
         Search all wiki pages using the SearchAndReplaceOperation sarOp and
         return list of all page names that match the search criteria.
         If applyOrdering is True, the ordering of the sarOp is applied before
         returning the list.
+        foundCallback -- if not None, it is called (in the calling thread)
+                with lists of found page names while a non-index search
+                is running to show intermediate results. The returned list
+                is still the complete result.
         """
         if sarOp.indexSearch == "no": 
             wikiData = self.getWikiData()
@@ -1807,9 +2149,20 @@ class WikiDataManager(MiscEventSourceMixin):
                     exclusionSet.add(k)
     
                     threadstop.testValidThread()
-    
+
+                if foundCallback is not None and len(preResultSet) > 0:
+                    foundCallback(list(preResultSet))
+
                 # Now search database
-                resultSet = self.getWikiData().search(sarOp, exclusionSet)
+                candidates, totalCount = self._planWikiSearch(sarOp)
+                if candidates is not None:
+                    resultSet = self._searchCandidates(sarOp, candidates,
+                            exclusionSet, threadstop)
+                elif sarOp.isTextNeededForTest():
+                    resultSet = self._scanContent(sarOp, totalCount,
+                            exclusionSet, foundCallback, threadstop)
+                else:
+                    resultSet = self.getWikiData().search(sarOp, exclusionSet)
                 threadstop.testValidThread()
                 resultSet |= preResultSet
                 if applyOrdering:
@@ -1828,6 +2181,9 @@ class WikiDataManager(MiscEventSourceMixin):
             if not self.isSearchIndexEnabled():
                 return []
 
+            # Make pending updates visible to the search
+            self.searchIndexWriter.flush()
+
             q = sarOp.getWhooshIndexQuery(self)
             s = self.getSearchIndex().searcher()
             threadstop.testValidThread()
@@ -1840,6 +2196,162 @@ class WikiDataManager(MiscEventSourceMixin):
             return result
 
 
+    # Fetching the content of a single page is estimated to cost as much as
+    # testing this number of pages during a full scan of the database
+    SEARCH_SINGLE_FETCH_COST = 4
+
+    def _planWikiSearch(self, sarOp):
+        """
+        Decide how the database part of a wiki-wide non-index search is done.
+        sarOp.beginWikiSearch() must have been called before.
+
+        Returns tuple (<candidates>, <total page count>) where candidates is
+        the set of existing pages to test one by one or None if a full
+        scan of the database is estimated to be cheaper.
+        """
+        allWords = self.getAllDefinedWikiPageNames()
+        candidates = sarOp.getCandidateWords()
+
+        if candidates is None:
+            return (None, len(allWords))
+
+        candidates = candidates.intersection(allWords)
+
+        if sarOp.isTextNeededForTest() and \
+                len(candidates) * self.SEARCH_SINGLE_FETCH_COST > len(allWords):
+            return (None, len(allWords))
+
+        return (candidates, len(allWords))
+
+
+    def _searchCandidates(self, sarOp, candidates, exclusionSet,
+            threadstop=DUMBTHREADSTOP):
+        """
+        Test only the pages in the candidates set instead of scanning
+        the whole database.
+        """
+        wikiData = self.getWikiData()
+        textNeeded = sarOp.isTextNeededForTest()
+        result = set()
+
+        for word in candidates:
+            if word in exclusionSet:
+                continue
+
+            threadstop.testValidThread()
+
+            if textNeeded:
+                try:
+                    text = wikiData.getContent(word)
+                except WikiFileNotFoundException:
+                    continue
+            else:
+                text = None
+
+            if sarOp.testWikiPage(word, text) == True:
+                result.add(word)
+
+        return result
+
+
+    # Worker processes are only used for the content scan if the wiki has
+    # at least this number of pages
+    SEARCH_PARALLEL_MIN_PAGES = 500
+
+    # Number of pages read and tested at once during content scan
+    SEARCH_SCAN_CHUNK_SIZE = 100
+
+    def _scanContent(self, sarOp, totalCount, exclusionSet, foundCallback=None,
+            threadstop=DUMBTHREADSTOP):
+        """
+        Scan content of all pages not in exclusionSet. The content is read in
+        chunks and, if possible, tested in worker processes.
+        """
+        processCount = 0
+        standaloneTest = None
+
+        if totalCount >= self.SEARCH_PARALLEL_MIN_PAGES:
+            processCount = WorkerProcesses.getProcessCount(
+                    GetApp().getGlobalConfig().getint("main",
+                    "search_scanProcessCount", -1))
+            if processCount > 1:
+                standaloneTest = sarOp.getStandaloneTest()
+
+        return ParallelSearch.scanChunks(
+                self._iterContentChunks(exclusionSet,
+                self.SEARCH_SCAN_CHUNK_SIZE), sarOp.testWikiPage,
+                standaloneTest, processCount, foundCallback, threadstop)
+
+
+    def _iterContentChunks(self, exclusionSet, chunkSize):
+        """
+        Iterate over all pages not in exclusionSet and yield lists of tuples
+        (word, content).
+        """
+        if self.getWikiData().checkCapability("content chunk iteration") \
+                is not None:
+            # Backend reads through its own connection, so the base object
+            # is used without the lock of the synchronizing proxy
+            chunkIter = self.baseWikiData.iterContentChunks(chunkSize)
+        else:
+            chunkIter = self._iterContentChunksByPage(chunkSize)
+
+        for chunk in chunkIter:
+            chunk = [item for item in chunk if not item[0] in exclusionSet]
+            if len(chunk) > 0:
+                yield chunk
+
+
+    def _iterContentChunksByPage(self, chunkSize):
+        """
+        Fallback for backends without own chunk iteration. Each page is
+        read by a separate call so the database lock isn't held during the
+        whole scan.
+        """
+        wikiData = self.getWikiData()
+        words = wikiData.getAllDefinedWikiPageNames()
+
+        for i in xrange(0, len(words), chunkSize):
+            chunk = []
+            for word in words[i:i + chunkSize]:
+                try:
+                    chunk.append((word, wikiData.getContent(word)))
+                except WikiFileNotFoundException:
+                    # some error in cache (should not happen)
+                    continue
+
+            yield chunk
+
+
+    def explainWikiSearch(self, sarOp):
+        """
+        Returns a unicode text describing how searchWiki() would process
+        sarOp, with the estimated number of pages passing each node of
+        the search tree.
+        """
+        if sarOp.indexSearch != "no":
+            return u"Index search"
+
+        sarOp.beginWikiSearch(self)
+        try:
+            candidates, totalCount = self._planWikiSearch(sarOp)
+            lines = sarOp.explainPlan(totalCount)
+
+            if candidates is not None:
+                lines.append(u"Plan: test %i candidate pages of %i" %
+                        (len(candidates), totalCount))
+            elif sarOp.isTextNeededForTest():
+                lines.append(u"Plan: scan content of all %i pages" %
+                        totalCount)
+            else:
+                lines.append(u"Plan: test names of all %i pages" %
+                        totalCount)
+        finally:
+            sarOp.endWikiSearch()
+
+        return u"\n".join(lines)
+
+
     @staticmethod
     def getWhooshIndexContentAnalyzer():
         from whoosh.analysis import StandardAnalyzer        
@@ -1886,6 +2398,8 @@ class WikiDataManager(MiscEventSourceMixin):
         
         p = self.updateExecutor.pause(wait=True)
         self.updateExecutor.clearDeque(self.UEQUEUE_INDEX)
+        self.updateExecutor.clearDeque(self.UEQUEUE_INDEXFLUSH)
+        self.searchIndexWriter.discard()
         self.updateExecutor.start()
 
         if self.whooshIndex is not None:
@@ -2083,6 +2597,8 @@ class WikiDataManager(MiscEventSourceMixin):
         pg = self.getFuncPage("wiki/CCBlacklist")
         bls.update(pg.getLiveText().split("\n"))
         self.ccWordBlacklist = bls
+        # Blacklist influences parsing
+        self.pageAstCache.clear()
 
     def _updateNccWordBlacklist(self):
         """
@@ -2094,6 +2610,8 @@ class WikiDataManager(MiscEventSourceMixin):
         pg = self.getFuncPage("wiki/NCCBlacklist")
         bls.update(pg.getLiveText().split("\n"))
         self.nccWordBlacklist = bls
+        # Blacklist influences parsing
+        self.pageAstCache.clear()
 
 
     def getWikiPageNameForLinkTerm(self, word):
@@ -2227,6 +2745,7 @@ class WikiDataManager(MiscEventSourceMixin):
         self.wikiData = None
         self.baseWikiData = None
         self.autoLinkRelaxInfo = None
+        self.childrenTreeOrderCache = {}
 
         wikiDataFactory, createWikiDbFunc = DbBackendUtils.getHandler(self.dbtype)
         if wikiDataFactory is None:
@@ -2313,6 +2832,7 @@ class WikiDataManager(MiscEventSourceMixin):
             if miscevt.has_key("changed configuration"):
                 attrs = miscevt.getProps().copy()
                 attrs["changed wiki configuration"] = True
+                self.invalidateChildrenTreeOrderCache()
                 self._handleWikiConfigurationChanged(miscevt)
                 self.fireMiscEventProps(attrs)
         elif miscevt.getSource() is GetApp():
@@ -2331,6 +2851,7 @@ class WikiDataManager(MiscEventSourceMixin):
             if miscevt.has_key_in(("deleted wiki page", "renamed wiki page",
                     "pseudo-deleted wiki page")):
                 self.autoLinkRelaxInfo = None
+                self.invalidateChildrenTreeOrderCache()
                 attrs = miscevt.getProps().copy()
                 attrs["wikiPage"] = miscevt.getSource()
                 self.fireMiscEventProps(attrs)
@@ -2338,12 +2859,14 @@ class WikiDataManager(MiscEventSourceMixin):
                 # TODO: Add new on rename
             elif miscevt.has_key("updated wiki page"):
                 self.autoLinkRelaxInfo = None
+                self.invalidateChildrenTreeOrderCache()
                 attrs = miscevt.getProps().copy()
                 attrs["wikiPage"] = miscevt.getSource()
                 self.fireMiscEventProps(attrs)
 #                 miscevt.getSource().putIntoSearchIndex()
             elif miscevt.has_key("saving new wiki page"):            
                 self.autoLinkRelaxInfo = None
+                self.invalidateChildrenTreeOrderCache()
 #                 miscevt.getSource().putIntoSearchIndex()
             elif miscevt.has_key("reread cc blacklist needed"):
                 self._updateCcWordBlacklist()
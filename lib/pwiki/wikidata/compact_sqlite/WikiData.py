@@ -24,6 +24,8 @@ from wx import GetApp
 
 from pwiki.WikiExceptions import *   # TODO make normal import
 from pwiki import SearchAndReplace
+from pwiki.wikidata.ReaderConnectionPool import ReaderConnectionPool, \
+        isWalUsable
 
 try:
     import pwiki.sqlite3api as sqlite
@@ -47,10 +49,41 @@ import Consts
 
 class WikiData:
     "Interface to wiki data."
+
+    # Maximum number of start words for which getAllSubWords() uses a
+    # recursive query (each one is a query parameter)
+    MAX_CTE_START_WORDS = 200
+
+    # Methods which only read from the database and don't use or fill
+    # caches, temporary tables or files. They can run on a connection of
+    # the reader pool (see getReaderMethodNames())
+    _READER_METHOD_NAMES = frozenset((
+        "getContent", "retrieveDataBlock", "retrieveDataBlockAsText",
+        "getTimestamps", "getWikiWordReadOnly", "getExistingWikiWordInfo",
+        "getMetaDataState", "getWikiPageNamesForMetaDataState",
+        "getChildRelationships", "getParentlessWikiWords", "getUndefinedWords",
+        "getAllDefinedWikiPageNames", "getDefinedWikiPageNamesStartingWith",
+        "isDefinedWikiPageName", "getWikiPageLinkTermsStartingWith",
+        "getWikiLinksStartingWith", "getWikiPageNamesModifiedWithin",
+        "getTimeMinMax", "getWikiPageNamesBefore", "getWikiPageNamesAfter",
+        "getFirstWikiPageName", "getNextWikiPageName", "getAttributeNames",
+        "getAttributeNamesStartingWith", "getDistinctAttributeValues",
+        "getAttributeTriples", "getWordsForAttributeName",
+        "getAttributesForWord", "getTodos", "getWikiWordMatchTermsWith",
+        "getDataBlockUnifNamesStartingWith", "getDbSettingsValue",
+        "getPresentationBlock"))
+
     def __init__(self, wikiDocument, dataDir, tempDir):
         self.wikiDocument = wikiDocument
         self.dataDir = dataDir
         self.cachedWikiPageLinkTermDict = None
+        # Pool of reader connections or None if not used
+        self.readerPool = None
+        # True iff database has the trigram table for infix search of
+        # match terms
+        self.matchTermTrigramsAvailable = False
+        # True iff sqlite library supports recursive queries ("with recursive")
+        self.recursiveCteAvailable = False
 
         dbPath = self.wikiDocument.getWikiConfig().get("wiki_db", "db_filename",
                 u"").strip()
@@ -69,9 +102,10 @@ class WikiData:
             raise DbWriteAccessError(e)
 
         dbfile = longPathDec(dbfile)
+        self.dbfile = dbfile
 
         try:
-            self.connWrap = DbStructure.ConnectWrapSyncCommit(
+            self.writeConnWrap = DbStructure.ConnectWrapSyncCommit(
                     sqlite.connect(dbfile))
         except (IOError, OSError, sqlite.Error), e:
             traceback.print_exc()
@@ -154,6 +188,20 @@ class WikiData:
         # Activate UTF8 support for text in database (content is blob!)
         DbStructure.registerUtf8Support(self.connWrap)
 
+        try:
+            self.matchTermTrigramsAvailable = \
+                    DbStructure.hasMatchTermTrigrams(self.connWrap)
+        except sqlite.Error, e:
+            self.matchTermTrigramsAvailable = False
+            lastException = DbReadAccessError(e)
+
+        try:
+            self.recursiveCteAvailable = \
+                    DbStructure.getSqliteLibVersion(self.connWrap) >= (3, 8, 3)
+        except sqlite.Error, e:
+            self.recursiveCteAvailable = False
+            lastException = DbReadAccessError(e)
+
         # Function to convert from content in database to
         # return value, used by getContent()
         self.contentDbToOutput = lambda c: utf8Dec(c, "replace")[0]
@@ -193,10 +241,83 @@ class WikiData:
                 raise DbReadAccessError(e2)
             raise DbReadAccessError(e)
 
+        if not recoveryMode:
+            self._initReaderConnectionPool()
+
         if lastException:
             raise lastException
 
 
+    def _initReaderConnectionPool(self):
+        """
+        Switch the database to WAL journal mode and create the pool of
+        reader connections if configured and supported by sqlite library
+        and file system. Otherwise switch it back to the rollback journal
+        if it is in WAL mode.
+        """
+        maxConnections = GetApp().getGlobalConfig().getint("main",
+                "db_readerConnectionCount", 0)
+
+        try:
+            wal = maxConnections > 0 and \
+                    DbStructure.getSqliteLibVersion(self.connWrap) >= \
+                    (3, 7, 0) and isWalUsable(self.dbfile)
+
+            if not DbStructure.setJournalModeWal(self.connWrap, wal):
+                return
+        except sqlite.Error, e:
+            # E.g. read-only database, continue without pool
+            traceback.print_exc()
+            return
+
+        self.readerPool = ReaderConnectionPool(self._createReaderConnection,
+                self.writeConnWrap.isInTransaction, maxConnections)
+
+
+    def _createReaderConnection(self):
+        """
+        Called by the reader connection pool to create a new connection.
+        """
+        connWrap = DbStructure.ConnectWrapSyncCommit(
+                sqlite.connect(self.dbfile))
+
+        DbStructure.registerSqliteFunctions(connWrap)
+        DbStructure.registerUtf8Support(connWrap)
+
+        return connWrap
+
+
+    def _getConnWrap(self):
+        """
+        Returns the connection wrapper to use in the current thread. This is
+        the reader connection of the thread while a call through the reader
+        connection pool runs, otherwise the writing connection.
+        """
+        if self.readerPool is not None:
+            connWrap = self.readerPool.getThreadConnection()
+            if connWrap is not None:
+                return connWrap
+
+        return self.writeConnWrap
+
+    connWrap = property(_getConnWrap)
+
+
+    def getReaderConnectionPool(self):
+        """
+        Return ReaderConnectionPool or None if not used.
+        """
+        return self.readerPool
+
+
+    def getReaderMethodNames(self):
+        """
+        Return set of names of the methods which can run on a connection
+        of the reader connection pool.
+        """
+        return self._READER_METHOD_NAMES
+
+
     def _reinit(self):
         """
         Actual initialization or reinitialization after rebuildWiki()
@@ -452,6 +573,8 @@ class WikiData:
                 "visited": Last visit date of page
                 "readonly": Read only flag
                 "firstcharpos": Dummy returning very high value
+                "tree_position", "priority": Last value of this attribute
+                    of the page or None
         """
         if withFields is None:
             withFields = ()
@@ -476,6 +599,13 @@ class WikiData:
                 # Fake character position. TODO More elegantly
                 addFields += ", 0"
                 converters.append(lambda s: 2000000000L)
+            elif field in ("tree_position", "priority"):
+                addFields += (", ifnull((select value from wikiwordattrs "
+                        "where wikiwordattrs.word = wikiwordcontent.word and "
+                        "key = '%s' order by rowid desc limit 1), '')" % field)
+                # Missing attribute is returned as empty string (a NULL
+                # would spoil the column types cached for the statement)
+                converters.append(lambda s: s or None)
 
 
         sql = "select word%s from wikiwordcontent where word = ?" % addFields
@@ -510,6 +640,8 @@ class WikiData:
                 self.connWrap.execSql("update wikiwordattrs set word = ? where word = ?", (toWord, word))
                 self.connWrap.execSql("update todos set word = ? where word = ?", (toWord, word))
                 self.connWrap.execSql("update wikiwordmatchterms set word = ? where word = ?", (toWord, word))
+                if self.matchTermTrigramsAvailable:
+                    self.connWrap.execSql("update matchtermtrigrams set word = ? where word = ?", (toWord, word))
                 self._renameContent(word, toWord)
                 self.connWrap.commit()
             except:
@@ -648,6 +780,9 @@ class WikiData:
                 "firstcharpos": position of link in page (may be -1 to represent
                     unknown)
                 "modified": Modification date of child
+                "tree_position", "priority": Last value of this attribute
+                    of the child (or its real page if child is an alias)
+                    or None
         """
         if withFields is None:
             withFields = ()
@@ -668,6 +803,21 @@ class WikiData:
                         "(wikiwordmatchterms.type & 2) != 0 limit 1)), 0.0)")
 
                 converters.append(float)
+            elif field in ("tree_position", "priority"):
+                # Attributes of the child page are retrieved within the
+                # same query instead of asking for each child separately
+                addFields += (", ifnull((select value from wikiwordattrs "
+                        "where key = '%s' and wikiwordattrs.word = "
+                        "ifnull((select word from wikiwordcontent "
+                        "where wikiwordcontent.word = relation), "
+                        "(select word from wikiwordmatchterms "
+                        "where wikiwordmatchterms.matchterm = relation and "
+                        "(wikiwordmatchterms.type & 2) != 0 limit 1)) "
+                        "order by rowid desc limit 1), '')" % field)
+
+                # Missing attribute is returned as empty string (a NULL
+                # would spoil the column types cached for the statement)
+                converters.append(lambda s: s or None)
 
 
         sql = "select relation%s from wikirelations where word = ?" % addFields
@@ -691,7 +841,8 @@ class WikiData:
 
         try:
             if len(withFields) > 0:
-                return self.connWrap.execSqlQuery(sql, (wikiWord,))
+                return [tuple(c(item) for c, item in zip(converters, row))
+                        for row in self.connWrap.execSqlQuery(sql, (wikiWord,))]
             else:
                 return self.connWrap.execSqlQuerySingleColumn(sql, (wikiWord,))
         except (IOError, OSError, sqlite.Error), e:
@@ -786,11 +937,23 @@ class WikiData:
             traceback.print_exc()
             raise DbWriteAccessError(e)
 
+    def _addRelationships(self, word, rels):
+        """
+        Add relationships from word to each rel in sequence rels,
+        see _addRelationship().
+        """
+        try:
+            self.connWrap.executemany(
+                    "insert or replace into wikirelations(word, relation, firstcharpos) "
+                    "values (?, ?, ?)", [(word, rel[0], rel[1]) for rel in rels])
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
     def updateChildRelations(self, word, childRelations):
         self.deleteChildRelationships(word)
         self.getExistingWikiWordInfo(word)
-        for r in childRelations:
-            self._addRelationship(word, r)
+        self._addRelationships(word, childRelations)
 
     def deleteChildRelationships(self, fromWord):
         try:
@@ -801,7 +964,20 @@ class WikiData:
             raise DbWriteAccessError(e)
 
 
-    # TODO Maybe optimize
+    def _getResolvedRelationSql(self, relationCol):
+        """
+        Returns SQL expression for the real page name of the link term
+        in column relationCol or NULL if term isn't defined.
+        """
+        return ("ifnull((select word from wikiwordcontent "
+                "where wikiwordcontent.word = %(rel)s), "
+                "(select word from wikiwordmatchterms "
+                "where wikiwordmatchterms.matchterm = %(rel)s and "
+                "(wikiwordmatchterms.type & 2) != 0 limit 1))" %
+                {"rel": relationCol})
+            # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+
+
     def getAllSubWords(self, words, level=-1):
         """
         Return all words which are children, grandchildren, etc.
@@ -809,9 +985,79 @@ class WikiData:
         functions. All returned words are real existing words, no aliases.
         Function must work for read-only wiki.
         """
-        checkList = [(w, 0)
+        startWords = [w
                 for w in (self.getWikiPageNameForLinkTerm(w) for w in words)
                 if w is not None]
+
+        if not self.recursiveCteAvailable or \
+                len(startWords) > self.MAX_CTE_START_WORDS:
+            return self._getAllSubWordsStepwise(startWords, level)
+
+        if len(startWords) == 0:
+            return []
+
+        # Retrieve all relations of the subtree in one query, aliases are
+        # resolved by the query. Without level limit the level column is
+        # always 0 otherwise cycles would recurse endlessly. With limit
+        # a relation may appear repeatedly (with different levels) which
+        # doesn't harm
+        startSql = " union ".join(["select NULL, NULL, ?, 0"] *
+                len(startWords))
+
+        if level > -1:
+            levelSql = "subtree.level + 1"
+            levelCondSql = " and subtree.level < %i" % level
+        else:
+            levelSql = "0"
+            levelCondSql = ""
+
+        sql = ("with recursive subtree(parent, relation, word, level) as (" +
+                startSql + " union select subtree.word, wikirelations.relation, " +
+                self._getResolvedRelationSql("wikirelations.relation") + ", " +
+                levelSql + " from subtree inner join wikirelations "
+                "on wikirelations.word = subtree.word and "
+                "wikirelations.relation != wikirelations.word" +
+                levelCondSql + ") "
+                "select parent, word from subtree "
+                "where parent is not null and word is not null "
+                "order by parent, relation")
+
+        try:
+            relations = self.connWrap.execSqlQuery(sql, tuple(startWords))
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbReadAccessError(e)
+
+        childrenDict = {}
+        for parent, child in relations:
+            childrenDict.setdefault(parent, []).append(child)
+
+        return self._collectSubWords(startWords, level,
+                lambda word: childrenDict.get(word, ()))
+
+
+    def _getAllSubWordsStepwise(self, startWords, level):
+        """
+        Previous implementation of getAllSubWords() for sqlite versions
+        without recursive queries. Retrieves the children of each word
+        separately.
+        """
+        def getChildren(word):
+            return [self.getWikiPageNameForLinkTerm(c)
+                    for c in self.getChildRelationships(word,
+                    existingonly=True, selfreference=False)]
+
+        return self._collectSubWords(startWords, level, getChildren)
+
+
+    @staticmethod
+    def _collectSubWords(startWords, level, getChildren):
+        """
+        Depth-first traversal for getAllSubWords().
+        getChildren -- function taking a word and returning sequence of
+                the real page names of its children
+        """
+        checkList = [(w, 0) for w in startWords]
         checkList.reverse()
         
         resultSet = {}
@@ -828,11 +1074,7 @@ class WikiData:
             if level > -1 and chLevel >= level:
                 continue  # Don't go deeper
             
-            children = self.getChildRelationships(toCheck, existingonly=True,
-                    selfreference=False)
-                    
-            children = [(self.getWikiPageNameForLinkTerm(c), chLevel + 1)
-                    for c in children]
+            children = [(c, chLevel + 1) for c in getChildren(toCheck)]
             children.reverse()
             checkList += children
 
@@ -1390,13 +1632,25 @@ class WikiData:
             raise DbWriteAccessError(e)
 
 
+    def _setAttributes(self, word, attrs):
+        """
+        Add attributes of word. attrs is a dictionary with the keys as
+        keys and lists of values as values.
+        """
+        try:
+            self.connWrap.executemany(
+                    "insert into wikiwordattrs(word, key, value) "
+                    "values (?, ?, ?)", [(word, k, v)
+                    for k, values in attrs.iteritems() for v in values])
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
+
     def updateAttributes(self, word, attrs):
         self.deleteAttributes(word)
         self.getExistingWikiWordInfo(word)
-        for k in attrs.keys():
-            values = attrs[k]
-            for v in values:
-                self._setAttribute(word, k, v)
+        self._setAttributes(word, attrs)
 
         self.cachedGlobalAttrs = None   # reset global attributes cache
 
@@ -1510,8 +1764,7 @@ class WikiData:
     def updateTodos(self, word, todos):
         self.deleteTodos(word)
         self.getExistingWikiWordInfo(word)
-        for t in todos:
-            self._addTodo(word, t)
+        self._addTodos(word, todos)
 
 
     def _addTodo(self, word, todo):
@@ -1523,6 +1776,16 @@ class WikiData:
             raise DbWriteAccessError(e)
 
 
+    def _addTodos(self, word, todos):
+        try:
+            self.connWrap.executemany("insert into todos(word, key, value) "
+                    "values (?, ?, ?)", [(word, todo[0], todo[1])
+                    for todo in todos])
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
+
     def deleteTodos(self, word):
         try:
             self.connWrap.execSql("delete from todos where word = ?", (word,))
@@ -1535,7 +1798,31 @@ class WikiData:
 
     def getWikiWordMatchTermsWith(self, thisStr, orderBy=None, descend=False):
         "get the list of match terms with thisStr in them."
-        thisStr = sqlite.escapeForGlob(thisStr.lower())   # TODO More general normcase function
+        searchStr = thisStr.lower()   # TODO More general normcase function
+        thisStr = sqlite.escapeForGlob(searchStr)
+
+        # Condition for match terms starting with thisStr
+        prefixSql = "matchtermnormcase glob (? || '*')"
+        prefixParams = (thisStr,)
+
+        # glob doesn't use the index on matchtermnormcase, a range does
+        rangeCond = DbStructure.getPrefixRangeCondition(searchStr)
+        if rangeCond is not None:
+            prefixSql = rangeCond[0] + " and " + prefixSql
+            prefixParams = rangeCond[1] + prefixParams
+
+        # Condition for match terms containing but not starting with thisStr
+        infixSql = "not matchtermnormcase glob (? || '*') " \
+                "and matchtermnormcase glob ('*' || ? || '*')"
+        infixParams = (thisStr, thisStr)
+
+        if self.matchTermTrigramsAvailable:
+            # Restrict candidates by trigram index instead of scanning all
+            # match terms, glob still checks the real containment
+            trigramCond = DbStructure.getMatchTermTrigramCondition(searchStr)
+            if trigramCond is not None:
+                infixSql = trigramCond[0] + " and " + infixSql
+                infixParams = trigramCond[1] + infixParams
 
 #         orderBy = "visited"   # !!! Test
 #         descend = True   # !!! Test
@@ -1547,16 +1834,14 @@ class WikiData:
                         "firstcharpos, charlength, visited "
                         "from wikiwordmatchterms inner join wikiwordcontent "
                         "on wikiwordmatchterms.word = wikiwordcontent.word where "
-                        "matchtermnormcase glob (? || '*')", (thisStr,))
+                        + prefixSql, prefixParams)
     
                 result2 = self.connWrap.execSqlQuery(
                         "select matchterm, type, wikiwordmatchterms.word, "
                         "firstcharpos, charlength, visited "
                         "from wikiwordmatchterms inner join wikiwordcontent "
                         "on wikiwordmatchterms.word = wikiwordcontent.word where "
-                        "not matchtermnormcase glob (? || '*') "
-                        "and matchtermnormcase glob ('*' || ? || '*')",
-                        (thisStr, thisStr))
+                        + infixSql, infixParams)
             except (IOError, OSError, sqlite.Error), e:
                 traceback.print_exc()
                 raise DbReadAccessError(e)
@@ -1565,14 +1850,12 @@ class WikiData:
                 result1 = self.connWrap.execSqlQuery(
                         "select matchterm, type, word, firstcharpos, charlength "
                         "from wikiwordmatchterms where "
-                        "matchtermnormcase glob (? || '*')", (thisStr,))
+                        + prefixSql, prefixParams)
     
                 result2 = self.connWrap.execSqlQuery(
                         "select matchterm, type, word, firstcharpos, charlength "
                         "from wikiwordmatchterms where "
-                        "not matchtermnormcase glob (? || '*') "
-                        "and matchtermnormcase glob ('*' || ? || '*')",
-                        (thisStr, thisStr))
+                        + infixSql, infixParams)
             except (IOError, OSError, sqlite.Error), e:
                 traceback.print_exc()
                 raise DbReadAccessError(e)
@@ -1596,9 +1879,7 @@ class WikiData:
     def updateWikiWordMatchTerms(self, word, wwmTerms, syncUpdate=False):
         self.deleteWikiWordMatchTerms(word, syncUpdate=syncUpdate)
         self.getExistingWikiWordInfo(word)
-        for t in wwmTerms:
-            assert t[2] == word
-            self._addWikiWordMatchTerm(t)
+        self._addWikiWordMatchTerms(word, wwmTerms)
 
 
     def _addWikiWordMatchTerm(self, wwmTerm):
@@ -1610,6 +1891,33 @@ class WikiData:
                     "values (?, ?, ?, ?, ?, ?)",
                     (matchterm, typ, word, firstcharpos, charlength,
                     matchterm.lower()))
+            if self.matchTermTrigramsAvailable:
+                DbStructure.addNewMatchTermTrigrams(self.connWrap, word,
+                        (matchterm.lower(),))
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
+
+    def _addWikiWordMatchTerms(self, word, wwmTerms):
+        """
+        Add sequence of match terms which must all belong to word.
+        """
+        for t in wwmTerms:
+            assert t[2] == word
+
+        try:
+            # TODO Check for name collisions
+            self.connWrap.executemany("insert into wikiwordmatchterms(matchterm, "
+                    "type, word, firstcharpos, charlength, matchtermnormcase) "
+                    "values (?, ?, ?, ?, ?, ?)",
+                    [(matchterm, typ, word, firstcharpos, charlength,
+                    matchterm.lower())
+                    for matchterm, typ, word, firstcharpos, charlength
+                    in wwmTerms])
+            if self.matchTermTrigramsAvailable:
+                DbStructure.addNewMatchTermTrigrams(self.connWrap, word,
+                        set(t[0].lower() for t in wwmTerms))
         except (IOError, OSError, sqlite.Error), e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -1625,12 +1933,59 @@ class WikiData:
         try:
             self.connWrap.execSql("delete from wikiwordmatchterms where "
                     "word = ?" + addSql, (word,))
+            if self.matchTermTrigramsAvailable:
+                # Match terms of the other update kind remain
+                DbStructure.updateMatchTermTrigramsForWord(self.connWrap, word)
             self.cachedWikiPageLinkTermDict = None
         except (IOError, OSError, sqlite.Error), e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
 
 
+    # ---------- Bulk update of page meta data ----------
+
+    def applyPageMetaData(self, word, childRelations=None, attrs=None,
+            todos=None, wwmTerms=None):
+        """
+        Replace the cached meta data of page word in one transaction.
+        A parameter which is None leaves the data unchanged, otherwise
+        it replaces the data as in updateChildRelations(), updateAttributes(),
+        updateTodos() and updateWikiWordMatchTerms() (with syncUpdate=False).
+        Raises WikiWordNotFoundException if page doesn't exist.
+        """
+        self.getExistingWikiWordInfo(word)
+
+        try:
+            # commit anything pending so we can rollback on error
+            self.connWrap.syncCommit()
+
+            try:
+                if childRelations is not None:
+                    self.deleteChildRelationships(word)
+                    self._addRelationships(word, childRelations)
+
+                if attrs is not None:
+                    self.deleteAttributes(word)
+                    self._setAttributes(word, attrs)
+                    self.cachedGlobalAttrs = None
+
+                if todos is not None:
+                    self.deleteTodos(word)
+                    self._addTodos(word, todos)
+
+                if wwmTerms is not None:
+                    self.deleteWikiWordMatchTerms(word, syncUpdate=False)
+                    self._addWikiWordMatchTerms(word, wwmTerms)
+
+                self.connWrap.commit()
+            except:
+                self.connWrap.rollback()
+                raise
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
+
     # ---------- Data block handling ----------
 
     def getDataBlockUnifNamesStartingWith(self, startingWith):
@@ -1792,6 +2147,53 @@ class WikiData:
             return result
 
 
+    def iterContentChunks(self, chunkSize=100):
+        """
+        Iterate over all wiki pages and yield lists of at most chunkSize
+        tuples (word, content).
+        The content is read through a separate connection to the database,
+        so the iterator doesn't need to be (and shouldn't be) protected by
+        the lock of the WikiDataSynchronizedProxy while a long scan runs.
+        Function must work for read-only wiki.
+        """
+        try:
+            connWrap = DbStructure.ConnectWrapSyncCommit(
+                    sqlite.connect(self.dbfile))
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbReadAccessError(e)
+
+        try:
+            DbStructure.registerUtf8Support(connWrap)
+            lastWord = None
+
+            while True:
+                # Each chunk is read by its own query so no read lock is held
+                # on the database between the chunks
+                try:
+                    if lastWord is None:
+                        data = connWrap.execSqlQuery(
+                                "select word, content from wikiwordcontent "
+                                "order by word limit ?", (chunkSize,))
+                    else:
+                        data = connWrap.execSqlQuery(
+                                "select word, content from wikiwordcontent "
+                                "where word > ? order by word limit ?",
+                                (lastWord, chunkSize))
+                except (IOError, OSError, sqlite.Error), e:
+                    traceback.print_exc()
+                    raise DbReadAccessError(e)
+
+                if len(data) == 0:
+                    return
+
+                lastWord = data[-1][0]
+                yield [(word, self.contentDbToOutput(content))
+                        for word, content in data]
+        finally:
+            connWrap.close()
+
+
 # explain select distinct type from wikiwordmatchterms where type & 2
 # explain select type from (select distinct type from wikiwordmatchterms) where type & 2
 # explain select type, type & 2 from (select distinct type from wikiwordmatchterms where type > 1) 
@@ -1804,6 +2206,8 @@ class WikiData:
         "compactify": 1,     # = sqlite vacuum
         "plain text import": 1,
         "recovery mode": 1,
+        "content chunk iteration": 1,  # iterContentChunks() is available
+        "reader connections": 1,  # getReaderMethodNames() is available
 #         "asynchronous commit":1  # Commit can be done in separate thread, but
 #                 # calling any other function during running commit is not allowed
         }
@@ -1879,10 +2283,13 @@ class WikiData:
 
 
     def close(self):
+        if self.readerPool is not None:
+            self.readerPool.close()
+
         self.connWrap.syncCommit()
         self.connWrap.close()
 
-        self.connWrap = None
+        self.writeConnWrap = None
 
 
     # ---------- Versioning (optional) ----------
@@ -2148,6 +2555,8 @@ class WikiData:
         """
         Do not call from this class, only from outside to handle errors.
         """
+        # May contain rolled back changes
+        self.cachedWikiPageLinkTermDict = None
         try:
             self.connWrap.rollback()
         except (IOError, OSError, sqlite.Error), e:
@@ -416,6 +416,8 @@ class WikiData:
                 "visited": Last visit date of page
                 "readonly": Read only flag
                 "firstcharpos": Dummy returning very high value
+                "tree_position", "priority": Last value of this attribute
+                    of the page or None
         """
         if withFields is None:
             withFields = ()
@@ -440,6 +442,9 @@ class WikiData:
                 # Fake character position. TODO More elegantly
                 addFields += ", 0"
                 converters.append(lambda s: 2000000000L)
+            elif field in ("tree_position", "priority"):
+                addFields += ", word"
+                converters.append(self._getAttrValueLookup(field, False))
 
 
         sql = "select word%s from wikiwords where word = ?" % addFields
@@ -681,7 +686,9 @@ class WikiData:
                 "firstcharpos": position of link in page (may be -1 to represent
                     unknown). The Gadfly implementation always returns -1
                 "modified": Modification date
-
+                "tree_position", "priority": Last value of this attribute
+                    of the child (or its real page if child is an alias)
+                    or None
         """
         # TODO moddateLookup should also process aliases?
         def moddateLookup(rel):
@@ -703,6 +710,9 @@ class WikiData:
             elif field == "modified":
                 addFields += ", relation"
                 converters.append(moddateLookup)
+            elif field in ("tree_position", "priority"):
+                addFields += ", relation"
+                converters.append(self._getAttrValueLookup(field, True))
 
         sql = "select relation%s from wikirelations where word = ?" % addFields
 
@@ -767,6 +777,29 @@ class WikiData:
 #         return map(lambda c: (c, self._hasChildren(c, existingonly,
 #                 selfreference)), children)
 
+    def _getAttrValueLookup(self, key, unalias):
+        """
+        Returns a function which takes a word and returns the last value of
+        attribute key of that word or None. Used as converter for the
+        "tree_position" and "priority" fields which can't be retrieved
+        by Gadfly SQL.
+        """
+        def attrValueLookup(word):
+            if unalias:
+                word = self.getWikiPageNameForLinkTerm(word)
+                if word is None:
+                    return None
+
+            values = [v for k, v in self.getAttributesForWord(word)
+                    if k == key]
+            if len(values) == 0:
+                return None
+
+            return values[-1]
+
+        return attrValueLookup
+
+
     def getParentRelationships(self, wikiWord):
         "get the parent relations to this word"
 
@@ -1939,6 +1972,29 @@ class WikiData:
             raise DbWriteAccessError(e)
 
 
+    # ---------- Bulk update of page meta data ----------
+
+    def applyPageMetaData(self, word, childRelations=None, attrs=None,
+            todos=None, wwmTerms=None):
+        """
+        Replace the cached meta data of page word. A parameter which is None
+        leaves the data unchanged, otherwise it replaces the data as in
+        updateChildRelations(), updateAttributes(), updateTodos() and
+        updateWikiWordMatchTerms() (with syncUpdate=False).
+        Raises WikiWordNotFoundException if page doesn't exist.
+        """
+        self.getExistingWikiWordInfo(word)
+
+        if childRelations is not None:
+            self.updateChildRelations(word, childRelations)
+        if attrs is not None:
+            self.updateAttributes(word, attrs)
+        if todos is not None:
+            self.updateTodos(word, todos)
+        if wwmTerms is not None:
+            self.updateWikiWordMatchTerms(word, wwmTerms)
+
+
     # ---------- Data block handling ----------
 
 #     def getDataBlockUnifNames(self):
@@ -2351,6 +2407,8 @@ class WikiData:
         self.commitNeeded = False
         
     def rollback(self):
+        # May contain rolled back changes
+        self.cachedWikiPageLinkTermDict = None
         self.connWrap.rollback()
         self.commitNeeded = False
         
@@ -119,6 +119,13 @@ class ConnectWrapBase:
         return self.dbCursor.lastrowid
 
 
+    def isInTransaction(self):
+        """
+        Return True iff a transaction is open on the connection
+        """
+        return not self.dbConn.thinConn.get_autocommit()
+
+
     def closeCursor(self):
         if self.dbCursor:
             self.dbCursor.close()
@@ -444,6 +451,13 @@ TABLE_DEFINITIONS = {
         ),
 
 
+    "matchtermtrigrams": (     # Cache, trigram index for infix search in wikiwordmatchterms
+        ("trigram", t.t),
+        ("matchtermnormcase", t.t),
+        ("word", t.t)
+        ),
+
+
     "datablocks": (
         ("unifiedname", t.t),
         ("data", t.b)
@@ -471,6 +485,7 @@ MAIN_TABLES = (
 #     "search_views",
     "settings",
     "wikiwordmatchterms",
+    "matchtermtrigrams",
     "datablocks",
     "datablocksexternal"
     )
@@ -532,6 +547,8 @@ def rebuildIndices(connwrap):
     connwrap.execSqlNoError("create unique index datablocks_unifiedname on datablocks(unifiedname)")
     connwrap.execSqlNoError("create unique index datablocksexternal_unifiedname on datablocksexternal(unifiedname)")
 
+    rebuildMatchTermTrigrams(connwrap)
+
 
 
 def recreateCacheTables(connwrap):
@@ -540,7 +557,7 @@ def recreateCacheTables(connwrap):
     associated indices
     """
     CACHE_TABLES = ("wikirelations", "wikiwordattrs", "todos",
-            "wikiwordmatchterms")
+            "wikiwordmatchterms", "matchtermtrigrams")
     
     for tn in CACHE_TABLES:
         connwrap.execSqlNoError("drop table %s" % tn)
@@ -798,6 +815,154 @@ def registerUtf8Support(connwrap):
 
 
 
+def getSqliteLibVersion(connwrap):
+    """
+    Returns version of the sqlite library as tuple of integers
+    """
+    verStr = connwrap.execSqlQuerySingleItem("select sqlite_version()")
+    return tuple(int(v) for v in verStr.split(".") if v.isdigit())
+
+
+def setJournalModeWal(connwrap, wal):
+    """
+    Switch the journal mode of the database to WAL if wal is True, otherwise
+    back to the default rollback journal (if it was WAL before).
+    Returns True iff database is in WAL mode afterwards.
+    """
+    connwrap.syncCommit()
+    mode = connwrap.execSqlQuerySingleItem("pragma journal_mode")
+
+    if wal and mode != "wal":
+        mode = connwrap.execSqlQuerySingleItem("pragma journal_mode = wal")
+    elif not wal and mode == "wal":
+        mode = connwrap.execSqlQuerySingleItem("pragma journal_mode = delete")
+
+    return mode == "wal"
+
+
+# Maximum number of trigrams of a search string whose posting lists are
+# intersected. Intersecting more lists costs more than checking the few
+# additional candidates with glob (see benchmarkMatchTermTrigrams.py)
+MAX_QUERY_TRIGRAMS = 3
+
+
+def getTrigrams(s):
+    """
+    Returns set of all substrings of length 3 of unicode string s
+    """
+    return set(s[i:i + 3] for i in xrange(len(s) - 2))
+
+
+def hasMatchTermTrigrams(connwrap):
+    """
+    Returns True iff the trigram table for match terms exists
+    """
+    return connwrap.execSqlQuerySingleItem("select name from sqlite_master "
+            "where type='table' and name='matchtermtrigrams'",
+            default=None) is not None
+
+
+def addMatchTermTrigrams(connwrap, word, matchtermnormcase):
+    connwrap.executemany("insert into matchtermtrigrams(trigram, "
+            "matchtermnormcase, word) values (?, ?, ?)",
+            [(tg, matchtermnormcase, word)
+            for tg in getTrigrams(matchtermnormcase)])
+
+
+def addNewMatchTermTrigrams(connwrap, word, matchtermnormcases):
+    """
+    Add trigrams of the normcased match terms of word which have no trigrams
+    for word yet. Trigrams are stored once per distinct normcased match
+    term of a word even if it has more match terms with this normcase
+    (e.g. the page name and a heading differing only in case).
+    """
+    for mtnc in matchtermnormcases:
+        if connwrap.execSqlQuerySingleItem("select 1 from matchtermtrigrams "
+                "where word = ? and matchtermnormcase = ? limit 1",
+                (word, mtnc)) is None:
+            addMatchTermTrigrams(connwrap, word, mtnc)
+
+
+def updateMatchTermTrigramsForWord(connwrap, word):
+    """
+    Rebuild the trigrams of all match terms of word
+    """
+    connwrap.execSql("delete from matchtermtrigrams where word = ?", (word,))
+
+    for mtnc in connwrap.execSqlQuerySingleColumn("select distinct "
+            "matchtermnormcase from wikiwordmatchterms where word = ?",
+            (word,)):
+        addMatchTermTrigrams(connwrap, word, mtnc)
+
+
+def rebuildMatchTermTrigrams(connwrap):
+    """
+    Create (if necessary) and fill trigram table from all match terms,
+    recreate its indices.
+    """
+    # Trigrams must be built from unicode strings
+    registerUtf8Support(connwrap)
+
+    changeTableSchema(connwrap, "matchtermtrigrams",
+            TABLE_DEFINITIONS["matchtermtrigrams"])
+
+    connwrap.execSqlNoError("drop index matchtermtrigrams_trigram")
+    connwrap.execSqlNoError("drop index matchtermtrigrams_word")
+
+    connwrap.execSql("delete from matchtermtrigrams")
+
+    for word, mtnc in connwrap.execSqlQuery("select distinct word, "
+            "matchtermnormcase from wikiwordmatchterms"):
+        addMatchTermTrigrams(connwrap, word, mtnc)
+
+    connwrap.execSqlNoError("create index matchtermtrigrams_trigram on matchtermtrigrams(trigram)")
+    connwrap.execSqlNoError("create index matchtermtrigrams_word on matchtermtrigrams(word)")
+
+
+def getMatchTermTrigramCondition(searchStr, column="matchtermnormcase"):
+    """
+    Returns tuple (sql, params) with condition for column which is true
+    (at least) for all normcased match terms containing the normcased
+    unicode string searchStr. It intersects the trigram posting lists.
+    The caller still has to test the actual containment (e.g. with glob).
+    Returns None if searchStr is too short to use trigrams.
+    """
+    trigrams = list(getTrigrams(searchStr))
+    if len(trigrams) == 0:
+        return None
+
+    if len(trigrams) > MAX_QUERY_TRIGRAMS:
+        # Spread the used trigrams over the search string
+        trigrams.sort(key=searchStr.find)
+        step = float(len(trigrams) - 1) / (MAX_QUERY_TRIGRAMS - 1)
+        trigrams = [trigrams[int(round(i * step))]
+                for i in xrange(MAX_QUERY_TRIGRAMS)]
+
+    sql = column + " in (" + " intersect ".join(
+            ["select matchtermnormcase from matchtermtrigrams "
+            "where trigram = ?"] * len(trigrams)) + ")"
+
+    return (sql, tuple(trigrams))
+
+
+def getPrefixRangeCondition(prefix, column="matchtermnormcase"):
+    """
+    Returns tuple (sql, params) with condition for column which is true
+    for all values starting with unicode string prefix (and a few more).
+    Unlike "glob (? || '*')" it can use an index on column. The caller still
+    has to test the actual prefix (e.g. with glob).
+    Returns None if no range can be built for prefix.
+    """
+    # Binary collation of UTF-8 is ordered by code point, surrogates of
+    # narrow builds are left out
+    if len(prefix) == 0 or ord(prefix[-1]) >= 0xd7ff:
+        return None
+
+    return (column + " >= ? and " + column + " < ?",
+            (prefix, prefix[:-1] + unichr(ord(prefix[-1]) + 1)))
+
+
+
 def getSettingsValue(connwrap, key, default=None):
     """
     Retrieve a value from the settings table
@@ -1027,6 +1192,14 @@ def updateDatabase2(connwrap):
     except sqlite.ReadOnlyDbError:
         pass
 
+    try:
+        # Trigram table was introduced without format version change
+        if not hasMatchTermTrigrams(connwrap):
+            rebuildMatchTermTrigrams(connwrap)
+            connwrap.syncCommit()
+    except sqlite.ReadOnlyDbError:
+        pass
+
 
 
 """
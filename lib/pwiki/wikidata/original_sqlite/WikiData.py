@@ -24,6 +24,8 @@ from wx import GetApp
 
 from pwiki.WikiExceptions import *   # TODO make normal import
 from pwiki import SearchAndReplace
+from pwiki.wikidata.ReaderConnectionPool import ReaderConnectionPool, \
+        isWalUsable
 
 try:
     import pwiki.sqlite3api as sqlite
@@ -49,10 +51,40 @@ import Consts
 
 class WikiData:
     "Interface to wiki data."
+
+    # Maximum number of start words for which getAllSubWords() uses a
+    # recursive query (each one is a query parameter)
+    MAX_CTE_START_WORDS = 200
+
+    # Methods which only read from the database and don't use or fill
+    # caches, temporary tables or files. They can run on a connection of
+    # the reader pool (see getReaderMethodNames())
+    _READER_METHOD_NAMES = frozenset((
+        "getTimestamps", "getWikiWordReadOnly", "getExistingWikiWordInfo",
+        "getMetaDataState", "getWikiPageNamesForMetaDataState",
+        "getChildRelationships", "getParentlessWikiWords", "getUndefinedWords",
+        "getAllDefinedWikiPageNames", "getDefinedWikiPageNamesStartingWith",
+        "isDefinedWikiPageName", "getWikiPageLinkTermsStartingWith",
+        "getWikiLinksStartingWith", "getWikiPageNamesModifiedWithin",
+        "getTimeMinMax", "getWikiPageNamesBefore", "getWikiPageNamesAfter",
+        "getFirstWikiPageName", "getNextWikiPageName", "getAttributeNames",
+        "getAttributeNamesStartingWith", "getDistinctAttributeValues",
+        "getAttributeTriples", "getWordsForAttributeName",
+        "getAttributesForWord", "getTodos", "getWikiWordMatchTermsWith",
+        "getDataBlockUnifNamesStartingWith", "getDbSettingsValue",
+        "getPresentationBlock"))
+
     def __init__(self, wikiDocument, dataDir, tempDir):
         self.wikiDocument = wikiDocument
         self.dataDir = dataDir
         self.cachedWikiPageLinkTermDict = None
+        # Pool of reader connections or None if not used
+        self.readerPool = None
+        # True iff database has the trigram table for infix search of
+        # match terms
+        self.matchTermTrigramsAvailable = False
+        # True iff sqlite library supports recursive queries ("with recursive")
+        self.recursiveCteAvailable = False
         
         dbPath = self.wikiDocument.getWikiConfig().get("wiki_db", "db_filename",
                 u"").strip()
@@ -71,9 +103,10 @@ class WikiData:
             raise DbWriteAccessError(e)
 
         dbfile = longPathDec(dbfile)
+        self.dbfile = dbfile
 
         try:
-            self.connWrap = DbStructure.ConnectWrapSyncCommit(
+            self.writeConnWrap = DbStructure.ConnectWrapSyncCommit(
                     sqlite.connect(dbfile))
         except (IOError, OSError, sqlite.Error), e:
             traceback.print_exc()
@@ -167,6 +200,20 @@ class WikiData:
         # Activate UTF8 support for text in database (content is blob!)
         DbStructure.registerUtf8Support(self.connWrap)
 
+        try:
+            self.matchTermTrigramsAvailable = \
+                    DbStructure.hasMatchTermTrigrams(self.connWrap)
+        except sqlite.Error, e:
+            self.matchTermTrigramsAvailable = False
+            lastException = DbReadAccessError(e)
+
+        try:
+            self.recursiveCteAvailable = \
+                    DbStructure.getSqliteLibVersion(self.connWrap) >= (3, 8, 3)
+        except sqlite.Error, e:
+            self.recursiveCteAvailable = False
+            lastException = DbReadAccessError(e)
+
         # Function to convert from content in database to
         # return value, used by getContent()
         self.contentDbToOutput = lambda c: utf8Dec(c, "replace")[0]
@@ -203,10 +250,83 @@ class WikiData:
                 raise DbReadAccessError(e2)
             raise DbReadAccessError(e)
             
+        if not recoveryMode:
+            self._initReaderConnectionPool()
+
         if lastException:
             raise lastException
 
 
+    def _initReaderConnectionPool(self):
+        """
+        Switch the database to WAL journal mode and create the pool of
+        reader connections if configured and supported by sqlite library
+        and file system. Otherwise switch it back to the rollback journal
+        if it is in WAL mode.
+        """
+        maxConnections = GetApp().getGlobalConfig().getint("main",
+                "db_readerConnectionCount", 0)
+
+        try:
+            wal = maxConnections > 0 and \
+                    DbStructure.getSqliteLibVersion(self.connWrap) >= \
+                    (3, 7, 0) and isWalUsable(self.dbfile)
+
+            if not DbStructure.setJournalModeWal(self.connWrap, wal):
+                return
+        except sqlite.Error, e:
+            # E.g. read-only database, continue without pool
+            traceback.print_exc()
+            return
+
+        self.readerPool = ReaderConnectionPool(self._createReaderConnection,
+                self.writeConnWrap.isInTransaction, maxConnections)
+
+
+    def _createReaderConnection(self):
+        """
+        Called by the reader connection pool to create a new connection.
+        """
+        connWrap = DbStructure.ConnectWrapSyncCommit(
+                sqlite.connect(self.dbfile))
+
+        DbStructure.registerSqliteFunctions(connWrap)
+        DbStructure.registerUtf8Support(connWrap)
+
+        return connWrap
+
+
+    def _getConnWrap(self):
+        """
+        Returns the connection wrapper to use in the current thread. This is
+        the reader connection of the thread while a call through the reader
+        connection pool runs, otherwise the writing connection.
+        """
+        if self.readerPool is not None:
+            connWrap = self.readerPool.getThreadConnection()
+            if connWrap is not None:
+                return connWrap
+
+        return self.writeConnWrap
+
+    connWrap = property(_getConnWrap)
+
+
+    def getReaderConnectionPool(self):
+        """
+        Return ReaderConnectionPool or None if not used.
+        """
+        return self.readerPool
+
+
+    def getReaderMethodNames(self):
+        """
+        Return set of names of the methods which can run on a connection
+        of the reader connection pool.
+        """
+        return self._READER_METHOD_NAMES
+
+
     def _reinit(self):
         """
         Actual initialization or reinitialization after rebuildWiki()
@@ -480,6 +600,8 @@ class WikiData:
                 "visited": Last visit date of page
                 "readonly": Read only flag
                 "firstcharpos": Dummy returning very high value
+                "tree_position", "priority": Last value of this attribute
+                    of the page or None
         """
         if withFields is None:
             withFields = ()
@@ -504,6 +626,13 @@ class WikiData:
                 # Fake character position. TODO More elegantly
                 addFields += ", 0"
                 converters.append(lambda s: 2000000000L)
+            elif field in ("tree_position", "priority"):
+                addFields += (", ifnull((select value from wikiwordattrs "
+                        "where wikiwordattrs.word = wikiwords.word and "
+                        "key = '%s' order by rowid desc limit 1), '')" % field)
+                # Missing attribute is returned as empty string (a NULL
+                # would spoil the column types cached for the statement)
+                converters.append(lambda s: s or None)
 
 
         sql = "select word%s from wikiwords where word = ?" % addFields
@@ -537,6 +666,8 @@ class WikiData:
                 self.connWrap.execSql("update wikiwordattrs set word = ? where word = ?", (toWord, word))
                 self.connWrap.execSql("update todos set word = ? where word = ?", (toWord, word))
                 self.connWrap.execSql("update wikiwordmatchterms set word = ? where word = ?", (toWord, word))
+                if self.matchTermTrigramsAvailable:
+                    self.connWrap.execSql("update matchtermtrigrams set word = ? where word = ?", (toWord, word))
                 self._renameContent(word, toWord)
                 self.connWrap.commit()
             except:
@@ -718,6 +849,9 @@ class WikiData:
                 "firstcharpos": position of link in page (may be -1 to represent
                     unknown)
                 "modified": Modification date of child
+                "tree_position", "priority": Last value of this attribute
+                    of the child (or its real page if child is an alias)
+                    or None
         """
         if withFields is None:
             withFields = ()
@@ -746,6 +880,21 @@ class WikiData:
                 # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
 
                 converters.append(float)
+            elif field in ("tree_position", "priority"):
+                # Attributes of the child page are retrieved within the
+                # same query instead of asking for each child separately
+                addFields += (", ifnull((select value from wikiwordattrs "
+                        "where key = '%s' and wikiwordattrs.word = "
+                        "ifnull((select word from wikiwords "
+                        "where wikiwords.word = relation), "
+                        "(select word from wikiwordmatchterms "
+                        "where wikiwordmatchterms.matchterm = relation and "
+                        "(wikiwordmatchterms.type & 2) != 0 limit 1)) "
+                        "order by rowid desc limit 1), '')" % field)
+
+                # Missing attribute is returned as empty string (a NULL
+                # would spoil the column types cached for the statement)
+                converters.append(lambda s: s or None)
 
 
         sql = "select relation%s from wikirelations where word = ?" % addFields
@@ -937,11 +1086,23 @@ class WikiData:
             traceback.print_exc()
             raise DbWriteAccessError(e)
 
+    def _addRelationships(self, word, rels):
+        """
+        Add relationships from word to each rel in sequence rels,
+        see _addRelationship().
+        """
+        try:
+            self.connWrap.executemany(
+                    "insert or replace into wikirelations(word, relation, firstcharpos) "
+                    "values (?, ?, ?)", [(word, rel[0], rel[1]) for rel in rels])
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
     def updateChildRelations(self, word, childRelations):
         self.deleteChildRelationships(word)
         self.getExistingWikiWordInfo(word)
-        for r in childRelations:
-            self._addRelationship(word, r)
+        self._addRelationships(word, childRelations)
 
     def deleteChildRelationships(self, fromWord):
         try:
@@ -952,7 +1113,20 @@ class WikiData:
             raise DbWriteAccessError(e)
 
 
-    # TODO Maybe optimize
+    def _getResolvedRelationSql(self, relationCol):
+        """
+        Returns SQL expression for the real page name of the link term
+        in column relationCol or NULL if term isn't defined.
+        """
+        return ("ifnull((select word from wikiwords "
+                "where wikiwords.word = %(rel)s), "
+                "(select word from wikiwordmatchterms "
+                "where wikiwordmatchterms.matchterm = %(rel)s and "
+                "(wikiwordmatchterms.type & 2) != 0 limit 1))" %
+                {"rel": relationCol})
+            # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+
+
     def getAllSubWords(self, words, level=-1):
         """
         Return all words which are children, grandchildren, etc.
@@ -960,9 +1134,79 @@ class WikiData:
         functions. All returned words are real existing words, no aliases.
         Function must work for read-only wiki.
         """
-        checkList = [(w, 0)
+        startWords = [w
                 for w in (self.getWikiPageNameForLinkTerm(w) for w in words)
                 if w is not None]
+
+        if not self.recursiveCteAvailable or \
+                len(startWords) > self.MAX_CTE_START_WORDS:
+            return self._getAllSubWordsStepwise(startWords, level)
+
+        if len(startWords) == 0:
+            return []
+
+        # Retrieve all relations of the subtree in one query, aliases are
+        # resolved by the query. Without level limit the level column is
+        # always 0 otherwise cycles would recurse endlessly. With limit
+        # a relation may appear repeatedly (with different levels) which
+        # doesn't harm
+        startSql = " union ".join(["select NULL, NULL, ?, 0"] *
+                len(startWords))
+
+        if level > -1:
+            levelSql = "subtree.level + 1"
+            levelCondSql = " and subtree.level < %i" % level
+        else:
+            levelSql = "0"
+            levelCondSql = ""
+
+        sql = ("with recursive subtree(parent, relation, word, level) as (" +
+                startSql + " union select subtree.word, wikirelations.relation, " +
+                self._getResolvedRelationSql("wikirelations.relation") + ", " +
+                levelSql + " from subtree inner join wikirelations "
+                "on wikirelations.word = subtree.word and "
+                "wikirelations.relation != wikirelations.word" +
+                levelCondSql + ") "
+                "select parent, word from subtree "
+                "where parent is not null and word is not null "
+                "order by parent, relation")
+
+        try:
+            relations = self.connWrap.execSqlQuery(sql, tuple(startWords))
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbReadAccessError(e)
+
+        childrenDict = {}
+        for parent, child in relations:
+            childrenDict.setdefault(parent, []).append(child)
+
+        return self._collectSubWords(startWords, level,
+                lambda word: childrenDict.get(word, ()))
+
+
+    def _getAllSubWordsStepwise(self, startWords, level):
+        """
+        Previous implementation of getAllSubWords() for sqlite versions
+        without recursive queries. Retrieves the children of each word
+        separately.
+        """
+        def getChildren(word):
+            return [self.getWikiPageNameForLinkTerm(c)
+                    for c in self.getChildRelationships(word,
+                    existingonly=True, selfreference=False)]
+
+        return self._collectSubWords(startWords, level, getChildren)
+
+
+    @staticmethod
+    def _collectSubWords(startWords, level, getChildren):
+        """
+        Depth-first traversal for getAllSubWords().
+        getChildren -- function taking a word and returning sequence of
+                the real page names of its children
+        """
+        checkList = [(w, 0) for w in startWords]
         checkList.reverse()
         
         resultSet = {}
@@ -979,11 +1223,7 @@ class WikiData:
             if level > -1 and chLevel >= level:
                 continue  # Don't go deeper
             
-            children = self.getChildRelationships(toCheck, existingonly=True,
-                    selfreference=False)
-                    
-            children = [(self.getWikiPageNameForLinkTerm(c), chLevel + 1)
-                    for c in children]
+            children = [(c, chLevel + 1) for c in getChildren(toCheck)]
             children.reverse()
             checkList += children
 
@@ -1785,15 +2025,25 @@ class WikiData:
             raise DbWriteAccessError(e)
 
 
+    def _setAttributes(self, word, attrs):
+        """
+        Add attributes of word. attrs is a dictionary with the keys as
+        keys and lists of values as values.
+        """
+        try:
+            self.connWrap.executemany(
+                    "insert into wikiwordattrs(word, key, value) "
+                    "values (?, ?, ?)", [(word, k, v)
+                    for k, values in attrs.iteritems() for v in values])
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
+
     def updateAttributes(self, word, attrs):
         self.deleteAttributes(word)
         self.getExistingWikiWordInfo(word)
-        for k in attrs.keys():
-            values = attrs[k]
-            for v in values:
-                self._setAttribute(word, k, v)
-#                 if k == "alias":
-#                     self.setAsAlias(v)
+        self._setAttributes(word, attrs)
 
         self.cachedGlobalAttrs = None   # reset global attributes cache
 
@@ -1907,8 +2157,7 @@ class WikiData:
     def updateTodos(self, word, todos):
         self.deleteTodos(word)
         self.getExistingWikiWordInfo(word)
-        for t in todos:
-            self._addTodo(word, t)
+        self._addTodos(word, todos)
 
 
     def _addTodo(self, word, todo):
@@ -1920,6 +2169,16 @@ class WikiData:
             raise DbWriteAccessError(e)
 
 
+    def _addTodos(self, word, todos):
+        try:
+            self.connWrap.executemany("insert into todos(word, key, value) "
+                    "values (?, ?, ?)", [(word, todo[0], todo[1])
+                    for todo in todos])
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
+
     def deleteTodos(self, word):
         try:
             self.connWrap.execSql("delete from todos where word = ?", (word,))
@@ -1932,7 +2191,31 @@ class WikiData:
 
     def getWikiWordMatchTermsWith(self, thisStr, orderBy=None, descend=False):
         "get the list of match terms with thisStr in them."
-        thisStr = sqlite.escapeForGlob(thisStr.lower())   # TODO More general normcase function
+        searchStr = thisStr.lower()   # TODO More general normcase function
+        thisStr = sqlite.escapeForGlob(searchStr)
+
+        # Condition for match terms starting with thisStr
+        prefixSql = "matchtermnormcase glob (? || '*')"
+        prefixParams = (thisStr,)
+
+        # glob doesn't use the index on matchtermnormcase, a range does
+        rangeCond = DbStructure.getPrefixRangeCondition(searchStr)
+        if rangeCond is not None:
+            prefixSql = rangeCond[0] + " and " + prefixSql
+            prefixParams = rangeCond[1] + prefixParams
+
+        # Condition for match terms containing but not starting with thisStr
+        infixSql = "not matchtermnormcase glob (? || '*') " \
+                "and matchtermnormcase glob ('*' || ? || '*')"
+        infixParams = (thisStr, thisStr)
+
+        if self.matchTermTrigramsAvailable:
+            # Restrict candidates by trigram index instead of scanning all
+            # match terms, glob still checks the real containment
+            trigramCond = DbStructure.getMatchTermTrigramCondition(searchStr)
+            if trigramCond is not None:
+                infixSql = trigramCond[0] + " and " + infixSql
+                infixParams = trigramCond[1] + infixParams
 
         if orderBy == "visited":
             try:
@@ -1941,16 +2224,14 @@ class WikiData:
                         "firstcharpos, charlength, visited "
                         "from wikiwordmatchterms inner join wikiwords "
                         "on wikiwordmatchterms.word = wikiwords.word where "
-                        "matchtermnormcase glob (? || '*')", (thisStr,))
+                        + prefixSql, prefixParams)
     
                 result2 = self.connWrap.execSqlQuery(
                         "select matchterm, type, wikiwordmatchterms.word, "
                         "firstcharpos, charlength, visited "
                         "from wikiwordmatchterms inner join wikiwords "
                         "on wikiwordmatchterms.word = wikiwords.word where "
-                        "not matchtermnormcase glob (? || '*') "
-                        "and matchtermnormcase glob ('*' || ? || '*')",
-                        (thisStr, thisStr))
+                        + infixSql, infixParams)
             except (IOError, OSError, sqlite.Error), e:
                 traceback.print_exc()
                 raise DbReadAccessError(e)
@@ -1959,14 +2240,12 @@ class WikiData:
                 result1 = self.connWrap.execSqlQuery(
                         "select matchterm, type, word, firstcharpos, charlength "
                         "from wikiwordmatchterms where "
-                        "matchtermnormcase glob (? || '*')", (thisStr,))
+                        + prefixSql, prefixParams)
     
                 result2 = self.connWrap.execSqlQuery(
                         "select matchterm, type, word, firstcharpos, charlength "
                         "from wikiwordmatchterms where "
-                        "not matchtermnormcase glob (? || '*') "
-                        "and matchtermnormcase glob ('*' || ? || '*')",
-                        (thisStr, thisStr))
+                        + infixSql, infixParams)
             except (IOError, OSError, sqlite.Error), e:
                 traceback.print_exc()
                 raise DbReadAccessError(e)
@@ -1990,9 +2269,7 @@ class WikiData:
     def updateWikiWordMatchTerms(self, word, wwmTerms, syncUpdate=False):
         self.deleteWikiWordMatchTerms(word, syncUpdate=syncUpdate)
         self.getExistingWikiWordInfo(word)
-        for t in wwmTerms:
-            assert t[2] == word
-            self._addWikiWordMatchTerm(t)
+        self._addWikiWordMatchTerms(word, wwmTerms)
 
 
     def _addWikiWordMatchTerm(self, wwmTerm):
@@ -2004,6 +2281,33 @@ class WikiData:
                     "values (?, ?, ?, ?, ?, ?)",
                     (matchterm, typ, word, firstcharpos, charlength,
                     matchterm.lower()))
+            if self.matchTermTrigramsAvailable:
+                DbStructure.addNewMatchTermTrigrams(self.connWrap, word,
+                        (matchterm.lower(),))
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
+
+    def _addWikiWordMatchTerms(self, word, wwmTerms):
+        """
+        Add sequence of match terms which must all belong to word.
+        """
+        for t in wwmTerms:
+            assert t[2] == word
+
+        try:
+            # TODO Check for name collisions
+            self.connWrap.executemany("insert into wikiwordmatchterms(matchterm, "
+                    "type, word, firstcharpos, charlength, matchtermnormcase) "
+                    "values (?, ?, ?, ?, ?, ?)",
+                    [(matchterm, typ, word, firstcharpos, charlength,
+                    matchterm.lower())
+                    for matchterm, typ, word, firstcharpos, charlength
+                    in wwmTerms])
+            if self.matchTermTrigramsAvailable:
+                DbStructure.addNewMatchTermTrigrams(self.connWrap, word,
+                        set(t[0].lower() for t in wwmTerms))
         except (IOError, OSError, sqlite.Error), e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -2019,12 +2323,59 @@ class WikiData:
         try:
             self.connWrap.execSql("delete from wikiwordmatchterms where "
                     "word = ?" + addSql, (word,))
+            if self.matchTermTrigramsAvailable:
+                # Match terms of the other update kind remain
+                DbStructure.updateMatchTermTrigramsForWord(self.connWrap, word)
             self.cachedWikiPageLinkTermDict = None
         except (IOError, OSError, sqlite.Error), e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
 
 
+    # ---------- Bulk update of page meta data ----------
+
+    def applyPageMetaData(self, word, childRelations=None, attrs=None,
+            todos=None, wwmTerms=None):
+        """
+        Replace the cached meta data of page word in one transaction.
+        A parameter which is None leaves the data unchanged, otherwise
+        it replaces the data as in updateChildRelations(), updateAttributes(),
+        updateTodos() and updateWikiWordMatchTerms() (with syncUpdate=False).
+        Raises WikiWordNotFoundException if page doesn't exist.
+        """
+        self.getExistingWikiWordInfo(word)
+
+        try:
+            # commit anything pending so we can rollback on error
+            self.connWrap.syncCommit()
+
+            try:
+                if childRelations is not None:
+                    self.deleteChildRelationships(word)
+                    self._addRelationships(word, childRelations)
+
+                if attrs is not None:
+                    self.deleteAttributes(word)
+                    self._setAttributes(word, attrs)
+                    self.cachedGlobalAttrs = None
+
+                if todos is not None:
+                    self.deleteTodos(word)
+                    self._addTodos(word, todos)
+
+                if wwmTerms is not None:
+                    self.deleteWikiWordMatchTerms(word, syncUpdate=False)
+                    self._addWikiWordMatchTerms(word, wwmTerms)
+
+                self.connWrap.commit()
+            except:
+                self.connWrap.rollback()
+                raise
+        except (IOError, OSError, sqlite.Error), e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
+
     # ---------- Data block handling ----------
 
     # TODO Optimize
@@ -2318,6 +2669,7 @@ class WikiData:
         "rebuild": 1,
         "compactify": 1,     # = sqlite vacuum
         "filePerPage": 1,   # Uses a single file per page
+        "reader connections": 1,  # getReaderMethodNames() is available
 #         "versioning": 1,     # (old versioning)
 #         "plain text import":1   # Is already plain text      
         }
@@ -2424,11 +2776,14 @@ class WikiData:
         """
         Function must work for read-only wiki.
         """
+        if self.readerPool is not None:
+            self.readerPool.close()
+
         try:
             self.connWrap.syncCommit()
             self.connWrap.close()
     
-            self.connWrap = None
+            self.writeConnWrap = None
         except (IOError, OSError, sqlite.Error), e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -2515,6 +2870,8 @@ class WikiData:
         """
         Do not call from this class, only from outside to handle errors.
         """
+        # May contain rolled back changes
+        self.cachedWikiPageLinkTermDict = None
         try:
             self.connWrap.rollback()
         except (IOError, OSError, sqlite.Error), e: